@@ -4,7 +4,6 @@ import logging
 from django.contrib import admin, messages
 from django.core.management import call_command
 from django.db import transaction
-from django.db.models import Count, Sum
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.utils import timezone
@@ -17,7 +16,7 @@ from unfold.decorators import action, display
 from strava.api import format_strava_error
 from strava.choices import SportType
 from strava.models import Activity, Athlete, Gear
-from strava.services import sync
+from strava.services import bases, curves, explorer, fitness, routes, sync
 
 
 logger = logging.getLogger('strava')
@@ -59,9 +58,26 @@ class DistanceFilter(RangeNumericListFilter):
     title = _("Distance")
 
 
+class IndexedSearchMixin:
+    """Serve the changelist search box from the model's indexed ``search`` (token-AND over
+    the folded ``search_text`` column, see strava.search) instead of per-row ``unaccent``
+    lookups. ``search_fields`` still enables the box; a term equal to an id also matches."""
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        matches = queryset.search(term)
+        try:
+            return matches | queryset.filter(pk=term), False
+        except (TypeError, ValueError):
+            # Not a valid id for this model (e.g. text against Activity's integer pk).
+            return matches, False
+
+
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
-    search_fields = ("id", "name__unaccent")
+class ActivityAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_fields = ("id", "search_text")
     actions = ["update_from_json", "fetch_from_api", "send_to_api"]
     actions_list = ["import_strava", "open_strava_activities"]
     date_hierarchy = "start_date"
@@ -78,6 +94,47 @@ class ActivityAdmin(admin.ModelAdmin):
     readonly_fields = ('distance', 'json', 'start_date', 'athlete', 'is_private')
     # autocomplete_fields = ("gear",)
 
+    def save_model(self, request, obj, form, change):
+        # An admin edit (the change form or the list-editable gear column) can move an
+        # activity between gear, so refresh both gear's denormalised statistics.
+        previous_gear_id, previous_cell, previous_start = (
+            Activity.objects.filter(pk=obj.pk).values_list("gear_id", "grid_cell", "start_date").first()
+            or (None, None, None))
+        super().save_model(request, obj, form, change)
+        sync.gear_refresh_stats(previous_gear_id, obj.gear_id)
+        explorer.record(obj)
+        routes.record(obj)
+        bases.record(obj, previous_cell)
+        curves.record(obj)
+        fitness.record(obj, previous_start)
+        sync.data_changed(obj.athlete_id)
+
+    def delete_model(self, request, obj):
+        # The activity's explorer tiles go with it: hand them to their next visitors first.
+        # Likewise its curves leave the envelopes they set values in.
+        explorer.forget(Activity.objects.filter(pk=obj.pk))
+        curves.forget(Activity.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+        sync.gear_refresh_stats(obj.gear_id)
+        bases.refresh(obj.athlete_id, obj.grid_cell)
+        fitness.refresh(obj.athlete_id, obj.start_date)
+        sync.data_changed(obj.athlete_id)
+
+    def delete_queryset(self, request, queryset):
+        gear_ids = set(queryset.values_list("gear_id", flat=True))
+        athlete_ids = set(queryset.values_list("athlete_id", flat=True))
+        starts = set(queryset.values_list("athlete_id", "grid_cell"))
+        start_dates = set(queryset.values_list("athlete_id", "start_date"))
+        explorer.forget(queryset)
+        curves.forget(queryset)
+        super().delete_queryset(request, queryset)
+        sync.gear_refresh_stats(*gear_ids)
+        for athlete_id, grid_cell in starts:
+            bases.refresh(athlete_id, grid_cell)
+        for athlete_id in athlete_ids:
+            fitness.refresh(athlete_id, *(start_date for owner, start_date in start_dates if owner == athlete_id))
+        sync.data_changed(*athlete_ids)
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "gear":
             formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -208,22 +265,25 @@ class ActivityAdmin(admin.ModelAdmin):
 
 
 @admin.register(Gear)
-class GearAdmin(admin.ModelAdmin):
-    search_fields = ("id", "brand_name", "model_name", "description")
-    actions = ["fetch_from_api"]
+class GearAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_fields = ("id", "search_text", "description")
+    actions = ["fetch_from_api", "rebuild_stats"]
     actions_list = ["open_strava_gear"]
     list_display = ("id", "brand_and_model", "show_gear_type", "description",
                     "show_activity_count", "show_distance", "show_age", "primary")
     list_display_links = ("id", "brand_and_model")
     list_filter = (("athlete", RelatedDropdownFilter), "gear_type", "brand_name")
-    readonly_fields = ("primary", "brand_name", "model_name", "description", "json", "athlete")
-
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            activity_count=Count("activity"),
-            distance_sum=Sum("activity__distance"),
-            distance_avg=Sum("activity__distance")/Count("activity"),
-        )
+    # The usage statistics are denormalised columns maintained on ingest (see
+    # Gear.STATS_FIELDS), so the changelist needs no aggregate join over the activities.
+    readonly_fields = ("primary", "brand_name", "model_name", "description", "json", "athlete",
+                       *Gear.STATS_FIELDS)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Gear descriptions aren't part of the folded search column; match them directly.
+        matches, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            matches = matches | queryset.filter(description__icontains=search_term.strip())
+        return matches, may_have_duplicates
 
     @action(description=_("Show gear on Strava"), url_path="open-strava-gear")
     def open_strava_gear(self, request, *args):
@@ -234,6 +294,24 @@ class GearAdmin(admin.ModelAdmin):
         for obj in queryset:
             sync.gear_fetch(obj)
 
+    @action(description=_("Rebuild statistics"))
+    def rebuild_stats(self, request, queryset):
+        gears = queryset.refresh_stats()
+        sync.data_changed(*(gear.athlete_id for gear in gears))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        sync.data_changed(obj.athlete_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        sync.data_changed(obj.athlete_id)
+
+    def delete_queryset(self, request, queryset):
+        athlete_ids = set(queryset.values_list("athlete_id", flat=True))
+        super().delete_queryset(request, queryset)
+        sync.data_changed(*athlete_ids)
+
     @display(description=_("Brand and model"), ordering="brand_name", header=True)
     def brand_and_model(self, obj):
         return [
@@ -248,17 +326,18 @@ class GearAdmin(admin.ModelAdmin):
     def show_gear_type(self, obj):
         return obj.get_gear_type_display()
 
-    @display(description=_("Total activities"), ordering="activity_count")
+    @display(description=_("Total activities"), ordering="total_activity_count")
     def show_activity_count(self, obj):
         url = reverse_lazy("admin:strava_activity_changelist")
         url += f"?gear__id__exact={obj.id}"
-        return mark_safe(f'<a href="{url}" class="text-primary-600">{obj.activity_count}</a>')
+        return mark_safe(f'<a href="{url}" class="text-primary-600">{obj.total_activity_count}</a>')
 
-    @display(description=_("Distance"), ordering="distance_sum", header=True)
+    @display(description=_("Distance"), ordering="total_distance", header=True)
     def show_distance(self, obj):
+        average = obj.total_distance / obj.total_activity_count if obj.total_activity_count else 0
         return [
-            f'{round(obj.distance_sum / 1000, 2)} km',
-            f'Average: {round(obj.distance_avg / 1000, 2)} km'
+            f'{round(obj.total_distance / 1000, 2)} km',
+            f'Average: {round(average / 1000, 2)} km'
         ]
 
     @display(description=_("Is old"))
@@ -279,6 +358,13 @@ class AthleteAdmin(admin.ModelAdmin):
                        "follower_count", "friend_count", "access_token", "refresh_token",
                        "token_expires_at", "scope", "json")
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # The power-based training loads are relative to the FTP (see services.fitness).
+        if "ftp" in form.changed_data:
+            fitness.rebuild(obj)
+        sync.data_changed(obj.pk)
+
     @action(description=_("Show activities"), url_path="show-activities")
     def show_activities(self, request, object_id):
         url = reverse_lazy("admin:strava_activity_changelist")
@@ -297,10 +383,14 @@ class AthleteAdmin(admin.ModelAdmin):
     @action(description=_("Make default"), url_path="make-default")
     def make_default(self, request, object_id):
         # One default at a time (enforced by a partial unique index) — clear the others
-        # before setting this one, both in a transaction.
+        # before setting this one, both in a transaction. The pages cached for both
+        # athletes showed the old default, so both retire them.
         with transaction.atomic():
-            Athlete.objects.filter(is_default=True).exclude(pk=object_id).update(is_default=False)
+            previous = Athlete.objects.filter(is_default=True).exclude(pk=object_id)
+            previous_ids = list(previous.values_list("pk", flat=True))
+            previous.update(is_default=False)
             Athlete.objects.filter(pk=object_id).update(is_default=True)
+            sync.data_changed(object_id, *previous_ids)
         self.message_user(request, _("Default athlete updated."), level=messages.SUCCESS)
         return redirect(request.META.get("HTTP_REFERER", reverse_lazy("admin:strava_athlete_changelist")))
 
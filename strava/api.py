@@ -13,6 +13,8 @@ from stravalib.util.limiter import (
   get_rates_from_response_headers,
 )
 
+from strava import streams
+
 logger = logging.getLogger("file")
 
 # One Strava API app authenticates every athlete; the per-athlete access/refresh tokens
@@ -218,6 +220,17 @@ class StravaApi:
     logger.info(self.get_formatted_json(activities))
     return activities
 
+  @token_syncing
+  @rate_limited
+  def get_activity_streams(self, id, types=streams.KINDS):
+    """``{kind: [value, ...]}`` of the activity's recorded streams among ``types`` (a kind
+    it didn't record is left out). Streams are long, so only their kinds and length are
+    logged."""
+    fetched = self.client.get_activity_streams(id, types=list(types)) or {}
+    data = {getattr(kind, 'value', kind): list(stream.data or []) for kind, stream in fetched.items()}
+    logger.info(f'Streams of activity {id}: {", ".join(f"{kind} ({len(values)})" for kind, values in data.items())}')
+    return data
+
   @token_syncing
   @rate_limited
   def update_activity(self, id, **kwargs):
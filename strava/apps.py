@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class StravaConfig(AppConfig):
+    name = "strava"
+    default_auto_field = "django.db.models.BigAutoField"
+
+    def ready(self):
+        post_migrate.connect(_install_search_index, sender=self)
+
+
+def _install_search_index(sender, using, **kwargs):
+    # The SQLite FTS5 search index lives outside the migration graph (see strava.search).
+    from django.db import connections
+    from strava.search import install_sqlite_index
+    install_sqlite_index(connections[using])
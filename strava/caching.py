@@ -0,0 +1,128 @@
+"""Versioned per-athlete cache of computed page sections.
+
+The dashboard and compare sections are pure functions of an athlete's data and the filter
+state, and the data only changes on a write (import, sync, admin edit). Each result is
+cached under a key made of the athlete, the athlete's ``data_version`` and the inputs
+(filter tuple, today's date). Every write path bumps the version (``sync.data_changed``),
+so stale entries are never read again; they are left to expire. Nothing is cached
+without an athlete.
+
+Uses Django's cache framework: the ``STRAVA_CACHE`` alias (default ``"default"``) with
+``STRAVA_CACHE_TIMEOUT`` seconds (default one day). A section that changes with the date
+alone is cached until local midnight instead.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+_MISSING = object()
+
+
+def _cache():
+    return caches[getattr(settings, "STRAVA_CACHE", "default")]
+
+
+def key(athlete, name, parts):
+    """The cache key of ``name`` computed from ``parts`` for ``athlete``'s current data.
+    The parts are hashed, so free text (a search query) is a safe key on any backend."""
+    digest = hashlib.sha1(repr(tuple(parts)).encode()).hexdigest()
+    return f"strava:{name}:{athlete.pk}:{athlete.data_version}:{digest}"
+
+
+def until_midnight():
+    """The seconds left in the local day."""
+    now = timezone.localtime()
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), now.tzinfo)
+    return max(1, round((midnight - now).total_seconds()))
+
+
+def cached(athlete, name, parts, compute, timeout=None):
+    """``compute()``, cached per athlete, data version and ``parts`` (for ``timeout``
+    seconds, ``STRAVA_CACHE_TIMEOUT`` by default)."""
+    if athlete is None:
+        return compute()
+    cache_key = key(athlete, name, parts)
+    value = _cache().get(cache_key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        if timeout is None:
+            timeout = getattr(settings, "STRAVA_CACHE_TIMEOUT", 60 * 60 * 24)
+        _cache().set(cache_key, value, timeout)
+    return value
+
+
+def dashboard_filter_bar(athlete, activities, sport, params):
+    """``dashboard.filter_bar``, cached."""
+    from strava.services import dashboard  # local import: the services import the models
+    return cached(athlete, "dashboard-filter-bar", (sport, params.get("dist_min"), params.get("dist_max")),
+                  lambda: dashboard.filter_bar(activities, sport, params))
+
+
+def dashboard_page(athlete, activities, filters, today, wanted=None):
+    """``dashboard.page`` for the filter tuple ``(q, sport, gear, year, dist_min,
+    dist_max)`` and the ``wanted`` sections of a partial page, cached."""
+    from strava.services import bases, dashboard
+    sections = sorted(wanted) if wanted is not None else None
+
+    def compute():
+        home = bases.home(athlete) if athlete is not None else None
+        return dashboard.page(activities, *filters, today, wanted, home)
+    return cached(athlete, "dashboard", (sections, *filters, today), compute)
+
+
+def explorer_summary(athlete, today):
+    """``explorer.summary``, cached."""
+    from strava.services import explorer
+    return cached(athlete, "explorer", (today,), lambda: explorer.summary(athlete, today))
+
+
+def repeat_routes(athlete, activities):
+    """``routes.repeat_routes``, cached."""
+    from strava.services import routes
+    return cached(athlete, "repeat-routes", (), lambda: routes.repeat_routes(activities))
+
+
+def countries(athlete, activities):
+    """``places.countries``, cached."""
+    from strava.services import places
+    return cached(athlete, "countries", (), lambda: places.countries(activities))
+
+
+def curves(athlete, year):
+    """``curves.curve_view``, cached."""
+    from strava.services import curves
+    return cached(athlete, "curves", (year,), lambda: curves.curve_view(athlete, year))
+
+
+def fitness(athlete, today):
+    """``fitness.summary``, cached."""
+    from strava.services import fitness
+    return cached(athlete, "fitness", (today,), lambda: fitness.summary(athlete, today))
+
+
+def on_this_day(athlete, activities, today):
+    """``anniversaries.on_this_day``, cached for the rest of the local day."""
+    from strava.services import anniversaries
+    return cached(athlete, "on-this-day", (today,), lambda: anniversaries.on_this_day(activities, today),
+                  until_midnight())
+
+
+def warm(athlete):
+    """Compute and cache the unfiltered dashboard, explorer summary, repeat routes,
+    countries, curves, fitness and "on this day" for ``athlete``'s current data, so the
+    first page load after an import is served from the cache."""
+    from strava.models import Activity
+    athlete.refresh_from_db(fields=["data_version"])
+    activities = Activity.objects.for_athlete(athlete).public()
+    bar = dashboard_filter_bar(athlete, activities, "all", {})
+    filters = ("", "all", "all", "all", bar["dist_min"], bar["dist_max"])
+    dashboard_page(athlete, activities, filters, timezone.localdate())
+    explorer_summary(athlete, timezone.localdate())
+    repeat_routes(athlete, activities)
+    countries(athlete, activities)
+    curves(athlete, "all")
+    fitness(athlete, timezone.localdate())
+    on_this_day(athlete, activities, timezone.localdate())
@@ -13,7 +13,67 @@ DETAIL_MARKER_FIELDS = ("embed_token", "calories", "description", "device_name")
 MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
-MAP_MARKER_LIMIT = 1000   # cap markers so a busy map stays readable
+# Markers in one map payload: above this many in view, the map shows server-side grid
+# clusters instead (see dashboard.viewport_markers).
+MAP_MARKER_LIMIT = 1000
+# The map's spatial grid (helpers.grid_cell): 2**MAP_GRID_BITS cells per axis over the
+# whole globe, ~300 m at the finest level. A view at zoom z clusters by the grid level
+# z + MAP_CLUSTER_LEVEL_OFFSET, i.e. 2**offset cells per map tile along each axis.
+MAP_GRID_BITS = 16
+MAP_CLUSTER_LEVEL_OFFSET = 3
+# Douglas–Peucker-simplified copies of each route, stored next to the full polyline
+# (helpers.simplified_routes): the column and its tolerance in degrees, coarsest first.
+# The map draws routes from the coarsest copy whose error stays under a pixel at its zoom
+# (helpers.route_resolution), ~zoom 11 and ~zoom 13 here; closer in, the full polyline.
+ROUTE_TOLERANCES = (("polyline_low", 5e-4), ("polyline_medium", 1e-4))
+# The activity cards' route thumbnail (``polyline_thumb``) is simplified to a tolerance of
+# one pixel of a trace this many pixels across, relative to the route's own extent.
+ROUTE_THUMBNAIL_SIZE = 300
+# Route heatmap tiles (services.heatmap): the number of routes through a pixel that
+# draws at full heat (counts are coloured on a log scale up to it), and the RGBA colour
+# stops from one route to saturation, in the run route colour. Tiles exist for zoom
+# levels 0 to HEATMAP_MAX_ZOOM.
+HEATMAP_SATURATION = 30
+HEATMAP_COLORS = ((252, 82, 0, 70), (252, 82, 0, 190), (255, 190, 0, 230), (255, 255, 220, 255))
+HEATMAP_MAX_ZOOM = 18
+# The deepest zoom whose tiles of the unfiltered layer are kept on disk; deeper tiles
+# cover little ground and draw few routes, so they're rendered on demand.
+HEATMAP_CACHE_MAX_ZOOM = 14
+# Explorer tiles (services.explorer): the map zoom whose tiles (~2.4 km across at the
+# equator, ~1.6 km at 48°N) count as visited once a route passes through them.
+EXPLORER_ZOOM = 14
+# Repeat routes (services.routes): a route is fingerprinted by the zoom-ROUTE_ZOOM tiles
+# it visits (~600 m at 48°N), as a MinHash signature of BANDS × ROWS hashes. Activities
+# sharing a band's rows land in the same LSH bucket; a candidate is the same route when
+# the signatures agree on at least ROUTE_MATCH_SIMILARITY of their hashes (the estimated
+# Jaccard similarity of the tile sets) and the distances differ by at most
+# ROUTE_MATCH_DISTANCE. The trend compares the average moving time of the latest
+# ROUTE_TREND_ATTEMPTS attempts with the as many before.
+ROUTE_ZOOM = 16
+ROUTE_MINHASH_BANDS = 16
+ROUTE_MINHASH_ROWS = 4
+ROUTE_MATCH_SIMILARITY = 0.7
+ROUTE_MATCH_DISTANCE = 0.15
+ROUTE_TREND_ATTEMPTS = 5
+REPEAT_ROUTES_COUNT = 5  # routes listed on the dashboard
+COUNTRIES_COUNT = 8  # countries listed on the dashboard (services.places)
+# Start-location bases (services.bases): start points are counted per cell of the map's
+# grid at HOME_GRID_LEVEL (~600 m × 800 m at 48°N). Neighbouring cells with at least
+# HOME_MIN_STARTS starts each merge into one base; the busiest base is "home".
+HOME_GRID_LEVEL = 15
+HOME_MIN_STARTS = 3
+HOME_BASES_COUNT = 5
+# The stored home (and every activity's distance from it) follows the busiest base once
+# that has moved more than this many km, so new starts nudging its mean don't trigger a
+# recomputation of the whole history.
+HOME_MOVE_KM = 1.0
+DASHBOARD_LATEST_COUNT = 4  # latest-activity cards on the dashboard
+ON_THIS_DAY_COUNT = 4  # "on this day" cards on the dashboard (services.anniversaries)
+
+# Rows per page of the cursor-paginated feeds (see strava.pagination); later pages load
+# by infinite scroll.
+ACTIVITIES_PAGE_SIZE = 30
+GALLERY_PAGE_SIZE = 40
 
 # Expected service life per gear type (km), used to compute wear percentage.
 SHOE_LIFESPAN_KM = 700
@@ -51,8 +111,57 @@ RIEGEL_EXP = 1.06
 # times, so predictors outside [target / ratio, target * ratio] are ignored.
 RIEGEL_MAX_RATIO = 3.0
 
+# --- Mean-maximal curves (see services.curves) ---
+# The durations (seconds) a best average power and pace is kept for, 5 s to 5 h. Stored
+# curves hold a value per duration: after changing it, run ``manage.py rebuild_curves``.
+CURVE_DURATIONS = (5, 10, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 10800, 18000)
+# Per curve kind: the stream it's computed from and the RECORDS_SPORT_TYPES group whose
+# activities its season and all-time envelopes take.
+CURVE_KINDS = {
+    'pace': ('distance', 'Running'),
+    'power': ('watts', 'Cycling'),
+}
+# A power sample holds until the next one, unless they are further apart than this
+# (seconds): the recording was paused, and the gap counts as zero watts.
+CURVE_MAX_GAP = 10
+# The durations listed under the dashboard's curve chart.
+CURVE_LISTED = (5, 60, 300, 1200, 3600)
+
 # --- "By the Numbers" fun-stat reference values ---
 EARTH_CIRCUMFERENCE_KM = 40075
 EVEREST_HEIGHT_M = 8849
 MARATHON_KM = 42.195
 CO2_KG_PER_KM = 0.12   # ~avg car tailpipe CO2 per km, avoided by cycling instead
+
+# --- Training-load widget (see services.rolling) ---
+# Rolling windows (days) summed up to today, and the windows whose peak block is shown.
+ROLLING_WINDOWS = (7, 28, 365)
+# Acute:chronic workload ratio: the last ACUTE days' moving time against the last CHRONIC
+# days' weekly average. Below LOW the athlete is detraining; above HIGH the load is
+# ramping faster than the body has adapted to (the usual injury-risk reading).
+ACWR_ACUTE_DAYS = 7
+ACWR_CHRONIC_DAYS = 28
+ACWR_LOW = 0.8
+ACWR_HIGH = 1.3
+
+# --- Fitness, fatigue and form (see services.fitness) ---
+# The time constants (days) of the exponentially weighted averages of daily load: fitness
+# (chronic training load, CTL) and fatigue (acute, ATL). Form (TSB) is their difference.
+FITNESS_DAYS = 42
+FATIGUE_DAYS = 7
+# An activity's load is Banister's TRIMP from its average heart rate: minutes × r ×
+# 0.64·e^(1.92·r), r its share of the heart-rate reserve. The resting and maximum heart
+# rates default to these (settings STRAVA_HEARTRATE_REST, STRAVA_HEARTRATE_MAX).
+TRIMP_HR_REST = 60
+TRIMP_HR_MAX = 190
+# Without heart rate (or power), an activity's load per hour by RECORDS_SPORT_TYPES group:
+# about the TRIMP of a steady effort in the sport. Other sports take the default.
+LOAD_PER_HOUR = {'Running': 90, 'Cycling': 70, 'Swimming': 80, 'Hiking': 45}
+LOAD_PER_HOUR_DEFAULT = 50
+# Form zones: above FRESH the athlete is rested, below TRAINING building fitness, below
+# OVERREACHING at risk of overdoing it.
+FORM_FRESH = 5
+FORM_TRAINING = -10
+FORM_OVERREACHING = -30
+# The days up to today the fitness chart shows.
+FITNESS_CHART_DAYS = 182
@@ -0,0 +1,152 @@
+"""Offline reverse geocoding: a start point's country and region, with no network call.
+
+Runs on data bundled in ``data/places.json.gz``:
+
+* Borders: Natural Earth's 1:110m country polygons (public domain), as rings of flat
+  ``lng, lat`` pairs. A point's country is the polygon holding it (even–odd ray casting).
+  The border edges are indexed by ``CELL_DEG`` latitude strip, so a ray is tested against
+  only the edges spanning its latitude, and only for the countries whose box holds the
+  point. A grid cell no border crosses has a single answer, worked out once per process
+  and then a dict lookup: most starts are inland, and most athletes start from a handful
+  of cells.
+* Regions: GeoNames populated places (CC BY 4.0), thinned to one per region per ~20 km.
+  A point's region is that of the nearest such seed in its country, a Voronoi partition
+  of the regions.
+
+The simplified coasts cut off beaches and harbours, and the smallest states (Monaco,
+Singapore) have no polygon at this scale: a point outside every border, or nearest a
+seed of a state without one, takes the country of the nearest seed (within
+``SEED_REACH`` cells). Near a border the answer is as good as the simplified border,
+within about ten kilometres. Countries are ISO 3166-1 alpha-2 codes (``country_name``
+for display); a point nothing matches (open sea) is ``('', '')``.
+"""
+import functools
+import gzip
+import json
+import math
+from pathlib import Path
+
+DATA = Path(__file__).parent / "data" / "places.json.gz"
+CELL_DEG = 0.5
+SEED_REACH = 1
+
+
+def _cell(value):
+    return math.floor(value / CELL_DEG)
+
+
+class Places:
+    """The bundled borders and region seeds, indexed for ``locate``."""
+
+    def __init__(self, data):
+        self.names = data["countries"]
+        self.regions = data["regions"]
+        self.boxes = {}
+        # {strip: {country: [edge, ...]}}: the border edges spanning each latitude strip.
+        self.strips = {}
+        self.crossed = set()
+        for code, rings in data["borders"].items():
+            xs, ys = [], []
+            for ring in rings:
+                points = list(zip(ring[0::2], ring[1::2]))
+                for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+                    cols = range(_cell(min(x1, x2)), _cell(max(x1, x2)) + 1)
+                    for row in range(_cell(min(y1, y2)), _cell(max(y1, y2)) + 1):
+                        self.strips.setdefault(row, {}).setdefault(code, []).append((x1, y1, x2, y2))
+                        self.crossed.update((row, col) for col in cols)
+                xs += ring[0::2]
+                ys += ring[1::2]
+            self.boxes[code] = (min(xs), min(ys), max(xs), max(ys))
+        self.seeds = {}
+        for code, flat in data["seeds"].items():
+            for lat, lng, region in zip(flat[0::3], flat[1::3], flat[2::3]):
+                self.seeds.setdefault((_cell(lat), _cell(lng)), []).append((lat, lng, code, region))
+        self._candidates = {}
+        self._settled = {}
+
+    def contains(self, code, lat, lng):
+        """Whether ``code``'s border holds the point."""
+        inside = False
+        for x1, y1, x2, y2 in self.strips.get(_cell(lat), {}).get(code, ()):
+            if (y1 > lat) != (y2 > lat) and lng < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def country(self, lat, lng):
+        """The code of the country whose border holds the point, or ``None``."""
+        cell = (_cell(lat), _cell(lng))
+        if cell in self._settled:
+            return self._settled[cell]
+        candidates = self._candidates.get(cell)
+        if candidates is None:
+            south, west = cell[0] * CELL_DEG, cell[1] * CELL_DEG
+            candidates = self._candidates[cell] = [
+                code for code, (x0, y0, x1, y1) in self.boxes.items()
+                if x0 <= west + CELL_DEG and west <= x1 and y0 <= south + CELL_DEG and south <= y1
+            ]
+        if cell not in self.crossed:
+            # No border in the cell: its centre's answer is every point's.
+            lat, lng = (cell[0] + 0.5) * CELL_DEG, (cell[1] + 0.5) * CELL_DEG
+        found = next((code for code in candidates if self.contains(code, lat, lng)), None)
+        if cell not in self.crossed:
+            self._settled[cell] = found
+        return found
+
+    def nearest_seed(self, lat, lng, code=None, reach=SEED_REACH):
+        """The nearest region seed ``(lat, lng, country, region)`` to the point (in
+        ``code`` only, when given), searched ring by ring out to ``reach`` cells."""
+        row, col = _cell(lat), _cell(lng)
+        scale = math.cos(math.radians(lat)) ** 2
+        best, best_distance = None, math.inf
+        for ring in range(reach + 1):
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    for seed in self.seeds.get((r, c), ()):
+                        if code is not None and seed[2] != code:
+                            continue
+                        distance = (seed[0] - lat) ** 2 + scale * (seed[1] - lng) ** 2
+                        if distance < best_distance:
+                            best, best_distance = seed, distance
+            # Everything within ``ring`` cells (a longitude cell shrinking with cos(lat))
+            # has been seen: a seed that close can't be beaten further out.
+            if best is not None and best_distance <= scale * (ring * CELL_DEG) ** 2:
+                break
+        return best
+
+    def locate(self, lat, lng):
+        code = self.country(lat, lng)
+        seed = self.nearest_seed(lat, lng)
+        if code is not None and (seed is None or seed[2] in self.boxes):
+            # Within a border, unless nearest a state too small to have one. Regions are
+            # large: look further for a seed in the country than for any.
+            seed = self.nearest_seed(lat, lng, code, reach=4 * SEED_REACH)
+        if seed is None:
+            return code or "", ""
+        return seed[2], self.regions[seed[2]][seed[3]]
+
+
+@functools.lru_cache(maxsize=None)
+def places():
+    """The bundled data, loaded and indexed on first use."""
+    return Places(json.loads(gzip.decompress(DATA.read_bytes())))
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _locate(lat, lng):
+    return places().locate(lat, lng)
+
+
+def locate(lat, lng):
+    """``(country, region)`` of a start point: an ISO alpha-2 code and a region name, each
+    blank when unknown (no point, or open sea). Points are rounded to the borders' ~100 m
+    precision, so an athlete's repeated start points are looked up once."""
+    if lat is None or lng is None:
+        return "", ""
+    return _locate(round(lat, 3), round(lng, 3))
+
+
+def country_name(code):
+    """The English name of a country code from ``locate`` (the code itself if unknown)."""
+    return places().names.get(code, code)
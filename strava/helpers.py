@@ -6,23 +6,157 @@ share them without pulling in the heavier analytics computations.
 """
 import math
 import unicodedata
+from collections import namedtuple
 
 from django.db.models import Max
 from django.utils import timezone
 
-from strava.consts import MIN_HIKE_PACE_SEC
+try:
+    import numpy as np
+except ImportError:  # optional dependency (the ``fast`` extra); haversine_many falls back
+    np = None
+
+from strava.consts import MAP_GRID_BITS, MIN_HIKE_PACE_SEC, ROUTE_THUMBNAIL_SIZE, ROUTE_TOLERANCES
 from strava.sports import TOP_SPORT_TYPES
 
 
-def local_date(activity):
-    """The activity's start date in the active timezone (dates group by local day)."""
-    return timezone.localtime(activity.start_date).date()
+def local_date(activity, tz=None):
+    """The activity's start date in the active timezone (dates group by local day). Loops
+    over many activities pass ``tz=timezone.get_current_timezone()``, resolved once:
+    looking the active timezone up is most of the per-call cost."""
+    return timezone.localtime(activity.start_date, tz).date()
+
+
+def month_day(day):
+    """``day``'s month and day as one sortable integer, month × 100 + day (Dec 31 is
+    1231): the key of Activity.month_day."""
+    return day.month * 100 + day.day
 
 
 def has_gps(activity):
     return activity.start_lat is not None
 
 
+def decode_polyline(encoded):
+    """The ``[(lat, lng), …]`` points of a Google-encoded polyline (Strava's route
+    format, five decimal places)."""
+    points, index, lat, lng = [], 0, 0, 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / 1e5, lng / 1e5))
+    return points
+
+
+def encode_polyline(points):
+    """The Google-encoded polyline of ``[(lat, lng), …]`` points (``decode_polyline``'s
+    inverse, five decimal places)."""
+    chunks, last = [], (0, 0)
+    for lat, lng in points:
+        current = (round(lat * 1e5), round(lng * 1e5))
+        for value in (current[0] - last[0], current[1] - last[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        last = current
+    return ''.join(chunks)
+
+
+def simplify(points, tolerance):
+    """Douglas–Peucker: the subset of ``points`` (``[(lat, lng), …]``, in order, ends
+    kept) that stays within ``tolerance`` degrees of the full line. Longitudes are scaled
+    by the cosine of the mean latitude, so the tolerance is the same distance both ways."""
+    if len(points) < 3:
+        return list(points)
+    scale = math.cos(math.radians(sum(lat for lat, _lng in points) / len(points)))
+    xy = [(lng * scale, lat) for lat, lng in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        worst, index = 0.0, None
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            # Distance to the chord, or to its start when the ends coincide (a loop).
+            d = abs(dy * (x - x1) - dx * (y - y1)) / length if length else math.hypot(x - x1, y - y1)
+            if d > worst:
+                worst, index = d, i
+        if index is not None and worst > tolerance:
+            keep[index] = True
+            stack.extend(((first, index), (index, last)))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplified_routes(polyline):
+    """The simplified copies of an activity's encoded route, as ``{column: encoded}``:
+    one per ``ROUTE_TOLERANCES`` level and the card thumbnail (``polyline_thumb``),
+    whose tolerance is one pixel of a ``ROUTE_THUMBNAIL_SIZE`` trace of this route. Empty
+    strings without a route."""
+    points = decode_polyline(polyline) if polyline else []
+    routes = {field: encode_polyline(simplify(points, tolerance)) for field, tolerance in ROUTE_TOLERANCES}
+    extent = 0.0
+    if points:
+        lats, lngs = zip(*points)
+        scale = math.cos(math.radians(sum(lats) / len(lats)))
+        extent = max(max(lats) - min(lats), (max(lngs) - min(lngs)) * scale)
+    routes['polyline_thumb'] = encode_polyline(simplify(points, extent / ROUTE_THUMBNAIL_SIZE))
+    return routes
+
+
+def route_resolution(zoom):
+    """The polyline column the map draws routes from at ``zoom`` and the deepest zoom it
+    serves (``None``: the full route, for any zoom): the coarsest ``ROUTE_TOLERANCES``
+    copy whose tolerance is under a pixel there (a 256 px tile spans 360° at zoom 0)."""
+    for field, tolerance in ROUTE_TOLERANCES:
+        max_zoom = math.floor(math.log2(360 / 256 / tolerance))
+        if zoom <= max_zoom:
+            return field, max_zoom
+    return 'polyline', None
+
+
+def route_bounds(polyline, start_lat, start_lng):
+    """The ``(min_lat, min_lng, max_lat, max_lng)`` box of an activity's route and start
+    point, or ``None`` without either."""
+    points = decode_polyline(polyline) if polyline else []
+    if start_lat is not None and start_lng is not None:
+        points.append((start_lat, start_lng))
+    if not points:
+        return None
+    lats, lngs = zip(*points)
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+def grid_cell(lat, lng, bits=MAP_GRID_BITS):
+    """The Z-order (Morton) code of the cell holding ``(lat, lng)`` in a ``2**bits``
+    square grid over the globe: the cell's row and column bits interleaved. The cells of
+    a coarser level ``k`` are code prefixes, ``code >> 2 * (bits - k)``, so grouping by a
+    zoom's cell is one integer division in SQL."""
+    size = 1 << bits
+    row = min(size - 1, max(0, int((lat + 90) / 180 * size)))
+    col = min(size - 1, max(0, int((lng + 180) / 360 * size)))
+    code = 0
+    for bit in range(bits):
+        code |= ((col >> bit) & 1) << (2 * bit) | ((row >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
 def to_float(value):
     """Parse ``value`` to a float, returning ``None`` for blank/non-numeric input
     (e.g. an empty or malformed query-string parameter)."""
@@ -32,6 +166,15 @@ def to_float(value):
         return None
 
 
+def to_bbox(value):
+    """Parse a ``west,south,east,north`` query-string box (Leaflet's
+    ``getBounds().toBBoxString()``) to a tuple of floats, or ``None`` if it isn't one."""
+    parts = [to_float(part) for part in (value or '').split(',')]
+    if len(parts) != 4 or None in parts or not all(map(math.isfinite, parts)):
+        return None
+    return tuple(parts)
+
+
 def distance_slider_context(public_qs, sport, params):
     """Distance-slider context (per-sport ceilings + current window) shared by the
     activities filter bar and the dashboard map filter bar.
@@ -73,6 +216,12 @@ def unaccent(s):
     return ''.join(c for c in normalized if not unicodedata.combining(c)).lower()
 
 
+def search_text(*parts):
+    """The folded (``unaccent``-ed) search column value for ``parts``, one per line. A
+    search token never contains whitespace, so it can't match across two parts."""
+    return '\n'.join(unaccent(part) for part in parts)
+
+
 def fmt_pace(seconds):
     """Seconds-per-unit formatted as m:ss (a per-km or per-100m pace)."""
     m, s = divmod(int(round(seconds)), 60)
@@ -97,23 +246,72 @@ def haversine_km(lat1, lng1, lat2, lng2):
     return 2 * radius * math.asin(math.sqrt(a))
 
 
+def haversine_many(lat, lng, points):
+    """``haversine_km`` from ``(lat, lng)`` to each of ``points`` (``(lat, lng)`` pairs),
+    as a list of kilometres: one array computation with NumPy, a loop without it."""
+    points = list(points)
+    if np is None or not points:
+        return [haversine_km(lat, lng, lat2, lng2) for lat2, lng2 in points]
+    lats, lngs = np.radians(np.array(points, dtype=np.float64).T)
+    phi = math.radians(lat)
+    a = np.sin((lats - phi) / 2) ** 2 + math.cos(phi) * np.cos(lats) * np.sin((lngs - math.radians(lng)) / 2) ** 2
+    return (2 * 6371.0 * np.arcsin(np.sqrt(a))).tolist()
+
+
+class Home(namedtuple('Home', 'lat lng')):
+    """An athlete's stored home (``services.bases.home``): the point their activities'
+    ``home_distance`` is measured from. An estimated home is a plain ``(lat, lng)``."""
+    __slots__ = ()
+
+
+def home_distances(activities, home):
+    """Each activity's distance from ``home`` in km. From a stored ``Home`` it's the
+    activity's ``home_distance`` where it has one; the rest are computed in one batch."""
+    stored = isinstance(home, Home)
+    distances = [a.home_distance if stored else None for a in activities]
+    missing = [i for i, distance in enumerate(distances) if distance is None]
+    if missing:
+        computed = haversine_many(home[0], home[1], ((activities[i].start_lat, activities[i].start_lng)
+                                                     for i in missing))
+        for i, distance in zip(missing, computed):
+            distances[i] = distance
+    return distances
+
+
 def home_location(activities):
     """Estimate "home" as the busiest start location. Start points are bucketed on a
     ~1 km grid (2-decimal rounding); the most-used bucket's averaged coordinates are
     returned as ``(lat, lng)``, or ``None`` when no activity has GPS."""
-    clusters = {}
+    home = HomeLocation()
     for a in activities:
+        home.add(a)
+    return home.result()
+
+
+class HomeLocation:
+    """Accumulator for ``home_location``, for callers estimating it within a larger pass."""
+
+    dated = False
+
+    def __init__(self):
+        self.clusters = {}
+
+    def add(self, a, day=None):
         if a.start_lat is None or a.start_lng is None:
-            continue
+            return
         key = (round(a.start_lat, 2), round(a.start_lng, 2))
-        agg = clusters.setdefault(key, [0, 0.0, 0.0])
+        agg = self.clusters.get(key)
+        if agg is None:
+            agg = self.clusters[key] = [0, 0.0, 0.0]
         agg[0] += 1
         agg[1] += a.start_lat
         agg[2] += a.start_lng
-    if not clusters:
-        return None
-    count, lat_sum, lng_sum = max(clusters.values(), key=lambda agg: agg[0])
-    return lat_sum / count, lng_sum / count
+
+    def result(self):
+        if not self.clusters:
+            return None
+        count, lat_sum, lng_sum = max(self.clusters.values(), key=lambda agg: agg[0])
+        return lat_sum / count, lng_sum / count
 
 
 def hike_pace_ok(a):
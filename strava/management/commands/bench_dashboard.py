@@ -0,0 +1,145 @@
+import datetime
+import random
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from strava import helpers
+from strava.models import ActivityRow
+from strava.services import analytics, dashboard, gear, rolling
+
+SPORTS = ["Run", "TrailRun", "Ride", "GravelRide", "Hike", "Walk", "Swim", "Yoga"]
+
+
+def synthetic_rows(count, seed=1):
+    """``count`` plausible activity rows (newest first), built in memory rather than read
+    from the database."""
+    rng = random.Random(seed)
+    start = timezone.now()
+    rows = []
+    for pk in range(count, 0, -1):
+        sport = rng.choice(SPORTS)
+        located = rng.random() < 0.8
+        gear_id = "b1" if "Ride" in sport else "g1" if rng.random() < 0.5 else None
+        values = {
+            'id': pk, 'name': f"{sport} {pk}", 'start_date': start - datetime.timedelta(hours=pk * 7),
+            'sport_type': sport, 'distance': rng.uniform(1000, 80000), 'moving_time': rng.randrange(600, 20000),
+            'total_elevation_gain': rng.uniform(0, 1500), 'max_speed': rng.uniform(2, 20),
+            'average_heartrate': rng.uniform(100, 170) if rng.random() < 0.7 else None,
+            'calories': rng.randrange(2000), 'kudos_count': rng.randrange(30), 'comment_count': rng.randrange(5),
+            'pr_count': rng.randrange(3), 'achievement_count': rng.randrange(5),
+            'total_photo_count': rng.randrange(3), 'photo_url': "",
+            'start_lat': 48.7 + rng.uniform(-1, 1) if located else None,
+            'start_lng': 21.2 + rng.uniform(-1, 1) if located else None,
+            'polyline_thumb': "", 'gear_id': gear_id, 'json__best_efforts': [],
+            'gear__brand_name': "Brand", 'gear__model_name': "Model",
+        }
+        # By column name, so a column added to ActivityRow defaults to None here.
+        rows.append(ActivityRow(*(values.get(column) for column in ActivityRow.COLUMNS)))
+    return rows
+
+
+class Timed:
+    """An accumulator whose ``add`` and ``result`` calls add their time to
+    ``elapsed[name]``."""
+
+    def __init__(self, accumulator, elapsed, name):
+        self.accumulator, self.elapsed, self.name = accumulator, elapsed, name
+
+    def add(self, a, day):
+        started = time.perf_counter()
+        self.accumulator.add(a, day)
+        self.elapsed[self.name] += time.perf_counter() - started
+
+    def result(self, *args):
+        started = time.perf_counter()
+        result = self.accumulator.result(*args)
+        self.elapsed[self.name] += time.perf_counter() - started
+        return result
+
+
+class Command(BaseCommand):
+    help = ("Times the dashboard sections over synthetic activities: one pass per section "
+            "(the per-section functions), and each section's share of the single-pass pipeline. "
+            "The activities are built in memory, but the gear section reads the Gear table, so "
+            "the database must be migrated.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=50000, help="Number of synthetic activities.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is kept.")
+
+    def handle(self, *args, **options):
+        rows = synthetic_rows(options["count"])
+        repeat = options["repeat"]
+        today = timezone.localdate()
+        filters = ("", "all", "all", "all", None, None)
+
+        def best(fn):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - started)
+            return min(timings) * 1000
+
+        home = helpers.home_location(rows)
+        season = activities = dashboard.filter_activities(rows, *filters)
+        # Each section as its own pass, keyed like the single pass's accumulators
+        # (dashboard.Sections), plus the map markers, which the page leaves to the map.
+        separate = {
+            "filter": lambda: dashboard.filter_activities(rows, *filters),
+            "home": lambda: helpers.home_location(rows),
+            "stats": lambda: dashboard.totals(activities),
+            "aoty": lambda: dashboard.activity_of_year(activities, "all", today),
+            "trends": lambda: analytics.trends(activities, today),
+            "calendar": lambda: analytics.activity_calendar(activities, today),
+            "training_load": lambda: rolling.training_load(activities, today),
+            "gear": lambda: gear.dashboard_sections(activities, True),
+            "numbers": lambda: analytics.by_the_numbers(activities),
+            "records": lambda: analytics.records(dashboard.filter_activities(rows, "", "all", "all", "all"), home),
+            "run_perf": lambda: analytics.run_performance(season),
+            "map_data": lambda: analytics.map_data(rows),
+        }
+        fused = best(lambda: dashboard.sections(rows, *filters, today))
+        shares = self.shares(rows, filters, today)
+
+        self.stdout.write(f"{len(rows)} activities, best of {repeat} runs (ms)")
+        self.stdout.write(f"{'section':<16}{'one pass each':>14}{'single pass':>13}")
+        total = 0.0
+        for name, fn in separate.items():
+            elapsed = best(fn)
+            total += elapsed
+            share = f"{fused * shares[name]:>13.1f}" if name in shares else f"{'-':>13}"
+            self.stdout.write(f"{name:<16}{elapsed:>14.1f}{share}")
+        self.stdout.write(f"{'total':<16}{total:>14.1f}{fused:>13.1f}")
+
+    def shares(self, rows, filters, today):
+        """Each accumulator's share of one ``dashboard.sections`` pass (the home estimate's
+        as ``home``), and the pass's own (dates and filter matches) as ``filter``. Timing
+        every call adds overhead, so the shares are fractions of the timed pass, to be
+        scaled to an untimed one."""
+        elapsed = {}
+
+        def timed(name, accumulator):
+            elapsed[name] = 0.0
+            return Timed(accumulator, elapsed, name)
+
+        class TimedSections(dashboard.Sections):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.accumulators = {name: timed(name, acc) for name, acc in self.accumulators.items()}
+                self.season = [acc for name, acc in self.accumulators.items() if name in dashboard.SEASON_SECTIONS]
+                self.filtered = [acc for name, acc in self.accumulators.items()
+                                 if name not in dashboard.SEASON_SECTIONS]
+
+        home_location = helpers.HomeLocation
+        started = time.perf_counter()
+        with mock.patch.object(dashboard, "Sections", TimedSections), \
+                mock.patch.object(helpers, "HomeLocation", lambda: timed("home", home_location())):
+            dashboard.sections(rows, *filters, today)
+        whole = time.perf_counter() - started
+        shares = {name: spent / whole for name, spent in elapsed.items()}
+        shares["filter"] = 1 - sum(shares.values())
+        return shares
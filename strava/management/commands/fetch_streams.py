@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from strava.api import StravaApi
+from strava.models import Activity, Athlete
+from strava.services import sync
+
+
+class Command(BaseCommand):
+    help = "Fetches the streams (time, position, altitude, heart rate, …) of stored activities still without them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--athlete", type=int,
+            help="Only fetch this athlete's activities (by Strava id).",
+        )
+        parser.add_argument(
+            "--limit", type=int,
+            help="Stop after this many activities (each is one API request).",
+        )
+
+    def handle(self, *args, **options):
+        # One request per activity, newest first, each through the API client's rate
+        # limiter: a long history is spread over as many limit windows as it needs, and
+        # an interrupted run resumes where it stopped.
+        athletes = Athlete.objects.connected()
+        if options["athlete"]:
+            athletes = athletes.filter(pk=options["athlete"])
+
+        count, limit = 0, options["limit"]
+        fetched = set()
+        for athlete in athletes:
+            api = StravaApi(athlete)
+            missing = Activity.objects.for_athlete(athlete).filter(streams__isnull=True).order_by("-start_date")
+            for activity in missing.iterator():
+                if limit is not None and count >= limit:
+                    break
+                stream = sync.activity_fetch_streams(activity, api=api)
+                count += 1
+                fetched.add(athlete.pk)
+                kinds = ", ".join(stream.kinds) or "none"
+                self.stdout.write(f"{activity.pk} ({activity}): {stream.points} points ({kinds})")
+        # The streams come with curves, which the dashboard shows.
+        sync.data_changed(*fetched)
+        self.stdout.write(self.style.SUCCESS(f"Fetched the streams of {count} activities."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from strava import geocode
+from strava.models import Activity
+from strava.services import sync
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Fills in the start country and region (offline reverse geocoding) of stored activities"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Geocode every activity with a start point, not only those still without a country.",
+        )
+
+    def handle(self, *args, **options):
+        activities = Activity.objects.filter(start_lat__isnull=False, start_lng__isnull=False)
+        if not options["all"]:
+            activities = activities.filter(country="")
+
+        batch, athletes, count = [], set(), 0
+        for activity in activities.only("pk", "athlete_id", "start_lat", "start_lng").iterator(chunk_size=BATCH_SIZE):
+            activity.country, activity.region = geocode.locate(activity.start_lat, activity.start_lng)
+            batch.append(activity)
+            athletes.add(activity.athlete_id)
+            if len(batch) == BATCH_SIZE:
+                count += self._save(batch)
+        count += self._save(batch)
+
+        sync.data_changed(*athletes)
+        self.stdout.write(self.style.SUCCESS(f"Geocoded the starts of {count} activities."))
+
+    @staticmethod
+    def _save(batch):
+        # bulk_update skips Activity.save, so the columns are derived above.
+        Activity.objects.bulk_update(batch, ["country", "region"])
+        saved = len(batch)
+        batch.clear()
+        return saved
@@ -2,15 +2,36 @@ import logging
 
 import os
 import json
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
+from strava import caching
 from strava.api import StravaApi
 from strava.models import Activity, Athlete
-from strava.services import sync
+from strava.services import bases, curves, explorer, fitness, routes, sync
 
 logger = logging.getLogger("file")
 
 
+class Touched:
+    """What a batch of activity writes touched, refreshed once after it rather than after
+    each activity: the gear used before and after each write (its statistics), the start
+    cells (services.bases) and the start dates (services.fitness, from the earliest)."""
+
+    def __init__(self):
+        self.gear, self.cells, self.starts = set(), set(), set()
+
+    def add(self, activity, previous_gear_id, previous_cell, previous_start):
+        self.gear |= {gear_id for gear_id in (previous_gear_id, activity.gear_id) if gear_id}
+        self.cells |= {previous_cell, activity.grid_cell} - {None}
+        self.starts |= {previous_start, activity.start_date} - {None}
+
+    def refresh(self, athlete_id):
+        sync.gear_refresh_stats(*self.gear)
+        bases.record_batch(athlete_id, self.cells, min(self.starts, default=None))
+        fitness.refresh(athlete_id, *self.starts)
+
+
 class Command(BaseCommand):
     help = "Reads athlete data from Strava"
 
@@ -41,29 +62,59 @@ class Command(BaseCommand):
 
         for athlete in athletes:
             api = StravaApi(athlete)
-            # Refresh the athlete profile (nav name/avatar/counts) on every import.
-            Athlete.store(api.get_athlete())
+            # Refresh the athlete profile (nav name/avatar/counts) on every import. The
+            # power-based training loads are relative to its FTP: a new one recomputes them.
+            profile = Athlete.store(api.get_athlete())
+            if profile.ftp != athlete.ftp:
+                fitness.rebuild(profile)
             latest = Activity.objects.for_athlete(athlete).order_by('-start_date').first()
             after = latest.start_date if latest else None
+            touched = Touched()
             for summary in api.get_activities(after=after):
-                self.create_activity_from_json(api.get_activity(summary['id']), athlete, api)
+                self.create_activity_from_json(api.get_activity(summary['id']), touched, athlete, api)
+            # Gear statistics, start cells and the training-load series are refreshed once
+            # per athlete for everything the batch touched, not after each activity: a
+            # first import comes newest first, and each older activity would recompute the
+            # whole series after it.
+            touched.refresh(athlete.pk)
+            # Retire the athlete's cached pages and recompute the unfiltered dashboard, so
+            # the next visit doesn't pay for it.
+            sync.data_changed(athlete.pk)
+            caching.warm(athlete)
 
     def create_activities(self, activities, athlete=None):
+        touched = Touched()
         for activity in activities:
-            self.create_activity_from_json(activity, athlete)
+            self.create_activity_from_json(activity, touched, athlete)
+        touched.refresh(athlete and athlete.pk)
+        sync.data_changed(athlete and athlete.pk)
 
-    def create_activity_from_json(self, json_data, athlete=None, api=None):
+    def create_activity_from_json(self, json_data, touched, athlete=None, api=None):
+        """Store one activity payload and return it. What the write touched is added to
+        ``touched`` for the caller to refresh once per batch (see ``Touched``)."""
         data = Activity.read_json(json_data)
         data['json'] = json_data
         data['athlete'] = athlete
 
+        previous_gear_id, previous_cell, previous_start = (
+            Activity.objects.filter(id=json_data["id"]).values_list('gear_id', 'grid_cell', 'start_date').first()
+            or (None, None, None))
         sync.gear_ensure(gear_id=data.get('gear_id'), api=api, athlete=athlete)
         activity, created = Activity.objects.update_or_create(
             id=json_data["id"],
             defaults=data,
         )
 
+        explorer.record(activity)
+        routes.record(activity)
+        curves.record(activity)
+        touched.add(activity, previous_gear_id, previous_cell, previous_start)
+        # A new activity's streams come with it; those stored before are backfilled by
+        # fetch_streams. One more API request per activity, hence the opt-out.
+        if created and api is not None and getattr(settings, 'STRAVA_IMPORT_STREAMS', True):
+            sync.activity_fetch_streams(activity, api=api)
         if created:
             logger.info(f"Added: {activity}")
         else:
             logger.info(f"Skipped (exists): {activity}")
+        return activity
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from strava.models import Athlete
+from strava.services import bases, sync
+
+
+class Command(BaseCommand):
+    help = "Recounts each athlete's start-location index, home and activity distances from home"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--athlete", type=int,
+            help="Only rebuild this athlete's index (by Strava id).",
+        )
+
+    def handle(self, *args, **options):
+        athletes = Athlete.objects.all()
+        if options["athlete"]:
+            athletes = athletes.filter(pk=options["athlete"])
+
+        for athlete in athletes:
+            count = bases.rebuild(athlete)
+            self.stdout.write(f"{athlete.pk} ({athlete}): {count} start cells")
+        sync.data_changed(*(athlete.pk for athlete in athletes))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the start-location index of {len(athletes)} athletes."))
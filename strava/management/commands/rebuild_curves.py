@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from strava.models import Athlete
+from strava.services import curves, sync
+
+
+class Command(BaseCommand):
+    help = "Recomputes each athlete's mean-maximal curves from their stored streams, and the season envelopes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--athlete", type=int,
+            help="Only rebuild this athlete's curves (by Strava id).",
+        )
+
+    def handle(self, *args, **options):
+        athletes = Athlete.objects.all()
+        if options["athlete"]:
+            athletes = athletes.filter(pk=options["athlete"])
+
+        for athlete in athletes:
+            count = curves.rebuild(athlete)
+            self.stdout.write(f"{athlete.pk} ({athlete}): {count} activity curves")
+        sync.data_changed(*(athlete.pk for athlete in athletes))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the curves of {len(athletes)} athletes."))
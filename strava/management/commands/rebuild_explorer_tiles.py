@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from strava.models import Athlete
+from strava.services import explorer, sync
+
+
+class Command(BaseCommand):
+    help = "Rebuilds each athlete's explorer-tile index (visited tiles and their first visits) from the routes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--athlete", type=int,
+            help="Only rebuild this athlete's index (by Strava id).",
+        )
+
+    def handle(self, *args, **options):
+        athletes = Athlete.objects.all()
+        if options["athlete"]:
+            athletes = athletes.filter(pk=options["athlete"])
+
+        for athlete in athletes:
+            count = explorer.rebuild(athlete)
+            self.stdout.write(f"{athlete.pk} ({athlete}): {count} tiles")
+        sync.data_changed(*(athlete.pk for athlete in athletes))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the explorer tiles of {len(athletes)} athletes."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from strava.models import Gear
+from strava.services import sync
+
+
+class Command(BaseCommand):
+    help = "Verifies or rebuilds the denormalised gear usage statistics from the activities"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report gear whose stored statistics are out of date; exit non-zero if any are.",
+        )
+
+    def handle(self, *args, **options):
+        stale = Gear.objects.stale_stats()
+        for gear, diff in stale:
+            details = ", ".join(f"{field}: {stored} != {actual}" for field, (stored, actual) in diff.items())
+            self.stdout.write(f"{gear.pk} ({gear}): {details}")
+
+        if options["check"]:
+            if stale:
+                raise CommandError(f"{len(stale)} gear with out-of-date statistics.")
+            self.stdout.write(self.style.SUCCESS("Gear statistics are up to date."))
+            return
+
+        Gear.objects.filter(pk__in=[gear.pk for gear, _diff in stale]).refresh_stats()
+        sync.data_changed(*(gear.athlete_id for gear, _diff in stale))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics for {len(stale)} gear."))
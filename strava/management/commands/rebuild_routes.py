@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from strava.models import Athlete
+from strava.services import routes, sync
+
+
+class Command(BaseCommand):
+    help = "Regroups each athlete's activities into repeat routes (fingerprints and LSH buckets)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--athlete", type=int,
+            help="Only regroup this athlete's activities (by Strava id).",
+        )
+
+    def handle(self, *args, **options):
+        athletes = Athlete.objects.all()
+        if options["athlete"]:
+            athletes = athletes.filter(pk=options["athlete"])
+
+        for athlete in athletes:
+            count = routes.rebuild(athlete)
+            self.stdout.write(f"{athlete.pk} ({athlete}): {count} routes")
+        sync.data_changed(*(athlete.pk for athlete in athletes))
+        self.stdout.write(self.style.SUCCESS(f"Regrouped the routes of {len(athletes)} athletes."))
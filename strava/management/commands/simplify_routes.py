@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from strava import helpers
+from strava.models import Activity
+from strava.services import sync
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Fills in the simplified route polylines (map zoom levels, card thumbnail) of stored activities"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Recompute every activity's simplified routes, not only those still missing them.",
+        )
+
+    def handle(self, *args, **options):
+        activities = Activity.objects.exclude(polyline="")
+        if not options["all"]:
+            activities = activities.filter(polyline_low="")
+
+        batch, athletes, count = [], set(), 0
+        for activity in activities.only("pk", "athlete_id", "polyline").iterator(chunk_size=BATCH_SIZE):
+            for field, value in helpers.simplified_routes(activity.polyline).items():
+                setattr(activity, field, value)
+            batch.append(activity)
+            athletes.add(activity.athlete_id)
+            if len(batch) == BATCH_SIZE:
+                count += self._save(batch)
+        count += self._save(batch)
+
+        sync.data_changed(*athletes)
+        self.stdout.write(self.style.SUCCESS(f"Simplified the routes of {count} activities."))
+
+    @staticmethod
+    def _save(batch):
+        # bulk_update skips Activity.save, so the columns are derived above.
+        Activity.objects.bulk_update(batch, Activity.ROUTE_FIELDS)
+        saved = len(batch)
+        batch.clear()
+        return saved
@@ -0,0 +1,71 @@
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+
+
+def backfill_gear_stats(apps, schema_editor):
+    """Populate the new denormalised usage statistics from each gear's activities, so
+    existing rows match what the ingest paths now maintain (GearQuerySet.refresh_stats)."""
+    Activity = apps.get_model("strava", "Activity")
+    Gear = apps.get_model("strava", "Gear")
+    public = Q(is_private=False)
+    rows = (
+        Activity.objects.exclude(gear_id=None).order_by().values("gear_id").annotate(
+            public_distance=Sum("distance", filter=public),
+            total_distance=Sum("distance"),
+            public_activity_count=Count("pk", filter=public),
+            total_activity_count=Count("pk"),
+            first_used=Min("start_date", filter=public),
+            last_used=Max("start_date", filter=public),
+        )
+    )
+    stats = {row.pop("gear_id"): row for row in rows}
+    batch = []
+    for gear in Gear.objects.filter(pk__in=stats).iterator():
+        for field, value in stats[gear.pk].items():
+            setattr(gear, field, value)
+        # A gear used only by private activities has no public distance sum.
+        gear.public_distance = gear.public_distance or 0
+        batch.append(gear)
+    if batch:
+        Gear.objects.bulk_update(batch, list(stats[batch[0].pk]), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0012_activity_is_private"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gear",
+            name="public_distance",
+            field=models.FloatField(default=0, verbose_name="public distance"),
+        ),
+        migrations.AddField(
+            model_name="gear",
+            name="total_distance",
+            field=models.FloatField(default=0, verbose_name="total distance"),
+        ),
+        migrations.AddField(
+            model_name="gear",
+            name="public_activity_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="public activities"),
+        ),
+        migrations.AddField(
+            model_name="gear",
+            name="total_activity_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="total activities"),
+        ),
+        migrations.AddField(
+            model_name="gear",
+            name="first_used",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="first used"),
+        ),
+        migrations.AddField(
+            model_name="gear",
+            name="last_used",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="last used"),
+        ),
+        migrations.RunPython(backfill_gear_stats, migrations.RunPython.noop),
+    ]
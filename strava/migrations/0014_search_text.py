@@ -0,0 +1,66 @@
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _fold(*parts):
+    # Same folding as strava.helpers.search_text (lowercase, diacritics stripped, one part
+    # per line), inlined so the migration doesn't depend on app code.
+    def unaccent(s):
+        normalized = unicodedata.normalize("NFD", s or "")
+        return "".join(c for c in normalized if not unicodedata.combining(c)).lower()
+    return "\n".join(unaccent(part) for part in parts)
+
+
+def backfill_search_text(apps, schema_editor):
+    """Populate the new folded search columns for existing rows (new writes derive them on
+    save)."""
+    for model_name, fields in (("Activity", ("name", "sport_type")), ("Gear", ("brand_name", "model_name"))):
+        Model = apps.get_model("strava", model_name)
+        batch = []
+        for obj in Model.objects.only("pk", *fields).iterator():
+            obj.search_text = _fold(*(getattr(obj, f) for f in fields))
+            batch.append(obj)
+        if batch:
+            Model.objects.bulk_update(batch, ["search_text"], batch_size=500)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """PostgreSQL: a pg_trgm GIN index per search column, serving ``LIKE '%token%'``.
+    SQLite's FTS5 index is installed after migrate instead (see strava.search)."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table in ("strava_activity", "strava_gear"):
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_search_trgm ON {table} USING gin (search_text gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in ("strava_activity", "strava_gear"):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0013_gear_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="search_text",
+            field=models.TextField(blank=True, default="", editable=False, verbose_name="search text"),
+        ),
+        migrations.AddField(
+            model_name="gear",
+            name="search_text",
+            field=models.TextField(blank=True, default="", editable=False, verbose_name="search text"),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
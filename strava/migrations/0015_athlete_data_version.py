@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0014_search_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="athlete",
+            name="data_version",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="data version"),
+        ),
+    ]
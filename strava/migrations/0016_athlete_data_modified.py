@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0015_athlete_data_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="athlete",
+            name="data_modified",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="data modified"),
+        ),
+    ]
@@ -0,0 +1,101 @@
+from django.db import migrations, models
+
+GRID_BITS = 16
+
+
+def _decode(encoded):
+    # Same decoding as strava.helpers.decode_polyline, inlined so the migration doesn't
+    # depend on app code.
+    points, index, lat, lng = [], 0, 0, 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / 1e5, lng / 1e5))
+    return points
+
+
+def _grid_cell(lat, lng):
+    # Same cell as strava.helpers.grid_cell.
+    size = 1 << GRID_BITS
+    row = min(size - 1, max(0, int((lat + 90) / 180 * size)))
+    col = min(size - 1, max(0, int((lng + 180) / 360 * size)))
+    code = 0
+    for bit in range(GRID_BITS):
+        code |= ((col >> bit) & 1) << (2 * bit) | ((row >> bit) & 1) << (2 * bit + 1)
+    return code
+
+
+def backfill_map_grid(apps, schema_editor):
+    """Populate the route boxes and grid cells of existing rows (new writes derive them on
+    save)."""
+    Activity = apps.get_model("strava", "Activity")
+    fields = ["min_lat", "min_lng", "max_lat", "max_lng", "grid_cell"]
+    batch = []
+    rows = Activity.objects.exclude(start_lat=None, polyline="").only("pk", "start_lat", "start_lng", "polyline")
+    for activity in rows.iterator():
+        points = _decode(activity.polyline) if activity.polyline else []
+        if activity.start_lat is not None and activity.start_lng is not None:
+            points.append((activity.start_lat, activity.start_lng))
+            activity.grid_cell = _grid_cell(activity.start_lat, activity.start_lng)
+        if points:
+            lats, lngs = zip(*points)
+            activity.min_lat, activity.min_lng, activity.max_lat, activity.max_lng = (
+                min(lats), min(lngs), max(lats), max(lngs))
+        batch.append(activity)
+    if batch:
+        Activity.objects.bulk_update(batch, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0016_athlete_data_modified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="min_lat",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="south"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="min_lng",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="west"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="max_lat",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="north"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="max_lng",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="east"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="grid_cell",
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name="grid cell"),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["athlete", "min_lat", "max_lat"], name="strava_activity_bbox"),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["athlete", "grid_cell"], name="strava_activity_grid"),
+        ),
+        migrations.RunPython(backfill_map_grid, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+# Existing rows are filled in by ``manage.py simplify_routes``; new and re-imported
+# activities derive the columns on save.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0017_activity_map_grid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="polyline_low",
+            field=models.TextField(blank=True, default="", editable=False, verbose_name="polyline (low zoom)"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="polyline_medium",
+            field=models.TextField(blank=True, default="", editable=False, verbose_name="polyline (medium zoom)"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="polyline_thumb",
+            field=models.TextField(blank=True, default="", editable=False, verbose_name="polyline (thumbnail)"),
+        ),
+    ]
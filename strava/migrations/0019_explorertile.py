@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The index is filled in for activities already stored by ``manage.py
+# rebuild_explorer_tiles``; every activity written afterwards updates it.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0018_activity_simplified_polylines"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExplorerTile",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("x", models.PositiveIntegerField(verbose_name="x")),
+                ("y", models.PositiveIntegerField(verbose_name="y")),
+                ("visited", models.DateTimeField(verbose_name="first visited")),
+                ("activity", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="explorer_tiles",
+                                               to="strava.activity", verbose_name="first visit")),
+                ("athlete", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="explorer_tiles",
+                                              to="strava.athlete")),
+            ],
+            options={
+                "verbose_name": "explorer tile",
+                "verbose_name_plural": "explorer tiles",
+                "constraints": [
+                    models.UniqueConstraint(fields=("athlete", "x", "y"), name="one_explorer_tile_per_athlete"),
+                ],
+            },
+        ),
+    ]
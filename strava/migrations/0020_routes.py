@@ -0,0 +1,54 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Activities already stored are matched into routes by ``manage.py rebuild_routes``;
+# every activity written afterwards is matched as it's stored.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0019_explorertile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Route",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=100, verbose_name="name")),
+                ("sport_type", models.CharField(choices=[("AlpineSki", "Alpine Ski"), ("BackcountrySki", "Backcountry Ski"), ("Badminton", "Badminton"), ("Canoeing", "Canoeing"), ("Crossfit", "Crossfit"), ("EBikeRide", "E-Bike Ride"), ("Elliptical", "Elliptical"), ("EMountainBikeRide", "E-Mountain Bike Ride"), ("Golf", "Golf"), ("GravelRide", "Gravel Ride"), ("Handcycle", "Handcycle"), ("HighIntensityIntervalTraining", "High-Intensity Interval Training"), ("Hike", "Hike"), ("IceSkate", "Ice Skate"), ("InlineSkate", "Inline Skate"), ("Kayaking", "Kayaking"), ("Kitesurf", "Kitesurf"), ("MountainBikeRide", "Mountain Bike Ride"), ("NordicSki", "Nordic Ski"), ("Pickleball", "Pickleball"), ("Pilates", "Pilates"), ("Racquetball", "Racquetball"), ("Ride", "Ride"), ("RockClimbing", "Rock Climbing"), ("RollerSki", "Roller Ski"), ("Rowing", "Rowing"), ("Run", "Run"), ("Sail", "Sail"), ("Skateboard", "Skateboard"), ("Snowboard", "Snowboard"), ("Snowshoe", "Snowshoe"), ("Soccer", "Soccer"), ("Squash", "Squash"), ("StairStepper", "Stair Stepper"), ("StandUpPaddling", "Stand Up Paddling"), ("Surfing", "Surfing"), ("Swim", "Swim"), ("TableTennis", "Table Tennis"), ("Tennis", "Tennis"), ("TrailRun", "Trail Run"), ("Velomobile", "Velomobile"), ("VirtualRide", "Virtual Ride"), ("VirtualRow", "Virtual Row"), ("VirtualRun", "Virtual Run"), ("Walk", "Walk"), ("WeightTraining", "Weight Training"), ("Wheelchair", "Wheelchair"), ("Windsurf", "Windsurf"), ("Workout", "Workout"), ("Yoga", "Yoga")], max_length=29, verbose_name="sport type")),
+                ("distance", models.FloatField(verbose_name="distance")),
+                ("signature", models.JSONField(verbose_name="signature")),
+                ("athlete", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="routes",
+                                              to="strava.athlete")),
+            ],
+            options={
+                "verbose_name": "route",
+                "verbose_name_plural": "routes",
+            },
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="route",
+            field=models.ForeignKey(blank=True, default=None, editable=False, null=True,
+                                    on_delete=django.db.models.deletion.SET_NULL, related_name="activities",
+                                    to="strava.route"),
+        ),
+        migrations.CreateModel(
+            name="RouteBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("band", models.PositiveSmallIntegerField(verbose_name="band")),
+                ("bucket", models.BigIntegerField(verbose_name="bucket")),
+                ("athlete", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+",
+                                              to="strava.athlete")),
+                ("route", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="buckets",
+                                            to="strava.route")),
+            ],
+            options={
+                "verbose_name": "route bucket",
+                "verbose_name_plural": "route buckets",
+                "indexes": [models.Index(fields=["athlete", "band", "bucket"], name="strava_route_bucket")],
+            },
+        ),
+    ]
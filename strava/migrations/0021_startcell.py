@@ -0,0 +1,51 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+GRID_BITS = 16
+HOME_GRID_LEVEL = 15
+
+
+def backfill_start_cells(apps, schema_editor):
+    """Count the start cells of existing public activities (new writes update them)."""
+    Activity = apps.get_model("strava", "Activity")
+    StartCell = apps.get_model("strava", "StartCell")
+    cell = models.ExpressionWrapper(models.F("grid_cell") / 4 ** (GRID_BITS - HOME_GRID_LEVEL),
+                                    output_field=models.BigIntegerField())
+    rows = (
+        Activity.objects.filter(is_private=False, athlete__isnull=False, grid_cell__isnull=False)
+        .order_by().values("athlete_id", cell=cell)
+        .annotate(count=models.Count("pk"), lat=models.Avg("start_lat"), lng=models.Avg("start_lng"),
+                  last=models.Max("start_date"))
+    )
+    StartCell.objects.bulk_create([StartCell(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0020_routes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StartCell",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("cell", models.BigIntegerField(verbose_name="cell")),
+                ("count", models.PositiveIntegerField(verbose_name="starts")),
+                ("lat", models.FloatField(verbose_name="latitude")),
+                ("lng", models.FloatField(verbose_name="longitude")),
+                ("last", models.DateTimeField(verbose_name="last start")),
+                ("athlete", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="start_cells",
+                                              to="strava.athlete")),
+            ],
+            options={
+                "verbose_name": "start cell",
+                "verbose_name_plural": "start cells",
+                "constraints": [
+                    models.UniqueConstraint(fields=("athlete", "cell"), name="one_start_cell_per_athlete"),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_start_cells, migrations.RunPython.noop),
+    ]
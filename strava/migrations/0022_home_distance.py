@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+# Each athlete's home and the distances from it are set by the next write, or at once by
+# ``manage.py rebuild_bases``; until then they're computed when read.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0021_startcell"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="home_distance",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="distance from home"),
+        ),
+        migrations.AddField(
+            model_name="athlete",
+            name="home_lat",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="home latitude"),
+        ),
+        migrations.AddField(
+            model_name="athlete",
+            name="home_lng",
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name="home longitude"),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["athlete", "home_distance"], name="strava_activity_home"),
+        ),
+    ]
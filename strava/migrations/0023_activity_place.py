@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+# The start countries and regions of stored activities are filled in by
+# ``manage.py geocode_activities`` (new and re-saved activities derive their own).
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0022_home_distance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="country",
+            field=models.CharField(blank=True, default="", editable=False, max_length=2, verbose_name="country"),
+        ),
+        migrations.AddField(
+            model_name="activity",
+            name="region",
+            field=models.CharField(blank=True, default="", editable=False, max_length=100, verbose_name="region"),
+        ),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["athlete", "country", "region"], name="strava_activity_place"),
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Streams are fetched as activities are imported; ``manage.py fetch_streams`` fetches
+# those of activities stored before.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0023_activity_place"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActivityStream",
+            fields=[
+                ("activity", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                                  related_name="streams", serialize=False, to="strava.activity")),
+                ("points", models.PositiveIntegerField(verbose_name="points")),
+                ("time", models.BinaryField(blank=True, null=True, verbose_name="time")),
+                ("latlng", models.BinaryField(blank=True, null=True, verbose_name="position")),
+                ("distance", models.BinaryField(blank=True, null=True, verbose_name="distance")),
+                ("altitude", models.BinaryField(blank=True, null=True, verbose_name="altitude")),
+                ("heartrate", models.BinaryField(blank=True, null=True, verbose_name="heart rate")),
+                ("velocity_smooth", models.BinaryField(blank=True, null=True, verbose_name="speed")),
+                ("watts", models.BinaryField(blank=True, null=True, verbose_name="power")),
+                ("cadence", models.BinaryField(blank=True, null=True, verbose_name="cadence")),
+                ("fetched", models.DateTimeField(auto_now=True, verbose_name="fetched")),
+            ],
+            options={
+                "verbose_name": "activity stream",
+                "verbose_name_plural": "activity streams",
+            },
+        ),
+    ]
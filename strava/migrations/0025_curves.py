@@ -0,0 +1,45 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Curves are computed as streams are fetched; ``manage.py rebuild_curves`` computes those
+# of streams stored before.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0024_activitystream"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActivityCurve",
+            fields=[
+                ("activity", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                                  related_name="curve", serialize=False, to="strava.activity")),
+                ("pace", models.JSONField(blank=True, null=True, verbose_name="pace")),
+                ("power", models.JSONField(blank=True, null=True, verbose_name="power")),
+            ],
+            options={
+                "verbose_name": "activity curve",
+                "verbose_name_plural": "activity curves",
+            },
+        ),
+        migrations.CreateModel(
+            name="CurveEnvelope",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(max_length=5, verbose_name="kind")),
+                ("season", models.PositiveSmallIntegerField(verbose_name="season")),
+                ("values", models.JSONField(verbose_name="values")),
+                ("activities", models.JSONField(verbose_name="activities")),
+                ("athlete", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                              related_name="curve_envelopes", to="strava.athlete")),
+            ],
+            options={
+                "verbose_name": "curve envelope",
+                "verbose_name_plural": "curve envelopes",
+                "constraints": [models.UniqueConstraint(fields=("athlete", "kind", "season"),
+                                                        name="one_curve_envelope_per_season")],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_power(apps, schema_editor):
+    """Promote the power-meter normalised power of stored activities and the athletes'
+    FTP from their stored JSON, as read_json now does on import."""
+    Activity = apps.get_model("strava", "Activity")
+    Athlete = apps.get_model("strava", "Athlete")
+    batch = []
+    for a in Activity.objects.only("pk", "json").iterator():
+        data = a.json or {}
+        if data.get("device_watts") and data.get("weighted_average_watts"):
+            a.weighted_average_watts = data["weighted_average_watts"]
+            batch.append(a)
+    Activity.objects.bulk_update(batch, ["weighted_average_watts"], batch_size=500)
+    for athlete in Athlete.objects.all():
+        ftp = (athlete.json or {}).get("ftp")
+        if ftp:
+            Athlete.objects.filter(pk=athlete.pk).update(ftp=ftp)
+
+
+# The series is computed by ``manage.py rebuild_training_load``; writes keep it current.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0025_curves"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="weighted_average_watts",
+            field=models.FloatField(blank=True, null=True, verbose_name="weighted average power"),
+        ),
+        migrations.AddField(
+            model_name="athlete",
+            name="ftp",
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name="FTP"),
+        ),
+        migrations.RunPython(backfill_power, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="TrainingDay",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField(verbose_name="day")),
+                ("load", models.FloatField(verbose_name="load")),
+                ("fitness", models.FloatField(verbose_name="fitness")),
+                ("fatigue", models.FloatField(verbose_name="fatigue")),
+                ("athlete", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                              related_name="training_days", to="strava.athlete")),
+            ],
+            options={
+                "verbose_name": "training day",
+                "verbose_name_plural": "training days",
+                "constraints": [models.UniqueConstraint(fields=("athlete", "day"),
+                                                        name="one_training_day_per_athlete")],
+            },
+        ),
+    ]
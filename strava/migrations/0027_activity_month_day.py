@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_month_day(apps, schema_editor):
+    """Derive the month-day key of stored activities from their local start date, as
+    saving one now does."""
+    Activity = apps.get_model("strava", "Activity")
+    tz = timezone.get_current_timezone()
+    batch = []
+    for a in Activity.objects.only("pk", "start_date").iterator():
+        day = timezone.localtime(a.start_date, tz)
+        a.month_day = day.month * 100 + day.day
+        batch.append(a)
+    Activity.objects.bulk_update(batch, ["month_day"], batch_size=500)
+
+
+# Backfilled here: the key follows from the start date alone.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("strava", "0026_training_load"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activity",
+            name="month_day",
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True,
+                                                   verbose_name="month and day"),
+        ),
+        migrations.RunPython(backfill_month_day, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(fields=["athlete", "month_day"], name="strava_activity_month_day"),
+        ),
+    ]
@@ -2,17 +2,70 @@ from datetime import datetime, timedelta
 
 from django.db import models
 from django.utils import timezone
+from django.utils.encoding import force_str
 from django.utils.translation import gettext_lazy as _
 
+from strava import geocode, helpers, streams
 from strava.choices import SportType
 from strava.consts import BIKE_LIFESPAN_KM, DETAIL_MARKER_FIELDS, GEAR_OLD_DAYS, SHOE_LIFESPAN_KM
 from strava.querysets import ActivityQuerySet, AthleteQuerySet, GearQuerySet
 from strava.sports import is_speed_sport, is_swim_sport, map_sport_type_for
 
 
+def _search_text(instance):
+  # Its SEARCH_FIELDS folded for search (strava.search).
+  return {'search_text': helpers.search_text(*(getattr(instance, f) for f in instance.SEARCH_FIELDS))}
+
+
+def _place(instance):
+  # Its route box and grid cell (the map's viewport queries) and its start's country and
+  # region (strava.geocode).
+  bounds = helpers.route_bounds(instance.polyline, instance.start_lat, instance.start_lng)
+  has_start = instance.start_lat is not None and instance.start_lng is not None
+  country, region = geocode.locate(instance.start_lat, instance.start_lng)
+  return {
+    **dict(zip(('min_lat', 'min_lng', 'max_lat', 'max_lng'), bounds or (None,) * 4)),
+    'grid_cell': helpers.grid_cell(instance.start_lat, instance.start_lng) if has_start else None,
+    'country': country,
+    'region': region,
+  }
+
+
+def _month_day(instance):
+  # helpers.month_day of its local start date.
+  return {'month_day': helpers.month_day(helpers.local_date(instance)) if instance.start_date else None}
+
+
+def _simplified_routes(instance):
+  # Its polyline simplified per zoom (helpers.simplified_routes).
+  return helpers.simplified_routes(instance.polyline)
+
+
+def _derive(instance, save_kwargs):
+  """Recompute ``instance``'s derived columns before a save. Each ``(sources, derive)``
+  of its DERIVED maps the fields it reads to a function returning the columns it sets.
+  A partial save (``update_fields``) recomputes only the columns whose sources it
+  touches, widened to include them."""
+  update_fields = save_kwargs.get('update_fields')
+  for sources, derive in instance.DERIVED:
+    if update_fields is not None and not set(update_fields) & set(sources):
+      continue
+    derived = derive(instance)
+    for field, value in derived.items():
+      setattr(instance, field, value)
+    if update_fields is not None:
+      update_fields = {*update_fields, *derived}
+  if update_fields is not None:
+    save_kwargs['update_fields'] = update_fields
+
+
 class Activity(models.Model):
   name = models.CharField(_("name"), max_length=100)
   start_date = models.DateTimeField(_("start date"))
+  # The local start date's month and day as month × 100 + day (1231 for Dec 31), derived
+  # on save and indexed so "on this day" in past years is a lookup rather than a scan
+  # over every start date (see ActivityQuerySet.on_this_day).
+  month_day = models.PositiveSmallIntegerField(_("month and day"), null=True, blank=True, editable=False)
   sport_type = models.CharField(_("sport type"), max_length=29, choices=SportType.choices)
   # Metres. Stored as a float (Strava sends a float and every consumer works in floats);
   # no exact-decimal arithmetic is needed, so a DecimalField only added casting noise.
@@ -24,6 +77,9 @@ class Activity(models.Model):
   max_speed = models.FloatField(_("max speed"), null=True, blank=True)
   average_heartrate = models.FloatField(_("average heartrate"), null=True, blank=True)
   max_heartrate = models.FloatField(_("max heartrate"), null=True, blank=True)
+  # Normalised power from a power meter (Strava's estimates aren't kept): the power-based
+  # training load (see services.fitness).
+  weighted_average_watts = models.FloatField(_("weighted average power"), null=True, blank=True)
   calories = models.PositiveSmallIntegerField(_("calories"), null=True, blank=True)
   kudos_count = models.PositiveIntegerField(_("kudos"), default=0)
   comment_count = models.PositiveIntegerField(_("comments"), default=0)
@@ -34,6 +90,28 @@ class Activity(models.Model):
   start_lat = models.FloatField(_("start latitude"), null=True, blank=True)
   start_lng = models.FloatField(_("start longitude"), null=True, blank=True)
   polyline = models.TextField(_("polyline"), blank=True, default="")
+  # Douglas–Peucker-simplified copies of the polyline, derived on save: the map's routes
+  # at low and medium zoom (see consts.ROUTE_TOLERANCES) and the cards' route thumbnail,
+  # so neither ships nor decodes the full-resolution route.
+  polyline_low = models.TextField(_("polyline (low zoom)"), blank=True, default="", editable=False)
+  polyline_medium = models.TextField(_("polyline (medium zoom)"), blank=True, default="", editable=False)
+  polyline_thumb = models.TextField(_("polyline (thumbnail)"), blank=True, default="", editable=False)
+  # The route's bounding box (with the start point) and the start point's cell in the
+  # map's spatial grid (helpers.grid_cell), derived on save for the map's viewport
+  # queries: the activities in view, clustered by cell (see ActivityQuerySet.in_bbox).
+  min_lat = models.FloatField(_("south"), null=True, blank=True, editable=False)
+  min_lng = models.FloatField(_("west"), null=True, blank=True, editable=False)
+  max_lat = models.FloatField(_("north"), null=True, blank=True, editable=False)
+  max_lng = models.FloatField(_("east"), null=True, blank=True, editable=False)
+  grid_cell = models.BigIntegerField(_("grid cell"), null=True, blank=True, editable=False)
+  # Where the activity starts, reverse geocoded offline on save (strava.geocode): an ISO
+  # 3166-1 alpha-2 code and a region name, blank when unknown.
+  country = models.CharField(_("country"), max_length=2, blank=True, default="", editable=False)
+  region = models.CharField(_("region"), max_length=100, blank=True, default="", editable=False)
+  # Kilometres from the athlete's home (Athlete.home_lat/home_lng) to the start point,
+  # stored so "furthest from home" is a lookup. Kept by services.bases, which recomputes
+  # every activity's when the home moves.
+  home_distance = models.FloatField(_("distance from home"), null=True, blank=True, editable=False)
   is_detailed = models.BooleanField(_("detailed"), default=False)
   # Marked private by the athlete on Strava. Hidden from every public-facing surface
   # (lists, map, records, statistics) via ActivityQuerySet.public(); the admin still
@@ -45,18 +123,47 @@ class Activity(models.Model):
   # have none until the next import backfills them (see import_strava).
   athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE,
                               blank=True, null=True, default=None, related_name="activities")
+  # The repeat route this activity is an attempt of, matched as it's written (see
+  # services.routes). Empty for activities without a public route.
+  route = models.ForeignKey("Route", on_delete=models.SET_NULL, blank=True, null=True, default=None,
+                            editable=False, related_name="activities")
+  # Name and sport type folded for search (lowercased, accents stripped), derived on save
+  # and indexed per database backend — see strava.search and ActivityQuerySet.search.
+  search_text = models.TextField(_("search text"), blank=True, default="", editable=False)
   json = models.JSONField()
   objects = ActivityQuerySet.as_manager()
 
+  SEARCH_FIELDS = ("name", "sport_type")
+  PLACE_FIELDS = ("start_lat", "start_lng", "polyline")
+  ROUTE_FIELDS = ("polyline_low", "polyline_medium", "polyline_thumb")
+  # The columns derived on save, per the fields they're derived from (see _derive).
+  DERIVED = (
+    (SEARCH_FIELDS, _search_text),
+    (PLACE_FIELDS, _place),
+    (("start_date",), _month_day),
+    (("polyline",), _simplified_routes),
+  )
+
   class Meta:
     verbose_name = _("activity")
     verbose_name_plural = _("activities")
     get_latest_by = "start_date"
     ordering = ("-start_date",)
+    indexes = [
+      models.Index(fields=["athlete", "min_lat", "max_lat"], name="strava_activity_bbox"),
+      models.Index(fields=["athlete", "grid_cell"], name="strava_activity_grid"),
+      models.Index(fields=["athlete", "home_distance"], name="strava_activity_home"),
+      models.Index(fields=["athlete", "country", "region"], name="strava_activity_place"),
+      models.Index(fields=["athlete", "month_day"], name="strava_activity_month_day"),
+    ]
 
   def __str__(self):
       return self.name
 
+  def save(self, *args, **kwargs):
+    _derive(self, kwargs)
+    super().save(*args, **kwargs)
+
   def get_absolute_url(self):
     return f'https://strava.com/activities/{self.id}'
 
@@ -82,6 +189,7 @@ class Activity(models.Model):
       'max_speed': json.get('max_speed'),
       'average_heartrate': json.get('average_heartrate'),
       'max_heartrate': json.get('max_heartrate'),
+      'weighted_average_watts': json.get('weighted_average_watts') if json.get('device_watts') else None,
       # calories is a DetailedActivity-only field; Strava sends it as a whole-number float.
       'calories': round(calories) if (calories := json.get('calories')) is not None else None,
       'kudos_count': json.get('kudos_count', 0) or 0,
@@ -185,6 +293,61 @@ class Activity(models.Model):
     return self.json.get('best_efforts') or []
 
 
+class ActivityRow:
+  """A lean, read-only stand-in for ``Activity`` in the analytics services.
+
+  The dashboard and compare pages read a handful of scalar columns from every activity of
+  the athlete; hydrating full model instances (with the ``json`` blob and a joined
+  ``Gear``) for that dominated their memory and build time on long histories. A row is
+  built straight from a ``values_list`` tuple (see ``ActivityQuerySet.rows``): only the
+  best efforts are pulled out of the blob, the gear arrives as its label, and the route is
+  the card thumbnail's simplified copy (``polyline_thumb``). The display properties are
+  the model's own, so the services produce identical results for either.
+  """
+
+  COLUMNS = (
+    'id', 'name', 'start_date', 'sport_type', 'distance', 'moving_time',
+    'total_elevation_gain', 'max_speed', 'average_heartrate', 'calories', 'kudos_count',
+    'comment_count', 'pr_count', 'achievement_count', 'total_photo_count', 'photo_url',
+    'start_lat', 'start_lng', 'home_distance', 'polyline_thumb', 'gear_id', 'json__best_efforts',
+    'gear__brand_name', 'gear__model_name',
+  )
+  __slots__ = COLUMNS[:-3] + ('best_efforts', 'gear')
+
+  def __init__(self, *values):
+    *fields, best_efforts, brand_name, model_name = values
+    for name, value in zip(self.__slots__, fields):
+      setattr(self, name, value)
+    self.best_efforts = best_efforts or []
+    # The gear's display label (``str(Gear)``), or None without gear.
+    self.gear = f'{brand_name} {model_name}' if self.gear_id else None
+
+  def __str__(self):
+    return self.name
+
+  def __repr__(self):
+    return f'<ActivityRow: {self.pk}>'
+
+  @property
+  def pk(self):
+    return self.id
+
+  def get_sport_type_display(self):
+    return force_str(dict(SportType.choices).get(self.sport_type, self.sport_type), strings_only=True)
+
+  get_absolute_url = Activity.get_absolute_url
+  map_sport_type = Activity.map_sport_type
+  distance_km = Activity.distance_km
+  duration = Activity.duration
+  is_speed_sport = Activity.is_speed_sport
+  is_swim_sport = Activity.is_swim_sport
+  pace_parts = Activity.pace_parts
+  pace = Activity.pace
+  elevation = Activity.elevation
+  pb = Activity.pb
+  has_gps = Activity.has_gps
+
+
 class Gear(models.Model):
   GEAR_TYPES = (('bike', _("bike")), ('shoe', _("shoe")))
 
@@ -197,24 +360,46 @@ class Gear(models.Model):
   # The gear's owner. Nullable for the same reason as Activity.athlete (backfilled on import).
   athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE,
                               blank=True, null=True, default=None, related_name="gear")
+  # Usage statistics denormalised from the gear's activities, so the gear page, admin
+  # changelist and dashboard read plain columns instead of aggregating over every activity.
+  # The "public" figures exclude private activities (what the frontend shows); the "total"
+  # ones count everything (what the admin shows). Kept current by the ingest/sync paths via
+  # GearQuerySet.refresh_stats(); `manage.py rebuild_gear_stats` verifies/rebuilds them.
+  public_distance = models.FloatField(_("public distance"), default=0)
+  total_distance = models.FloatField(_("total distance"), default=0)
+  public_activity_count = models.PositiveIntegerField(_("public activities"), default=0)
+  total_activity_count = models.PositiveIntegerField(_("total activities"), default=0)
+  first_used = models.DateTimeField(_("first used"), null=True, blank=True)
+  last_used = models.DateTimeField(_("last used"), null=True, blank=True)
+  # Brand and model folded for search; see Activity.search_text.
+  search_text = models.TextField(_("search text"), blank=True, default="", editable=False)
   json = models.JSONField()
   objects = GearQuerySet.as_manager()
 
+  SEARCH_FIELDS = ("brand_name", "model_name")
+  DERIVED = ((SEARCH_FIELDS, _search_text),)
+
+  STATS_FIELDS = ("public_distance", "total_distance", "public_activity_count",
+                  "total_activity_count", "first_used", "last_used")
+
   def __str__(self):
       return f'{self.brand_name} {self.model_name}'
 
+  def save(self, *args, **kwargs):
+    _derive(self, kwargs)
+    super().save(*args, **kwargs)
+
   @property
   def distance(self):
       # Private activities are excluded from the public gear mileage total.
-      return self.activity_set.public().aggregate(models.Sum('distance'))['distance__sum']
+      return self.public_distance
 
   @property
   def is_old(self):
     # "Last used" ignores private activities, matching what the public gear page shows.
-    last_used = self.activity_set.public().aggregate(models.Max('start_date'))['start_date__max']
-    if last_used is None:
+    if self.last_used is None:
       return True
-    return last_used < timezone.now() - timedelta(days=GEAR_OLD_DAYS)
+    return self.last_used < timezone.now() - timedelta(days=GEAR_OLD_DAYS)
 
   @property
   def lifespan_km(self):
@@ -252,6 +437,8 @@ class Athlete(models.Model):
   country = models.CharField(_("country"), max_length=100, blank=True, default="")
   follower_count = models.PositiveIntegerField(_("followers"), null=True, blank=True)
   friend_count = models.PositiveIntegerField(_("following"), null=True, blank=True)
+  # Functional threshold power, which the power-based training loads are relative to.
+  ftp = models.PositiveSmallIntegerField(_("FTP"), null=True, blank=True)
   # Per-athlete OAuth credentials. Populated by the OAuth connect flow (see strava.views);
   # refreshed access/refresh tokens are written back here after each API call by StravaApi.
   # Blank until the athlete is connected — `import_strava` skips athletes without tokens.
@@ -262,6 +449,16 @@ class Athlete(models.Model):
   # The athlete rendered at the site root. Exactly one row is default (enforced below);
   # the frontend switcher overrides it per request.
   is_default = models.BooleanField(_("default"), default=False)
+  # Bumped on every write to the athlete's activities or gear (import, sync, admin edits;
+  # see sync.data_changed). Part of every cached result's key (strava.caching), so a write
+  # retires the athlete's cached results at once.
+  data_version = models.PositiveIntegerField(_("data version"), default=0, editable=False)
+  # The busiest start-location base, which every Activity.home_distance is measured from.
+  # Moves only when that base does by more than HOME_MOVE_KM (see services.bases).
+  home_lat = models.FloatField(_("home latitude"), null=True, blank=True, editable=False)
+  home_lng = models.FloatField(_("home longitude"), null=True, blank=True, editable=False)
+  # When data_version was last bumped: the pages' Last-Modified (see views.ConditionalGetMixin).
+  data_modified = models.DateTimeField(_("data modified"), null=True, blank=True, editable=False)
   json = models.JSONField()
   objects = AthleteQuerySet.as_manager()
 
@@ -338,6 +535,7 @@ class Athlete(models.Model):
       'country': json.get('country') or '',
       'follower_count': json.get('follower_count'),
       'friend_count': json.get('friend_count'),
+      'ftp': json.get('ftp') or None,
     }
 
   @classmethod
@@ -352,3 +550,200 @@ class Athlete(models.Model):
     for attr, value in Athlete.read_json(self.json).items():
       setattr(self, attr, value)
     self.save()
+
+
+class ExplorerTile(models.Model):
+  """A zoom-``EXPLORER_ZOOM`` map tile an athlete's public routes have visited, with the
+  activity that first did: the inverted index behind the explorer-tiles widget and
+  overlay. Maintained per activity as it's written (see services.explorer)."""
+
+  athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE, related_name="explorer_tiles")
+  x = models.PositiveIntegerField(_("x"))
+  y = models.PositiveIntegerField(_("y"))
+  activity = models.ForeignKey("Activity", on_delete=models.CASCADE, related_name="explorer_tiles",
+                               verbose_name=_("first visit"))
+  visited = models.DateTimeField(_("first visited"))
+
+  class Meta:
+    verbose_name = _("explorer tile")
+    verbose_name_plural = _("explorer tiles")
+    constraints = [
+      models.UniqueConstraint(fields=["athlete", "x", "y"], name="one_explorer_tile_per_athlete"),
+    ]
+
+  def __str__(self):
+    return f"{self.x}/{self.y}"
+
+
+class Route(models.Model):
+  """A route an athlete repeats: the activities that follow the same path, grouped by
+  their MinHash ``signature`` (see services.routes). Named after, and measured by, the
+  activity that first took it."""
+
+  athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE, related_name="routes")
+  name = models.CharField(_("name"), max_length=100)
+  sport_type = models.CharField(_("sport type"), max_length=29, choices=SportType.choices)
+  distance = models.FloatField(_("distance"))
+  signature = models.JSONField(_("signature"))
+
+  class Meta:
+    verbose_name = _("route")
+    verbose_name_plural = _("routes")
+
+  def __str__(self):
+    return self.name
+
+
+class RouteBucket(models.Model):
+  """One LSH band of a route's signature, hashed: the index a new activity's route is
+  looked up in, so matching reads the few routes sharing one of its buckets instead of
+  the whole history."""
+
+  athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE, related_name="+")
+  band = models.PositiveSmallIntegerField(_("band"))
+  bucket = models.BigIntegerField(_("bucket"))
+  route = models.ForeignKey("Route", on_delete=models.CASCADE, related_name="buckets")
+
+  class Meta:
+    verbose_name = _("route bucket")
+    verbose_name_plural = _("route buckets")
+    indexes = [
+      models.Index(fields=["athlete", "band", "bucket"], name="strava_route_bucket"),
+    ]
+
+  def __str__(self):
+    return f"{self.band}:{self.bucket}"
+
+
+class StartCell(models.Model):
+  """The public activities of an athlete starting in one cell of the map's grid at
+  ``HOME_GRID_LEVEL``: their count, mean start point and latest start. The index the
+  start-location bases (and "home") are clustered from, kept current per activity as it's
+  written (see services.bases)."""
+
+  athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE, related_name="start_cells")
+  cell = models.BigIntegerField(_("cell"))
+  count = models.PositiveIntegerField(_("starts"))
+  lat = models.FloatField(_("latitude"))
+  lng = models.FloatField(_("longitude"))
+  last = models.DateTimeField(_("last start"))
+
+  class Meta:
+    verbose_name = _("start cell")
+    verbose_name_plural = _("start cells")
+    constraints = [
+      models.UniqueConstraint(fields=["athlete", "cell"], name="one_start_cell_per_athlete"),
+    ]
+
+  def __str__(self):
+    return str(self.cell)
+
+
+class ActivityStream(models.Model):
+  """An activity's recorded streams (time, position, altitude, heart rate, …), one
+  compact binary array per kind (see strava.streams), fetched from Strava on import or by
+  ``manage.py fetch_streams``. A kind the activity didn't record is empty."""
+
+  activity = models.OneToOneField("Activity", on_delete=models.CASCADE, primary_key=True, related_name="streams")
+  points = models.PositiveIntegerField(_("points"))
+  time = models.BinaryField(_("time"), null=True, blank=True)
+  latlng = models.BinaryField(_("position"), null=True, blank=True)
+  distance = models.BinaryField(_("distance"), null=True, blank=True)
+  altitude = models.BinaryField(_("altitude"), null=True, blank=True)
+  heartrate = models.BinaryField(_("heart rate"), null=True, blank=True)
+  velocity_smooth = models.BinaryField(_("speed"), null=True, blank=True)
+  watts = models.BinaryField(_("power"), null=True, blank=True)
+  cadence = models.BinaryField(_("cadence"), null=True, blank=True)
+  fetched = models.DateTimeField(_("fetched"), auto_now=True)
+
+  class Meta:
+    verbose_name = _("activity stream")
+    verbose_name_plural = _("activity streams")
+
+  def __str__(self):
+    return str(self.activity_id)
+
+  @classmethod
+  def store(cls, activity, data):
+    """Store ``data``, Strava's streams of ``activity`` as ``{kind: [value, ...]}``
+    (kinds not in ``streams.KINDS`` are dropped), replacing any stored before."""
+    kinds = {kind: values for kind, values in data.items() if kind in streams.KINDS and values}
+    return cls.objects.update_or_create(activity=activity, defaults={
+      'points': max((len(values) for values in kinds.values()), default=0),
+      **{kind: streams.encode(kind, kinds[kind]) if kind in kinds else None for kind in streams.KINDS},
+    })[0]
+
+  @property
+  def kinds(self):
+    """The kinds recorded, in ``streams.KINDS`` order."""
+    return [kind for kind in streams.KINDS if getattr(self, kind) is not None]
+
+  def series(self, kind):
+    """The ``kind`` stream decoded (see ``streams.decode``), or ``None`` if not recorded."""
+    data = getattr(self, kind)
+    return None if data is None else streams.decode(kind, bytes(data))
+
+
+class ActivityCurve(models.Model):
+  """An activity's mean-maximal curves: its best average pace (as speed, m/s) and power
+  (W) over each of ``CURVE_DURATIONS``, ``None`` past the activity's length. A handful of
+  numbers computed once from its streams (see services.curves), so nothing reads the
+  streams again."""
+
+  activity = models.OneToOneField("Activity", on_delete=models.CASCADE, primary_key=True, related_name="curve")
+  pace = models.JSONField(_("pace"), null=True, blank=True)
+  power = models.JSONField(_("power"), null=True, blank=True)
+
+  class Meta:
+    verbose_name = _("activity curve")
+    verbose_name_plural = _("activity curves")
+
+  def __str__(self):
+    return str(self.activity_id)
+
+
+class CurveEnvelope(models.Model):
+  """The best of an athlete's ``ActivityCurve``s of one kind over a season (a year, or
+  ``ALL_TIME``): per duration the best value and the activity that set it. Merged into as
+  curves are stored (see services.curves), so the dashboard's curve view reads one row."""
+
+  ALL_TIME = 0
+
+  athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE, related_name="curve_envelopes")
+  kind = models.CharField(_("kind"), max_length=5)
+  season = models.PositiveSmallIntegerField(_("season"))
+  values = models.JSONField(_("values"))
+  activities = models.JSONField(_("activities"))
+
+  class Meta:
+    verbose_name = _("curve envelope")
+    verbose_name_plural = _("curve envelopes")
+    constraints = [
+      models.UniqueConstraint(fields=["athlete", "kind", "season"], name="one_curve_envelope_per_season"),
+    ]
+
+  def __str__(self):
+    return f"{self.kind} {self.season or 'all time'}"
+
+
+class TrainingDay(models.Model):
+  """One calendar day of an athlete's training-load series, from their first public
+  activity's day to their last: the day's load (TRIMP, or TSS from power) and the fitness
+  and fatigue averages at its end. Rest days have a row too, with no load. Kept current
+  from a written activity's day forward (see services.fitness)."""
+
+  athlete = models.ForeignKey("Athlete", on_delete=models.CASCADE, related_name="training_days")
+  day = models.DateField(_("day"))
+  load = models.FloatField(_("load"))
+  fitness = models.FloatField(_("fitness"))
+  fatigue = models.FloatField(_("fatigue"))
+
+  class Meta:
+    verbose_name = _("training day")
+    verbose_name_plural = _("training days")
+    constraints = [
+      models.UniqueConstraint(fields=["athlete", "day"], name="one_training_day_per_athlete"),
+    ]
+
+  def __str__(self):
+    return str(self.day)
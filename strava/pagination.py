@@ -0,0 +1,89 @@
+"""Keyset (cursor) pagination for the activity feeds (activities list, gallery).
+
+Offset pagination makes the database walk and discard every earlier row, so deep pages
+of a long history get slower. A cursor instead carries the sort-column values of the
+last row shown (see ``querysets.activity_sort_columns``) and the next page is the rows
+strictly after it (``ActivityQuerySet.seek``): every page costs the same. The feeds load
+the next page by htmx infinite scroll — a "load more" sentinel at the end of each page
+requests the page after it when scrolled into view.
+"""
+import base64
+import json
+from typing import NamedTuple
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from strava.querysets import activity_sort_columns
+
+
+class Page(NamedTuple):
+    items: list
+    # The cursor of the page after this one, or None on the last page.
+    next_cursor: str | None
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe token for a row's sort-column values."""
+    # isoformat keeps full microsecond precision (DjangoJSONEncoder would truncate it),
+    # so the decoded start date compares equal to the stored one.
+    raw = json.dumps(values, default=lambda value: value.isoformat(), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _cursor_value(name, value):
+    # A sort-column value from a decoded token, checked against its column; ValueError
+    # if it can't be one.
+    if name == 'start_date':
+        # JSON has no datetime: the start date travels as an ISO string.
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None or timezone.is_naive(parsed):
+            raise ValueError(value)
+        return parsed
+    if name == 'pk':
+        valid = isinstance(value, int)
+    else:  # sort_value: a number, a name, or null (nulls sort last)
+        valid = value is None or isinstance(value, (int, float, str))
+    if not valid or isinstance(value, bool):
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(token, key, direction):
+    """The sort-column values in ``token`` for the ``(key, direction)`` ordering, or
+    ``None`` for a blank or malformed token (which then reads as the first page)."""
+    if not token:
+        return None
+    columns = activity_sort_columns(key, direction)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [_cursor_value(name, value) for (name, _descending), value in zip(columns, values)]
+    except ValueError:
+        return None
+
+
+def paginate(queryset, key, direction, cursor, size):
+    """One page of ``queryset`` — already ``sorted_by(key, direction)`` — starting after
+    ``cursor``. Fetches one extra row to learn whether a next page exists."""
+    values = decode_cursor(cursor, key, direction)
+    if values is not None:
+        queryset = queryset.seek(key, direction, values)
+    rows = list(queryset[:size + 1])
+    items = rows[:size]
+    if len(rows) <= size:
+        return Page(items, None)
+    last = items[-1]
+    return Page(items, encode_cursor([getattr(last, name) for name, _descending
+                                      in activity_sort_columns(key, direction)]))
+
+
+def next_page_url(request, page):
+    """The current URL with the cursor advanced to ``page``'s next page (other filter
+    params kept), or ``''`` on the last page."""
+    if page.next_cursor is None:
+        return ''
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return f'{request.path}?{params.urlencode()}'
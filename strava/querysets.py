@@ -1,11 +1,42 @@
-from datetime import timedelta
+import calendar
+import functools
+import math
+import operator
+from datetime import datetime, timedelta
 
-from django.db import models
-from django.db.models import F, Value, Q, CharField, FloatField, Func, ExpressionWrapper
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+from django.db.models import (
+    F, Value, Q, Avg, CharField, FloatField, Func, ExpressionWrapper, Count, Max, Min, Sum, Window,
+)
+from django.db.models.functions import ExtractYear, Round, RowNumber
 from django.utils import timezone
 
-from strava.consts import GEAR_OLD_DAYS
-from strava.helpers import to_float
+from strava.consts import GEAR_OLD_DAYS, MAP_GRID_BITS
+from strava.helpers import month_day, to_float, unaccent
+from strava.search import ACTIVITY_FTS_TABLE, TRIGRAM, fts_match, sqlite_fts_supported
+
+
+class SearchQuerySet(models.QuerySet):
+    # Token-AND search over the model's folded ``search_text`` column (see strava.search):
+    # every whitespace-separated token must appear in one of the model's SEARCH_FIELDS,
+    # ignoring case and accents. Served by a trigram index rather than unaccent() per row.
+    fts_table = None
+
+    def search(self, query):
+        qs = self
+        for token in unaccent(query).split():
+            qs = qs.filter(qs._search_condition(token))
+        return qs
+
+    def _search_condition(self, token):
+        vendor = connections[self.db].vendor
+        if self.fts_table and vendor == 'sqlite' and len(token) >= TRIGRAM and sqlite_fts_supported():
+            return Q(pk__in=RawSQL(
+                f'SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH %s',
+                [fts_match(token)],
+            ))
+        return Q(search_text__contains=token)
 
 
 class AthleteQuerySet(models.QuerySet):
@@ -15,7 +46,9 @@ class AthleteQuerySet(models.QuerySet):
         return self.exclude(access_token="").exclude(refresh_token="")
 
 
-class ActivityQuerySet(models.QuerySet):
+class ActivityQuerySet(SearchQuerySet):
+    fts_table = ACTIVITY_FTS_TABLE
+
     def for_athlete(self, athlete):
         # Scope to one athlete's rows. ``None`` (no athlete selected/connected yet) is a
         # no-op so callers can pass the resolved athlete unconditionally.
@@ -53,13 +86,89 @@ class ActivityQuerySet(models.QuerySet):
     def detailed(self):
         return self.filter(is_detailed=True)
 
-    def search(self, query):
+    def rows(self):
+        # The activities as lean read-only ``ActivityRow``s built straight from a
+        # values_list tuple, for the analytics services that read every activity of an
+        # athlete but only a few columns of each.
+        from strava.models import ActivityRow  # local import: models imports us
+        return [ActivityRow(*values) for values in self.values_list(*ActivityRow.COLUMNS)]
+
+    def per_year(self, **aggregates):
+        # ``aggregates`` grouped by the local calendar year of the start date (the year
+        # ``helpers.local_date`` gives): ``{year: {name: value}}``, one GROUP BY query.
+        rows = self.order_by().annotate(year=ExtractYear('start_date')).values('year').annotate(**aggregates)
+        return {row.pop('year'): row for row in rows}
+
+    def top_per_year(self, *order_by):
+        # The pk of each local calendar year's first activity in ``order_by`` (ties go to
+        # the newest): ``{year: pk}``. One ROW_NUMBER() window query partitioned by year,
+        # so only the winners leave the database.
+        year = ExtractYear('start_date')
+        ranked = self.order_by().annotate(year=year, rank=Window(
+            RowNumber(), partition_by=[year],
+            order_by=[*order_by, F('start_date').desc(), F('pk').desc()],
+        )).filter(rank=1)
+        return dict(ranked.values_list('year', 'pk'))
+
+    def home_location(self):
+        # The database twin of ``helpers.home_location``: the busiest ~1 km start bucket
+        # (2-decimal rounding) and its averaged coordinates, as ``(lat, lng)`` or ``None``.
+        # Ties go to the bucket used most recently, the one the newest-first scan meets
+        # first.
+        busiest = (
+            self.order_by()
+            .filter(start_lat__isnull=False, start_lng__isnull=False)
+            .values(lat_bucket=Round('start_lat', 2), lng_bucket=Round('start_lng', 2))
+            .annotate(count=Count('pk'), lat=Avg('start_lat'), lng=Avg('start_lng'), last=Max('start_date'))
+            .order_by('-count', '-last')
+            .first()
+        )
+        return (busiest['lat'], busiest['lng']) if busiest else None
+
+    def in_bbox(self, west, south, east, north):
+        # Activities whose route box (see Activity.min_lat) overlaps the viewport, so a
+        # route crossing the view counts even when it starts outside it. A viewport
+        # spanning the whole world (Leaflet's longitudes run past ±180 when zoomed out)
+        # doesn't filter on longitude.
+        qs = self.filter(min_lat__lte=north, max_lat__gte=south)
+        if east - west < 360:
+            west, east = max(west, -180), min(east, 180)
+            qs = qs.filter(min_lng__lte=east, max_lng__gte=west)
+        return qs
+
+    def grid_clusters(self, level):
+        # The start points grouped by their cell at ``level`` of the map's spatial grid
+        # (helpers.grid_cell), one GROUP BY on a prefix of the indexed ``grid_cell``: each
+        # cluster's count, mean position, extent and latest start, biggest first.
+        cell = ExpressionWrapper(F('grid_cell') / 4 ** (MAP_GRID_BITS - level),
+                                 output_field=models.BigIntegerField())
+        return list(
+            self.order_by()
+            .filter(grid_cell__isnull=False)
+            .values(cell=cell)
+            .annotate(count=Count('pk'), lat=Avg('start_lat'), lng=Avg('start_lng'),
+                      south=Min('start_lat'), west=Min('start_lng'),
+                      north=Max('start_lat'), east=Max('start_lng'), last=Max('start_date'))
+            .order_by('-count', 'cell')
+        )
+
+    def map_search(self, query):
+        # The dashboard map's search (see dashboard.activity_filter): every token must
+        # appear in the folded name or in the map sport type ('trail', 'ride', …). Served
+        # by the search index, but it can over-match (the folded column holds the
+        # sport_type too, and the map-type rules are matched loosely), so callers re-check
+        # the fetched rows. A token inside the catch-all 'other' type can't narrow anything.
+        from strava.sports import DEFAULT_MAP_SPORT_TYPE, MAP_SPORT_TYPES
         qs = self
-        for token in (query or '').split():
-            qs = qs.filter(
-                Q(name__unaccent__icontains=token)
-                | Q(sport_type__unaccent__icontains=token)
-            )
+        for token in unaccent(query).split():
+            if token in DEFAULT_MAP_SPORT_TYPE:
+                continue
+            condition = qs._search_condition(token)
+            for name, rule in MAP_SPORT_TYPES:
+                if token in name:
+                    condition |= (Q(sport_type__contains=rule['contains']) if 'contains' in rule
+                                  else Q(sport_type__in=rule['values']))
+            qs = qs.filter(condition)
         return qs
 
     def for_sport(self, sport_type):
@@ -80,6 +189,22 @@ class ActivityQuerySet(models.QuerySet):
             return self
         return self.filter(gear_id=gear_id)
 
+    def for_country(self, country):
+        # ``country`` is 'all' or an ISO code as stored by strava.geocode; served by the
+        # (athlete, country, region) index.
+        if not country or country == 'all':
+            return self
+        return self.filter(country=country)
+
+    def countries(self):
+        # Per country started in (unknown ones left out): the activities, their distance,
+        # the regions visited and the first and last visit, most visited first. One
+        # GROUP BY over the indexed column.
+        return (self.order_by().exclude(country='').values('country')
+                .annotate(count=Count('pk'), distance=Sum('distance'), regions=Count('region', distinct=True, filter=~Q(region='')),
+                          first=Min('start_date'), last=Max('start_date'))
+                .order_by('-count', 'country'))
+
     def for_month(self, year_month):
         if not year_month or year_month == 'all':
             return self
@@ -97,6 +222,16 @@ class ActivityQuerySet(models.QuerySet):
         except (ValueError, TypeError):
             return self
 
+    def on_this_day(self, day):
+        # The activities started on ``day``'s month and day in the years before it, newest
+        # first: an equality on the indexed (athlete, month_day) key, not a scan over every
+        # start date. On Feb 28 of a common year, Feb 29's count too.
+        keys = [month_day(day)]
+        if keys == [228] and not calendar.isleap(day.year):
+            keys.append(229)
+        year_start = timezone.make_aware(datetime(day.year, 1, 1))
+        return self.filter(month_day__in=keys, start_date__lt=year_start).order_by('-start_date')
+
     def for_distance(self, min_km, max_km):
         # Range filter driven by the distance slider. Bounds arrive in kilometres (the
         # slider's unit) and are compared against the metres stored on the row. A blank
@@ -111,66 +246,173 @@ class ActivityQuerySet(models.QuerySet):
         return qs
 
     def sorted_by(self, key, direction='desc'):
-        fields = {
-            'name': F('name'),
-            'date': F('start_date'),
-            'dist': F('distance'),
-            'time': F('moving_time'),
-            'elev': F('total_elevation_gain'),
-            'cal': F('calories'),
-            'pace': ExpressionWrapper(
-                F('moving_time') / Func(F('distance'), Value(0), function='NULLIF'),
-                output_field=FloatField(),
-            ),
-        }
-        if key not in fields:
+        # Order by one of ACTIVITY_SORT_FIELDS, nulls last, with start date and pk as
+        # tie-breakers so the order is total (cursor pagination relies on it; see seek).
+        # A key other than 'date' is annotated as ``sort_value`` so the last row of a page
+        # carries it for the next cursor. An unknown key leaves the queryset unchanged.
+        if key not in ACTIVITY_SORT_FIELDS:
             return self
-        expression = fields[key]
-        order = expression.desc(nulls_last=True) if direction == 'desc' else expression.asc(nulls_last=True)
-        return self.order_by(order)
+        columns = activity_sort_columns(key, direction)
+        qs = self
+        if key != 'date':
+            qs = qs.annotate(sort_value=ACTIVITY_SORT_FIELDS[key])
+        return qs.order_by(*(
+            F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True)
+            for name, descending in columns
+        ))
+
+    def seek(self, key, direction, values):
+        # The rows strictly after ``values`` — the sort-column values (see
+        # activity_sort_columns) of the last row already shown — in the
+        # ``sorted_by(key, direction)`` order, which must already be applied. A keyset
+        # condition the database can answer from an index range, however deep the page.
+        after, equal = [], Q()
+        for (name, descending), value in zip(activity_sort_columns(key, direction), values):
+            if value is None:
+                # Only the leading sort value is nullable; nulls sort last, so nothing
+                # but another null (decided by the tie-breakers) comes after one.
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            beyond = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            if name == 'sort_value':
+                beyond |= Q(sort_value__isnull=True)
+            after.append(equal & beyond)
+            equal &= Q(**{name: value})
+        if not after:
+            return self.none()
+        return self.filter(functools.reduce(operator.or_, after))
 
 
-class GearQuerySet(models.QuerySet):
+# Sort keys shared by the activities list and the gallery → the ordering expression.
+ACTIVITY_SORT_FIELDS = {
+    'name': F('name'),
+    'date': F('start_date'),
+    'dist': F('distance'),
+    'time': F('moving_time'),
+    'elev': F('total_elevation_gain'),
+    'cal': F('calories'),
+    'pace': ExpressionWrapper(
+        F('moving_time') / Func(F('distance'), Value(0), function='NULLIF'),
+        output_field=FloatField(),
+    ),
+    'kudos': F('kudos_count'),
+}
+
+
+def activity_sort_columns(key, direction):
+    """The total ordering behind ``ActivityQuerySet.sorted_by(key, direction)`` as
+    ``[(column, descending), ...]``: the sort value, then newest-first start date and pk
+    as tie-breakers ('date' itself only needs the pk)."""
+    descending = direction == 'desc'
+    if key == 'date':
+        return [('start_date', descending), ('pk', descending)]
+    return [('sort_value', descending), ('start_date', True), ('pk', True)]
+
+
+class GearQuerySet(SearchQuerySet):
     def for_athlete(self, athlete):
         if athlete is None:
             return self
         return self.filter(athlete=athlete)
 
-    def search(self, query):
-        qs = self
-        for token in (query or '').split():
-            qs = qs.filter(
-                Q(brand_name__unaccent__icontains=token)
-                | Q(model_name__unaccent__icontains=token)
-            )
-        return qs
-
     def of_type(self, gear_type):
         if gear_type in ('bike', 'shoe'):
             return self.filter(gear_type=gear_type)
         return self
 
+    def used(self):
+        # Gear with at least one public activity (the activities-page gear dropdown).
+        return self.filter(public_activity_count__gt=0)
+
     def by_age(self, age):
         # "old" gear = not used within GEAR_OLD_DAYS days (or never used), mirroring
-        # Gear.is_old; "active" is its complement. Relies on the ``last_activity``
-        # annotation added by GearView. Any other value (e.g. 'all') is a no-op.
+        # Gear.is_old; "active" is its complement. Reads the denormalised ``last_used``
+        # column. Any other value (e.g. 'all') is a no-op.
         if age not in ('old', 'active'):
             return self
         cutoff = timezone.now() - timedelta(days=GEAR_OLD_DAYS)
         if age == 'old':
-            return self.filter(Q(last_activity__isnull=True) | Q(last_activity__lt=cutoff))
-        return self.filter(last_activity__gte=cutoff)
+            return self.filter(Q(last_used__isnull=True) | Q(last_used__lt=cutoff))
+        return self.filter(last_used__gte=cutoff)
+
+    def computed_stats(self):
+        # The usage statistics (Gear.STATS_FIELDS) of every gear in the queryset, aggregated
+        # from its activities in one grouped query: ``{gear_id: {field: value}}``. Gear with
+        # no activities is absent — its statistics are the field defaults.
+        from strava.models import Activity  # local import: models imports us
+        public = Q(is_private=False)
+        rows = (
+            Activity.objects.filter(gear__in=self.values('pk'))
+            .order_by()
+            .values('gear_id')
+            .annotate(
+                public_distance=Sum('distance', filter=public),
+                total_distance=Sum('distance'),
+                public_activity_count=Count('pk', filter=public),
+                total_activity_count=Count('pk'),
+                first_used=Min('start_date', filter=public),
+                last_used=Max('start_date', filter=public),
+            )
+        )
+        return {
+            row.pop('gear_id'): {**row,
+                                 'public_distance': row['public_distance'] or 0.0,
+                                 'total_distance': row['total_distance'] or 0.0}
+            for row in rows
+        }
+
+    def refresh_stats(self):
+        # Recompute and store the denormalised usage statistics for every gear in the
+        # queryset. Called by the ingest/sync paths with just the gear an activity write
+        # touched, so the cost is one grouped aggregate over those gear's activities.
+        # Returns the refreshed gear.
+        stats = self.computed_stats()
+        gears = list(self.order_by())
+        for gear in gears:
+            for field, value in _gear_stats(stats, gear.pk).items():
+                setattr(gear, field, value)
+        self.model.objects.bulk_update(gears, self.model.STATS_FIELDS, batch_size=500)
+        return gears
+
+    def stale_stats(self):
+        # Gear whose stored statistics disagree with their activities, as
+        # ``[(gear, {field: (stored, actual)}), ...]`` — what ``rebuild_gear_stats
+        # --check`` reports. Distances compare with a float tolerance (summation order).
+        stats = self.computed_stats()
+        stale = []
+        for gear in self.order_by('pk'):
+            diff = {}
+            for field, actual in _gear_stats(stats, gear.pk).items():
+                stored = getattr(gear, field)
+                if isinstance(actual, float):
+                    same = math.isclose(stored, actual, rel_tol=1e-9, abs_tol=1e-6)
+                else:
+                    same = stored == actual
+                if not same:
+                    diff[field] = (stored, actual)
+            if diff:
+                stale.append((gear, diff))
+        return stale
 
     def sorted_by(self, key, direction='asc'):
-        # Sort fields reference annotations added by the view (see GearView).
+        # Sort fields are the denormalised usage statistics (see Gear.STATS_FIELDS).
         fields = {
             'name': F('brand_name'),
-            'distance': F('distance_sum'),
-            'rides': F('activity_count'),
-            'recent': F('last_activity'),
+            'distance': F('public_distance'),
+            'rides': F('public_activity_count'),
+            'recent': F('last_used'),
         }
         if key not in fields:
             return self.order_by('-primary', 'brand_name', 'model_name')
         expression = fields[key]
         order = expression.desc(nulls_last=True) if direction == 'desc' else expression.asc(nulls_last=True)
         return self.order_by(order)
+
+
+def _gear_stats(stats, gear_id):
+    """One gear's statistics from ``GearQuerySet.computed_stats``, defaulted when unused."""
+    return stats.get(gear_id) or {
+        'public_distance': 0.0, 'total_distance': 0.0,
+        'public_activity_count': 0, 'total_activity_count': 0,
+        'first_used': None, 'last_used': None,
+    }
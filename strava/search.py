@@ -0,0 +1,73 @@
+"""Indexed search over the denormalised ``search_text`` columns.
+
+``Activity.search_text`` and ``Gear.search_text`` hold the searchable fields lowercased and
+accent-folded (see ``helpers.search_text``), filled in on save. A search token is folded
+the same way and matched with a plain substring test, so no ``unaccent()`` runs per row
+and the column can be indexed:
+
+* PostgreSQL — a ``pg_trgm`` GIN index on each column (migration 0014), which serves the
+  ``LIKE '%token%'`` a substring test compiles to.
+* SQLite — an FTS5 shadow table with the trigram tokenizer over ``Activity.search_text``,
+  kept in step by triggers. SQLite rebuilds a table (dropping its triggers) on many schema
+  changes, so the table and triggers are (re)installed after every ``migrate`` rather
+  than once by a migration. Gear is a handful of rows and searches its column directly.
+
+Trigram indexes can't serve tokens shorter than three characters; those fall back to the
+plain column test on either backend, with the same results.
+"""
+import functools
+import sqlite3
+
+ACTIVITY_FTS_TABLE = "strava_activity_fts"
+TRIGRAM = 3
+
+
+@functools.lru_cache(maxsize=None)
+def sqlite_fts_supported():
+    """Whether the linked SQLite library has FTS5 with the trigram tokenizer (3.34+)."""
+    try:
+        with sqlite3.connect(":memory:") as probe:
+            probe.execute("CREATE VIRTUAL TABLE probe USING fts5(x, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def fts_match(token):
+    """``token`` as an FTS5 MATCH expression: a quoted string (quotes doubled)."""
+    return '"' + token.replace('"', '""') + '"'
+
+
+def install_sqlite_index(connection):
+    """Create the activity FTS5 table and its sync triggers if missing (idempotent).
+
+    When the triggers had to be (re)created — first install, or after a schema change
+    rebuilt ``strava_activity`` — the index is rebuilt from the table, since writes made
+    without triggers never reached it."""
+    if connection.vendor != "sqlite" or not sqlite_fts_supported():
+        return
+    table, fts = "strava_activity", ACTIVITY_FTS_TABLE
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                       [f"{fts}_%"])
+        if len(cursor.fetchall()) == 3:
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"search_text, content='{table}', content_rowid='id', tokenize='trigram')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF search_text ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+            f"INSERT INTO {fts}(rowid, search_text) VALUES (new.id, new.search_text); END"
+        )
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
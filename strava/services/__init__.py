@@ -1,11 +1,24 @@
 """Service layer.
 
 Two kinds of module live here. Most (``activities``, ``analytics``, ``compare``,
-``dashboard``, ``gear``) are *pure computation* over already-fetched ``Activity``/``Gear``
-collections, so views stay thin orchestrators and the arithmetic is unit-testable in
-isolation. ``sync`` is the write side: the API-and-DB orchestration that reconciles a row
-with Strava (pull/push), kept out of the models for the same reason.
+``dashboard``, ``gear``, ``rolling``) are *pure computation* over already-fetched
+``Activity``/``Gear`` collections (activities may equally be the lean ``ActivityRow``s
+of ``ActivityQuerySet.rows``, which the dashboard and compare pages pass), so views stay
+thin orchestrators and the arithmetic is unit-testable in isolation. ``sync`` is the
+write side: the API-and-DB orchestration that reconciles a row with Strava (pull/push),
+kept out of the models for the same reason. ``heatmap`` renders the map's route tiles
+and ``explorer``, ``routes`` and ``bases`` keep the explorer-tile, repeat-route and
+start-location indexes current as activities are written, ``curves`` the mean-maximal
+curves as their streams are stored, and ``fitness`` the daily training-load series.
+``places`` breaks the activities down by the country they start in and ``anniversaries``
+finds the ones started on today's date in past years.
 """
-from strava.services import activities, analytics, compare, dashboard, gear, sync
+from strava.services import (
+    activities, analytics, anniversaries, bases, compare, curves, dashboard, explorer, fitness, gear,
+    heatmap, places, rolling, routes, sync,
+)
 
-__all__ = ["activities", "analytics", "compare", "dashboard", "gear", "sync"]
+__all__ = [
+    "activities", "analytics", "anniversaries", "bases", "compare", "curves", "dashboard", "explorer",
+    "fitness", "gear", "heatmap", "places", "rolling", "routes", "sync",
+]
@@ -5,6 +5,13 @@ cycle: it takes activities (usually an already-filtered list) and returns plain
 dicts/lists ready for a template context. Keeping the arithmetic out of the views makes
 it unit-testable directly and lets the dashboard and compare pages share one
 implementation instead of reaching into each other's view classes.
+
+Each section is an *accumulator* — ``add(activity, day)`` per activity (``day`` being its
+``local_date``, computed once by the caller; ``None`` for accumulators that aren't
+``dated``), then ``result()`` — so the dashboard can
+feed every section from a single pass over the activities (``dashboard.sections``). The
+functions (``records``, ``trends``, …) run one accumulator over a list, for callers that
+need a single section.
 """
 import datetime
 
@@ -15,10 +22,22 @@ from strava.consts import (
     MARATHON_KM, MAX_RIDE_AVG_KMH, MAX_RIDE_TOP_KMH, MONTHS,
     RIEGEL_EXP, RIEGEL_MAX_RATIO, RUN_PERF_DISTANCES,
 )
-from strava.helpers import fmt_hms, fmt_pace, has_gps, haversine_km, hike_pace_ok, local_date
+from strava.helpers import fmt_hms, fmt_pace, has_gps, hike_pace_ok, home_distances, local_date
 from strava.sports import RECORDS_SPORT_TYPES
 
 
+# --------------------------------------------------------------------------- #
+# Accumulation
+# --------------------------------------------------------------------------- #
+def accumulate(accumulator, activities):
+    """Feed every activity to ``accumulator`` and return it (for its ``result()``). The
+    local date is only worked out for accumulators that read it (``dated``)."""
+    tz = timezone.get_current_timezone()
+    for a in activities:
+        accumulator.add(a, local_date(a, tz) if accumulator.dated else None)
+    return accumulator
+
+
 # --------------------------------------------------------------------------- #
 # Personal records
 # --------------------------------------------------------------------------- #
@@ -32,80 +51,117 @@ def records(activities, home=None):
     ``{'label', 'value', 'unit', 'id'}`` dict — ``id`` is the pk of the activity that
     holds the record, so clicking the row opens that activity's card. ``home`` is the
     (lat, lng) the "furthest from home" record measures against."""
-    return {
-        name: _sport_records(name, [a for a in activities if a.sport_type in sports], home)
-        for name, sports in RECORDS_SPORT_TYPES.items()
-    }
-
-
-def _sport_records(name, acts, home=None):
-    if not acts:
-        return []
-    recs = []
-
-    # Longest distance. For hiking, ignore run-paced activities (likely mis-tagged).
-    longest_pool = [a for a in acts if hike_pace_ok(a)] if name == 'Hiking' else acts
-    if longest_pool:
-        longest = max(longest_pool, key=lambda a: a.distance)
-        recs.append(_rec('Longest', longest, f'{longest.distance / 1000:.1f}', 'km'))
-
-    # Fastest — avg speed for rides, per-100m for swims, avg pace otherwise. Derived from
-    # distance/time (like Activity.pace_parts) to avoid relying on the raw API speed
-    # units. Hiking again drops run-paced activities.
-    moving = [a for a in acts if a.moving_time and a.distance]
-    if name == 'Hiking':
-        moving = [a for a in moving if hike_pace_ok(a)]
-    if name == 'Cycling':
-        # Drop rides whose average speed exceeds MAX_RIDE_AVG_KMH — GPS glitches or
-        # mis-tagged motorized activities, not real cycling PRs.
-        rides = [a for a in moving
-                 if (a.distance / 1000) / (a.moving_time / 3600) <= MAX_RIDE_AVG_KMH]
-        if rides:
-            best = max(rides, key=lambda a: a.distance / a.moving_time)
+    return accumulate(Records(), activities).result(home)
+
+
+class Records:
+    """Accumulator for ``records``. Home is usually estimated over the same pass, so it is
+    only needed by ``result``: until then the located activities are kept per tab."""
+
+    dated = False
+
+    def __init__(self):
+        self.tabs = {name: _SportRecords(name) for name in RECORDS_SPORT_TYPES}
+        self.tab_of = {sport: self.tabs[name] for name, sports in RECORDS_SPORT_TYPES.items()
+                       for sport in sports}
+
+    def add(self, a, day):
+        tab = self.tab_of.get(a.sport_type)
+        if tab:
+            tab.add(a)
+
+    def result(self, home=None):
+        return {name: tab.result(home) for name, tab in self.tabs.items()}
+
+
+class _SportRecords:
+    """One tab's records, each the running best activity. A later activity only replaces
+    the best when strictly better, so ties go to the earliest, as ``max``/``min`` do."""
+
+    def __init__(self, name):
+        self.name = name
+        self.seen = False
+        self.longest = None
+        self.fastest = self.fastest_key = None
+        self.climb = None
+        self.top = None        # top speed (cycling) / longest moving time (the rest)
+        self.located = []
+
+    def add(self, a):
+        name = self.name
+        self.seen = True
+        # Longest distance. For hiking, ignore run-paced activities (likely mis-tagged).
+        hike_ok = name != 'Hiking' or hike_pace_ok(a)
+        if hike_ok and (self.longest is None or a.distance > self.longest.distance):
+            self.longest = a
+
+        # Fastest — avg speed for rides, per-100m for swims, avg pace otherwise. Derived
+        # from distance/time (like Activity.pace_parts) to avoid relying on the raw API
+        # speed units. Hiking again drops run-paced activities.
+        if a.moving_time and a.distance and hike_ok:
+            if name == 'Cycling':
+                # Drop rides whose average speed exceeds MAX_RIDE_AVG_KMH — GPS glitches or
+                # mis-tagged motorized activities, not real cycling PRs.
+                if (a.distance / 1000) / (a.moving_time / 3600) <= MAX_RIDE_AVG_KMH:
+                    self._faster(a, -(a.distance / a.moving_time))
+            elif name == 'Swimming':
+                self._faster(a, a.moving_time / (a.distance / 100))
+            else:
+                self._faster(a, a.moving_time / (a.distance / 1000))
+
+        # Most elevation (not meaningful for swimming)
+        if name != 'Swimming' and a.total_elevation_gain:
+            if self.climb is None or a.total_elevation_gain > self.climb.total_elevation_gain:
+                self.climb = a
+
+        # Top speed only for cycling (descents legitimately hit 50–70 km/h). For other
+        # sports the GPS max_speed is dominated by noisy spikes — a single bad fix on a slow
+        # run reads as 50+ km/h — so show the reliable longest moving time instead.
+        if name == 'Cycling':
+            if a.max_speed and a.max_speed * 3.6 <= MAX_RIDE_TOP_KMH:
+                if self.top is None or a.max_speed > self.top.max_speed:
+                    self.top = a
+        elif a.moving_time:
+            if self.top is None or a.moving_time > self.top.moving_time:
+                self.top = a
+
+        if a.start_lat is not None and a.start_lng is not None:
+            self.located.append(a)
+
+    def _faster(self, a, key):
+        # ``key`` is lower-is-better (a ride's speed is negated).
+        if self.fastest is None or key < self.fastest_key:
+            self.fastest, self.fastest_key = a, key
+
+    def result(self, home=None):
+        if not self.seen:
+            return []
+        name, recs = self.name, []
+        if self.longest:
+            recs.append(_rec('Longest', self.longest, f'{self.longest.distance / 1000:.1f}', 'km'))
+        best = self.fastest
+        if best and name == 'Cycling':
             kmh = (best.distance / 1000) / (best.moving_time / 3600)
             recs.append(_rec('Fastest (avg. speed)', best, f'{kmh:.1f}', 'km/h'))
-    elif name == 'Swimming':
-        if moving:
-            best = min(moving, key=lambda a: a.moving_time / (a.distance / 100))
+        elif best and name == 'Swimming':
             recs.append(_rec('Fastest (per 100 m)', best,
                              fmt_pace(best.moving_time / (best.distance / 100)), '/100m'))
-    else:
-        if moving:
-            best = min(moving, key=lambda a: a.moving_time / (a.distance / 1000))
+        elif best:
             recs.append(_rec('Fastest (avg. pace)', best,
                              fmt_pace(best.moving_time / (best.distance / 1000)), '/km'))
+        if self.climb:
+            recs.append(_rec('Most Elevation', self.climb, f'{self.climb.total_elevation_gain:,.0f}', 'm'))
+        if self.top and name == 'Cycling':
+            recs.append(_rec('Top Speed', self.top, f'{self.top.max_speed * 3.6:.1f}', 'km/h'))
+        elif self.top:
+            recs.append(_rec('Longest Time', self.top, self.top.duration, ''))
 
-    # Most elevation (not meaningful for swimming)
-    if name != 'Swimming':
-        climbs = [a for a in acts if a.total_elevation_gain]
-        if climbs:
-            best = max(climbs, key=lambda a: a.total_elevation_gain)
-            recs.append(_rec('Most Elevation', best, f'{best.total_elevation_gain:,.0f}', 'm'))
-
-    # Top speed only for cycling (descents legitimately hit 50–70 km/h). For other sports
-    # the GPS max_speed is dominated by noisy spikes — a single bad fix on a slow run
-    # reads as 50+ km/h — so show the reliable longest moving time instead.
-    if name == 'Cycling':
-        speeds = [a for a in acts if a.max_speed and a.max_speed * 3.6 <= MAX_RIDE_TOP_KMH]
-        if speeds:
-            best = max(speeds, key=lambda a: a.max_speed)
-            recs.append(_rec('Top Speed', best, f'{best.max_speed * 3.6:.1f}', 'km/h'))
-    else:
-        timed = [a for a in acts if a.moving_time]
-        if timed:
-            best = max(timed, key=lambda a: a.moving_time)
-            recs.append(_rec('Longest Time', best, best.duration, ''))
-
-    # Furthest from home — the activity starting farthest from the usual start point.
-    if home:
-        located = [a for a in acts if a.start_lat is not None and a.start_lng is not None]
-        if located:
-            best = max(located, key=lambda a: haversine_km(
-                home[0], home[1], a.start_lat, a.start_lng))
-            dist = haversine_km(home[0], home[1], best.start_lat, best.start_lng)
-            recs.append(_rec('Furthest from Home', best, f'{dist:,.0f}', 'km'))
-
-    return recs
+        # Furthest from home — the activity starting farthest from the usual start point.
+        if home and self.located:
+            distances = home_distances(self.located, home)
+            i = max(range(len(distances)), key=distances.__getitem__)
+            recs.append(_rec('Furthest from Home', self.located[i], f'{distances[i]:,.0f}', 'km'))
+        return recs
 
 
 # --------------------------------------------------------------------------- #
@@ -118,11 +174,22 @@ def run_performance(activities):
     the activity that set it, for the click-to-open card) plus a Riegel estimate range
     projected from the athlete's best efforts at every recorded distance. Best/estimate
     are ``'—'`` when there's nothing to compute."""
-    runs = [a for a in activities if a.sport_type in RECORDS_SPORT_TYPES['Running']]
+    return accumulate(RunPerformance(), activities).result()
 
-    best_by_name = {}   # lowercased effort name -> (elapsed_seconds, activity_pk)
-    predictors = {}     # effort distance (m) -> fastest elapsed_seconds seen
-    for a in runs:
+
+class RunPerformance:
+    """Accumulator for ``run_performance``."""
+
+    dated = False
+
+    def __init__(self):
+        self.best_by_name = {}   # lowercased effort name -> (elapsed_seconds, activity_pk)
+        self.predictors = {}     # effort distance (m) -> fastest elapsed_seconds seen
+
+    def add(self, a, day):
+        if a.sport_type not in RECORDS_SPORT_TYPES['Running']:
+            return
+        best_by_name, predictors = self.best_by_name, self.predictors
         for e in a.best_efforts:
             t, d = e.get('elapsed_time'), e.get('distance')
             if not isinstance(t, (int, float)) or not t or not d:
@@ -133,24 +200,25 @@ def run_performance(activities):
             if d not in predictors or t < predictors[d]:
                 predictors[d] = t
 
-    perf = []
-    for label, key, dist in RUN_PERF_DISTANCES:
-        row = {'dist': label, 'best': '—', 'best_id': None, 'est': '—', 'est_pace': '—'}
-        if key in best_by_name:
-            t, pk = best_by_name[key]
-            row['best'], row['best_id'] = fmt_hms(t), pk
-        # Only project from predictors within a sensible extrapolation window;
-        # short splits (e.g. a 1 km burst) would otherwise yield unrealistically
-        # fast long-distance estimates.
-        projections = [pt * (dist / pd) ** RIEGEL_EXP
-                       for pd, pt in predictors.items()
-                       if 1 / RIEGEL_MAX_RATIO <= dist / pd <= RIEGEL_MAX_RATIO]
-        if projections:
-            est = min(projections)
-            row['est'] = f'{fmt_hms(est * 0.975)} – {fmt_hms(est * 1.025)}'
-            row['est_pace'] = f'{fmt_pace(est / (dist / 1000))}/km'
-        perf.append(row)
-    return perf
+    def result(self):
+        perf = []
+        for label, key, dist in RUN_PERF_DISTANCES:
+            row = {'dist': label, 'best': '—', 'best_id': None, 'est': '—', 'est_pace': '—'}
+            if key in self.best_by_name:
+                t, pk = self.best_by_name[key]
+                row['best'], row['best_id'] = fmt_hms(t), pk
+            # Only project from predictors within a sensible extrapolation window;
+            # short splits (e.g. a 1 km burst) would otherwise yield unrealistically
+            # fast long-distance estimates.
+            projections = [pt * (dist / pd) ** RIEGEL_EXP
+                           for pd, pt in self.predictors.items()
+                           if 1 / RIEGEL_MAX_RATIO <= dist / pd <= RIEGEL_MAX_RATIO]
+            if projections:
+                est = min(projections)
+                row['est'] = f'{fmt_hms(est * 0.975)} – {fmt_hms(est * 1.025)}'
+                row['est_pace'] = f'{fmt_pace(est / (dist / 1000))}/km'
+            perf.append(row)
+        return perf
 
 
 # --------------------------------------------------------------------------- #
@@ -160,31 +228,52 @@ def by_the_numbers(activities):
     """Fun-stat and summary tallies for the "By the Numbers" cards. Returns
     ``(fun_stats, summary)`` dicts. Calories / achievements / PR counts come from promoted
     model fields, computed over whatever (already-filtered) activities are passed in."""
-    total_km = sum(a.distance for a in activities) / 1000
-    total_elev = sum((a.total_elevation_gain or 0) for a in activities)
-    cycling_km = sum(a.distance for a in activities
-                     if a.sport_type in RECORDS_SPORT_TYPES['Cycling']) / 1000
-
-    # Heart rate averaged across activities, weighted by moving time.
-    hr = [a for a in activities if a.average_heartrate and a.moving_time]
-    avg_hr = (round(sum(a.average_heartrate * a.moving_time for a in hr)
-                    / sum(a.moving_time for a in hr)) if hr else 0)
-
-    fun_stats = {
-        'around_earth': f'{total_km / EARTH_CIRCUMFERENCE_KM * 100:.1f}%',
-        'everest': f'{total_elev / EVEREST_HEIGHT_M:.1f}x',
-        'co2_saved': f'{round(cycling_km * CO2_KG_PER_KM):,} kg',
-        'marathons': f'{round(total_km / MARATHON_KM):,}',
-    }
-    summary = {
-        'photos': sum(a.total_photo_count for a in activities),
-        'calories': sum((a.calories or 0) for a in activities),
-        'kudos': sum(a.kudos_count for a in activities),
-        'avg_hr': avg_hr,
-        'achievements': sum(a.achievement_count for a in activities),
-        'prs': sum(a.pr_count for a in activities),
-    }
-    return fun_stats, summary
+    return accumulate(ByTheNumbers(), activities).result()
+
+
+class ByTheNumbers:
+    """Accumulator for ``by_the_numbers``."""
+
+    dated = False
+
+    def __init__(self):
+        self.distance = self.elevation = self.cycling = 0
+        self.hr_beats = self.hr_secs = 0
+        self.photos = self.calories = self.kudos = self.achievements = self.prs = 0
+
+    def add(self, a, day):
+        self.distance += a.distance
+        self.elevation += a.total_elevation_gain or 0
+        if a.sport_type in RECORDS_SPORT_TYPES['Cycling']:
+            self.cycling += a.distance
+        # Heart rate averaged across activities, weighted by moving time.
+        if a.average_heartrate and a.moving_time:
+            self.hr_beats += a.average_heartrate * a.moving_time
+            self.hr_secs += a.moving_time
+        self.photos += a.total_photo_count
+        self.calories += a.calories or 0
+        self.kudos += a.kudos_count
+        self.achievements += a.achievement_count
+        self.prs += a.pr_count
+
+    def result(self):
+        total_km = self.distance / 1000
+        cycling_km = self.cycling / 1000
+        fun_stats = {
+            'around_earth': f'{total_km / EARTH_CIRCUMFERENCE_KM * 100:.1f}%',
+            'everest': f'{self.elevation / EVEREST_HEIGHT_M:.1f}x',
+            'co2_saved': f'{round(cycling_km * CO2_KG_PER_KM):,} kg',
+            'marathons': f'{round(total_km / MARATHON_KM):,}',
+        }
+        summary = {
+            'photos': self.photos,
+            'calories': self.calories,
+            'kudos': self.kudos,
+            'avg_hr': round(self.hr_beats / self.hr_secs) if self.hr_secs else 0,
+            'achievements': self.achievements,
+            'prs': self.prs,
+        }
+        return fun_stats, summary
 
 
 # --------------------------------------------------------------------------- #
@@ -194,52 +283,79 @@ def trends(activities, today):
     """Weekly / monthly / yearly rollups (distance, elevation, hours, activity count and
     distance-weighted pace) as ``{'weekly': [...], 'monthly': [...], 'yearly': [...]}``.
     Weekly is capped to the last 52 weeks; the current year is flagged ``partial``."""
+    return accumulate(Trends(today), activities).result()
 
-    weekly, monthly, yearly = {}, {}, {}
-    for a in activities:
-        d = local_date(a)
+
+class Trends:
+    """Accumulator for ``trends``."""
+
+    dated = True
+
+    def __init__(self, today):
+        self.today = today
+        self.weekly, self.monthly, self.yearly = {}, {}, {}
+
+    def add(self, a, day):
         km = a.distance / 1000
         elev = a.total_elevation_gain or 0
         secs = a.moving_time or 0
-        wk = d - datetime.timedelta(days=d.weekday())
-        for buckets, key in ((weekly, wk), (monthly, (d.year, d.month)), (yearly, d.year)):
-            b = buckets.setdefault(key, {'km': 0.0, 'elev': 0.0, 'secs': 0.0, 'acts': 0})
+        wk = day - datetime.timedelta(days=day.weekday())
+        for buckets, key in ((self.weekly, wk), (self.monthly, (day.year, day.month)), (self.yearly, day.year)):
+            b = buckets.get(key)
+            if b is None:
+                b = buckets[key] = {'km': 0.0, 'elev': 0.0, 'secs': 0.0, 'acts': 0}
             b['km'] += km
             b['elev'] += elev
             b['secs'] += secs
             b['acts'] += 1
 
-    def rows(buckets, label, partial=None):
-        out = []
-        for key in sorted(buckets):
-            b = buckets[key]
-            out.append({
-                'label': label(key),
-                'km': round(b['km']),
-                'elev': round(b['elev']),
-                'hours': round(b['secs'] / 3600, 1),
-                'acts': b['acts'],
-                'pace': round((b['secs'] / 60) / b['km'], 2) if b['km'] else 0,
-                **({'partial': True} if partial and partial(key) else {}),
-            })
-        return out
-
-    return {
-        'weekly': rows(weekly, lambda k: f'{MONTHS[k.month - 1]} {k.day}')[-52:],
-        'monthly': rows(monthly, lambda k: f"{MONTHS[k[1] - 1]} '{str(k[0])[2:]}"),
-        'yearly': rows(yearly, str, partial=lambda y: y == today.year),
-    }
+    def result(self):
+        def rows(buckets, label, partial=None):
+            out = []
+            for key in sorted(buckets):
+                b = buckets[key]
+                out.append({
+                    'label': label(key),
+                    'km': round(b['km']),
+                    'elev': round(b['elev']),
+                    'hours': round(b['secs'] / 3600, 1),
+                    'acts': b['acts'],
+                    'pace': round((b['secs'] / 60) / b['km'], 2) if b['km'] else 0,
+                    **({'partial': True} if partial and partial(key) else {}),
+                })
+            return out
+
+        return {
+            'weekly': rows(self.weekly, lambda k: f'{MONTHS[k.month - 1]} {k.day}')[-52:],
+            'monthly': rows(self.monthly, lambda k: f"{MONTHS[k[1] - 1]} '{str(k[0])[2:]}"),
+            'yearly': rows(self.yearly, str, partial=lambda y: y == self.today.year),
+        }
 
 
 def activity_calendar(activities, today):
     """The last five weeks as ``[{'label', 'dots': [0|1|2, ...7]}, ...]`` — a dot per day
     at intensity 0/1/2 (no activity / one / two-or-more), for the dashboard heat strip."""
+    return accumulate(ActivityCalendar(today), activities).result()
+
+
+class ActivityCalendar:
+    """Accumulator for ``activity_calendar``."""
+
+    dated = True
+
+    def __init__(self, today):
+        self.today = today
+        self.day_counts = {}
+
+    def add(self, a, day):
+        self.day_counts[day] = self.day_counts.get(day, 0) + 1
+
+    def result(self):
+        return calendar_weeks(self.day_counts, self.today)
 
-    day_counts = {}
-    for a in activities:
-        d = local_date(a)
-        day_counts[d] = day_counts.get(d, 0) + 1
 
+def calendar_weeks(day_counts, today):
+    """The heat-strip weeks of ``activity_calendar`` from ``{local date: activity count}``."""
     weeks = []
     week_start = today - datetime.timedelta(days=today.weekday())
     for w in range(4, -1, -1):
@@ -261,29 +377,84 @@ def map_data(activities):
     """Collect map markers and their activities from ``start_latlng``.
 
     Returns ``(markers, map_activities)`` where ``markers`` is a list of marker dicts the
-    Leaflet map plots (the encoded ``polyline`` is drawn as the route when a marker is
-    clicked; ``sport_type``/``gear``/``year`` back the filter pills; ``id`` lazily fetches
-    the activity's card), and ``map_activities`` are the matching ``Activity`` objects in
+    Leaflet map plots (``sport_type``/``gear``/``year`` back the filter pills; ``id``
+    lazily fetches the activity's card and its route, see ``map_routes``), and ``map_activities`` are the matching activities in
     the same order. Both are capped at ``MAP_MARKER_LIMIT``. GPS-less activities (pool
     swims, treadmill runs, …) carry no marker."""
-    markers, map_activities = [], []
+    markers, tz = MapData(), timezone.get_current_timezone()
     for a in activities:
-        if has_gps(a):
-            markers.append({
-                'id': a.pk,  # for lazily fetching the activity's card on marker click
-                'lat': a.start_lat,
-                'lng': a.start_lng,
-                'map_sport_type': a.map_sport_type,
-                'distance': a.distance_km,  # km, for the distance range filter
-                'title': f'{a.name} · {a.distance_km} km',
-                'polyline': a.polyline,
-                'sport_type': a.sport_type,
-                'sport_label': a.get_sport_type_display(),
-                'gear': str(a.gear_id) if a.gear_id else '',
-                'gear_label': str(a.gear) if a.gear_id else '',
-                'year': timezone.localtime(a.start_date).year,
-            })
-            map_activities.append(a)
-        if len(markers) >= MAP_MARKER_LIMIT:
+        if markers.full:
             break
-    return markers, map_activities
+        markers.add(a, local_date(a, tz))
+    return markers.result()
+
+
+def map_markers(activities):
+    """``map_data``'s markers as the compact payload the dashboard map fetches after the
+    page has painted (see ``MapMarkersView``). The payload is columnar, one array per field
+    in marker order, which gzips well. The sport types and the gear are dictionary-encoded:
+    each is sent once (``sports``: ``[sport_type, map_sport_type]``, ``gear_list``: ``[id,
+    label]``) and referenced by index (``-1``: no gear). The coordinates are rounded to
+    ~1 m. The title is derived client-side from ``name`` and ``distance``, and the routes
+    come separately (``map_routes``)."""
+    markers, _activities = map_data(activities)
+    sports, gear = {}, {}
+    payload = {key: [] for key in ('id', 'lat', 'lng', 'sport', 'gear', 'distance', 'year', 'name')}
+    for m in markers:
+        payload['id'].append(m['id'])
+        payload['lat'].append(round(m['lat'], 5))
+        payload['lng'].append(round(m['lng'], 5))
+        payload['sport'].append(sports.setdefault((m['sport_type'], m['map_sport_type']), len(sports)))
+        payload['gear'].append(gear.setdefault((m['gear'], m['gear_label']), len(gear)) if m['gear'] else -1)
+        payload['distance'].append(m['distance'])
+        payload['year'].append(m['year'])
+        payload['name'].append(m['name'])
+    payload['sports'] = [list(key) for key in sports]
+    payload['gear_list'] = [list(key) for key in gear]
+    return payload
+
+
+def map_routes(routes, max_zoom=None):
+    """The map's routes payload from ``(id, encoded polyline)`` pairs, as ``{'id': [...],
+    'polyline': [...], 'max_zoom': …}``; activities without a route are left out.
+    ``max_zoom`` is the deepest zoom the routes' resolution serves (``None``: full
+    resolution), past which the map asks for finer ones (see ``helpers.route_resolution``).
+    Fetched by the map after the markers, since the routes are the bulk of its data."""
+    routes = [(pk, polyline) for pk, polyline in routes if polyline]
+    return {'id': [pk for pk, _polyline in routes], 'polyline': [polyline for _pk, polyline in routes],
+            'max_zoom': max_zoom}
+
+
+class MapData:
+    """Accumulator for ``map_data``; ignores activities once ``full``."""
+
+    dated = True
+
+    def __init__(self):
+        self.markers, self.activities = [], []
+
+    @property
+    def full(self):
+        return len(self.markers) >= MAP_MARKER_LIMIT
+
+    def add(self, a, day):
+        if self.full or not has_gps(a):
+            return
+        self.markers.append({
+            'id': a.pk,  # for lazily fetching the activity's card on marker click
+            'lat': a.start_lat,
+            'lng': a.start_lng,
+            'map_sport_type': a.map_sport_type,
+            'distance': a.distance_km,  # km, for the distance range filter
+            'name': a.name,
+            'title': f'{a.name} · {a.distance_km} km',
+            'sport_type': a.sport_type,
+            'sport_label': a.get_sport_type_display(),
+            'gear': str(a.gear_id) if a.gear_id else '',
+            'gear_label': str(a.gear) if a.gear_id else '',
+            'year': day.year,
+        })
+        self.activities.append(a)
+
+    def result(self):
+        return self.markers, self.activities
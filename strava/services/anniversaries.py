@@ -0,0 +1,18 @@
+"""On this day: the activities started on today's date in past years, behind the
+dashboard's "on this day" widget.
+
+Every activity stores its local start date's month and day as one indexed key
+(``Activity.month_day``, derived on save), so the widget's query is an equality on the
+(athlete, month_day) index (``ActivityQuerySet.on_this_day``) that reads only the matching
+rows, with their gear joined in for the cards. The result changes with the date alone
+between writes, so it's cached until local midnight (``caching.on_this_day``).
+"""
+from strava import helpers
+from strava.consts import ON_THIS_DAY_COUNT
+
+
+def on_this_day(activities, today, count=ON_THIS_DAY_COUNT):
+    """The ``count`` latest of ``activities`` started on ``today``'s month and day in an
+    earlier year, newest first, each with how many ``years_ago``."""
+    return [{'activity': activity, 'years_ago': today.year - helpers.local_date(activity).year}
+            for activity in activities.on_this_day(today).select_related('gear')[:count]]
@@ -0,0 +1,179 @@
+"""Start-location bases: the places an athlete's activities start from, busiest first.
+
+Backed by an index, ``StartCell``: per cell of the map's grid at ``HOME_GRID_LEVEL``, the
+public activities starting there (count, mean start point, latest start). A write
+recounts only the cells the activity starts in, before and after (``refresh``); nothing
+rescans the history. ``ranked`` clusters the cells into bases: neighbouring cells with at
+least ``HOME_MIN_STARTS`` starts each merge, so a town's spread of start points is one
+base and an athlete who moves or travels has several.
+
+The busiest base is "home" (``home``), which the "furthest from home" records measure
+against. It's stored on the athlete, with every activity's distance from it
+(``Activity.home_distance``), so those records are a lookup. The stored home follows the
+busiest base once that has moved more than ``HOME_MOVE_KM`` (``rehome``), and only then
+are the distances recomputed, in one batch. An import folds its activities in together
+(``record_batch``): one recount of the cells they touch, and one batch of distances.
+"""
+from django.db.models import Q
+
+from strava import helpers
+from strava.consts import HOME_BASES_COUNT, HOME_GRID_LEVEL, HOME_MIN_STARTS, HOME_MOVE_KM, MAP_GRID_BITS
+from strava.models import Activity, Athlete, StartCell
+
+_SHIFT = 2 * (MAP_GRID_BITS - HOME_GRID_LEVEL)
+
+
+def cell_of(grid_cell):
+    """The ``HOME_GRID_LEVEL`` cell holding an activity's (finest level) ``grid_cell``."""
+    return grid_cell >> _SHIFT
+
+
+def refresh(athlete_id, *grid_cells):
+    """Recount ``athlete_id``'s start cells holding the given activity ``grid_cell``s
+    (``None``s are skipped). Pass a written activity's cell from before and after the
+    write, so a moved, hidden or deleted start leaves its old cell too. Then moves the
+    athlete's home if its base has (``rehome``). Returns whether it moved."""
+    cells = {cell_of(grid_cell) for grid_cell in grid_cells if grid_cell is not None}
+    if not athlete_id or not cells:
+        return False
+    condition = Q()
+    for cell in cells:
+        condition |= Q(grid_cell__gte=cell << _SHIFT, grid_cell__lt=(cell + 1) << _SHIFT)
+    counted = (Activity.objects.filter(athlete_id=athlete_id).public().filter(condition)
+               .grid_clusters(HOME_GRID_LEVEL))
+    StartCell.objects.filter(athlete_id=athlete_id, cell__in=cells).delete()
+    StartCell.objects.bulk_create([
+        StartCell(athlete_id=athlete_id, cell=row['cell'], count=row['count'], lat=row['lat'], lng=row['lng'],
+                  last=row['last'])
+        for row in counted
+    ])
+    return rehome(athlete_id)
+
+
+def record(activity, previous_cell=None):
+    """Fold a written ``activity`` into the index: recount its start cell, and its cell
+    before the write (``previous_cell``), then store its distance from home."""
+    refresh(activity.athlete_id, previous_cell, activity.grid_cell)
+    if activity.athlete_id is None:
+        return
+    home_lat, home_lng = Athlete.objects.filter(pk=activity.athlete_id).values_list('home_lat', 'home_lng').get()
+    distance = None
+    if home_lat is not None and activity.start_lat is not None and activity.start_lng is not None:
+        distance = helpers.haversine_km(home_lat, home_lng, activity.start_lat, activity.start_lng)
+    # update(), not save(): the distance is derived, and saving would re-run the save hooks.
+    Activity.objects.filter(pk=activity.pk).update(home_distance=distance)
+    activity.home_distance = distance
+
+
+def record_batch(athlete_id, grid_cells, since):
+    """Fold a batch of ``athlete_id``'s written activities into the index at once: recount
+    the cells they start in, before and after (``grid_cells``, as for ``refresh``), then
+    store the distance from home of the activities starting from ``since`` (the batch's
+    earliest start), unless the home moved and every distance was recomputed anyway."""
+    if not athlete_id or since is None or refresh(athlete_id, *grid_cells):
+        return
+    home = Athlete.objects.filter(pk=athlete_id).values_list('home_lat', 'home_lng').get()
+    _measure(athlete_id, home, since)
+
+
+def rehome(athlete_id, force=False):
+    """Move ``athlete_id``'s stored home to the busiest base when that's more than
+    ``HOME_MOVE_KM`` away (or appeared, or vanished), recomputing every activity's
+    ``home_distance`` from it. Returns whether the home moved."""
+    stored = Athlete.objects.filter(pk=athlete_id).values_list('home_lat', 'home_lng').get()
+    busiest = cluster(StartCell.objects.filter(athlete_id=athlete_id))[:1]
+    home = (busiest[0]['lat'], busiest[0]['lng']) if busiest else (None, None)
+    if not force and stored == (None, None) and home == (None, None):
+        return False
+    if not force and None not in stored and None not in home and helpers.haversine_km(*stored, *home) <= HOME_MOVE_KM:
+        return False
+    Athlete.objects.filter(pk=athlete_id).update(home_lat=home[0], home_lng=home[1])
+    _measure(athlete_id, home)
+    return True
+
+
+def _measure(athlete_id, home, since=None):
+    # Every activity's (starting from ``since``) distance from ``home`` (None without
+    # one), as one batched haversine and a bulk update.
+    activities = Activity.objects.filter(athlete_id=athlete_id)
+    if since is not None:
+        activities = activities.filter(start_date__gte=since)
+    if None in home:
+        activities.update(home_distance=None)
+        return
+    activities.filter(Q(start_lat=None) | Q(start_lng=None)).update(home_distance=None)
+    located = list(activities.filter(start_lat__isnull=False, start_lng__isnull=False)
+                   .values_list('pk', 'start_lat', 'start_lng'))
+    distances = helpers.haversine_many(home[0], home[1], ((lat, lng) for _pk, lat, lng in located))
+    Activity.objects.bulk_update([Activity(pk=pk, home_distance=distance)
+                                  for (pk, _lat, _lng), distance in zip(located, distances)],
+                                 ['home_distance'], batch_size=500)
+
+
+def rebuild(athlete):
+    """Recount all of ``athlete``'s start cells, then re-anchor their home and the
+    distances from it. Returns the number of cells."""
+    StartCell.objects.filter(athlete=athlete).delete()
+    counted = Activity.objects.for_athlete(athlete).public().grid_clusters(HOME_GRID_LEVEL)
+    StartCell.objects.bulk_create([
+        StartCell(athlete=athlete, cell=row['cell'], count=row['count'], lat=row['lat'], lng=row['lng'],
+                  last=row['last'])
+        for row in counted
+    ])
+    rehome(athlete.pk, force=True)
+    return len(counted)
+
+
+def _row_col(cell):
+    # The grid row and column of a Morton-coded cell (see helpers.grid_cell).
+    row = col = 0
+    for bit in range(HOME_GRID_LEVEL):
+        col |= ((cell >> (2 * bit)) & 1) << bit
+        row |= ((cell >> (2 * bit + 1)) & 1) << bit
+    return row, col
+
+
+def cluster(cells):
+    """The bases of a set of start cells (``StartCell``-like objects), busiest first (ties
+    to the most recently used): each ``{'lat', 'lng', 'count', 'last', 'cells'}``, its
+    position the starts' mean. Cells with at least ``HOME_MIN_STARTS`` starts merge with
+    such neighbours (the eight around them); sparser cells are bases of their own."""
+    by_position = {_row_col(cell.cell): cell for cell in cells}
+    seen, bases = set(), []
+    for position, cell in by_position.items():
+        if position in seen:
+            continue
+        seen.add(position)
+        group, stack = [], [position]
+        while stack:
+            row, col = current = stack.pop()
+            group.append(by_position[current])
+            if by_position[current].count < HOME_MIN_STARTS:
+                continue
+            for neighbour in ((row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)):
+                other = by_position.get(neighbour)
+                if other is not None and neighbour not in seen and other.count >= HOME_MIN_STARTS:
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        count = sum(c.count for c in group)
+        bases.append({
+            'lat': sum(c.lat * c.count for c in group) / count,
+            'lng': sum(c.lng * c.count for c in group) / count,
+            'count': count,
+            'last': max(c.last for c in group),
+            'cells': len(group),
+        })
+    bases.sort(key=lambda base: (base['count'], base['last']), reverse=True)
+    return bases
+
+
+def ranked(athlete, count=HOME_BASES_COUNT):
+    """``athlete``'s ``count`` busiest bases (see ``cluster``)."""
+    return cluster(StartCell.objects.filter(athlete=athlete))[:count]
+
+
+def home(athlete):
+    """``athlete``'s stored home, a ``helpers.Home`` (the busiest base, see ``rehome``),
+    or ``None`` without located starts."""
+    stored = Athlete.objects.filter(pk=athlete.pk).values_list('home_lat', 'home_lng').first()
+    return helpers.Home(*stored) if stored and None not in stored else None
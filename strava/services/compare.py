@@ -1,12 +1,19 @@
 """Year-over-year comparison matrix computation.
 
-Pure functions over a list of ``Activity`` objects: given the activities for a sport
-selection, build the numeric metric rows (one per row, one season per column) and the
-signature-effort rows. Kept out of the view so the arithmetic is unit-testable and the
-view stays a thin orchestrator.
+Given the activities for a sport selection, build the numeric metric rows (one per
+row, one season per column) and the signature-effort rows. Kept out of the view so the
+arithmetic is unit-testable and the view stays a thin orchestrator. ``queryset_matrix``
+computes them from database aggregates over a queryset, so the compare page never loads
+the history.
 """
+import math
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ASin, Coalesce, Cos, Power, Radians, Sin, Sqrt, TruncDate
+
 from strava import helpers
 from strava.consts import MONTHS
+from strava.services import rolling
 from strava.sports import PACE_SPORT_TYPES
 
 # Paces faster than this (seconds per km) are GPS/distance glitches — a corrupt near-zero
@@ -15,28 +22,106 @@ from strava.sports import PACE_SPORT_TYPES
 MIN_PLAUSIBLE_PACE_SEC = 150
 
 
-def paceable(a):
-    """A foot sport (PACE_SPORT_TYPES) with a plausible /km pace (see MIN_PLAUSIBLE_PACE_SEC)."""
-    if a.sport_type not in PACE_SPORT_TYPES or not a.moving_time or not a.distance:
-        return False
-    return a.moving_time / (a.distance / 1000) >= MIN_PLAUSIBLE_PACE_SEC
+def queryset_matrix(activities, home, today):
+    """The comparison matrix (``matrix``) of the ``activities`` queryset, computed in the
+    database.
+
+    The numeric rows are per-year GROUP BY aggregates, and the pace-eligible subset uses
+    conditional aggregates. "Biggest week" runs the rolling engine over per-day distance
+    totals. Each signature-effort row is a per-year top-1 window query. The activities
+    themselves never load: only the aggregates, the daily totals and the handful of
+    standout rows do."""
+    yearly = activities.per_year(
+        count=Count('pk'),
+        metres=Sum('distance'),
+        elevation=Sum('total_elevation_gain'),
+        seconds=Sum('moving_time'),
+        active_days=Count(TruncDate('start_date'), distinct=True),
+        kudos=Sum('kudos_count'),
+        prs=Sum('pr_count'),
+        achievements=Sum('achievement_count'),
+        paced_distance=Sum('distance', filter=PACEABLE),
+        paced_seconds=Sum('moving_time', filter=PACEABLE),
+    )
+    if not yearly:
+        return {'years': [], 'rows': [], 'aoty_rows': []}
 
+    # Contiguous span so every season sits side by side, even a gap year.
+    years = list(range(min(yearly), max(yearly) + 1))
+    daily = (activities.order_by().annotate(day=TruncDate('start_date'))
+             .values_list('day').annotate(Sum('distance')).order_by('day'))
+    return matrix(years, _aggregate_values(years, yearly, daily),
+                  _effort_picks_sql(years, activities, home), home, today)
 
-def compare_matrix(activities, home, today):
-    """Build the comparison matrix for ``activities``.
 
-    Returns ``{'years': [...], 'rows': [...], 'aoty_rows': [...]}`` — the season columns,
-    the numeric metric rows, and the signature-effort rows. All empty when there's no data.
-    """
-    by_year = {}
-    for a in activities:
-        by_year.setdefault(helpers.local_date(a).year, []).append(a)
+# A foot sport whose pace (moving time / km) is plausible (see MIN_PLAUSIBLE_PACE_SEC).
+PACEABLE = Q(sport_type__in=PACE_SPORT_TYPES, moving_time__gt=0, distance__gt=0,
+             moving_time__gte=F('distance') * MIN_PLAUSIBLE_PACE_SEC / 1000)
 
-    if not by_year:
-        return {'years': [], 'rows': [], 'aoty_rows': []}
 
-    # Contiguous span so every season sits side by side, even a gap year.
-    years = list(range(min(by_year), max(by_year) + 1))
+def _aggregate_values(years, yearly, daily):
+    """Each METRICS name's value per year from the per-year aggregate rows and the
+    ``(day, metres)`` daily distance totals."""
+    days_of = {}
+    for day, metres in daily:
+        days_of.setdefault(day.year, ([], []))
+        days_of[day.year][0].append(day)
+        days_of[day.year][1].append(metres / 1000)
+
+    def biggest_week(year):
+        days, km = days_of[year]
+        peak = rolling.DailySeries(days, {'distance': km}).peak('distance', 7)
+        return round(peak[0]) or None
+
+    def per_year(fn):
+        return [fn(yearly[y], y) if y in yearly else None for y in years]
+
+    return {
+        'Distance': per_year(lambda row, y: round(row['metres'] / 1000)),
+        'Elevation gain': per_year(lambda row, y: round(row['elevation'] or 0)),
+        'Moving time': per_year(lambda row, y: int(round((row['seconds'] or 0) / 3600))),
+        'Activities': per_year(lambda row, y: row['count']),
+        'Active days': per_year(lambda row, y: row['active_days']),
+        'Average pace': per_year(lambda row, y: (row['paced_seconds'] / (row['paced_distance'] / 1000)
+                                                 if row['paced_distance'] else None)),
+        'Biggest week': per_year(lambda row, y: biggest_week(y)),
+        'Kudos received': per_year(lambda row, y: row['kudos']),
+        'PRs set': per_year(lambda row, y: row['prs']),
+        'Achievements': per_year(lambda row, y: row['achievements']),
+    }
+
+
+def _effort_picks_sql(years, activities, home):
+    """The standout activity per year of each EFFORTS row, ``{icon: [activity|None, ...]}``,
+    as one top-1-per-year window query per row, then one query loading the picked
+    activities. Ties go to the latest activity."""
+    rankings = {
+        'trophy': (Q(), Coalesce('calories', 0).desc()),
+        'longest': (Q(), F('distance').desc()),
+        'climb': (Q(total_elevation_gain__isnull=False) & ~Q(total_elevation_gain=0),
+                  F('total_elevation_gain').desc()),
+        'bolt': (PACEABLE, (F('moving_time') / F('distance')).asc()),
+    }
+    if home:
+        phi, lam = math.radians(home[0]), math.radians(home[1])
+        away = (Power(Sin((Radians('start_lat') - phi) / 2), 2)
+                + math.cos(phi) * Cos(Radians('start_lat')) * Power(Sin((Radians('start_lng') - lam) / 2), 2))
+        if isinstance(home, helpers.Home):
+            # The stored distance where there is one (an indexed column), else the haversine.
+            away = Coalesce('home_distance', 2 * 6371.0 * ASin(Sqrt(away)))
+        # Otherwise ordered by the haversine's inner term, which grows with the distance.
+        rankings['pin'] = (Q(start_lat__isnull=False, start_lng__isnull=False), away.desc())
+    tops = {icon: activities.filter(valid).top_per_year(order)
+            for icon, (valid, order) in rankings.items()}
+    picked = {pk for top in tops.values() for pk in top.values()}
+    rows = {a.pk: a for a in activities.filter(pk__in=picked).rows()} if picked else {}
+    return {icon: [rows.get(top.get(y)) for y in years] for icon, top in tops.items()}
+
+
+def matrix(years, values, picks, home, today):
+    """Assemble the matrix for the season columns ``years`` from ``values`` — each METRICS
+    name's value per year (``None`` for no data) — and ``picks`` — each EFFORTS icon's
+    standout activity per year (``None`` for none)."""
     year_cols = [
         {'year': y, 'current': y == today.year,
          'tag': (f'through {MONTHS[today.month - 1]} {today.day}'
@@ -45,76 +130,31 @@ def compare_matrix(activities, home, today):
     ]
     return {
         'years': year_cols,
-        'rows': _numeric_rows(years, by_year, today),
-        'aoty_rows': _effort_rows(years, by_year, home, today),
+        'rows': _numeric_rows(years, values, today),
+        'aoty_rows': _effort_rows(years, picks, home, today),
     }
 
 
-def _numeric_rows(years, by_year, today):
-    ld = helpers.local_date
-
-    def distance(acts):
-        return round(sum(a.distance for a in acts) / 1000) if acts else None
-
-    def elevation(acts):
-        return round(sum((a.total_elevation_gain or 0) for a in acts)) if acts else None
-
-    def hours(acts):
-        return int(round(sum((a.moving_time or 0) for a in acts) / 3600)) if acts else None
-
-    def count(acts):
-        return len(acts) or None
-
-    def active_days(acts):
-        return len({ld(a) for a in acts}) or None
-
-    def kudos(acts):
-        return sum(a.kudos_count for a in acts) if acts else None
-
-    def prs(acts):
-        return sum(a.pr_count for a in acts) if acts else None
-
-    def achievements(acts):
-        return sum(a.achievement_count for a in acts) if acts else None
-
-    def avg_pace(acts):
-        # Distance-weighted pace for the whole year (total time / total distance),
-        # not the single fastest run — a short sprint race isn't representative.
-        paced = [a for a in acts if paceable(a)]
-        total_km = sum(a.distance for a in paced) / 1000
-        return sum(a.moving_time for a in paced) / total_km if total_km else None
-
-    def biggest_week(acts):
-        if not acts:
-            return None
-        daily = {}
-        for a in acts:
-            daily[ld(a)] = daily.get(ld(a), 0.0) + a.distance / 1000
-        items = list(daily.items())
-        best = 0.0
-        for d0, _ in items:
-            window = sum(km for d, km in items if 0 <= (d - d0).days <= 6)
-            best = max(best, window)
-        return round(best) or None
-
-    # (name, unit, icon, small-unit, format, lower-is-better, value fn)
-    specs = [
-        ('Distance', 'kilometres', 'dist', 'km', 'int', False, distance),
-        ('Elevation gain', 'metres climbed', 'elev', 'm', 'int', False, elevation),
-        ('Moving time', 'hours active', 'time', 'h', 'int', False, hours),
-        ('Activities', 'sessions logged', 'acts', '', 'int', False, count),
-        ('Active days', 'days on the move', 'days', 'd', 'int', False, active_days),
-        ('Average pace', 'lower is faster', 'pace', '/km', 'pace', True, avg_pace),
-        ('Biggest week', 'peak 7-day block', 'week', 'km', 'int', False, biggest_week),
-        ('Kudos received', 'from the community', 'kudos', '', 'int', False, kudos),
-        ('PRs set', 'personal records', 'prs', '', 'int', False, prs),
-        ('Achievements', 'badges earned', 'ach', '', 'int', False, achievements),
-    ]
+# (name, unit, icon, small-unit, format, lower-is-better) of each numeric row, in order.
+METRICS = (
+    ('Distance', 'kilometres', 'dist', 'km', 'int', False),
+    ('Elevation gain', 'metres climbed', 'elev', 'm', 'int', False),
+    ('Moving time', 'hours active', 'time', 'h', 'int', False),
+    ('Activities', 'sessions logged', 'acts', '', 'int', False),
+    ('Active days', 'days on the move', 'days', 'd', 'int', False),
+    ('Average pace', 'lower is faster', 'pace', '/km', 'pace', True),
+    ('Biggest week', 'peak 7-day block', 'week', 'km', 'int', False),
+    ('Kudos received', 'from the community', 'kudos', '', 'int', False),
+    ('PRs set', 'personal records', 'prs', '', 'int', False),
+    ('Achievements', 'badges earned', 'ach', '', 'int', False),
+)
+
+
+def _numeric_rows(years, values, today):
     rows = []
-    for name, unit, icon, small, fmt, lower, fn in specs:
-        values = [fn(by_year.get(y, [])) for y in years]
-        if any(v is not None for v in values):
-            rows.append(_numeric_row(years, values, name, unit, icon, small, fmt, lower, today))
+    for name, unit, icon, small, fmt, lower in METRICS:
+        if any(v is not None for v in values[name]):
+            rows.append(_numeric_row(years, values[name], name, unit, icon, small, fmt, lower, today))
     return rows
 
 
@@ -174,7 +214,22 @@ def _fmt_value(value, fmt):
     return f'{value:,}'
 
 
-def _effort_rows(years, by_year, home, today):
+# (icon, name, unit) of each signature-effort row, in order. The "pin" row (furthest from
+# home) only exists when a home location is known.
+EFFORTS = (
+    ('trophy', 'Activity of the year', 'signature effort'),
+    ('longest', 'Longest activity', 'biggest single outing'),
+    ('climb', 'Most elevation', 'single climb'),
+    ('pin', 'Furthest from home', 'travel effort'),
+    ('bolt', 'Fastest avg pace', 'quickest effort'),
+)
+
+
+def pace_of(a):
+    return a.moving_time / (a.distance / 1000)
+
+
+def _effort_rows(years, picks, home, today):
     """Signature-effort rows: the standout activity per year for a handful of
     superlatives, shown as name + a compact stat line."""
     def dist_seg(a):
@@ -183,48 +238,28 @@ def _effort_rows(years, by_year, home, today):
     def elev_seg(a):
         return {'v': f'{a.elevation:,}', 'u': 'm'}
 
-    def pace_of(a):
-        return a.moving_time / (a.distance / 1000)
+    def away_seg(a):
+        km, = helpers.home_distances([a], home)
+        return {'v': f'{round(km):,}', 'u': 'km away'}
 
-    def build(icon, name, unit, pick, segs, valid=None):
-        cells, any_present = [], False
-        for y in years:
-            acts = by_year.get(y, [])
-            if valid:
-                acts = [a for a in acts if valid(a)]
+    segments = {
+        'trophy': lambda a: [dist_seg(a), elev_seg(a)],
+        'longest': lambda a: [dist_seg(a), elev_seg(a)],
+        'climb': lambda a: [elev_seg(a), dist_seg(a)],
+        'pin': lambda a: [away_seg(a)],
+        'bolt': lambda a: [{'v': helpers.fmt_pace(pace_of(a)), 'u': '/km'}, dist_seg(a)],
+    }
+    rows = []
+    for icon, name, unit in EFFORTS:
+        if not any(picks.get(icon, ())):
+            continue
+        cells = []
+        for y, best in zip(years, picks[icon]):
             current = y == today.year
-            if not acts:
+            if best is None:
                 cells.append({'current': current})
-                continue
-            any_present = True
-            best = pick(acts)
-            cells.append({'current': current, 'id': best.pk,
-                          'title': best.name, 'segments': segs(best)})
-        return {'icon': icon, 'name': name, 'unit': unit, 'cells': cells} if any_present else None
-
-    haversine = helpers.haversine_km
-    rows = [
-        build('trophy', 'Activity of the year', 'signature effort',
-              lambda acts: max(acts, key=lambda a: a.calories or 0),
-              lambda a: [dist_seg(a), elev_seg(a)]),
-        build('longest', 'Longest activity', 'biggest single outing',
-              lambda acts: max(acts, key=lambda a: a.distance),
-              lambda a: [dist_seg(a), elev_seg(a)]),
-        build('climb', 'Most elevation', 'single climb',
-              lambda acts: max(acts, key=lambda a: a.total_elevation_gain or 0),
-              lambda a: [elev_seg(a), dist_seg(a)],
-              valid=lambda a: a.total_elevation_gain),
-    ]
-    if home:
-        rows.append(build(
-            'pin', 'Furthest from home', 'travel effort',
-            lambda acts: max(acts, key=lambda a: haversine(home[0], home[1], a.start_lat, a.start_lng)),
-            lambda a: [{'v': f'{round(haversine(home[0], home[1], a.start_lat, a.start_lng)):,}',
-                        'u': 'km away'}],
-            valid=lambda a: a.start_lat is not None and a.start_lng is not None))
-    rows.append(build(
-        'bolt', 'Fastest avg pace', 'quickest effort',
-        lambda acts: min(acts, key=pace_of),
-        lambda a: [{'v': helpers.fmt_pace(pace_of(a)), 'u': '/km'}, dist_seg(a)],
-        valid=paceable))
-    return [r for r in rows if r]
+            else:
+                cells.append({'current': current, 'id': best.pk,
+                              'title': best.name, 'segments': segments[icon](best)})
+        rows.append({'icon': icon, 'name': name, 'unit': unit, 'cells': cells})
+    return rows
@@ -0,0 +1,262 @@
+"""Mean-maximal curves: an athlete's best average pace and power over 5 s … 5 h.
+
+An activity's curves are computed once, as its streams are stored (``store``). The
+samples are laid on a one-second grid over elapsed time as a cumulative series: distance
+already is one, power is held from sample to sample and summed (``per_second``). The best
+average over a window of ``d`` seconds is then the largest rise of the series over ``d``
+seconds, one vectorised difference per duration. With the fixed ``CURVE_DURATIONS`` that
+is O(n) per activity, not a scan of every window length. Without NumPy the same
+arithmetic runs in Python. The curves are stored as a value per duration
+(``ActivityCurve``).
+
+Each curve is merged into its athlete's envelopes (``CurveEnvelope``): per kind, the best
+value at each duration over a season and over all time, with the activity that set it.
+A written activity's curve is merged in element-wise (``record``). Only an envelope that
+held one of its values (it was edited out of the season, sport or public set, or its
+curve recomputed) is recomputed, and then from the stored curves: no stream is read
+again. ``curve_view`` draws an envelope for the dashboard's running-performance card.
+"""
+import math
+
+from django.utils import timezone
+
+from strava import helpers
+from strava.consts import CURVE_DURATIONS, CURVE_KINDS, CURVE_LISTED, CURVE_MAX_GAP
+from strava.models import Activity, ActivityCurve, ActivityStream, CurveEnvelope
+from strava.sports import RECORDS_SPORT_TYPES
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional (the "fast" extra)
+    np = None
+
+ALL_TIME = CurveEnvelope.ALL_TIME
+# The curve chart's y extent, in viewBox units (the x axis spans 0–100).
+CHART_HEIGHT = 40
+_LOG_SPAN = (math.log(CURVE_DURATIONS[0]), math.log(CURVE_DURATIONS[-1]))
+
+
+def per_second(time, values, cumulative=False):
+    """A stream as a cumulative series on a one-second grid of elapsed ``time``. A
+    ``cumulative`` stream (distance) is interpolated; any other (power) holds each sample
+    until the next, or for ``CURVE_MAX_GAP`` seconds across a pause, and is summed."""
+    if np is not None:
+        time = np.asarray(time, dtype=float)
+        time = time - time[0]
+        values = np.asarray(values, dtype=float)
+        grid = np.arange(int(time[-1]) + 1)
+        if cumulative:
+            return np.interp(grid, time, values)
+        latest = np.searchsorted(time, grid, side='right') - 1
+        held = np.where(grid - time[latest] <= CURVE_MAX_GAP, values[latest], 0.0)
+        return np.concatenate(([0.0], np.cumsum(held)))
+    start, last, series, total = time[0], len(time) - 1, [] if cumulative else [0.0], 0.0
+    i = 0
+    for second in range(int(time[-1] - start) + 1):
+        while i < last and time[i + 1] - start <= second:
+            i += 1
+        if cumulative:
+            span = time[i + 1] - time[i] if i < last else 0
+            share = (second - (time[i] - start)) / span if span else 0
+            series.append(values[i] + share * (values[i + 1] - values[i]) if share else float(values[i]))
+        else:
+            total += values[i] if second - (time[i] - start) <= CURVE_MAX_GAP else 0.0
+            series.append(total)
+    return series
+
+
+def best_rises(series, durations=CURVE_DURATIONS):
+    """Per duration ``d``, the largest rise of a one-second ``series`` over ``d`` seconds
+    divided by ``d`` (the best average), or ``None`` when the series is shorter."""
+    best = []
+    for d in durations:
+        if len(series) <= d:
+            best.append(None)
+        elif np is not None:
+            best.append(float(np.max(series[d:] - series[:-d])) / d)
+        else:
+            best.append(max(series[k + d] - series[k] for k in range(len(series) - d)) / d)
+    return best
+
+
+def mean_maximal(time, values, cumulative=False):
+    """The mean-maximal curve of a stream: its best average over each of
+    ``CURVE_DURATIONS`` (see ``per_second``), positive or ``None``."""
+    if time is None or values is None or len(time) < 2:
+        return None
+    curve = [value if value and value > 0 else None for value in best_rises(per_second(time, values, cumulative))]
+    return curve if any(value is not None for value in curve) else None
+
+
+def compute(stream):
+    """``{kind: curve}`` of an ``ActivityStream``: pace as m/s to the mm, power in whole
+    watts, each ``None`` when the stream isn't recorded."""
+    time, curves = stream.series('time'), {}
+    for kind, (source, _group) in CURVE_KINDS.items():
+        curve = mean_maximal(time, stream.series(source), cumulative=source == 'distance')
+        digits = 3 if kind == 'pace' else None
+        curves[kind] = curve and [None if value is None else round(value, digits) for value in curve]
+    return curves
+
+
+def store(activity, stream):
+    """Compute ``activity``'s curves from its just-stored ``stream``, then fold them into
+    its athlete's envelopes (``record``)."""
+    ActivityCurve.objects.update_or_create(activity=activity, defaults=compute(stream))
+    record(activity)
+
+
+def envelope_keys(activity):
+    """The ``(kind, season)`` envelopes ``activity``'s curves belong to: its year's and
+    all time, for the kinds of its sport. Private activities are in none."""
+    if activity.is_private or activity.athlete_id is None:
+        return []
+    year = timezone.localtime(activity.start_date).year
+    return [(kind, season) for kind, (_source, group) in CURVE_KINDS.items()
+            if activity.sport_type in RECORDS_SPORT_TYPES[group] for season in (year, ALL_TIME)]
+
+
+def _merge(envelope, curve, pk):
+    # Fold one curve into an envelope's values, element-wise.
+    for i, value in enumerate(curve):
+        if value is not None and (envelope.values[i] is None or value > envelope.values[i]):
+            envelope.values[i], envelope.activities[i] = value, pk
+
+
+def _empty(athlete_id, kind, season):
+    return CurveEnvelope(athlete_id=athlete_id, kind=kind, season=season, values=[None] * len(CURVE_DURATIONS),
+                         activities=[None] * len(CURVE_DURATIONS))
+
+
+def _save(envelope):
+    # An envelope left without values is dropped.
+    if any(value is not None for value in envelope.values):
+        envelope.save()
+    elif envelope.pk is not None:
+        envelope.delete()
+
+
+def recompute(athlete_id, kind, season, envelope=None):
+    """Recompute one envelope from the stored curves of the athlete's public activities
+    of its sport (and season)."""
+    envelope = envelope or _empty(athlete_id, kind, season)
+    envelope.values, envelope.activities = [None] * len(CURVE_DURATIONS), [None] * len(CURVE_DURATIONS)
+    activities = (Activity.objects.filter(athlete_id=athlete_id).public()
+                  .filter(sport_type__in=RECORDS_SPORT_TYPES[CURVE_KINDS[kind][1]]))
+    if season != ALL_TIME:
+        activities = activities.for_year(season)
+    curves = ActivityCurve.objects.filter(activity__in=activities).exclude(**{f'{kind}__isnull': True})
+    for pk, curve in curves.values_list('activity_id', kind):
+        _merge(envelope, curve, pk)
+    _save(envelope)
+    return envelope
+
+
+def record(activity):
+    """Fold a written ``activity``'s stored curves into its athlete's envelopes: merged
+    into the ones it belongs to, and any other envelope holding one of its values
+    recomputed (it left that season, sport or the public set, or was recomputed)."""
+    curve = ActivityCurve.objects.filter(activity_id=activity.pk).first()
+    if curve is None or activity.athlete_id is None:
+        return
+    keys = set(envelope_keys(activity))
+    for envelope in CurveEnvelope.objects.filter(athlete_id=activity.athlete_id):
+        if activity.pk in envelope.activities:
+            recompute(activity.athlete_id, envelope.kind, envelope.season, envelope)
+            keys.discard((envelope.kind, envelope.season))
+    existing = {(e.kind, e.season): e for e in CurveEnvelope.objects.filter(athlete_id=activity.athlete_id)}
+    for kind, season in keys:
+        if getattr(curve, kind) is None:
+            continue
+        envelope = existing.get((kind, season)) or _empty(activity.athlete_id, kind, season)
+        _merge(envelope, getattr(curve, kind), activity.pk)
+        _save(envelope)
+
+
+def forget(activities):
+    """Drop the curves of ``activities`` (a queryset about to be deleted), recomputing
+    the envelopes that held their values."""
+    pks = set(activities.values_list('pk', flat=True))
+    athlete_ids = set(activities.values_list('athlete_id', flat=True))
+    ActivityCurve.objects.filter(activity_id__in=pks).delete()
+    for envelope in CurveEnvelope.objects.filter(athlete_id__in=athlete_ids):
+        if pks.intersection(envelope.activities):
+            recompute(envelope.athlete_id, envelope.kind, envelope.season, envelope)
+
+
+def rebuild(athlete):
+    """Recompute every curve of ``athlete``'s stored streams, then their envelopes.
+    Returns the number of activities with a curve."""
+    ActivityCurve.objects.filter(activity__athlete=athlete).delete()
+    streams = ActivityStream.objects.filter(activity__athlete=athlete)
+    ActivityCurve.objects.bulk_create([ActivityCurve(activity_id=stream.activity_id, **compute(stream))
+                                       for stream in streams.iterator()], batch_size=500)
+    CurveEnvelope.objects.filter(athlete=athlete).delete()
+    curved = Activity.objects.for_athlete(athlete).public().filter(curve__isnull=False)
+    for kind, (_source, group) in CURVE_KINDS.items():
+        years = curved.filter(sport_type__in=RECORDS_SPORT_TYPES[group]).dates('start_date', 'year')
+        for season in [ALL_TIME, *(day.year for day in years)]:
+            recompute(athlete.pk, kind, season)
+    return ActivityCurve.objects.filter(activity__athlete=athlete).count()
+
+
+def duration_label(seconds):
+    """``5s``, ``1m``, ``20m``, ``1h``: a curve duration, in its largest whole unit."""
+    for unit, size in (('h', 3600), ('m', 60)):
+        if seconds >= size and not seconds % size:
+            return f'{seconds // size}{unit}'
+    return f'{seconds}s'
+
+
+def _display(kind, value):
+    # (value, unit) as shown: pace per km from a speed, or watts.
+    if kind == 'pace':
+        return helpers.fmt_pace(1000 / value), '/km'
+    return f'{value:,.0f}', 'W'
+
+
+def _points(values, top):
+    # An SVG polyline's points: log-scaled duration across, the value up from the bottom.
+    low, high = _LOG_SPAN
+    return ' '.join(
+        f'{(math.log(d) - low) / (high - low) * 100:.1f},{CHART_HEIGHT * (1 - value / top):.1f}'
+        for d, value in zip(CURVE_DURATIONS, values) if value is not None)
+
+
+def curve_view(athlete, year):
+    """The dashboard's curve view of ``athlete``'s envelopes for ``year`` (``'all'``: all
+    time): per kind with an all-time envelope, its ``label``, the chart's ``points`` (the
+    season's, or all time's) and ``all_points`` (all time's, drawn behind a season), the
+    x-axis ``ticks`` and ``rows`` at ``CURVE_LISTED`` (value, unit and the activity that
+    set it). Reads the stored envelopes only."""
+    if athlete is None:
+        return []
+    season = int(year) if year != 'all' and year.isdigit() else ALL_TIME
+    envelopes = {(e.kind, e.season): e for e in CurveEnvelope.objects.filter(athlete=athlete,
+                                                                           season__in={season, ALL_TIME})}
+    low, high = _LOG_SPAN
+    ticks = [{'x': round((math.log(d) - low) / (high - low) * 100, 1), 'label': duration_label(d)}
+             for d in CURVE_LISTED]
+    view = []
+    for kind in CURVE_KINDS:
+        best = envelopes.get((kind, ALL_TIME))
+        if best is None:
+            continue
+        shown = envelopes.get((kind, season))
+        top = max(value for value in best.values if value is not None) * 1.05
+        rows = []
+        for d in CURVE_LISTED:
+            i = CURVE_DURATIONS.index(d)
+            value = shown.values[i] if shown else None
+            text, unit = _display(kind, value) if value is not None else ('—', '')
+            rows.append({'duration': duration_label(d), 'value': text, 'unit': unit,
+                         'id': shown.activities[i] if value is not None else None})
+        view.append({
+            'kind': kind,
+            'label': 'Pace' if kind == 'pace' else 'Power',
+            'points': _points(shown.values, top) if shown else '',
+            'all_points': _points(best.values, top) if season != ALL_TIME else '',
+            'ticks': ticks,
+            'rows': rows,
+        })
+    return view
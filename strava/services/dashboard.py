@@ -1,53 +1,384 @@
 """Dashboard-page computation: filtering the activity set and the headline aggregates.
 
 Mirrors the map's client-side search + sport/gear/year filters server-side so every
-dashboard section recomputes over the same matching activities.
+dashboard section recomputes over the same matching activities. ``sections`` builds the
+whole page in one pass over the athlete's activities, feeding each section's accumulator
+(see ``analytics``) as it goes. ``viewport_markers``/``viewport_routes`` serve the map,
+``heatmap_tile`` its route heatmap.
 """
+
+from django.db.models import Max, Min
+from django.db.models.functions import MD5
+from django.utils import timezone
+
 from strava import helpers
-from strava.sports import sport_matches
+from strava.consts import (
+    DASHBOARD_LATEST_COUNT, HEATMAP_CACHE_MAX_ZOOM, MAP_CLUSTER_LEVEL_OFFSET, MAP_GRID_BITS, MAP_MARKER_LIMIT,
+)
+from strava.services import analytics, gear as gear_service, heatmap, rolling
+from strava.sports import sport_matches, sport_options
 
 
-def filter_activities(all_activities, q, sport, gear, year, dist_min=None, dist_max=None):
-    """The activities matching the dashboard filter state (search text, sport group, gear,
-    year, distance window). Non-GPS activities (pool swims, treadmill runs) carry no marker
-    but still count. The distance bounds arrive in kilometres (the slider's unit) and are
-    compared against the metres stored on the row; a blank/non-numeric bound is ignored."""
+# The filter inputs, as named in the request (and the map's hidden #dash-filters form).
+FILTERS = ('q', 'sport', 'gear', 'year', 'dist_min', 'dist_max')
+
+# The sections an htmx filter change re-renders (each an out-of-band fragment of
+# hx/dashboard_results.html) with the filters each depends on. The client requests only
+# the sections whose inputs changed (``?sections=``), and only those are computed.
+SECTION_FILTERS = {
+    'stats': FILTERS,
+    'latest': FILTERS,
+    'map_note': FILTERS,
+    'aoty': FILTERS,
+    'trends': FILTERS,
+    'calendar': FILTERS,
+    'training_load': FILTERS,
+    'gear': FILTERS,
+    'numbers': FILTERS,
+    # The records and running performance have their own sport tabs: only the year applies.
+    'records': ('year',),
+    'run_perf': ('year',),
+}
+SECTIONS = frozenset(SECTION_FILTERS)
+SEASON_SECTIONS = frozenset({'records', 'run_perf'})
+
+
+def parse_sections(value):
+    """The sections named by a ``?sections=`` value (comma-separated); unknown names are
+    ignored, and a blank or absent value means every section."""
+    wanted = SECTIONS.intersection((value or '').split(','))
+    return frozenset(wanted) if wanted else SECTIONS
+
+
+def activity_filter(q, sport, gear, year, dist_min=None, dist_max=None):
+    """The dashboard filter state (search text, sport group, gear, year, distance window)
+    as a predicate ``matches(activity, day)`` — ``day`` being the activity's local date.
+    The distance bounds arrive in kilometres (the slider's unit) and are compared against
+    the metres stored on the row; a blank/non-numeric bound is ignored."""
     tokens = helpers.unaccent(q).split()
     lower = helpers.to_float(dist_min)
     upper = helpers.to_float(dist_max)
 
-    def matches(a):
-        haystack = helpers.unaccent(f'{a.name} {a.map_sport_type}')
+    def matches(a, day):
         return (
-            all(t in haystack for t in tokens)
+            (not tokens or all(t in helpers.unaccent(f'{a.name} {a.map_sport_type}') for t in tokens))
             and sport_matches(sport, a.sport_type)
             and (gear == 'all' or str(a.gear_id or '') == gear)
-            and (year == 'all' or str(helpers.local_date(a).year) == year)
+            and (year == 'all' or str(day.year) == year)
             and (lower is None or a.distance >= lower * 1000)
             and (upper is None or a.distance <= upper * 1000)
         )
 
-    return [a for a in all_activities if matches(a)]
+    return matches
+
+
+def filter_activities(all_activities, q, sport, gear, year, dist_min=None, dist_max=None):
+    """The activities matching the dashboard filter state (see ``activity_filter``).
+    Non-GPS activities (pool swims, treadmill runs) carry no marker but still count."""
+    matches = activity_filter(q, sport, gear, year, dist_min, dist_max)
+    tz = timezone.get_current_timezone()
+    return [a for a in all_activities if matches(a, helpers.local_date(a, tz))]
 
 
 def totals(activities):
     """Headline totals for the active filter."""
-    total_secs = sum((a.moving_time or 0) for a in activities)
-    return {
-        'distance_km': round(sum(a.distance for a in activities) / 1000),
-        'elev': round(sum((a.total_elevation_gain or 0) for a in activities)),
-        'time_h': int(total_secs // 3600),
-        'time_m': int(total_secs % 3600 // 60),
-        'activities': len(activities),
-        'active_days': len({helpers.local_date(a) for a in activities}),
-    }
+    return analytics.accumulate(Totals(), activities).result()
+
+
+class Totals:
+    """Accumulator for ``totals``."""
+
+    dated = True
+
+    def __init__(self):
+        self.secs = self.distance = self.elevation = self.count = 0
+        self.days = set()
+
+    def add(self, a, day):
+        self.secs += a.moving_time or 0
+        self.distance += a.distance
+        self.elevation += a.total_elevation_gain or 0
+        self.count += 1
+        self.days.add(day)
+
+    def result(self):
+        return {
+            'distance_km': round(self.distance / 1000),
+            'elev': round(self.elevation),
+            'time_h': int(self.secs // 3600),
+            'time_m': int(self.secs % 3600 // 60),
+            'activities': self.count,
+            'active_days': len(self.days),
+        }
 
 
 def activity_of_year(activities, year, today):
     """The biggest effort of the selected season (else overall). Ranked by calories (a
     cross-sport effort proxy) rather than distance, which isn't comparable across sports;
     summary-only activities have no calories and count as 0."""
-    season_year = int(year) if year != 'all' and year.isdigit() else today.year
-    year_acts = [a for a in activities if helpers.local_date(a).year == season_year]
-    pool = year_acts or activities
-    return max(pool, key=lambda a: a.calories or 0) if pool else None
+    return analytics.accumulate(ActivityOfYear(year, today), activities).result()
+
+
+class ActivityOfYear:
+    """Accumulator for ``activity_of_year``: the season's and the overall best so far
+    (ties keep the earliest, as ``max`` does)."""
+
+    dated = True
+
+    def __init__(self, year, today):
+        self.season_year = int(year) if year != 'all' and year.isdigit() else today.year
+        self.season = self.overall = None
+
+    def add(self, a, day):
+        calories = a.calories or 0
+        if self.overall is None or calories > (self.overall.calories or 0):
+            self.overall = a
+        if day.year == self.season_year and (self.season is None or calories > (self.season.calories or 0)):
+            self.season = a
+
+    def result(self):
+        return self.season or self.overall
+
+
+def filter_queryset(activities, q, sport, gear, year, dist_min=None, dist_max=None):
+    """``filter_activities`` pushed into the database: the ``activities`` queryset narrowed
+    by the same filter state, newest first. The search part (``map_search``) may
+    over-match, so the rows still go through ``activity_filter``. A year that isn't a
+    plain year string matches nothing, as it does in ``activity_filter``."""
+    if year != 'all' and not (year.isdigit() and str(int(year)) == year):
+        return activities.none()
+    return (activities.map_search(q).for_sport_selection(sport).for_gear(gear).for_year(year)
+            .for_distance(dist_min, dist_max).order_by('-start_date'))
+
+
+def filter_bar(activities, sport, params):
+    """The map filter bar's data from the public ``activities`` queryset: the sport
+    dropdown's options (every sport in the data, not just GPS-mapped ones) and the
+    distance slider's bounds (shared with the activities filter bar)."""
+    return {'sport_options': sport_options(activities),
+            **helpers.distance_slider_context(activities, sport, params)}
+
+
+def page(activities, q, sport, gear, year, dist_min, dist_max, today, wanted=None, home=None):
+    """The dashboard sections from the public ``activities`` queryset. A partial page (an
+    htmx filter change, naming the ``wanted`` sections) is ``filtered_sections``. The full
+    page is ``sections`` over every activity, loaded as lean rows (see ActivityRow).
+    ``home`` is the athlete's home from the start-location index (``bases.home``); without
+    it, it's estimated from the activities."""
+    if wanted is not None:
+        return filtered_sections(activities, q, sport, gear, year, dist_min, dist_max, today, wanted, home)
+    return sections(activities.order_by('-start_date').rows(), q, sport, gear, year, dist_min, dist_max, today,
+                    home)
+
+
+def sections(all_activities, q, sport, gear, year, dist_min, dist_max, today, home=None):
+    """Every dashboard section's context for the filter state, from one pass over
+    ``all_activities`` (newest first).
+
+    Each activity's local date is computed once and the activity is fed to the accumulators
+    of the sections it belongs to: the home location takes every activity, the personal
+    records and running performance the selected year's (those widgets have their own
+    sport tabs, which the other filters would empty), and everything else the filtered
+    activities. The map markers aren't part of the page; the map fetches them
+    (``analytics.map_markers``). A known ``home`` isn't estimated again."""
+    matches = activity_filter(q, sport, gear, year, dist_min, dist_max)
+    estimate = helpers.HomeLocation() if home is None else None
+    page = Sections(q, sport, gear, year, today)
+
+    tz = timezone.get_current_timezone()
+    for a in all_activities:
+        day = helpers.local_date(a, tz)
+        if estimate is not None:
+            estimate.add(a, day)
+        if year == 'all' or str(day.year) == year:
+            page.add_season(a, day)
+        if matches(a, day):
+            page.add(a, day)
+    return page.result(estimate.result() if estimate is not None else home)
+
+
+def filtered_sections(activities, q, sport, gear, year, dist_min, dist_max, today, wanted=SECTIONS, home=None):
+    """The ``wanted`` sections of a dashboard filter change, with the filters applied in
+    the database. Only the matching rows are fetched, plus the selected year's for the
+    records and running performance; a query no wanted section needs is skipped.
+    ``activities`` is the athlete's public activity queryset."""
+    matches = activity_filter(q, sport, gear, year, dist_min, dist_max)
+    page = Sections(q, sport, gear, year, today, wanted)
+
+    tz = timezone.get_current_timezone()
+    if wanted & SEASON_SECTIONS:
+        for a in filter_queryset(activities, '', 'all', 'all', year).rows():
+            page.add_season(a, helpers.local_date(a, tz))
+    if wanted - SEASON_SECTIONS:
+        for a in filter_queryset(activities, q, sport, gear, year, dist_min, dist_max).rows():
+            day = helpers.local_date(a, tz)
+            if matches(a, day):
+                page.add(a, day)
+    if 'records' in wanted and home is None:
+        home = activities.home_location()
+    return page.result(home)
+
+
+class Sections:
+    """The ``wanted`` filter-dependent dashboard sections, fed the selected year's
+    activities (``add_season``) and the filtered ones (``add``), each newest first.
+    ``result(home)`` is their context; only the wanted sections are accumulated."""
+
+    def __init__(self, q, sport, gear, year, today, wanted=SECTIONS):
+        no_filter = not q and sport == 'all' and gear == 'all' and year == 'all'
+        builders = {
+            'stats': Totals,
+            'aoty': lambda: ActivityOfYear(year, today),
+            'trends': lambda: analytics.Trends(today),
+            'calendar': lambda: analytics.ActivityCalendar(today),
+            'training_load': rolling.DailyTotals,
+            'gear': lambda: gear_service.GearUsage(no_filter),
+            'numbers': analytics.ByTheNumbers,
+            'records': analytics.Records,
+            'run_perf': analytics.RunPerformance,
+        }
+        self.accumulators = {name: build() for name, build in builders.items() if name in wanted}
+        self.season = [acc for name, acc in self.accumulators.items() if name in SEASON_SECTIONS]
+        self.filtered = [acc for name, acc in self.accumulators.items() if name not in SEASON_SECTIONS]
+        self.wanted, self.today = wanted, today
+        self.latest, self.hidden = [], 0
+
+    def add_season(self, a, day):
+        for accumulator in self.season:
+            accumulator.add(a, day)
+
+    def add(self, a, day):
+        for accumulator in self.filtered:
+            accumulator.add(a, day)
+        if len(self.latest) < DASHBOARD_LATEST_COUNT:
+            self.latest.append(a)
+        if not helpers.has_gps(a):
+            self.hidden += 1
+
+    def result(self, home):
+        acc, context = self.accumulators, {}
+        if 'stats' in acc:
+            context['stat'] = acc['stats'].result()
+        if 'latest' in self.wanted:
+            context['latest_activity'] = self.latest[0] if self.latest else None
+            context['latest_activities'] = self.latest
+        if 'map_note' in self.wanted:
+            # map_hidden_count counts only the filtered activities without GPS, so it
+            # tracks what the (client-side filtered) map displays.
+            context['map_hidden_count'] = self.hidden
+        if 'aoty' in acc:
+            context['aoty'] = acc['aoty'].result()
+        if 'records' in acc:
+            # Home is the most-used start location across all activities, stable across
+            # the year filter.
+            context['records'] = acc['records'].result(home)
+        if 'run_perf' in acc:
+            context['run_perf'] = acc['run_perf'].result()
+        if 'trends' in acc:
+            context['trends'] = acc['trends'].result()
+        if 'calendar' in acc:
+            context['calendar'] = acc['calendar'].result()
+        if 'training_load' in acc:
+            context['training_load'] = rolling.training_load_of(acc['training_load'].result(), self.today)
+        if 'gear' in acc:
+            context['gear_health'], context['gear_usage'] = acc['gear'].result()
+        if 'numbers' in acc:
+            context['fun_stats'], context['summary'] = acc['numbers'].result()
+        return context
+
+
+# --------------------------------------------------------------------------- #
+# Map
+# --------------------------------------------------------------------------- #
+CLUSTER_FIELDS = ('count', 'lat', 'lng', 'south', 'west', 'north', 'east')
+
+
+def viewport_markers(activities, filters=None, bbox=None, zoom=0):
+    """The map's markers payload for the public ``activities`` queryset: the GPS
+    activities matching the dashboard ``filters`` (a ``(q, sport, gear, year, dist_min,
+    dist_max)`` tuple; ``None``: unfiltered) whose routes cross the viewport ``bbox``
+    (``(west, south, east, north)``; ``None``: anywhere).
+
+    Up to ``MAP_MARKER_LIMIT`` matches are sent as markers (``analytics.map_markers``);
+    the payload is ``complete`` when nothing narrowed them, and the map then filters and
+    clusters them client-side with no further requests. Above the limit, the matches are
+    clustered in the database by their cell at the zoom's level of the spatial grid
+    (``clusters``, columnar like the markers), so the map scales to any number of
+    activities and re-requests its viewport as it moves. A request without a viewport
+    (the first) also carries the extent of the matches (``bounds``, south-west then
+    north-east) and the filter pills' options (``gear_options``, ``years``)."""
+    matching = _map_matches(activities, filters, bbox)
+    if matching.count() <= MAP_MARKER_LIMIT:
+        payload = analytics.map_markers(_recheck(matching.rows(), filters))
+        payload['complete'] = filters is None and bbox is None
+    else:
+        level = max(0, min(MAP_GRID_BITS, int(zoom) + MAP_CLUSTER_LEVEL_OFFSET))
+        clusters = matching.grid_clusters(level)
+        payload = {'clusters': {field: [c[field] if field == 'count' else round(c[field], 5) for c in clusters]
+                                for field in CLUSTER_FIELDS},
+                   'complete': False}
+    if bbox is None:
+        extent = matching.aggregate(Min('min_lat'), Min('min_lng'), Max('max_lat'), Max('max_lng'))
+        payload['bounds'] = ([[extent['min_lat__min'], extent['min_lng__min']],
+                              [extent['max_lat__max'], extent['max_lng__max']]]
+                             if extent['min_lat__min'] is not None else None)
+        gps = activities.exclude(start_lat=None)
+        gear = gps.exclude(gear=None).order_by().values_list('gear_id', 'gear__brand_name', 'gear__model_name')
+        payload['gear_options'] = [[gear_id, f'{brand} {model}'] for gear_id, brand, model in gear.distinct()]
+        payload['years'] = [d.year for d in gps.dates('start_date', 'year', order='DESC')]
+    return payload
+
+
+def viewport_routes(activities, filters=None, bbox=None, zoom=0):
+    """The routes (``analytics.map_routes``) of the newest ``MAP_MARKER_LIMIT`` map
+    activities matching ``filters`` in ``bbox``, as for ``viewport_markers``, at the
+    resolution that fits ``zoom`` (``helpers.route_resolution``)."""
+    field, max_zoom = helpers.route_resolution(zoom)
+    matching = _map_matches(activities, filters, bbox)[:MAP_MARKER_LIMIT]
+    if filters:
+        matching = activities.filter(pk__in=[a.pk for a in _recheck(matching.rows(), filters)])
+    return analytics.map_routes(matching.values_list('pk', field), max_zoom)
+
+
+def heatmap_tile(athlete, activities, filters, z, x, y):
+    """Heatmap tile ``z/x/y`` (``heatmap.render``) of the routes of the map activities
+    matching ``filters`` that touch it, as ``(fingerprint, draw)``: ``draw()`` returns the
+    PNG, so a tile the browser holds revalidates without being drawn. The unfiltered layer
+    is served from the disk cache up to ``HEATMAP_CACHE_MAX_ZOOM`` while the fingerprint
+    of those activities (``heatmap.fingerprint``) holds, so a write re-renders only the
+    tiles its routes touch; filtered and deeper tiles are rendered on demand."""
+    field, _max_zoom = helpers.route_resolution(z)
+    matching = _map_matches(activities, filters, heatmap.tile_bounds(z, x, y, pad=1)).exclude(polyline='')
+    rows = list(matching.values_list('pk', MD5(field)))
+    if filters:
+        kept = {a.pk for a in _recheck(matching.rows(), filters)}
+        rows = [row for row in rows if row[0] in kept]
+    digest, drawn = heatmap.fingerprint(rows), {row[0] for row in rows}
+
+    def render():
+        polylines = (line for pk, line in matching.values_list('pk', field) if pk in drawn)
+        return heatmap.render(polylines, z, x, y)
+
+    def draw():
+        if not rows:
+            return heatmap.BLANK
+        if filters or z > HEATMAP_CACHE_MAX_ZOOM:
+            return render()
+        return heatmap.cached_tile(str(athlete.pk if athlete else 'none'), z, x, y, digest, render)
+
+    return digest, draw
+
+
+def _map_matches(activities, filters, bbox):
+    gps = activities.exclude(start_lat=None)
+    matching = filter_queryset(gps, *filters) if filters else gps.order_by('-start_date')
+    return matching.in_bbox(*bbox) if bbox else matching
+
+
+def _recheck(rows, filters):
+    # The search part of filter_queryset may over-match (see map_search).
+    if not filters:
+        return rows
+    matches = activity_filter(*filters)
+    tz = timezone.get_current_timezone()
+    return [a for a in rows if matches(a, helpers.local_date(a, tz))]
@@ -0,0 +1,236 @@
+"""Explorer tiles: the zoom-``EXPLORER_ZOOM`` map tiles an athlete's routes have visited.
+
+Backed by an inverted index, ``ExplorerTile``: one row per visited tile with the activity
+that first reached it. The index is kept current one activity at a time as activities
+are written (``record``, ``forget``). Importing an activity decodes that one route. It
+never re-reads the athlete's other routes, except where a tile loses its first visit,
+which only re-reads the routes crossing that tile. ``rebuild`` recomputes an athlete's
+index from scratch (``manage.py rebuild_explorer_tiles``).
+
+From the visited set come the statshunters-style figures: the largest fully visited
+square (``max_square``) and the largest cluster, a connected group of visited tiles whose
+four neighbours are all visited (``max_cluster``). Only public activities count, as
+everywhere else on the public pages.
+"""
+import math
+
+from django.db.models import Q
+from django.utils import timezone
+
+from strava import helpers
+from strava.consts import EXPLORER_ZOOM
+from strava.models import Activity, ExplorerTile
+from strava.services import heatmap
+
+# Consecutive route points further apart than this many tiles are a recording gap (a
+# paused watch, a ferry), not a path: only their own tiles count, not the ones between.
+MAX_STEP_TILES = 8
+BATCH_SIZE = 1000
+
+
+def tile_xy(lat, lng, zoom=EXPLORER_ZOOM):
+    """The fractional Web Mercator tile coordinates of a point at ``zoom``."""
+    n = 2 ** zoom
+    lat = max(-85.0511, min(85.0511, lat))
+    return (lng + 180) / 360 * n, (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+
+
+def route_tiles(polyline, zoom=EXPLORER_ZOOM):
+    """The ``(x, y)`` tiles an encoded route passes through: each point's tile and, walked
+    with a grid traversal (Amanatides–Woo), every tile a segment between two points
+    crosses."""
+    tiles = set()
+    previous = None
+    for lat, lng in helpers.decode_polyline(polyline):
+        fx, fy = tile_xy(lat, lng, zoom)
+        cx, cy = int(fx), int(fy)
+        tiles.add((cx, cy))
+        if previous is not None:
+            px, py = previous
+            steps = abs(cx - int(px)) + abs(cy - int(py))
+            if 1 < steps <= MAX_STEP_TILES:
+                _cross(px, py, fx, fy, steps, tiles)
+        previous = fx, fy
+    return tiles
+
+
+def _cross(x0, y0, x1, y1, steps, tiles):
+    # The tiles the segment (x0, y0)–(x1, y1) crosses, one tile boundary per step.
+    cx, cy = int(x0), int(y0)
+    dx, dy = x1 - x0, y1 - y0
+    step_x, step_y = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+    next_x = ((cx + (step_x > 0)) - x0) / dx if dx else math.inf
+    next_y = ((cy + (step_y > 0)) - y0) / dy if dy else math.inf
+    delta_x, delta_y = (abs(1 / dx) if dx else math.inf), (abs(1 / dy) if dy else math.inf)
+    for _ in range(steps):
+        if next_x < next_y:
+            cx += step_x
+            next_x += delta_x
+        else:
+            cy += step_y
+            next_y += delta_y
+        tiles.add((cx, cy))
+
+
+def _counts(activity):
+    return not activity.is_private and bool(activity.polyline) and activity.athlete_id is not None
+
+
+def record(activity):
+    """Fold a written ``activity`` into its athlete's index: the tiles its route visits
+    first (or earlier than the stored first visit) now point at it, and the tiles it no
+    longer visits (its route changed, or it's now private) go to their next visitor."""
+    tiles = route_tiles(activity.polyline) if _counts(activity) else set()
+    dropped = set(ExplorerTile.objects.filter(activity=activity).values_list('x', 'y')) - tiles
+    if dropped:
+        _reassign(activity.athlete_id, dropped, exclude={activity.pk})
+    if not tiles:
+        return
+
+    xs, ys = [x for x, _y in tiles], [y for _x, y in tiles]
+    existing = {
+        (tile.x, tile.y): tile
+        for tile in ExplorerTile.objects.filter(athlete_id=activity.athlete_id, x__range=(min(xs), max(xs)),
+                                                y__range=(min(ys), max(ys)))
+        if (tile.x, tile.y) in tiles
+    }
+    earlier = [tile for tile in existing.values()
+               if tile.activity_id != activity.pk and tile.visited > activity.start_date]
+    for tile in earlier:
+        tile.activity, tile.visited = activity, activity.start_date
+    ExplorerTile.objects.bulk_update(earlier, ['activity', 'visited'], batch_size=BATCH_SIZE)
+    ExplorerTile.objects.bulk_create(
+        [ExplorerTile(athlete_id=activity.athlete_id, x=x, y=y, activity=activity, visited=activity.start_date)
+         for x, y in tiles - existing.keys()],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+
+
+def forget(activities):
+    """Hand the tiles the given ``activities`` (a queryset, about to be deleted) first
+    visited to each tile's next visitor. Call before the delete: the rows cascade away
+    with their activity, and with them the record of which tiles need a new visitor."""
+    lost = {}
+    for athlete_id, x, y in ExplorerTile.objects.filter(activity__in=activities).values_list('athlete_id', 'x', 'y'):
+        lost.setdefault(athlete_id, set()).add((x, y))
+    excluded = set(activities.values_list('pk', flat=True))
+    for athlete_id, tiles in lost.items():
+        _reassign(athlete_id, tiles, exclude=excluded)
+
+
+def _reassign(athlete_id, tiles, exclude):
+    # Re-derive the first visit of ``tiles`` from the athlete's other public routes that
+    # cross them (found by route box, then checked tile by tile), oldest first.
+    ExplorerTile.objects.filter(athlete_id=athlete_id, activity__in=exclude).filter(
+        _tiles_q(tiles)).delete()
+    boxes = [heatmap.tile_bounds(EXPLORER_ZOOM, x, y) for x, y in tiles]
+    west, south = min(b[0] for b in boxes), min(b[1] for b in boxes)
+    east, north = max(b[2] for b in boxes), max(b[3] for b in boxes)
+    candidates = (Activity.objects.filter(athlete_id=athlete_id).public().exclude(polyline='')
+                  .exclude(pk__in=exclude).in_bbox(west, south, east, north).order_by('start_date')
+                  .values_list('pk', 'start_date', 'polyline'))
+    remaining, found = set(tiles), []
+    for pk, start_date, polyline in candidates.iterator():
+        for x, y in route_tiles(polyline) & remaining:
+            found.append(ExplorerTile(athlete_id=athlete_id, x=x, y=y, activity_id=pk, visited=start_date))
+            remaining.discard((x, y))
+        if not remaining:
+            break
+    ExplorerTile.objects.bulk_create(found, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def _tiles_q(tiles):
+    condition = Q()
+    for x, y in tiles:
+        condition |= Q(x=x, y=y)
+    return condition
+
+
+def rebuild(athlete):
+    """Recompute ``athlete``'s whole index from their public routes, oldest first.
+    Returns the number of visited tiles."""
+    ExplorerTile.objects.filter(athlete=athlete).delete()
+    first = {}
+    routes = (Activity.objects.for_athlete(athlete).public().exclude(polyline='').order_by('start_date')
+              .values_list('pk', 'start_date', 'polyline'))
+    for pk, start_date, polyline in routes.iterator():
+        for tile in route_tiles(polyline):
+            first.setdefault(tile, (pk, start_date))
+    ExplorerTile.objects.bulk_create(
+        [ExplorerTile(athlete=athlete, x=x, y=y, activity_id=pk, visited=visited)
+         for (x, y), (pk, visited) in first.items()],
+        batch_size=BATCH_SIZE,
+    )
+    return len(first)
+
+
+def max_square(tiles):
+    """The largest square of visited ``tiles`` as ``(x, y, size)`` (its top-left tile),
+    or ``None`` without tiles. Dynamic programming over the tiles in row order: a tile
+    ends a square one larger than the smallest of those ending left, above and above-left
+    of it."""
+    sizes, best = {}, None
+    for x, y in sorted(tiles, key=lambda tile: (tile[1], tile[0])):
+        size = 1 + min(sizes.get((x - 1, y), 0), sizes.get((x, y - 1), 0), sizes.get((x - 1, y - 1), 0))
+        sizes[x, y] = size
+        if best is None or size > best[2]:
+            best = (x - size + 1, y - size + 1, size)
+    return best
+
+
+def max_cluster(tiles):
+    """The largest cluster of visited ``tiles``: of the tiles whose four neighbours are
+    all visited, the largest group connected edge to edge, as a set (empty if none)."""
+    inner = {(x, y) for x, y in tiles
+             if {(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)} <= tiles}
+    best, seen = set(), set()
+    for start in inner:
+        if start in seen:
+            continue
+        group, stack = set(), [start]
+        seen.add(start)
+        while stack:
+            x, y = stack.pop()
+            group.add((x, y))
+            for neighbour in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if neighbour in inner and neighbour not in seen:
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        if len(group) > len(best):
+            best = group
+    return best
+
+
+def summary(athlete, today):
+    """The explorer widget's figures for ``athlete``: the visited tiles, those first
+    visited in ``today``'s year, the max square (``(x, y, size)`` or ``None``) and the
+    max cluster (its tiles, sorted)."""
+    rows = ExplorerTile.objects.filter(athlete=athlete).values_list('x', 'y', 'visited')
+    tiles, this_year = set(), 0
+    for x, y, visited in rows:
+        tiles.add((x, y))
+        this_year += timezone.localtime(visited).year == today.year
+    return {
+        'zoom': EXPLORER_ZOOM,
+        'tiles': len(tiles),
+        'this_year': this_year,
+        'square': max_square(tiles),
+        'cluster': sorted(max_cluster(tiles)),
+    }
+
+
+def overlay(athlete, bbox, summary):
+    """The explorer map overlay's payload for the tiles in ``bbox`` (``(west, south,
+    east, north)``): the visited tiles, columnar (``x``, ``y``, ``cluster``: whether the
+    tile is in the max cluster), and the max square from ``summary``."""
+    west, south, east, north = bbox
+    (x0, y0), (x1, y1) = tile_xy(north, max(-180, west)), tile_xy(south, min(180, east))
+    tiles = (ExplorerTile.objects.filter(athlete=athlete, x__range=(int(x0), int(x1)), y__range=(int(y0), int(y1)))
+             .order_by('y', 'x').values_list('x', 'y'))
+    cluster = set(map(tuple, summary['cluster']))
+    payload = {'zoom': EXPLORER_ZOOM, 'x': [], 'y': [], 'cluster': [], 'square': summary['square']}
+    for x, y in tiles:
+        payload['x'].append(x)
+        payload['y'].append(y)
+        payload['cluster'].append(int((x, y) in cluster))
+    return payload
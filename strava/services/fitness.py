@@ -0,0 +1,186 @@
+"""Fitness, fatigue and form: an athlete's training load as a stored daily series.
+
+Each public activity has a load (``load``). With a power meter and a known FTP it's the
+activity's TSS: hours × IF² × 100, IF its normalised power over the FTP (the power-based
+option, on unless ``STRAVA_TRAINING_LOAD_POWER`` is False). Otherwise it's Banister's
+TRIMP from its average heart rate, and without one an hourly rate for its sport. A day's
+load is the sum of its activities'. Fitness and fatigue are exponentially weighted
+averages of the daily load over ``FITNESS_DAYS`` and ``FATIGUE_DAYS`` (the CTL and ATL of
+the performance-manager model). Form (TSB) is fitness minus fatigue.
+
+The series is stored a row a day (``TrainingDay``), from the first public activity's day
+to the last. A day's averages follow from the day before and its own load alone, so a
+write recomputes only from the written activity's day forward (``refresh``), seeded from
+the stored day before it: for a new activity, a row or two. ``rebuild`` recomputes the
+whole series in one query for the activities, one pass over the days and one bulk insert.
+``summary`` is the dashboard's view, read from the stored rows and decayed over the rest
+days since the last.
+"""
+import datetime
+import math
+
+from django.conf import settings
+from django.utils import timezone
+
+from strava.consts import (
+    FATIGUE_DAYS, FITNESS_CHART_DAYS, FITNESS_DAYS, FORM_FRESH, FORM_OVERREACHING, FORM_TRAINING, LOAD_PER_HOUR,
+    LOAD_PER_HOUR_DEFAULT, TRIMP_HR_MAX, TRIMP_HR_REST,
+)
+from strava.models import Activity, Athlete, TrainingDay
+from strava.sports import RECORDS_SPORT_TYPES
+
+ONE_DAY = datetime.timedelta(days=1)
+# The columns an activity's load is computed from, after its start date.
+LOAD_FIELDS = ('sport_type', 'moving_time', 'average_heartrate', 'weighted_average_watts')
+_PER_HOUR = {sport: rate for group, rate in LOAD_PER_HOUR.items() for sport in RECORDS_SPORT_TYPES[group]}
+# The chart's y extent, in viewBox units (the x axis spans 0–100).
+CHART_HEIGHT = 40
+
+
+def load(sport_type, moving_time, average_heartrate, weighted_average_watts, ftp=None):
+    """An activity's training load from its ``LOAD_FIELDS`` (see the module docstring)."""
+    hours = (moving_time or 0) / 3600
+    if not hours:
+        return 0.0
+    if ftp and weighted_average_watts and getattr(settings, 'STRAVA_TRAINING_LOAD_POWER', True):
+        return hours * (weighted_average_watts / ftp) ** 2 * 100
+    if average_heartrate:
+        rest = getattr(settings, 'STRAVA_HEARTRATE_REST', TRIMP_HR_REST)
+        top = getattr(settings, 'STRAVA_HEARTRATE_MAX', TRIMP_HR_MAX)
+        reserve = min(max((average_heartrate - rest) / (top - rest), 0.0), 1.0)
+        return hours * 60 * reserve * 0.64 * math.exp(1.92 * reserve)
+    return hours * _PER_HOUR.get(sport_type, LOAD_PER_HOUR_DEFAULT)
+
+
+def daily_loads(athlete_id, ftp=None, since=None):
+    """``{day: load}`` of ``athlete_id``'s public activities (from the local day ``since``)."""
+    activities = Activity.objects.filter(athlete_id=athlete_id).public()
+    if since is not None:
+        activities = activities.filter(
+            start_date__gte=timezone.make_aware(datetime.datetime.combine(since, datetime.time.min)))
+    tz, daily = timezone.get_current_timezone(), {}
+    for start_date, *fields in activities.order_by().values_list('start_date', *LOAD_FIELDS):
+        day = timezone.localtime(start_date, tz).date()
+        daily[day] = daily.get(day, 0.0) + load(*fields, ftp=ftp)
+    return daily
+
+
+def series(daily, first, fitness=0.0, fatigue=0.0):
+    """``(day, load, fitness, fatigue)`` for every day from ``first`` to the last of
+    ``daily`` (``{day: load}``), the averages carried on from ``fitness`` and
+    ``fatigue`` the day before ``first``."""
+    rows, day, last = [], first, max(daily)
+    while day <= last:
+        value = daily.get(day, 0.0)
+        fitness += (value - fitness) / FITNESS_DAYS
+        fatigue += (value - fatigue) / FATIGUE_DAYS
+        rows.append((day, value, fitness, fatigue))
+        day += ONE_DAY
+    return rows
+
+
+def _recompute(athlete_id, since=None):
+    # Rewrite the stored series from the day after the last stored day before ``since``
+    # (all of it without one) and return the number of days written.
+    seed = None
+    if since is not None:
+        seed = TrainingDay.objects.filter(athlete_id=athlete_id, day__lt=since).order_by('-day').first()
+    begin = seed.day + ONE_DAY if seed else None
+    ftp = Athlete.objects.filter(pk=athlete_id).values_list('ftp', flat=True).first()
+    daily = daily_loads(athlete_id, ftp, begin)
+    stale = TrainingDay.objects.filter(athlete_id=athlete_id)
+    (stale.filter(day__gte=begin) if begin else stale).delete()
+    if not daily:
+        # The series' last activity went: end it on the last day that still has a load.
+        last = stale.filter(load__gt=0).order_by('-day').values_list('day', flat=True).first()
+        (stale.filter(day__gt=last) if last else stale).delete()
+        return 0
+    rows = series(daily, begin or min(daily), *((seed.fitness, seed.fatigue) if seed else ()))
+    TrainingDay.objects.bulk_create([
+        TrainingDay(athlete_id=athlete_id, day=day, load=value, fitness=fitness, fatigue=fatigue)
+        for day, value, fitness, fatigue in rows
+    ], batch_size=1000)
+    return len(rows)
+
+
+def refresh(athlete_id, *start_dates):
+    """Recompute ``athlete_id``'s series from the earliest local day of the given start
+    dates forward (``None``s are skipped). Pass a written activity's start date from before
+    and after the write, so a moved or deleted activity leaves its old day too."""
+    days = [timezone.localtime(start_date).date() for start_date in start_dates if start_date is not None]
+    if athlete_id and days:
+        _recompute(athlete_id, min(days))
+
+
+def record(activity, previous_start=None):
+    """Fold a written ``activity`` into its athlete's series (``refresh`` from its day, or
+    its day before the write, ``previous_start``, if earlier)."""
+    refresh(activity.athlete_id, previous_start, activity.start_date)
+
+
+def rebuild(athlete):
+    """Recompute ``athlete``'s whole series. Returns the number of days."""
+    return _recompute(athlete.pk)
+
+
+def _zone(form):
+    if form > FORM_FRESH:
+        return 'fresh'
+    if form >= FORM_TRAINING:
+        return 'neutral'
+    return 'training' if form >= FORM_OVERREACHING else 'overreaching'
+
+
+def summary(athlete, today, days=FITNESS_CHART_DAYS):
+    """The dashboard's fitness card for ``athlete`` on ``today``: the day's ``fitness``,
+    ``fatigue``, ``form`` (with its ``zone``) and ``ramp`` (the fitness gained over the
+    last week), and the ``chart`` of the last ``days`` days (SVG polyline ``points`` of
+    each, the zero line's ``zero`` and the date range). ``None`` without a stored series.
+    Reads the stored rows only; the rest days after the last are decayed."""
+    if athlete is None:
+        return None
+    first = today - datetime.timedelta(days=days - 1)
+    stored = TrainingDay.objects.filter(athlete=athlete, day__lte=today)
+    rows = {day: (fitness, fatigue)
+            for day, fitness, fatigue in stored.filter(day__gte=first).values_list('day', 'fitness', 'fatigue')}
+    seed = stored.filter(day__lt=first).order_by('-day').values_list('day', 'fitness', 'fatigue').first()
+    if not rows and seed is None:
+        return None
+    fitness = fatigue = 0.0
+    if seed is not None:
+        rest = (first - seed[0]).days - 1
+        fitness = seed[1] * (1 - 1 / FITNESS_DAYS) ** rest
+        fatigue = seed[2] * (1 - 1 / FATIGUE_DAYS) ** rest
+    daily = []
+    for i in range(days):
+        day = first + datetime.timedelta(days=i)
+        if day in rows:
+            fitness, fatigue = rows[day]
+        else:
+            fitness -= fitness / FITNESS_DAYS
+            fatigue -= fatigue / FATIGUE_DAYS
+        daily.append((fitness, fatigue, fitness - fatigue))
+
+    low = min(0.0, *(form for _fitness, _fatigue, form in daily))
+    high = max(1.0, *(max(fitness, fatigue) for fitness, fatigue, _form in daily))
+
+    def points(column):
+        return ' '.join(f'{i / (days - 1) * 100:.1f},{CHART_HEIGHT * (high - values[column]) / (high - low):.1f}'
+                        for i, values in enumerate(daily))
+
+    fitness, fatigue, form = daily[-1]
+    return {
+        'fitness': round(fitness),
+        'fatigue': round(fatigue),
+        'form': round(form),
+        'zone': _zone(form),
+        'ramp': round(fitness - daily[-8][0], 1) if days > 7 else None,
+        'chart': {
+            'fitness': points(0),
+            'fatigue': points(1),
+            'form': points(2),
+            'zero': round(CHART_HEIGHT * high / (high - low), 1),
+            'start': first,
+            'end': today,
+        },
+    }
@@ -1,8 +1,9 @@
 """Gear aggregation and display computation.
 
 ``dashboard_sections`` powers the dashboard's gear-health table + usage donut over the
-currently filtered activities; ``gear_page`` decorates the gear-list page's already-queried
-gear with wear/badge display fields and its summary totals.
+currently filtered activities; ``page`` decorates the gear-list page's already-queried gear
+(whose usage statistics are denormalised columns) with wear/badge display fields and its
+summary totals.
 """
 from strava.models import Gear
 
@@ -21,43 +22,59 @@ def dashboard_sections(activities, no_filter):
     """Gear health rows + usage-donut slices, aggregated over the filtered activities
     (not DB-wide totals) so gear stats track the active filter like every other section.
     With no active filter, gear unused for over a year is hidden."""
-    gear_acts, gear_dist = {}, {}
+    usage = GearUsage(no_filter)
     for a in activities:
+        usage.add(a, None)
+    return usage.result()
+
+
+class GearUsage:
+    """Accumulator for ``dashboard_sections`` (see ``analytics`` for the protocol)."""
+
+    dated = False
+
+    def __init__(self, no_filter):
+        self.no_filter = no_filter
+        self.acts, self.dist = {}, {}
+
+    def add(self, a, day):
         if a.gear_id:
-            gear_acts[a.gear_id] = gear_acts.get(a.gear_id, 0) + 1
-            gear_dist[a.gear_id] = gear_dist.get(a.gear_id, 0) + a.distance
-    gears = list(Gear.objects.all())
-    if no_filter:
-        gears = [g for g in gears if not g.is_old]
-    for g in gears:
-        g.activity_count = gear_acts.get(g.pk, 0)
-        g.distance_sum = gear_dist.get(g.pk, 0)
-        g.distance_km = round((g.distance_sum or 0) / 1000)
-        g.wear_pct = min(100, round(g.distance_km / g.lifespan_km * 100)) if g.lifespan_km else 0
-        g.wear_alert = 75 <= g.wear_pct < 100
-    if not no_filter:
-        # Under an active filter, only show gear used by the matching activities.
-        gears = [g for g in gears if g.activity_count]
-    gear_health = sorted(gears, key=lambda g: g.activity_count, reverse=True)
+            self.acts[a.gear_id] = self.acts.get(a.gear_id, 0) + 1
+            self.dist[a.gear_id] = self.dist.get(a.gear_id, 0) + a.distance
+
+    def result(self):
+        no_filter, gear_acts, gear_dist = self.no_filter, self.acts, self.dist
+        # Unused-for-a-year gear is dropped in SQL off the denormalised last-used date.
+        gears = list(Gear.objects.by_age('active') if no_filter else Gear.objects.all())
+        for g in gears:
+            g.activity_count = gear_acts.get(g.pk, 0)
+            g.distance_sum = gear_dist.get(g.pk, 0)
+            g.distance_km = round((g.distance_sum or 0) / 1000)
+            g.wear_pct = min(100, round(g.distance_km / g.lifespan_km * 100)) if g.lifespan_km else 0
+            g.wear_alert = 75 <= g.wear_pct < 100
+        if not no_filter:
+            # Under an active filter, only show gear used by the matching activities.
+            gears = [g for g in gears if g.activity_count]
+        gear_health = sorted(gears, key=lambda g: g.activity_count, reverse=True)
 
-    used = sorted((g for g in gears if g.activity_count), key=lambda g: g.activity_count, reverse=True)
-    gear_usage = [
-        {
-            'name': str(g),
-            'acts': g.activity_count,
-            'color': DONUT_PALETTE[i % len(DONUT_PALETTE)][0],
-            'hoverColor': DONUT_PALETTE[i % len(DONUT_PALETTE)][1],
-        }
-        for i, g in enumerate(used)
-    ]
-    return gear_health, gear_usage
+        used = sorted((g for g in gears if g.activity_count), key=lambda g: g.activity_count, reverse=True)
+        gear_usage = [
+            {
+                'name': str(g),
+                'acts': g.activity_count,
+                'color': DONUT_PALETTE[i % len(DONUT_PALETTE)][0],
+                'hoverColor': DONUT_PALETTE[i % len(DONUT_PALETTE)][1],
+            }
+            for i, g in enumerate(used)
+        ]
+        return gear_health, gear_usage
 
 
 def page(gear_list):
     """Decorate the gear-list page's gear with wear/badge display fields and split them
     into bikes/shoes. Returns ``(gear_list, bikes, shoes, summary)``."""
     for g in gear_list:
-        g.distance_km = round((g.distance_sum or 0) / 1000)
+        g.distance_km = round((g.public_distance or 0) / 1000)
         g.wear_pct = min(100, round(g.distance_km / g.lifespan_km * 100)) if g.lifespan_km else 0
         g.wear_class = 'wear-low' if g.wear_pct < 40 else 'wear-mid' if g.wear_pct < 75 else 'wear-high'
         g.is_retired = g.wear_pct >= 100
@@ -77,6 +94,6 @@ def page(gear_list):
         'bikes': len(bikes),
         'shoes': len(shoes),
         'total_km': sum(g.distance_km for g in gear_list),
-        'activities': sum(g.activity_count for g in gear_list),
+        'activities': sum(g.public_activity_count for g in gear_list),
     }
     return gear_list, bikes, shoes, summary
@@ -0,0 +1,213 @@
+"""Route heatmap tiles: every route of an athlete rasterised into 256 px ``z/x/y`` PNGs.
+
+The dashboard map draws routes as vector lines, which stops scaling past a few thousand.
+The heatmap layer is plain image tiles instead, so the client cost is the same for ten
+routes or ten thousand. A tile counts, per pixel, the routes passing through it (each
+route once, its polyline at the resolution that fits the zoom, see
+``helpers.route_resolution``) and colours the counts on a log scale up to
+``HEATMAP_SATURATION`` routes.
+
+Rendered tiles of an athlete's unfiltered layer, up to ``HEATMAP_CACHE_MAX_ZOOM``, are
+kept on disk under ``STRAVA_HEATMAP_ROOT`` (default: a ``strava-heatmap`` directory in
+the system temp dir), each named after a fingerprint of the activities whose route box
+touches it and of their routes (``fingerprint``). A write changes the fingerprints of the
+tiles its routes touch, so only those re-render; every other tile is served from disk.
+The cache thus holds at most one file per tile the athlete's routes cross. Empty tiles
+are never written: they are all the one ``BLANK`` PNG. ``dashboard.heatmap_tile`` picks
+the activities; this module is the geometry, the rasteriser, the PNG encoder and the disk
+cache.
+"""
+import hashlib
+import math
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+
+from strava import helpers
+from strava.consts import HEATMAP_COLORS, HEATMAP_SATURATION
+
+TILE_SIZE = 256
+
+
+def tile_bounds(z, x, y, pad=0):
+    """The ``(west, south, east, north)`` box of Web Mercator tile ``z/x/y``, grown by
+    ``pad`` pixels each way (a route just outside still draws its edge pixel)."""
+    n = 2 ** z
+    pad /= TILE_SIZE
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (
+        (x - pad) / n * 360 - 180, lat(min(n, y + 1 + pad)),
+        (x + 1 + pad) / n * 360 - 180, lat(max(0, y - pad)),
+    )
+
+
+def _projector(z, x, y):
+    # Lat/lng to pixel coordinates within the tile (Web Mercator, 256 px tiles).
+    scale = TILE_SIZE * 2 ** z
+    ox, oy = x * TILE_SIZE, y * TILE_SIZE
+
+    def project(point):
+        lat, lng = point
+        s = math.sin(math.radians(max(-85.0511, min(85.0511, lat))))
+        return (lng + 180) / 360 * scale - ox, (0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * scale - oy
+
+    return project
+
+
+def segments(points, z, x, y):
+    """The segments of a route (``[(lat, lng), …]``) that may cross tile ``z/x/y``, as
+    pixel coordinate pairs. Segments wholly off one side of the tile are dropped before
+    projecting, so a long route costs little on the tiles it only passes near."""
+    west, south, east, north = tile_bounds(z, x, y, pad=1)
+    project = _projector(z, x, y)
+    if len(points) == 1:
+        points = points * 2
+    last, b = None, None
+    for i in range(len(points) - 1):
+        (lat1, lng1), (lat2, lng2) = points[i], points[i + 1]
+        if ((lat1 < south and lat2 < south) or (lat1 > north and lat2 > north)
+                or (lng1 < west and lng2 < west) or (lng1 > east and lng2 > east)):
+            continue
+        # Consecutive kept segments share a point: project it once.
+        a = b if last == i else project(points[i])
+        b, last = project(points[i + 1]), i + 1
+        yield a, b
+
+
+def _clip(x1, y1, x2, y2):
+    # Liang–Barsky: the part of the segment inside the tile, or None.
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1), (dx, TILE_SIZE - 1 - x1), (-dy, y1), (dy, TILE_SIZE - 1 - y1)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    return x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy
+
+
+def route_pixels(segments):
+    """The set of tile pixels (``row * TILE_SIZE + col``) a route's projected
+    ``segments`` pass through, each clipped to the tile and walked with Bresenham's line
+    algorithm."""
+    pixels = set()
+    for (ax, ay), (bx, by) in segments:
+        clipped = _clip(ax, ay, bx, by)
+        if clipped is None:
+            continue
+        x0, y0, x1, y1 = (int(v) for v in clipped)
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        err = dx + dy
+        while True:
+            pixels.add(y0 * TILE_SIZE + x0)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+    return pixels
+
+
+def accumulate(polylines, z, x, y):
+    """Per pixel of tile ``z/x/y``, the number of the encoded ``polylines`` through it, as
+    ``{pixel: count}`` (unvisited pixels absent)."""
+    counts = {}
+    for polyline in polylines:
+        if not polyline:
+            continue
+        for pixel in route_pixels(segments(helpers.decode_polyline(polyline), z, x, y)):
+            counts[pixel] = counts.get(pixel, 0) + 1
+    return counts
+
+
+def _color(count):
+    # Log scale up to HEATMAP_SATURATION, interpolated between the HEATMAP_COLORS stops.
+    t = min(1.0, math.log1p(count) / math.log1p(HEATMAP_SATURATION)) * (len(HEATMAP_COLORS) - 1)
+    i = min(int(t), len(HEATMAP_COLORS) - 2)
+    f = t - i
+    return bytes(round(a + (b - a) * f) for a, b in zip(HEATMAP_COLORS[i], HEATMAP_COLORS[i + 1]))
+
+
+def encode_png(counts):
+    """The counts (``accumulate``) as a 256×256 RGBA PNG, unvisited pixels transparent."""
+    row_bytes = TILE_SIZE * 4
+    raw = bytearray((row_bytes + 1) * TILE_SIZE)  # each row: filter byte 0, then RGBA
+    colors = {}
+    for pixel, count in counts.items():
+        row, col = divmod(pixel, TILE_SIZE)
+        offset = row * (row_bytes + 1) + 1 + col * 4
+        raw[offset:offset + 4] = colors.get(count) or colors.setdefault(count, _color(count))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', TILE_SIZE, TILE_SIZE, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(bytes(raw), 6))
+            + chunk(b'IEND', b''))
+
+
+# Every tile no route crosses.
+BLANK = encode_png({})
+
+
+def render(polylines, z, x, y):
+    """Tile ``z/x/y`` of the encoded ``polylines`` as PNG bytes (``BLANK`` if none
+    crosses it)."""
+    counts = accumulate(polylines, z, x, y)
+    return encode_png(counts) if counts else BLANK
+
+
+def fingerprint(rows):
+    """A digest of the activities drawn on a tile, from ``(pk, route digest)`` rows (the
+    digest of the polyline the tile draws): it changes when one is added, removed or
+    hidden, or its route changes."""
+    return hashlib.sha1(repr(sorted(rows)).encode()).hexdigest()[:16]
+
+
+def _root():
+    return Path(getattr(settings, 'STRAVA_HEATMAP_ROOT', None) or Path(tempfile.gettempdir()) / 'strava-heatmap')
+
+
+def cached_tile(layer, z, x, y, digest, compute):
+    """Tile ``z/x/y`` of ``layer`` (a path segment: the athlete and filter state) for the
+    activities ``digest`` fingerprints: read from disk, or ``compute()``-d and stored
+    there, replacing the tile's files for earlier fingerprints. A ``BLANK`` tile isn't
+    stored."""
+    directory = _root() / layer / str(z) / str(x)
+    path = directory / f'{y}-{digest}.png'
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    png = compute()
+    if png is BLANK:
+        return png
+    directory.mkdir(parents=True, exist_ok=True)
+    for stale in directory.glob(f'{y}-*.png'):
+        stale.unlink(missing_ok=True)
+    # Written aside and renamed, so a concurrent request never reads half a tile.
+    temporary = directory / f'.{y}-{digest}.{os.getpid()}.tmp'
+    temporary.write_bytes(png)
+    os.replace(temporary, path)
+    return png
@@ -0,0 +1,38 @@
+"""Where activities start: the per-country breakdown behind the dashboard's countries
+widget.
+
+Every activity stores its start's country and region, reverse geocoded offline as it's
+saved (``strava.geocode``; ``manage.py geocode_activities`` for rows stored before).
+The breakdown is grouped in the database over the indexed columns, and the activities
+page filters by country the same way (``ActivityQuerySet.for_country``).
+"""
+from django.db.models import Count
+from django.utils import timezone
+
+from strava import geocode
+from strava.consts import COUNTRIES_COUNT
+
+
+def countries(activities, count=COUNTRIES_COUNT):
+    """The countries ``activities`` start in: their number, the ``count`` most visited
+    (per country its activities, distance, regions and last visit) and, per year, newest
+    first, the countries visited and how many of them were new."""
+    rows = list(activities.countries())
+    firsts = {}
+    for row in rows:
+        year = timezone.localtime(row['first']).year
+        firsts[year] = firsts.get(year, 0) + 1
+    visited = activities.exclude(country='').per_year(visited=Count('country', distinct=True))
+    return {
+        'total': len(rows),
+        'countries': [{
+            'code': row['country'],
+            'name': geocode.country_name(row['country']),
+            'activities': row['count'],
+            'distance_km': round(row['distance'] / 1000),
+            'regions': row['regions'],
+            'last': timezone.localtime(row['last']).date(),
+        } for row in rows[:count]],
+        'years': [{'year': year, 'visited': visited[year]['visited'], 'new': firsts.get(year, 0)}
+                  for year in sorted(visited, reverse=True)],
+    }
@@ -0,0 +1,132 @@
+"""Rolling-window metrics over daily series.
+
+A *daily series* holds per-day totals (distance, moving time, elevation) on the active
+days only, in ascending date order. Windows are calendar windows of ``width`` days, so
+the rest days between active days still count towards a window's span without being
+stored. Every window sum is a difference of two prefix sums, and the window edges move
+forward with two pointers (or one bisect for a single window), so a series of n active
+days costs O(n). A multi-decade history is a few thousand active days, which the old
+approach of re-summing every window turned into millions of steps.
+"""
+import bisect
+import datetime
+from itertools import accumulate
+
+from strava.consts import ACWR_ACUTE_DAYS, ACWR_CHRONIC_DAYS, ACWR_HIGH, ACWR_LOW, ROLLING_WINDOWS
+from strava.services import analytics
+
+# The quantities summed per day: distance in km, moving time in hours, elevation in m.
+METRICS = ('distance', 'hours', 'elevation')
+
+
+class DailySeries:
+    """Per-day totals of each METRICS quantity on the active ``days`` (ascending dates).
+    ``values`` maps a metric to its per-day list, aligned with ``days``."""
+
+    def __init__(self, days, values):
+        self.days = days
+        self.values = values
+        self.ordinals = [d.toordinal() for d in days]
+        self.prefix = {metric: list(accumulate(v, initial=0.0)) for metric, v in values.items()}
+
+    def __len__(self):
+        return len(self.days)
+
+    def trailing(self, metric, width):
+        """Each active day's sum over the ``width`` days ending on it (that day included)."""
+        prefix, ordinals, start, sums = self.prefix[metric], self.ordinals, 0, []
+        for end, ordinal in enumerate(self.ordinals):
+            while ordinals[start] <= ordinal - width:
+                start += 1
+            sums.append(prefix[end + 1] - prefix[start])
+        return sums
+
+    def total(self, metric, width, on):
+        """The sum over the ``width`` days ending on the date ``on``."""
+        ordinal = on.toordinal()
+        end = bisect.bisect_right(self.ordinals, ordinal)
+        start = bisect.bisect_right(self.ordinals, ordinal - width)
+        prefix = self.prefix[metric]
+        return prefix[end] - prefix[start]
+
+    def peak(self, metric, width):
+        """The biggest ``width``-day block as ``(sum, first day, last day)``, or ``None``
+        for an empty series. The best block can always be slid to start on an active day,
+        so only those starts are tried. A tie keeps the earliest block."""
+        prefix, ordinals, end = self.prefix[metric], self.ordinals, 0
+        best = None
+        for start, ordinal in enumerate(ordinals):
+            while end < len(ordinals) and ordinals[end] < ordinal + width:
+                end += 1
+            window = prefix[end] - prefix[start]
+            if best is None or window > best[0]:
+                best = (window, start)
+        if best is None:
+            return None
+        first = self.days[best[1]]
+        return best[0], first, first + datetime.timedelta(days=width - 1)
+
+    def acwr(self, metric, on, acute=ACWR_ACUTE_DAYS, chronic=ACWR_CHRONIC_DAYS):
+        """The acute:chronic workload ratio on the date ``on``. This is the last
+        ``acute`` days' load against the average ``acute``-day load over the last
+        ``chronic`` days. It is ``None`` when there was no chronic load."""
+        chronic_load = self.total(metric, chronic, on) * acute / chronic
+        return self.total(metric, acute, on) / chronic_load if chronic_load else None
+
+
+def daily_series(activities):
+    """The DailySeries of ``activities`` (any order)."""
+    return analytics.accumulate(DailyTotals(), activities).result()
+
+
+class DailyTotals:
+    """Accumulator for ``daily_series`` (see ``analytics`` for the protocol)."""
+
+    dated = True
+
+    def __init__(self):
+        self.daily = {}
+
+    def add(self, a, day):
+        totals = self.daily.get(day)
+        if totals is None:
+            totals = self.daily[day] = [0.0, 0.0, 0.0]
+        totals[0] += a.distance / 1000
+        totals[1] += (a.moving_time or 0) / 3600
+        totals[2] += a.total_elevation_gain or 0
+
+    def result(self):
+        days = sorted(self.daily)
+        return DailySeries(days, {
+            metric: [self.daily[d][i] for d in days] for i, metric in enumerate(METRICS)
+        })
+
+
+def training_load(activities, today):
+    """The dashboard's training-load widget for ``activities``."""
+    return training_load_of(daily_series(activities), today)
+
+
+def training_load_of(series, today):
+    """The training-load widget context from a DailySeries. It has the distance, time
+    and climbing over the ROLLING_WINDOWS up to ``today``, the peak distance block of
+    each window, and the acute:chronic ratio of moving time."""
+    windows, peaks = [], []
+    for width in ROLLING_WINDOWS:
+        windows.append({
+            'days': width,
+            'distance': round(series.total('distance', width, today)),
+            'hours': round(series.total('hours', width, today), 1),
+            'elevation': round(series.total('elevation', width, today)),
+        })
+        peak = series.peak('distance', width)
+        if peak and round(peak[0]):
+            peaks.append({'days': width, 'distance': round(peak[0]), 'start': peak[1], 'end': peak[2]})
+
+    ratio = series.acwr('hours', today)
+    if ratio is None:
+        acwr = None
+    else:
+        zone = 'low' if ratio < ACWR_LOW else 'high' if ratio > ACWR_HIGH else 'optimal'
+        acwr = {'ratio': round(ratio, 2), 'zone': zone}
+    return {'windows': windows, 'peaks': peaks, 'acwr': acwr}
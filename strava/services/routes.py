@@ -0,0 +1,169 @@
+"""Repeat routes: an athlete's activities that follow the same path, grouped into ``Route``s.
+
+Each public route is fingerprinted as it's written: the zoom-``ROUTE_ZOOM`` tiles it
+visits, reduced to a MinHash signature (``signature``). Two routes' signatures agree on
+about as many hashes as the share of tiles they have in common. The signature is split
+into ``ROUTE_MINHASH_BANDS`` bands, each hashed into a ``RouteBucket``. An activity is
+matched against only the routes sharing one of its buckets (locality-sensitive hashing),
+so matching costs the same with ten activities in the history or ten thousand. A
+candidate is the same route when its signature and distance are close enough
+(``ROUTE_MATCH_SIMILARITY``, ``ROUTE_MATCH_DISTANCE``). An activity matching none starts
+a new route. ``rebuild`` regroups an athlete's whole history (``manage.py
+rebuild_routes``).
+
+``repeat_routes`` is the dashboard's view of it: the most repeated routes with their
+attempts, best time and trend.
+"""
+import hashlib
+import random
+
+from django.db.models import Q
+from django.utils import timezone
+
+from strava import helpers
+from strava.consts import (
+    REPEAT_ROUTES_COUNT, ROUTE_MATCH_DISTANCE, ROUTE_MATCH_SIMILARITY, ROUTE_MINHASH_BANDS, ROUTE_MINHASH_ROWS,
+    ROUTE_TREND_ATTEMPTS, ROUTE_ZOOM,
+)
+from strava.models import Activity, Route, RouteBucket
+from strava.services import explorer
+
+_PRIME = (1 << 61) - 1
+# The MinHash permutations, h(c) = (a·c + b) mod p: fixed, so stored signatures stay
+# comparable across processes and releases.
+_rng = random.Random(0x5712A7A)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME))
+                 for _ in range(ROUTE_MINHASH_BANDS * ROUTE_MINHASH_ROWS)]
+
+
+def signature(polyline):
+    """The MinHash signature of an encoded route's tiles (a list of ints), or ``None``
+    for an empty route."""
+    cells = [x << ROUTE_ZOOM | y for x, y in explorer.route_tiles(polyline, ROUTE_ZOOM)]
+    if not cells:
+        return None
+    return [min((a * cell + b) % _PRIME for cell in cells) for a, b in _PERMUTATIONS]
+
+
+def buckets(signature):
+    """The LSH buckets of a signature: per band, its rows hashed to a signed 64-bit int."""
+    return [
+        int.from_bytes(hashlib.blake2b(repr(signature[band:band + ROUTE_MINHASH_ROWS]).encode(),
+                                       digest_size=8).digest(), 'big', signed=True)
+        for band in range(0, len(signature), ROUTE_MINHASH_ROWS)
+    ]
+
+
+def similarity(a, b):
+    """The share of hashes two signatures agree on: an estimate of the Jaccard similarity
+    of the routes' tile sets."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def _same_route(route, activity, sig):
+    # The candidate's similarity to the activity, or None when it isn't the same route.
+    if route.sport_type != activity.sport_type:
+        return None
+    if abs(activity.distance - route.distance) > ROUTE_MATCH_DISTANCE * route.distance:
+        return None
+    score = similarity(route.signature, sig)
+    return score if score >= ROUTE_MATCH_SIMILARITY else None
+
+
+def match(activity, sig):
+    """The athlete's route ``activity`` (with signature ``sig``) is an attempt of, or
+    ``None``: the most similar of the routes sharing one of its buckets."""
+    condition = Q()
+    for band, bucket in enumerate(buckets(sig)):
+        condition |= Q(band=band, bucket=bucket)
+    candidates = RouteBucket.objects.filter(athlete_id=activity.athlete_id).filter(condition).values('route_id')
+    best, best_score = None, None
+    for route in Route.objects.filter(pk__in=candidates):
+        score = _same_route(route, activity, sig)
+        if score is not None and (best_score is None or score > best_score):
+            best, best_score = route, score
+    return best
+
+
+def _create(activity, sig):
+    route = Route.objects.create(athlete_id=activity.athlete_id, name=activity.name,
+                                 sport_type=activity.sport_type, distance=activity.distance, signature=sig)
+    RouteBucket.objects.bulk_create([
+        RouteBucket(athlete_id=activity.athlete_id, band=band, bucket=bucket, route=route)
+        for band, bucket in enumerate(buckets(sig))
+    ])
+    return route
+
+
+def record(activity):
+    """Match a written ``activity`` to its route, starting a new route when none
+    matches. An activity that's private or has no route belongs to none. A route left
+    without activities is dropped."""
+    sig = None
+    if not activity.is_private and activity.polyline and activity.athlete_id is not None:
+        sig = signature(activity.polyline)
+    route = None
+    if sig is not None:
+        route = match(activity, sig) or _create(activity, sig)
+    previous = activity.route_id
+    if route is not None and route.pk == previous:
+        return
+    # update(), not save(): the route is derived, and saving would re-run the save hooks.
+    Activity.objects.filter(pk=activity.pk).update(route=route)
+    activity.route = route
+    if previous is not None:
+        Route.objects.filter(pk=previous, activities__isnull=True).delete()
+
+
+def rebuild(athlete):
+    """Regroup ``athlete``'s whole history into routes, oldest activity first (each
+    route named after its first attempt). Returns the number of routes."""
+    Route.objects.filter(athlete=athlete).delete()
+    activities = (Activity.objects.for_athlete(athlete).order_by('start_date')
+                  .only('pk', 'athlete_id', 'name', 'sport_type', 'distance', 'polyline', 'is_private', 'route'))
+    for activity in activities.iterator():
+        record(activity)
+    return Route.objects.filter(athlete=athlete).count()
+
+
+def _trend(times):
+    # The latest attempts' average moving time against as many attempts before them, in
+    # seconds (negative: faster), or None with too few timed attempts.
+    times = [time for time in times if time]
+    recent = min(ROUTE_TREND_ATTEMPTS, len(times) // 2)
+    if recent < 2:
+        return None
+    latest, before = times[-recent:], times[-2 * recent:-recent]
+    return sum(latest) / recent - sum(before) / recent
+
+
+def repeat_routes(activities, count=REPEAT_ROUTES_COUNT):
+    """The ``count`` routes repeated most among ``activities``: per route its name,
+    attempts, best moving time (and that attempt's date), last attempt and trend (see
+    ``_trend``, with its display string). Only routes taken at least twice count."""
+    attempts = {}
+    rows = (activities.filter(route__isnull=False).order_by('start_date')
+            .values_list('route_id', 'pk', 'start_date', 'moving_time'))
+    for route_id, pk, start_date, moving_time in rows:
+        attempts.setdefault(route_id, []).append((pk, start_date, moving_time))
+    ranked = sorted((route_id for route_id, runs in attempts.items() if len(runs) > 1),
+                    key=lambda route_id: (len(attempts[route_id]), attempts[route_id][-1][1]), reverse=True)[:count]
+    names = dict(Route.objects.filter(pk__in=ranked).values_list('pk', 'name'))
+
+    result = []
+    for route_id in ranked:
+        runs = attempts[route_id]
+        timed = [run for run in runs if run[2]]
+        best = min(timed, key=lambda run: run[2]) if timed else None
+        trend = _trend([run[2] for run in runs])
+        result.append({
+            'id': route_id,
+            'name': names.get(route_id, ''),
+            'attempts': len(runs),
+            'best': {'id': best[0], 'date': timezone.localtime(best[1]).date(), 'time': helpers.fmt_hms(best[2])}
+            if best else None,
+            'last': timezone.localtime(runs[-1][1]).date(),
+            'trend': trend,
+            'trend_display': (('−' if trend < 0 else '+') + helpers.fmt_hms(abs(trend))) if trend is not None else '',
+        })
+    return result
@@ -12,9 +12,14 @@ fetched collections. This module is the counterpart: the writes.
 from __future__ import annotations
 
 from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from stravalib import exc
 
 from strava.api import StravaApi
-from strava.models import Activity, Athlete, Gear
+from strava.models import Activity, ActivityStream, Athlete, Gear
+from strava.services import bases, curves, explorer, fitness, routes
 
 
 def gear_ensure(*, gear_id: str | None, api: StravaApi | None = None,
@@ -40,6 +45,27 @@ def gear_ensure(*, gear_id: str | None, api: StravaApi | None = None,
     return gear
 
 
+def gear_refresh_stats(*gear_ids: str | None) -> None:
+    """Recompute the denormalised usage statistics of the given gear (falsy ids — an
+    activity without gear — are skipped). Called after every activity write with both the
+    gear it used before and after, so a gear change moves the mileage between them."""
+    ids = {gear_id for gear_id in gear_ids if gear_id}
+    if ids:
+        Gear.objects.filter(pk__in=ids).refresh_stats()
+
+
+def data_changed(*athlete_ids: int | None) -> None:
+    """Record a write to the given athletes' data (activities, gear, profile) by bumping
+    their ``data_version`` and ``data_modified``. This retires every cached result computed
+    from the old data (see strava.caching) and every page validator the browsers hold (see
+    views.ConditionalGetMixin). Falsy ids (unowned rows) are skipped. Called by every write
+    path: import, sync and admin edits."""
+    ids = {athlete_id for athlete_id in athlete_ids if athlete_id}
+    if ids:
+        Athlete.objects.filter(pk__in=ids).update(data_version=F("data_version") + 1,
+                                                  data_modified=timezone.now())
+
+
 def gear_fetch(gear: Gear) -> Gear:
     """Pull ``gear`` from Strava (with its owner's token), store the raw payload, and
     re-derive its columns."""
@@ -48,6 +74,7 @@ def gear_fetch(gear: Gear) -> Gear:
     for attr, value in Gear.read_json(gear.json).items():
         setattr(gear, attr, value)
     gear.save()
+    data_changed(gear.athlete_id)
     return gear
 
 
@@ -56,6 +83,7 @@ def activity_apply_json(activity: Activity, *, api: StravaApi | None = None) ->
     """Refresh ``activity``'s promoted columns from its stored ``json`` and make sure its
     gear exists locally (fetched from Strava on first sight, with the activity owner's
     token). Persists and returns it."""
+    previous_gear_id, previous_cell, previous_start = activity.gear_id, activity.grid_cell, activity.start_date
     for attr, value in Activity.read_json(activity.json).items():
         setattr(activity, attr, value)
 
@@ -64,6 +92,13 @@ def activity_apply_json(activity: Activity, *, api: StravaApi | None = None) ->
     gear_ensure(gear_id=activity.gear_id, api=api, athlete=activity.athlete)
 
     activity.save()
+    gear_refresh_stats(previous_gear_id, activity.gear_id)
+    explorer.record(activity)
+    routes.record(activity)
+    bases.record(activity, previous_cell)
+    curves.record(activity)
+    fitness.record(activity, previous_start)
+    data_changed(activity.athlete_id)
     return activity
 
 
@@ -76,6 +111,21 @@ def activity_fetch(activity: Activity) -> Activity:
     return activity_apply_json(activity, api=api)
 
 
+def activity_fetch_streams(activity: Activity, *, api: StravaApi | None = None) -> ActivityStream:
+    """Pull ``activity``'s streams from Strava (with its owner's token) and store them
+    compactly (see strava.streams), with the mean-maximal curves computed from them (see
+    services.curves). An activity Strava has none for (a manual entry) gets an empty row,
+    so a backfill doesn't ask again."""
+    api = api or StravaApi(activity.athlete)
+    try:
+        data = api.get_activity_streams(activity.id)
+    except exc.ObjectNotFound:
+        data = {}
+    stream = ActivityStream.store(activity, data)
+    curves.store(activity, stream)
+    return stream
+
+
 def activity_push(activity: Activity) -> Activity:
     """Push local edits (name/sport/gear) to Strava, then re-fetch so the row reflects the
     server's truth."""
@@ -89,5 +139,11 @@ def activity_push(activity: Activity) -> Activity:
 
 
 def athlete_sync(athlete: Athlete) -> Athlete:
-    """Fetch ``athlete`` from Strava (with its token) and upsert the local row."""
-    return Athlete.store(StravaApi(athlete).get_athlete())
+    """Fetch ``athlete`` from Strava (with its token) and upsert the local row. A changed
+    FTP recomputes the training-load series, whose power-based loads are relative to it."""
+    previous_ftp = athlete.ftp
+    athlete = Athlete.store(StravaApi(athlete).get_athlete())
+    if athlete.ftp != previous_ftp:
+        fitness.rebuild(athlete)
+    data_changed(athlete.pk)
+    return athlete
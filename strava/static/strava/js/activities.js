@@ -5,7 +5,8 @@ function renderRoutes(root) {
   });
 }
 renderRoutes(document);
-document.body.addEventListener('htmx:afterSwap', function(e) { renderRoutes(e.target); });
+// htmx:load fires on all new content — filter swaps and infinite-scroll pages alike.
+document.body.addEventListener('htmx:load', function(e) { renderRoutes(e.target); });
 
 // ——— Distance range slider (dual handle) ———
 // The slider itself lives in the shared DSDistSlider module. Here it has no onChange
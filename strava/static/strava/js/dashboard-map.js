@@ -1,10 +1,29 @@
 /* django-strava · dashboard activity map (Leaflet) */
 // Interactive activity map (Leaflet) — markers built from each activity's start_latlng.
-(function() {
+(async function() {
   const el = document.getElementById('activity-map');
   if (!el || typeof L === 'undefined') return;
-  const dataEl = document.getElementById('map-markers');
-  const markers = dataEl ? JSON.parse(dataEl.textContent) : [];
+
+  function fetchJson(url) {
+    return fetch(url, { credentials: 'same-origin' }).then(function(r) {
+      if (!r.ok) throw new Error(r.status);
+      return r.json();
+    });
+  }
+
+  // Expand the columnar markers payload (see analytics.map_markers) into one object per
+  // marker: the sport types and gear arrive once each, referenced by index.
+  function decodeMarkers(p) {
+    return p.id.map(function(id, i) {
+      const sport = p.sports[p.sport[i]];
+      const gear = p.gear[i] >= 0 ? p.gear_list[p.gear[i]] : ['', ''];
+      return {
+        id: id, lat: p.lat[i], lng: p.lng[i], sport_type: sport[0], map_sport_type: sport[1],
+        gear: gear[0], gear_label: gear[1], distance: p.distance[i], year: p.year[i],
+        title: p.name[i] + ' · ' + p.distance[i].toFixed(1) + ' km', polyline: '',
+      };
+    });
+  }
 
   // Per-sport glyphs, reused from the sport filter's options island (each entry is
   // [sport_type, label, svg] from strava/sport_icons.py) so the map draws the same icon
@@ -61,6 +80,7 @@
   let hoverLayer = null;
   let selectedMarker = null;   // lone pin shown while a card is open (others hidden)
   let allRoutesLayer = null;   // overlay of every visible activity's route, toggled on
+  let heatLayer = null;        // viewport mode: the overlay as server-rendered heatmap tiles
   let showAllRoutes = true;    // on by default (routes overlay draws once zoomed past ROUTE_ZOOM_MIN)
   let savedView = null;
   let userMoved = false;
@@ -101,6 +121,12 @@
   // of activities currently in view, and only when zoomed in past ROUTE_ZOOM_MIN.
   // Follows the active filter and stays beneath the hover/selected route.
   function renderAllRoutes() {
+    if (heatLayer) {
+      // The tiles hold every matching route at any zoom, at the cost of a tile image each.
+      const show = showAllRoutes && !selectedMarker;
+      if (show !== map.hasLayer(heatLayer)) show ? heatLayer.addTo(map) : map.removeLayer(heatLayer);
+      return;
+    }
     if (allRoutesLayer) { map.removeLayer(allRoutesLayer); allRoutesLayer = null; }
     if (!showAllRoutes || selectedMarker || map.getZoom() < ROUTE_ZOOM_MIN) return;
     const bounds = map.getBounds();
@@ -250,6 +276,8 @@
     if (allRoutesLayer) { map.removeLayer(allRoutesLayer); allRoutesLayer = null; }
     if (selectedMarker) map.removeLayer(selectedMarker);
     selectedMarker = L.marker([m.lat, m.lng], { icon: pinIcon(m) }).addTo(map);
+    selectedMarker._activity = m;  // its route is redrawn if finer routes arrive
+    renderAllRoutes();  // hides the heatmap
   }
   function restoreMarkers() {
     if (selectedMarker) { map.removeLayer(selectedMarker); selectedMarker = null; }
@@ -290,14 +318,64 @@
     if (view) map.setView(view.center, view.zoom);
   }
 
+  // The map is up (tiles loading); plot the markers once they arrive. A `complete`
+  // payload holds every GPS activity, which the map filters and clusters client-side.
+  // Past MAP_MARKER_LIMIT the map is in viewport mode instead: every move or filter
+  // change requests the activities in view, clustered server-side while there are too
+  // many to plot (see dashboard.viewport_markers).
+  const first = await fetchJson(el.dataset.markersUrl).catch(function() { return null; });
+  const viewportMode = !!first && !first.complete;
+  let markers = [];
   let resetView;
   let clusters = null;
-  const leafletMarkers = [];
+  let gridLayer = null;  // server-side clusters (viewport mode)
+  let leafletMarkers = [];
   // The markers currently on the map (all of them, or the active filter's matches).
   // visibleCoords backs reset framing; visibleMarkers backs the "all routes" overlay.
-  let visibleMarkers = markers.slice();
-  let visibleCoords = markers.map(function(m) { return [m.lat, m.lng]; });
-  if (markers.length) {
+  let visibleMarkers = [];
+  let visibleCoords = [];
+
+  function clusterIcon(count) {
+    return L.divIcon({
+      html: '<span class="map-cluster">' + count + '</span>',
+      className: '', iconSize: [36, 36], iconAnchor: [18, 18],
+    });
+  }
+
+  // Replace the plotted markers with `list` (added to the client-side cluster group).
+  function plotMarkers(list) {
+    markers = list;
+    leafletMarkers = [];
+    clusters.clearLayers();
+    markers.forEach(function(m) {
+      const marker = L.marker([m.lat, m.lng], { icon: pinIcon(m) })
+        .bindTooltip(m.title)
+        .on('mouseover', function() { showHoverRoute(m, marker); })
+        .on('mouseout', function() { clearHoverRoute(); })
+        .on('click', function() { selectActivity(m); });
+      m._marker = marker;  // let a route-line hover highlight this same marker
+      leafletMarkers.push(marker);
+      clusters.addLayer(marker);
+    });
+    visibleMarkers = markers.slice();
+    visibleCoords = markers.map(function(m) { return [m.lat, m.lng]; });
+  }
+
+  // Replace the server-side clusters with the payload's `c` (none: clear them). A click
+  // zooms to the cluster's extent, where the next viewport request splits it.
+  function plotGrid(c) {
+    if (gridLayer) { map.removeLayer(gridLayer); gridLayer = null; }
+    if (!c) return;
+    gridLayer = L.layerGroup(c.count.map(function(count, i) {
+      return L.marker([c.lat[i], c.lng[i]], { icon: clusterIcon(count) }).on('click', function() {
+        closeCard();
+        clearHoverRoute();
+        map.fitBounds([[c.south[i], c.west[i]], [c.north[i], c.east[i]]], Object.assign({ maxZoom: 14 }, FIT));
+      });
+    })).addTo(map);
+  }
+
+  if (first && (viewportMode || first.id.length)) {
     clusters = L.markerClusterGroup({
       showCoverageOnHover: false,
       maxClusterRadius: 60,
@@ -305,12 +383,7 @@
       // zoomToBounds ignores it, leaving the bottom marker under the Season totals).
       // spiderfyOnMaxZoom stays enabled so coincident markers still fan out.
       zoomToBoundsOnClick: false,
-      iconCreateFunction: function(cluster) {
-        return L.divIcon({
-          html: '<span class="map-cluster">' + cluster.getChildCount() + '</span>',
-          className: '', iconSize: [36, 36], iconAnchor: [18, 18],
-        });
-      },
+      iconCreateFunction: function(cluster) { return clusterIcon(cluster.getChildCount()); },
     });
     clusters.on('clusterclick', function(e) {
       closeCard();  // drilling into a cluster dismisses any open activity card
@@ -323,17 +396,17 @@
       if (bottom._zoom === clusters._maxZoom && bottom._childCount === cluster._childCount) return;
       map.fitBounds(cluster.getBounds(), Object.assign({ maxZoom: clusters._maxZoom }, FIT));
     });
-    markers.forEach(function(m, i) {
-      const marker = L.marker([m.lat, m.lng], { icon: pinIcon(m) })
-        .bindTooltip(m.title)
-        .on('mouseover', function() { showHoverRoute(m, marker); })
-        .on('mouseout', function() { clearHoverRoute(); })
-        .on('click', function() { selectActivity(m); });
-      m._marker = marker;  // let a route-line hover highlight this same marker
-      leafletMarkers.push(marker);
-      clusters.addLayer(marker);
-    });
     map.addLayer(clusters);
+  }
+  if (viewportMode) {
+    plotGrid(first.clusters);
+    // Frame every matching activity; the resulting move loads the view's activities.
+    resetView = function() {
+      if (first.bounds) map.fitBounds(first.bounds, Object.assign({ maxZoom: 14 }, FIT));
+      else map.setView([48.6, 18.2], 6);
+    };
+  } else if (clusters) {
+    plotMarkers(decodeMarkers(first));
     // Reset frames whatever markers are currently visible (all of them, or the
     // active filter's matches). Tracked from marker coords rather than
     // markercluster.getBounds(), which shrinks once off-screen markers unload.
@@ -415,21 +488,141 @@
   // Re-render as the view changes so routes appear once zoomed in and track the viewport.
   map.on('moveend zoomend', function() { if (showAllRoutes) renderAllRoutes(); });
 
+  // Explorer toggle: shade the visited explorer tiles in view (the max cluster darker)
+  // and outline the max square (see MapExplorerView). Off by default; below
+  // EXPLORER_ZOOM_MIN the tiles are too small to see, so nothing is fetched.
+  const EXPLORER_ZOOM_MIN = 9;
+  const explorerToggle = document.getElementById('map-explorer-toggle');
+  let explorerLayer = null;
+  let explorerRequest = 0;
+  function explorerBounds(zoom, x, y, size) {
+    const n = Math.pow(2, zoom);
+    function lat(row) { return Math.atan(Math.sinh(Math.PI * (1 - 2 * row / n))) * 180 / Math.PI; }
+    return [[lat(y + size), x / n * 360 - 180], [lat(y), (x + size) / n * 360 - 180]];
+  }
+  function loadExplorer() {
+    const request = ++explorerRequest;
+    if (explorerLayer) { map.removeLayer(explorerLayer); explorerLayer = null; }
+    if (!explorerToggle.classList.contains('active') || map.getZoom() < EXPLORER_ZOOM_MIN) return;
+    const query = '&bbox=' + map.getBounds().toBBoxString();
+    fetchJson(el.dataset.explorerUrl + query).then(function(p) {
+      if (request !== explorerRequest) return;
+      const renderer = L.canvas({ padding: 0.2 });
+      const layer = L.layerGroup();
+      p.x.forEach(function(x, i) {
+        L.rectangle(explorerBounds(p.zoom, x, p.y[i], 1), {
+          renderer: renderer, interactive: false, weight: 0,
+          fillColor: p.cluster[i] ? '#1d4ed8' : '#60a5fa', fillOpacity: p.cluster[i] ? 0.35 : 0.25,
+        }).addTo(layer);
+      });
+      if (p.square) {
+        L.rectangle(explorerBounds(p.zoom, p.square[0], p.square[1], p.square[2]), {
+          renderer: renderer, interactive: false, fill: false, color: '#dc2626', weight: 2,
+        }).addTo(layer);
+      }
+      explorerLayer = layer.addTo(map);
+    }).catch(function() {});
+  }
+  if (explorerToggle && el.dataset.explorerUrl) {
+    explorerToggle.addEventListener('click', function() {
+      const active = explorerToggle.classList.toggle('active');
+      explorerToggle.setAttribute('aria-pressed', active ? 'true' : 'false');
+      loadExplorer();
+    });
+    map.on('moveend', function() { if (explorerToggle.classList.contains('active')) loadExplorer(); });
+  }
+
+  // Set each marker's route from a routes payload (see analytics.map_routes).
+  function attachRoutes(p) {
+    const byId = {};
+    p.id.forEach(function(id, i) { byId[id] = p.polyline[i]; });
+    markers.forEach(function(m) { m.polyline = byId[m.id] || ''; delete m._coords; });
+    if (!selectedMarker) renderAllRoutes();
+  }
+
+  // Viewport mode: load the activities in view for the current filter, as markers (then
+  // their routes) or as server-side clusters. A response the map has moved past, or
+  // one arriving while a card is open, is dropped.
+  let viewportRequest = 0;
+  function filterParams() {
+    const params = new URLSearchParams();
+    Object.keys(filterState).forEach(function(key) {
+      const value = filterState[key];
+      if (value !== '' && value !== 'all' && value !== Infinity) params.set(key, value);
+    });
+    return params;
+  }
+  // The heatmap's tile URL template for the current filter (see MapHeatmapView).
+  function heatmapUrl() {
+    const query = filterParams().toString();
+    return el.dataset.heatmapUrl.replace('/0/0/0.png', '/{z}/{x}/{y}.png') + (query ? '&' + query : '');
+  }
+  function loadViewport() {
+    const params = filterParams();
+    params.set('bbox', map.getBounds().toBBoxString());
+    params.set('zoom', map.getZoom());
+    const query = '&' + params.toString();
+    const request = ++viewportRequest;
+    fetchJson(el.dataset.markersUrl + query).then(function(p) {
+      if (request !== viewportRequest || selectedMarker) return;
+      plotGrid(p.clusters);
+      plotMarkers(p.clusters ? [] : decodeMarkers(p));
+      renderAllRoutes();
+      // The view's routes, for the hover preview and the selected route (the heatmap
+      // draws the overlay).
+      if (p.clusters || map.getZoom() < ROUTE_ZOOM_MIN) return;
+      return fetchJson(el.dataset.routesUrl + query).then(function(r) {
+        if (request === viewportRequest) attachRoutes(r);
+      });
+    }).catch(function() {});
+  }
+  if (viewportMode) {
+    let moveTimer;
+    map.on('moveend', function() {
+      if (selectedMarker) return;
+      clearTimeout(moveTimer);
+      moveTimer = setTimeout(loadViewport, 250);
+    });
+  }
+
   // ---- Map filters: search box + sport / gear / year pills ----
   // The map itself filters its markers client-side (below); the same state is mirrored
   // into the hidden #dash-filters form so the dependent dashboard sections (season
   // totals, latest activities, trends, calendar, gear stats) recompute server-side.
   const filterState = { q: '', sport: 'all', gear: 'all', year: 'all', dist_min: 0, dist_max: Infinity };
 
+  // Each re-renderable section and the filters it depends on (SECTION_FILTERS server-side).
+  const sectionFiltersEl = document.getElementById('dashboard-section-filters');
+  const sectionFilters = sectionFiltersEl ? JSON.parse(sectionFiltersEl.textContent) : null;
+
+  // Sections requested but not yet swapped in: a newer filter change replaces (aborts)
+  // the in-flight request, so its sections ride along with the next one.
+  const pendingSections = new Set();
+  document.body.addEventListener('htmx:afterRequest', function(e) {
+    if (e.detail.elt && e.detail.elt.id === 'dash-filters' && e.detail.successful) pendingSections.clear();
+  });
+
+  // Only the sections whose filters changed since the last request are recomputed and
+  // swapped; the form's inputs hold the last requested state.
   function syncDashboard() {
     const form = document.getElementById('dash-filters');
     if (!form || typeof htmx === 'undefined') return;
-    document.getElementById('df-q').value = filterState.q;
-    document.getElementById('df-sport').value = filterState.sport;
-    document.getElementById('df-gear').value = filterState.gear;
-    document.getElementById('df-year').value = filterState.year;
-    document.getElementById('df-dist_min').value = filterState.dist_min;
-    document.getElementById('df-dist_max').value = filterState.dist_max;
+    const changed = new Set();
+    Object.keys(filterState).forEach(function(key) {
+      const input = document.getElementById('df-' + key);
+      const value = String(filterState[key]);
+      if (input.value !== value) changed.add(key);
+      input.value = value;
+    });
+    if (!changed.size) return;
+    if (sectionFilters) {
+      Object.keys(sectionFilters).forEach(function(name) {
+        if (sectionFilters[name].some(function(key) { return changed.has(key); })) pendingSections.add(name);
+      });
+      if (!pendingSections.size) return;
+    }
+    // Blank (no section map on the page) re-renders every section.
+    document.getElementById('df-sections').value = Array.from(pendingSections).join(',');
     htmx.trigger(form, 'refresh');
   }
 
@@ -443,6 +636,14 @@
   // with each whitespace-separated token required to match (AND).
   function applyFilters() {
     if (!clusters) return;
+    if (viewportMode) {
+      closeCard();
+      clearHoverRoute();
+      loadViewport();   // the server filters (and clusters) the view's activities
+      if (heatLayer) heatLayer.setUrl(heatmapUrl());
+      syncDashboard();
+      return;
+    }
     const tokens = unaccent(filterState.q.trim()).split(/\s+/).filter(Boolean);
     closeCard();
     clearHoverRoute();
@@ -477,20 +678,6 @@
     });
   }
 
-  // Distinct {value, label} options present among the markers for a given pair of keys.
-  function distinctOptions(valueKey, labelKey) {
-    const seen = {}, out = [];
-    markers.forEach(function(m) {
-      const v = m[valueKey];
-      if (v === '' || v == null) return;
-      const key = String(v);
-      if (seen[key]) return;
-      seen[key] = true;
-      out.push({ value: key, label: String(m[labelKey]) });
-    });
-    return out;
-  }
-
   // Turn a pill button into a dropdown of options; selecting one updates the filter.
   // Reuses the .sports-dd styling. Hidden entirely when there's nothing to choose.
   function setupFilterPill(btn, allLabel, options, key) {
@@ -529,10 +716,11 @@
     });
   }
 
-  const gearOpts = distinctOptions('gear', 'gear_label')
+  // The options come with the first payload, covering every activity on the map (in
+  // viewport mode the plotted markers are only the view's).
+  const gearOpts = (first && first.gear_options || []).map(function(g) { return { value: g[0], label: g[1] }; })
     .sort(function(a, b) { return a.label.localeCompare(b.label); });
-  const yearOpts = distinctOptions('year', 'year')
-    .sort(function(a, b) { return Number(b.value) - Number(a.value); });
+  const yearOpts = (first && first.years || []).map(function(y) { return { value: String(y), label: String(y) }; });
 
   // Distance range slider (shared DSDistSlider module). Filtering runs client-side on
   // release; the sport dropdown rescales the track to the selected sport's ceiling.
@@ -566,4 +754,39 @@
   document.addEventListener('click', function() {
     document.querySelectorAll('.sports-dd').forEach(function(d) { d.style.display = 'none'; });
   });
+
+  // The routes (the bulk of the map's data) load after the markers; the hover preview,
+  // the overlay and route framing pick them up as they arrive. Viewport mode loads the
+  // view's markers and routes together, first for the initial frame (whose move fired
+  // before the filter state above existed). Its routes overlay is the heatmap.
+  if (viewportMode) {
+    if (el.dataset.heatmapUrl) {
+      heatLayer = L.tileLayer(heatmapUrl(), { maxNativeZoom: 18, maxZoom: 19, opacity: 0.85 });
+      renderAllRoutes();
+    }
+    loadViewport();
+  } else if (markers.length) {
+    // The routes arrive simplified for the current zoom (see helpers.route_resolution);
+    // zooming in past what they serve (max_zoom) swaps in finer ones.
+    let routesMaxZoom = null;
+    let routesRequest = 0;
+    function loadRoutes() {
+      const request = ++routesRequest;
+      return fetchJson(el.dataset.routesUrl + '&zoom=' + Math.floor(map.getZoom())).then(function(p) {
+        if (request !== routesRequest) return;
+        routesMaxZoom = p.max_zoom;
+        attachRoutes(p);
+        if (routeLayer && selectedMarker) {
+          const coords = activityCoords(selectedMarker._activity);
+          if (coords.length) routeLayer.eachLayer(function(line) { line.setLatLngs(coords); });
+        }
+      });
+    }
+    loadRoutes().then(function() {
+      if (!selectedMarker && !userMoved) frameVisible();
+    }).catch(function() {});
+    map.on('zoomend', function() {
+      if (routesMaxZoom !== null && map.getZoom() > routesMaxZoom) loadRoutes().catch(function() {});
+    });
+  }
 })();
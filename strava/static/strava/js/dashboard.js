@@ -1,4 +1,4 @@
-/* django-strava · dashboard wiring (non-map): records/calendar/trends,
+/* django-strava · dashboard wiring (non-map): records/performance/calendar/trends,
    lazy float-card route rendering, activity modal, row-height sync, gear donut. */
 
 /* ---- Records, calendar & trends charts (formerly classic-data.js) ---- */
@@ -63,6 +63,24 @@
     showRecords(recSport);
   });
 
+  /* ---- Running performance: best-effort distances or a mean-maximal curve ---- */
+  // The card is OOB-swapped on a filter change, so clicks are delegated from the document
+  // and the chosen view is re-applied to the fresh card (distances if it has no such curve).
+  let perfView = "distances";
+  function showPerfView() {
+    const card = $("#dash-run-perf");
+    if (!card) return;
+    const view = card.querySelector(`[data-perf-view="${perfView}"]`) ? perfView : "distances";
+    card.querySelectorAll("[data-perf-view]").forEach(el => { el.hidden = el.dataset.perfView !== view; });
+    card.querySelectorAll(".perf-seg button").forEach(b => b.setAttribute("aria-pressed", b.dataset.view === view));
+  }
+  document.addEventListener("click", e => {
+    const b = e.target.closest(".perf-seg button"); if (!b) return;
+    perfView = b.dataset.view;
+    showPerfView();
+  });
+  window.addEventListener("ds:datachanged", showPerfView);
+
   /* ---- Activity calendar dots (5 weeks, sizes 0–2) ---- */
   // Re-read on a filter change (ds:datachanged) so the dots track the active filter.
   function renderCalendar() {
@@ -177,12 +195,13 @@
     });
   })();
 
-  // After a filter swaps in fresh sections, draw the new latest-activity card routes
-  // and tell the charts/calendar/donut to reload their data (ds:datachanged) and the
-  // trends/calendar cards to re-equalise their heights (ds:tweaks).
+  // After a filter swaps in fresh sections, draw the new latest-activity (and, after a
+  // refresh, "on this day") card routes and tell the charts/calendar/donut to reload
+  // their data (ds:datachanged) and the trends/calendar cards to re-equalise their
+  // heights (ds:tweaks).
   document.body.addEventListener('htmx:afterSettle', function(e) {
     if (e.target && e.target.id !== 'dash-sink') return;
-    document.querySelectorAll('#latest-activities .float-card').forEach(function(card) {
+    document.querySelectorAll('#latest-activities .float-card, #dash-on-this-day .float-card').forEach(function(card) {
       if (card.offsetParent !== null) window.renderCardRoute(card);
     });
     window.dispatchEvent(new Event('ds:datachanged'));
@@ -0,0 +1,83 @@
+"""Compact binary storage for activity streams (``ActivityStream``).
+
+Strava sends a stream as a JSON list per kind, one value per recorded point, which is
+~10 bytes a number as JSON. Stored here, each kind is one little-endian array, compressed:
+
+* Measured, smoothly changing series (time, position, distance, altitude, heart rate,
+  cadence, power) are scaled to integers (``CODECS``: 1e-5° for positions, decimetres
+  for distance and altitude) and delta-encoded as int32. Consecutive points differ by a
+  little, so the deltas are small and repetitive, and compress several times over.
+* ``velocity_smooth`` has no useful integer scale and is stored as float32.
+
+``decode`` returns a NumPy array when NumPy is installed (the ``fast`` extra): a float32
+series is a read-only view straight over the decompressed buffer, a delta-encoded one a
+single cumulative sum. Without NumPy it's a list. ``latlng`` decodes to ``(lat, lng)``
+rows.
+"""
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional (the "fast" extra)
+    np = None
+
+# The stream kinds stored, as the Strava API names them.
+KINDS = ("time", "latlng", "distance", "altitude", "heartrate", "velocity_smooth", "watts", "cadence")
+# Per kind: the scale values are multiplied by before rounding to int32 deltas, or None
+# for a float32 series stored as is.
+CODECS = {
+    "time": 1,
+    "latlng": 100_000,
+    "distance": 10,
+    "altitude": 10,
+    "heartrate": 1,
+    "velocity_smooth": None,
+    "watts": 1,
+    "cadence": 1,
+}
+# latlng is two numbers a point, interleaved.
+WIDTH = {"latlng": 2}
+COMPRESSION = 6
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def encode(kind, values):
+    """The stored bytes of a ``kind`` stream's ``values`` (Strava's JSON list)."""
+    if WIDTH.get(kind, 1) > 1:
+        values = [number for point in values for number in point]
+    scale = CODECS[kind]
+    if scale is None:
+        packed = array("f", (float(value or 0) for value in values))
+    else:
+        packed, previous = array("i"), [0] * WIDTH.get(kind, 1)
+        for i, value in enumerate(values):
+            column = i % len(previous)
+            scaled = round((value or 0) * scale)
+            packed.append(scaled - previous[column])
+            previous[column] = scaled
+    return zlib.compress(_little_endian(packed).tobytes(), COMPRESSION)
+
+
+def decode(kind, data):
+    """A ``kind`` stream from its stored bytes (see the module docstring for the type)."""
+    raw = zlib.decompress(data)
+    scale, width = CODECS[kind], WIDTH.get(kind, 1)
+    if np is not None:
+        if scale is None:
+            return np.frombuffer(raw, dtype="<f4")
+        deltas = np.frombuffer(raw, dtype="<i4").reshape(-1, width)
+        series = np.cumsum(deltas, axis=0, dtype=np.int64) / scale
+        return series if width > 1 else series[:, 0]
+    values = _little_endian(array("f" if scale is None else "i", raw))
+    if scale is None:
+        return list(values)
+    columns = [[value / scale for value in accumulate(values[column::width])] for column in range(width)]
+    return list(zip(*columns)) if width > 1 else columns[0]
@@ -7,6 +7,10 @@ app_name = 'strava'
 urlpatterns = [
     path('',              views.DashboardView.as_view(),  name='dashboard'),
     path('refresh/',      views.RefreshView.as_view(),  name='refresh'),
+    path('map/markers/',  views.MapMarkersView.as_view(),  name='map_markers'),
+    path('map/routes/',   views.MapRoutesView.as_view(),  name='map_routes'),
+    path('map/explorer/', views.MapExplorerView.as_view(),  name='map_explorer'),
+    path('map/heatmap/<int:z>/<int:x>/<int:y>.png', views.MapHeatmapView.as_view(),  name='map_heatmap'),
     path('oauth/connect/',  views.oauth_connect,   name='oauth_connect'),
     path('oauth/callback/', views.oauth_callback,  name='oauth_callback'),
     path('activity/<int:pk>/card/', views.ActivityCardView.as_view(),  name='activity_card'),
@@ -1,3 +1,5 @@
+import datetime
+import hashlib
 import logging
 import secrets
 
@@ -6,18 +8,22 @@ from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.core.management import call_command
 from django.db import IntegrityError, transaction
-from django.db.models import Count, F, Max, Q, Sum
-from django.http import HttpResponseBadRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from django.utils.translation import gettext_lazy as _
-from django.views.generic import DetailView, ListView, TemplateView
+from django.views.generic import DetailView, ListView, TemplateView, View
+from django.views.generic.base import TemplateResponseMixin
 
-from strava import helpers, services
+from strava import caching, geocode, helpers, pagination, services
 from strava.api import StravaApi, _from_epoch, format_strava_error
+from strava.consts import ACTIVITIES_PAGE_SIZE, GALLERY_PAGE_SIZE, HEATMAP_MAX_ZOOM
 from strava.models import Activity, Athlete, Gear
-from strava.sports import TOP_SPORT_TYPES, group_data, sport_matches, sport_options
+from strava.querysets import ACTIVITY_SORT_FIELDS
+from strava.sports import TOP_SPORT_TYPES, group_data, sport_options
 
 
 logger = logging.getLogger('strava')
@@ -44,7 +50,65 @@ class AthleteScopedMixin:
         return context
 
 
-class DashboardView(AthleteScopedMixin, TemplateView):
+class ConditionalGetMixin:
+    """Answer a repeat GET with ``304 Not Modified`` while nothing the page shows has
+    changed. Every response carries an ``ETag`` derived from the view, the athlete and its
+    ``data_version``, today's date, the full URL (filters, cursor), whether it's an htmx
+    partial, the user (the refresh button is superuser-only) and, on pages, the athletes
+    the nav switches between (``nav_version``), plus a ``Last-Modified`` of the athlete's
+    last write. The browser revalidates (``Cache-Control: private,
+    no-cache``) and a matching ``If-None-Match`` / ``If-Modified-Since`` skips the render.
+
+    Subclasses provide ``data_validators()``: ``(version, modified)`` of the data the page
+    is computed from, or ``None`` to serve it unconditionally."""
+
+    def data_validators(self):
+        if self.athlete is None:
+            return None
+        return (self.athlete.pk, self.athlete.data_version), self.athlete.data_modified
+
+    def nav_version(self):
+        """The nav's athlete switcher (``athletes``, see AthleteScopedMixin) as a page shows
+        it, ``None`` for responses without the nav. Another athlete's rename or a new
+        athlete doesn't touch this athlete's data version."""
+        if not (isinstance(self, AthleteScopedMixin) and isinstance(self, TemplateResponseMixin)):
+            return None
+        return tuple(Athlete.objects.order_by('pk').values_list('pk', 'firstname', 'lastname', 'profile'))
+
+    def get(self, request, *args, **kwargs):
+        validators = self.data_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        etag, last_modified = self.conditional_headers(*validators)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('HX-Request', 'Cookie'))
+        return response
+
+    def conditional_headers(self, version, modified):
+        """The ``(etag, last_modified)`` of this request's response; ``last_modified`` is
+        a timestamp or ``None`` for data never written since the field was added."""
+        request = self.request
+        today = timezone.localdate()
+        user = getattr(request, 'user', None)
+        parts = (type(self).__name__, version, today, request.get_full_path(),
+                 bool(getattr(request, 'htmx', False)), getattr(user, 'pk', None),
+                 getattr(user, 'is_superuser', False), self.nav_version())
+        etag = quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+        if modified is None:
+            return etag, None
+        # The pages also depend on the date (the current week, "today" windows), so a
+        # response is never older than local midnight.
+        midnight = timezone.make_aware(datetime.datetime.combine(today, datetime.time()))
+        return etag, int(max(modified, midnight).timestamp())
+
+
+class DashboardView(ConditionalGetMixin, AthleteScopedMixin, TemplateView):
     template_name = 'strava/pages/dashboard.html'
 
     def get_template_names(self):
@@ -58,9 +122,6 @@ class DashboardView(AthleteScopedMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         context['active_page'] = 'dashboard'
 
-        all_activities = list(
-            Activity.objects.for_athlete(self.athlete).public().select_related('gear').order_by('-start_date')
-        )
         today = timezone.localdate()
 
         # ---- Filters (mirror the map's client-side search + sport/gear/year pills) ----
@@ -74,56 +135,136 @@ class DashboardView(AthleteScopedMixin, TemplateView):
         year = params.get('year') or 'all'
         context['q'], context['sport'], context['gear'], context['year'] = q, sport, gear, year
 
-        # Sport filter dropdown: every sport in the data (not just GPS-mapped ones) + groups.
+        # Sport filter dropdown (every sport in the data, not just GPS-mapped ones) + groups,
+        # and the distance slider bounds (shared with the activities filter bar); the map
+        # filters markers client-side against dist_min/dist_max, mirrored here so every
+        # section recomputes over the same distance window.
         public_qs = Activity.objects.for_athlete(self.athlete).public()
-        context['sport_options'] = sport_options(public_qs)
+        context.update(caching.dashboard_filter_bar(self.athlete, public_qs, sport, params))
         context['sport_groups'] = group_data()
-
-        # Distance slider bounds (shared with the activities filter bar); the map filters
-        # markers client-side against dist_min/dist_max, mirrored here so every section
-        # recomputes over the same distance window.
-        context.update(helpers.distance_slider_context(public_qs, sport, params))
         dist_min, dist_max = context['dist_min'], context['dist_max']
 
-        activities = services.dashboard.filter_activities(all_activities, q, sport, gear, year, dist_min, dist_max)
-
-        # ---- Totals + latest activities for the active filter ----
-        context['stat'] = services.dashboard.totals(activities)
-        context['latest_activity'] = activities[0] if activities else None
-        context['latest_activities'] = activities[:4]
-
-        # ---- Activity map markers (from each activity's start_latlng) ----
-        # Built from every activity (the map filters them in JS); map_hidden_count counts
-        # only the filtered activities without GPS so it tracks what the map displays.
-        context['map_markers'], context['map_activities'] = services.analytics.map_data(all_activities)
-        context['map_hidden_count'] = sum(1 for a in activities if not helpers.has_gps(a))
-
-        context['aoty'] = services.dashboard.activity_of_year(activities, year, today)
-
-        # ---- Personal records + running performance ----
-        # Scoped by the year filter only (the widgets have their own sport tabs, which the
-        # sport/gear/search filters would otherwise empty). Home is the most-used start
-        # location across all activities, stable across the year filter.
-        records_acts = [a for a in all_activities
-                        if year == 'all' or str(helpers.local_date(a).year) == year]
-        home = helpers.home_location(all_activities)
-        context['records'] = services.analytics.records(records_acts, home)
-        context['run_perf'] = services.analytics.run_performance(records_acts)
-
-        # ---- Trends (weekly / monthly / yearly) + activity calendar ----
-        context['trends'] = services.analytics.trends(activities, today)
-        context['calendar'] = services.analytics.activity_calendar(activities, today)
-
-        # ---- Gear health table + usage donut ----
-        no_filter = not q and sport == 'all' and gear == 'all' and year == 'all'
-        context['gear_health'], context['gear_usage'] = services.gear.dashboard_sections(activities, no_filter)
-
-        # ---- "By the Numbers" — fun stats + summary, over the filtered activities ----
-        context['fun_stats'], context['summary'] = services.analytics.by_the_numbers(activities)
-        context['last_updated'] = timezone.localtime()
+        # ---- Every section over the filtered activities: totals, latest activities, map
+        # markers, activity of the year, records + running performance, trends, calendar,
+        # gear health + usage donut and "By the Numbers" (see services.dashboard.page). A
+        # filter change (or the refresh button) comes over htmx and re-renders only the
+        # sections whose filters changed (``?sections=``, from SECTION_FILTERS, which the
+        # map JS reads from the page), never the map, so its filters run in the database.
+        # Both are cached per athlete until the athlete's data next changes (see
+        # strava.caching).
+        filters = (q, sport, gear, year, dist_min, dist_max)
+        if getattr(self.request, 'htmx', False):
+            wanted = services.dashboard.parse_sections(params.get('sections'))
+        else:
+            wanted = None
+            context['section_filters'] = {
+                name: list(deps) for name, deps in services.dashboard.SECTION_FILTERS.items()
+            }
+        context['sections'] = wanted or services.dashboard.SECTIONS
+        context.update(caching.dashboard_page(self.athlete, public_qs, filters, today, wanted))
+        # The running performance's curve view reads the stored envelopes (see
+        # services.curves), for the year like the rest of the card.
+        if 'run_perf' in context['sections']:
+            context['curves'] = caching.curves(self.athlete, year)
+        # Explorer tiles, repeat routes, countries and fitness follow no filter: every
+        # public activity counts (see services.explorer, services.routes, services.places,
+        # services.fitness).
+        context['explorer'] = caching.explorer_summary(self.athlete, today)
+        context['repeat_routes'] = caching.repeat_routes(self.athlete, public_qs)
+        context['countries'] = caching.countries(self.athlete, public_qs)
+        context['fitness'] = caching.fitness(self.athlete, today)
+        # Today's date in past years, by the indexed month-day key (see
+        # services.anniversaries); also filter-independent.
+        context['on_this_day'] = caching.on_this_day(self.athlete, public_qs, today)
+        # The athlete's last write, not the render time: the page may be a 304 revalidation.
+        modified = self.athlete.data_modified if self.athlete else None
+        context['last_updated'] = timezone.localtime(modified) if modified else timezone.localtime()
         return context
 
 
+class MapDataView(AthleteScopedMixin, View):
+    """One of the dashboard map's JSON payloads, fetched by the map JS once the page has
+    painted rather than embedded in it, so the page stays small and each is cached (and
+    revalidated by ETag) on its own. The map narrows a request to its viewport
+    (``bbox``, ``zoom``) and filter state (the dashboard's filter params) once it shows
+    more activities than one payload holds; see ``dashboard.viewport_markers``."""
+
+    def map_filters(self):
+        """The request's filter tuple ``(q, sport, gear, year, dist_min, dist_max)``, or
+        ``None`` without any filter."""
+        params = self.request.GET
+        if not any(params.get(key) for key in services.dashboard.FILTERS):
+            return None
+        return ((params.get('q') or '').strip(), params.get('sport') or 'all',
+                params.get('gear') or 'all', params.get('year') or 'all',
+                params.get('dist_min'), params.get('dist_max'))
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(self.data(request.GET), json_dumps_params={'separators': (',', ':')})
+
+    def data(self, params):
+        """The payload for the request's ``params``."""
+        activities = Activity.objects.for_athlete(self.athlete).public()
+        filters = self.map_filters()
+        bbox = helpers.to_bbox(params.get('bbox'))
+        zoom = helpers.to_float(params.get('zoom')) or 0
+        if bbox is None and filters is None:
+            # The first request of every page load: cached until the data changes.
+            return caching.cached(self.athlete, self.cache_name, self.cache_parts(zoom),
+                                  lambda: self.payload(activities, None, None, zoom))
+        return self.payload(activities, filters, bbox, zoom)
+
+    def cache_parts(self, zoom):
+        return (int(zoom),)
+
+
+class MapMarkersView(ConditionalGetMixin, MapDataView):
+    cache_name = 'map-markers'
+
+    def payload(self, activities, filters, bbox, zoom):
+        return services.dashboard.viewport_markers(activities, filters, bbox, zoom)
+
+
+class MapRoutesView(ConditionalGetMixin, MapDataView):
+    cache_name = 'map-routes'
+
+    def cache_parts(self, zoom):
+        # Every zoom a resolution serves gets the same routes.
+        return helpers.route_resolution(zoom)
+
+    def payload(self, activities, filters, bbox, zoom):
+        return services.dashboard.viewport_routes(activities, filters, bbox, zoom)
+
+
+class MapExplorerView(ConditionalGetMixin, MapDataView):
+    """The dashboard map's explorer overlay: the visited explorer tiles in the map's view
+    (``bbox``; the whole world without one), which of them make up the max cluster, and
+    the max square. Follows no filter, like the explorer widget."""
+
+    def data(self, params):
+        bbox = helpers.to_bbox(params.get('bbox')) or (-180, -90, 180, 90)
+        summary = caching.explorer_summary(self.athlete, timezone.localdate())
+        return services.explorer.overlay(self.athlete, bbox, summary)
+
+
+class MapHeatmapView(MapDataView):
+    """A ``z/x/y`` PNG tile of the dashboard map's route heatmap, for the map's filter
+    state (see ``dashboard.heatmap_tile``). The tile's ETag is the fingerprint of the
+    activities drawn on it, so a tile stays valid in the browser, as on disk, until a
+    write touches one of its routes."""
+
+    def get(self, request, *args, z, x, y, **kwargs):
+        if z > HEATMAP_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            raise Http404('No such tile.')
+        activities = Activity.objects.for_athlete(self.athlete).public()
+        digest, draw = services.dashboard.heatmap_tile(self.athlete, activities, self.map_filters(), z, x, y)
+        etag = quote_etag(digest)
+        response = get_conditional_response(request, etag=etag) or HttpResponse(draw(), content_type='image/png')
+        response.headers['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class RefreshView(UserPassesTestMixin, DashboardView):
     """Footer refresh button (POST): run the ``import_strava`` management command to
     pull the latest activities from the Strava API, then re-render every dashboard
@@ -158,16 +299,28 @@ class RefreshView(UserPassesTestMixin, DashboardView):
         return self.render_to_response(context)
 
 
-class ActivitiesView(AthleteScopedMixin, ListView):
+class ActivitiesView(ConditionalGetMixin, AthleteScopedMixin, ListView):
     model = Activity
     template_name = 'strava/pages/activities.html'
     context_object_name = 'activities'
 
     def get_template_names(self):
+        # A ``cursor`` request is the infinite-scroll sentinel asking for the next page:
+        # just the rows (cards or table rows) plus the following sentinel.
         if getattr(self.request, 'htmx', False):
+            if self.request.GET.get('cursor'):
+                return ['strava/hx/activities_page.html']
             return ['strava/hx/activities_results.html']
         return [self.template_name]
 
+    @property
+    def sort_order(self):
+        """The effective ``(key, direction)``: an unknown or blank sort is newest first."""
+        params = self.request.GET
+        if params.get('sort') not in ACTIVITY_SORT_FIELDS:
+            return 'date', 'desc'
+        return params.get('sort'), params.get('dir', 'desc')
+
     def get_queryset(self):
         params = self.request.GET
         return (
@@ -178,8 +331,9 @@ class ActivitiesView(AthleteScopedMixin, ListView):
             .for_sport_selection(params.get('sport'))
             .for_gear(params.get('gear'))
             .for_month(params.get('month'))
+            .for_country(params.get('country'))
             .for_distance(params.get('dist_min'), params.get('dist_max'))
-            .sorted_by(params.get('sort'), params.get('dir', 'desc'))
+            .sorted_by(*self.sort_order)
         )
 
     def get_context_data(self, **kwargs):
@@ -187,24 +341,36 @@ class ActivitiesView(AthleteScopedMixin, ListView):
         context['active_page'] = 'activities'
 
         params = self.request.GET
+        context['view'] = params.get('view', 'grid')
+
+        # Only one page of the filtered list is rendered; the rest scrolls in by cursor.
+        page = pagination.paginate(self.object_list, *self.sort_order, params.get('cursor'), ACTIVITIES_PAGE_SIZE)
+        context['activities'] = page.items
+        context['next_url'] = pagination.next_page_url(self.request, page)
+        if params.get('cursor'):
+            return context
+
         context['q'] = params.get('q', '')
         context['sport'] = params.get('sport', 'all')
         context['gear'] = params.get('gear', 'all')
         context['month'] = params.get('month', 'all')
+        context['country'] = params.get('country', 'all')
         context['sort'] = params.get('sort', '')
         context['dir'] = params.get('dir', 'desc')
-        context['view'] = params.get('view', 'grid')
 
         context['sport_options'] = sport_options(Activity.objects.for_athlete(self.athlete).public())
         context['sport_groups'] = group_data()
         context['gear_list'] = (
-            Gear.objects.for_athlete(self.athlete)
-            .filter(activity__is_private=False).distinct().order_by('brand_name', 'model_name')
+            Gear.objects.for_athlete(self.athlete).used().order_by('brand_name', 'model_name')
         )
         context['month_list'] = [
             (d.strftime('%Y-%m'), d.strftime('%b %Y'))
             for d in Activity.objects.for_athlete(self.athlete).public().dates('start_date', 'month', order='DESC')
         ]
+        context['country_list'] = [
+            (row['country'], geocode.country_name(row['country']))
+            for row in Activity.objects.for_athlete(self.athlete).public().countries()
+        ]
         context.update(helpers.distance_slider_context(
             Activity.objects.for_athlete(self.athlete).public(), context['sport'], params,
         ))
@@ -212,7 +378,7 @@ class ActivitiesView(AthleteScopedMixin, ListView):
         return context
 
 
-class GearView(AthleteScopedMixin, ListView):
+class GearView(ConditionalGetMixin, AthleteScopedMixin, ListView):
     model = Gear
     template_name = 'strava/pages/gear.html'
     context_object_name = 'gear_list'
@@ -224,15 +390,10 @@ class GearView(AthleteScopedMixin, ListView):
 
     def get_queryset(self):
         params = self.request.GET
+        # Ride count, mileage and last-used date are the gear's denormalised public
+        # statistics (private activities don't count), so no aggregate join is needed.
         return (
             Gear.objects.for_athlete(self.athlete)
-            .annotate(
-                # Gear stats are public-facing, so private activities don't count toward
-                # a gear's ride count, mileage or last-used date.
-                activity_count=Count('activity', filter=Q(activity__is_private=False)),
-                distance_sum=Sum('activity__distance', filter=Q(activity__is_private=False)),
-                last_activity=Max('activity__start_date', filter=Q(activity__is_private=False)),
-            )
             .search(params.get('q'))
             .of_type(params.get('type'))
             .by_age(params.get('age'))
@@ -259,48 +420,56 @@ class GearView(AthleteScopedMixin, ListView):
         return context
 
 
-class GalleryView(AthleteScopedMixin, ListView):
+class GalleryView(ConditionalGetMixin, AthleteScopedMixin, ListView):
     model = Activity
     template_name = 'strava/pages/gallery.html'
     context_object_name = 'photos'
 
+    # Gallery sort choice → the ActivityQuerySet.sorted_by ``(key, direction)``.
+    SORTS = {'newest': ('date', 'desc'), 'oldest': ('date', 'asc'), 'kudos': ('kudos', 'desc')}
+
     def get_template_names(self):
+        # A ``cursor`` request is the infinite-scroll sentinel asking for the next page.
         if getattr(self.request, 'htmx', False):
+            if self.request.GET.get('cursor'):
+                return ['strava/hx/gallery_page.html']
             return ['strava/hx/gallery_results.html']
         return [self.template_name]
 
+    @property
+    def sort_order(self):
+        return self.SORTS.get(self.request.GET.get('sort'), self.SORTS['newest'])
+
     def get_queryset(self):
         params = self.request.GET
         # A gallery item is an activity with a primary photo; filter that in SQL.
-        qs = (
+        return (
             Activity.objects.for_athlete(self.athlete)
             .public()
             .exclude(photo_url='')
             .search(params.get('q'))
             .for_sport_selection(params.get('sport'))
             .for_year(params.get('year'))
+            .sorted_by(*self.sort_order)
         )
-        sort = params.get('sort', 'newest')
-        if sort == 'oldest':
-            return qs.order_by('start_date')
-        if sort == 'kudos':
-            return qs.order_by(F('kudos_count').desc(nulls_last=True), '-start_date')
-        return qs.order_by('-start_date')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['active_page'] = 'gallery'
 
         params = self.request.GET
+        # Only one page of photos is rendered; the rest scrolls in by cursor.
+        page = pagination.paginate(self.object_list, *self.sort_order, params.get('cursor'), GALLERY_PAGE_SIZE)
+        context['photos'] = page.items
+        context['next_url'] = pagination.next_page_url(self.request, page)
+        if params.get('cursor'):
+            return context
+
         context['q'] = params.get('q', '')
         context['sport'] = params.get('sport', 'all')
         context['year'] = params.get('year', 'all')
         context['sort'] = params.get('sort', 'newest')
-
-        # Photo presence is now filtered in the queryset (photo_url), so the list is ready.
-        photos = list(context['photos'])
-        context['photos'] = photos
-        context['count'] = len(photos)
+        context['count'] = self.object_list.count()
         scoped = Activity.objects.for_athlete(self.athlete).public()
         context['year_list'] = [d.year for d in scoped.dates('start_date', 'year', order='DESC')]
         context['sport_options'] = sport_options(scoped.exclude(photo_url=''))
@@ -308,7 +477,7 @@ class GalleryView(AthleteScopedMixin, ListView):
         return context
 
 
-class CompareView(AthleteScopedMixin, TemplateView):
+class CompareView(ConditionalGetMixin, AthleteScopedMixin, TemplateView):
     """Year-over-year comparison matrix: one metric per row, one season per column.
 
     Each numeric row is scaled into a bar (relative to the row's best year) and
@@ -333,25 +502,31 @@ class CompareView(AthleteScopedMixin, TemplateView):
         sport = self.request.GET.get('sport') or 'all'
         context['sport'] = sport
 
-        all_activities = list(Activity.objects.for_athlete(self.athlete).public().select_related('gear'))
-        activities = [a for a in all_activities if sport_matches(sport, a.sport_type)]
-
-        # Sport filter: "All sports" plus the top-sport groups actually present in the
-        # data (an empty group would filter to nothing, so it's hidden).
-        present = {a.sport_type for a in all_activities}
-        seg = [{'key': 'all', 'label': 'All sports', 'icon': 'all', 'active': sport == 'all'}]
-        for group in TOP_SPORT_TYPES:
-            if present.intersection(group['types']):
-                seg.append({'key': group['key'], 'label': str(group['label']),
-                            'icon': group['icon'], 'active': sport == group['key']})
-        context['sport_seg'] = seg
-
-        home = helpers.home_location(all_activities)
-        context.update(services.compare.compare_matrix(activities, home, timezone.localdate()))
+        # Every aggregate is computed in the database (see compare.queryset_matrix): only
+        # the per-season totals and the standout activities are fetched. The result is
+        # cached per athlete until the athlete's data next changes (see strava.caching).
+        public = Activity.objects.for_athlete(self.athlete).public()
+        today = timezone.localdate()
+
+        def compute():
+            # Sport filter: "All sports" plus the top-sport groups actually present in the
+            # data (an empty group would filter to nothing, so it's hidden).
+            present = set(public.order_by().values_list('sport_type', flat=True).distinct())
+            seg = [{'key': 'all', 'label': 'All sports', 'icon': 'all', 'active': sport == 'all'}]
+            for group in TOP_SPORT_TYPES:
+                if present.intersection(group['types']):
+                    seg.append({'key': group['key'], 'label': str(group['label']),
+                                'icon': group['icon'], 'active': sport == group['key']})
+            # Home from the start-location index; unowned rows have none, so it's estimated.
+            home = services.bases.home(self.athlete) if self.athlete else public.home_location()
+            return {'sport_seg': seg, **services.compare.queryset_matrix(
+                public.for_sport_selection(sport), home, today)}
+
+        context.update(caching.cached(self.athlete, 'compare', (sport, today), compute))
         return context
 
 
-class ActivityCardView(DetailView):
+class ActivityCardView(ConditionalGetMixin, DetailView):
     """Render a single activity's float card, fetched lazily when its map marker is
     clicked. Keeps the dashboard from server-rendering a card for every marker up
     front (which dominated page load once the marker cap was raised)."""
@@ -365,6 +540,12 @@ class ActivityCardView(DetailView):
         # Still public()-filtered so a private activity can't be surfaced by its PK.
         return Activity.objects.public().select_related('gear')
 
+    def data_validators(self):
+        # The card shows one activity (and its gear): validated by its owner's data.
+        row = (self.get_queryset().filter(pk=self.kwargs.get('pk'), athlete__isnull=False)
+               .values_list('athlete_id', 'athlete__data_version', 'athlete__data_modified').first())
+        return ((row[0], row[1]), row[2]) if row else None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['show_close'] = True  # card is shown standalone (visible, with a close button)
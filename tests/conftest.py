@@ -0,0 +1,31 @@
+"""Fixtures shared by the test modules: the athlete the data belongs to and a factory of
+its activities."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from strava.models import Activity, Athlete
+
+# make_activity's ``day`` counts days from here.
+DAY_ZERO = datetime(2025, 1, 1, 7, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def athlete(db):
+    """The default, connected athlete (pk 42)."""
+    return Athlete.objects.create(id=42, access_token="tok", refresh_token="ref", is_default=True, json={})
+
+
+@pytest.fixture
+def make_activity(athlete):
+    """``make_activity(id, day=1, start=None, **fields)``: create a 10 km run of
+    ``athlete``'s starting ``day`` days after DAY_ZERO, at ``start`` (a ``(lat, lng)``)
+    when given. ``fields`` set or override any other column (``start_date`` included)."""
+    def make(id, day=1, start=None, **fields):
+        if start is not None:
+            fields["start_lat"], fields["start_lng"] = start
+        return Activity.objects.create(**{
+            "id": id, "name": f"Activity {id}", "sport_type": "Run", "distance": 10000, "athlete": athlete,
+            "start_date": DAY_ZERO + timedelta(days=day), "json": {}, **fields,
+        })
+    return make
@@ -208,6 +208,18 @@ class TestStravaApiClient:
         result = self._api(client).get_activities()
         assert result == [{"id": 1}, {"id": 2}]
 
+    def test_get_activity_streams_keys_by_kind(self):
+        requested = {}
+
+        def get_activity_streams(id, types):
+            requested.update(id=id, types=types)
+            return {"time": SimpleNamespace(data=[0, 1]), "heartrate": SimpleNamespace(data=None)}
+
+        client = SimpleNamespace(get_activity_streams=get_activity_streams)
+        result = self._api(client).get_activity_streams(42)
+        assert result == {"time": [0, 1], "heartrate": []}
+        assert requested["id"] == 42 and "latlng" in requested["types"]
+
     def test_update_activity_forwards_kwargs(self):
         calls = {}
         client = SimpleNamespace(
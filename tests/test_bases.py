@@ -0,0 +1,138 @@
+"""Start-location bases (services.bases): the start-cell index, its clustering and the
+stored distances from home."""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from strava import caching, helpers
+from strava.consts import HOME_GRID_LEVEL, MAP_GRID_BITS
+from strava.models import Activity, StartCell
+from strava.services import bases, compare
+
+KOSICE = (48.7200, 21.2580)
+VIENNA = (48.2100, 16.3700)
+
+
+def cell(lat, lng, count, day=1):
+    return SimpleNamespace(cell=helpers.grid_cell(lat, lng, HOME_GRID_LEVEL), count=count, lat=lat, lng=lng,
+                           last=datetime(2025, 1, day, tzinfo=timezone.utc))
+
+
+class TestCluster:
+    def test_dense_neighbours_merge(self):
+        step = 180 / 2 ** HOME_GRID_LEVEL  # one cell north
+        found = bases.cluster([cell(*KOSICE, 4), cell(KOSICE[0] + step, KOSICE[1], 3), cell(*VIENNA, 5)])
+        assert [(b["count"], b["cells"]) for b in found] == [(7, 2), (5, 1)]
+        assert found[0]["lat"] == pytest.approx(KOSICE[0] + step * 3 / 7)
+
+    def test_sparse_cells_stay_apart(self):
+        step = 180 / 2 ** HOME_GRID_LEVEL
+        found = bases.cluster([cell(*KOSICE, 4), cell(KOSICE[0] + step, KOSICE[1], 1)])
+        assert [b["count"] for b in found] == [4, 1]
+
+    def test_ties_go_to_the_latest(self):
+        found = bases.cluster([cell(*KOSICE, 2, day=1), cell(*VIENNA, 2, day=9)])
+        assert found[0]["lat"] == VIENNA[0]
+
+    def test_cell_of_is_the_grid_prefix(self):
+        assert bases.cell_of(helpers.grid_cell(*KOSICE)) == helpers.grid_cell(*KOSICE, HOME_GRID_LEVEL)
+        assert MAP_GRID_BITS >= HOME_GRID_LEVEL
+
+
+class TestIndex:
+    def test_refresh_counts_the_written_cells(self, athlete, make_activity):
+        for pk in (1, 2, 3):
+            activity = make_activity(pk, start=KOSICE, day=pk)
+            bases.refresh(athlete.pk, activity.grid_cell)
+        stored = StartCell.objects.get(athlete=athlete)
+        assert stored.count == 3 and stored.last == activity.start_date
+        assert bases.home(athlete) == pytest.approx(KOSICE)
+
+    def test_moved_or_hidden_starts_leave_their_cell(self, athlete, make_activity):
+        moved = make_activity(1, start=KOSICE)
+        hidden = make_activity(2, start=KOSICE, day=2)
+        bases.rebuild(athlete)
+
+        previous = moved.grid_cell
+        moved.start_lat, moved.start_lng = VIENNA
+        moved.save()
+        bases.refresh(athlete.pk, previous, moved.grid_cell)
+        hidden.is_private = True
+        hidden.save()
+        bases.refresh(athlete.pk, hidden.grid_cell)
+
+        assert [(b["lat"], b["count"]) for b in bases.ranked(athlete)] == [(VIENNA[0], 1)]
+
+    def test_private_starts_are_not_counted(self, athlete, make_activity):
+        make_activity(1, start=KOSICE, is_private=True)
+        assert bases.rebuild(athlete) == 0 and bases.home(athlete) is None
+
+
+class TestHome:
+    def test_records_measure_from_the_indexed_home(self, athlete, make_activity):
+        # Vienna is home by the index; the Košice starts written around it aren't indexed,
+        # so the records must read the index rather than rescan the activities.
+        for pk in (1, 2):
+            make_activity(pk, start=VIENNA, day=pk)
+        bases.rebuild(athlete)
+        for pk in (3, 4, 5):
+            make_activity(pk, start=KOSICE, day=pk)
+
+        activities = Activity.objects.for_athlete(athlete).public()
+        filters = ("", "all", "all", "all", None, None)
+        today = datetime(2025, 6, 1).date()
+        for wanted in (None, {"records"}):
+            records = caching.dashboard_page(athlete, activities, filters, today, wanted)["records"]
+            furthest = next(r for r in records["Running"] if r["label"] == "Furthest from Home")
+            assert furthest["id"] in (3, 4, 5)
+
+
+class TestDistances:
+    def test_haversine_many_matches_the_scalar(self):
+        points = [KOSICE, VIENNA, (0.0, 0.0)]
+        expected = [helpers.haversine_km(*VIENNA, *point) for point in points]
+        assert helpers.haversine_many(*VIENNA, points) == pytest.approx(expected)
+        with patch("strava.helpers.np", None):
+            assert helpers.haversine_many(*VIENNA, points) == pytest.approx(expected)
+        assert helpers.haversine_many(*VIENNA, []) == []
+
+    def test_written_activities_store_their_distance(self, athlete, make_activity):
+        for pk in (1, 2, 3):
+            bases.record(make_activity(pk, start=VIENNA, day=pk))
+        away = make_activity(4, start=KOSICE, day=4)
+        bases.record(away)
+        assert bases.home(athlete) == pytest.approx(VIENNA)
+        assert Activity.objects.get(pk=4).home_distance == pytest.approx(helpers.haversine_km(*VIENNA, *KOSICE))
+        assert Activity.objects.get(pk=1).home_distance == pytest.approx(0)
+
+    def test_distances_are_recomputed_only_when_home_moves(self, athlete, make_activity):
+        for pk in (1, 2):
+            make_activity(pk, start=VIENNA, day=pk)
+        bases.rebuild(athlete)
+        assert not bases.rehome(athlete.pk)
+
+        # Košice overtakes Vienna: the home moves and every distance follows it.
+        for pk in (3, 4, 5):
+            bases.record(make_activity(pk, start=KOSICE, day=pk))
+        assert bases.home(athlete) == pytest.approx(KOSICE)
+        assert Activity.objects.get(pk=1).home_distance == pytest.approx(helpers.haversine_km(*KOSICE, *VIENNA))
+
+    def test_records_read_the_stored_distance(self, athlete, make_activity):
+        for pk in (1, 2):
+            make_activity(pk, start=VIENNA, day=pk)
+        make_activity(3, start=KOSICE, day=3)
+        bases.rebuild(athlete)
+        # A stored distance wins over the geometry: it's what the index measured.
+        Activity.objects.filter(pk=2).update(home_distance=5000)
+        home = bases.home(athlete)
+        activities = Activity.objects.for_athlete(athlete).public()
+        filters = ("", "all", "all", "all", None, None)
+        today = datetime(2025, 6, 1).date()
+        records = caching.dashboard_page(athlete, activities, filters, today)["records"]
+        furthest = next(r for r in records["Running"] if r["label"] == "Furthest from Home")
+        assert (furthest["id"], furthest["value"]) == (2, "5,000")
+        assert [a.pk for a in compare._effort_picks_sql([2025], activities, home)["pin"]] == [2]
+        # An estimated home is measured, never read from the stored distances.
+        assert helpers.home_distances(list(activities.order_by("pk")), tuple(home))[1] == pytest.approx(0)
@@ -0,0 +1,180 @@
+"""The versioned per-athlete result cache (strava.caching) and the page validators
+(views.ConditionalGetMixin) built on the same data version."""
+from datetime import date, datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.utils import timezone as dj_timezone
+
+from strava import caching
+from strava.models import Activity, Athlete, Gear
+from strava.services import sync
+from strava.views import ActivityCardView, CompareView, DashboardView
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "strava-tests"}}
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache():
+    with override_settings(CACHES=LOCMEM):
+        caching._cache().clear()
+        yield
+
+
+def context(view_cls, htmx=False, **params):
+    view = view_cls()
+    view.request = RequestFactory().get("/", params)
+    view.request.htmx = htmx
+    view.kwargs = {}
+    return view.get_context_data()
+
+
+class TestCached:
+    def test_computes_once_per_version_and_parts(self, athlete):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        assert caching.cached(athlete, "x", ("a",), compute) == 1
+        assert caching.cached(athlete, "x", ("a",), compute) == 1
+        assert caching.cached(athlete, "x", ("b",), compute) == 2
+        sync.data_changed(athlete.pk)
+        athlete.refresh_from_db()
+        assert caching.cached(athlete, "x", ("a",), compute) == 3
+
+    def test_no_athlete_is_not_cached(self):
+        assert caching.cached(None, "x", (), lambda: 1) == 1
+        assert caching.cached(None, "x", (), lambda: 2) == 2
+
+    def test_key_is_safe_for_free_text(self, athlete):
+        key = caching.key(athlete, "dashboard", ("évening run ride", None))
+        assert " " not in key and key.isascii()
+
+
+class TestViews:
+    def test_repeat_dashboard_load_is_served_from_cache(self, django_assert_max_num_queries, make_activity):
+        make_activity(1)
+        first = context(DashboardView)
+        with django_assert_max_num_queries(2):  # the athlete lookups (selected + switcher)
+            again = context(DashboardView)
+        assert again["stat"] == first["stat"]
+
+    def test_write_retires_cached_sections(self, athlete, make_activity):
+        make_activity(1)
+        assert context(DashboardView, htmx=True, sport="group-run")["stat"]["activities"] == 1
+        make_activity(2)
+        # Unchanged version: still the cached result.
+        assert context(DashboardView, htmx=True, sport="group-run")["stat"]["activities"] == 1
+        sync.data_changed(athlete.pk)
+        assert context(DashboardView, htmx=True, sport="group-run")["stat"]["activities"] == 2
+
+    def test_compare_is_cached(self, django_assert_max_num_queries, make_activity):
+        make_activity(1)
+        first = context(CompareView)
+        with django_assert_max_num_queries(2):
+            assert context(CompareView)["rows"] == first["rows"]
+
+
+class TestOnThisDay:
+    def test_widget_reads_gear_with_the_rows(self, athlete, django_assert_num_queries):
+        gear = Gear.objects.create(id="g1", primary=False, brand_name="B", model_name="M", description="", json={})
+        Activity.objects.create(id=1, name="Back then", sport_type="Run", distance=5000, athlete=athlete, gear=gear,
+                                start_date=datetime(2022, 6, 15, 12, tzinfo=timezone.utc), json={})
+        with django_assert_num_queries(1):
+            items = caching.on_this_day(athlete, Activity.objects.for_athlete(athlete).public(), date(2025, 6, 15))
+            assert items[0]["activity"].gear.brand_name == "B"
+        assert items[0]["years_ago"] == 3
+        # Cached: no query the second time.
+        with django_assert_num_queries(0):
+            caching.on_this_day(athlete, Activity.objects.for_athlete(athlete).public(), date(2025, 6, 15))
+
+    def test_cached_until_midnight(self, athlete):
+        now = datetime(2025, 6, 15, 22, 30, tzinfo=dj_timezone.get_current_timezone())
+        with patch("strava.caching.timezone.localtime", return_value=now):
+            assert caching.until_midnight() == 90 * 60
+        with patch("strava.caching.until_midnight", return_value=60), \
+                patch.object(caching._cache(), "set", wraps=caching._cache().set) as cache_set:
+            caching.on_this_day(athlete, Activity.objects.none(), now.date())
+        assert cache_set.call_args.args[2] == 60
+
+
+class TestWritePaths:
+    def test_apply_json_bumps_version(self, athlete, make_activity):
+        activity = make_activity(1)
+        activity.json = {"id": 1, "name": "Renamed", "gear_id": None, "sport_type": "Run", "distance": 5000,
+                         "start_date": "2025-06-01T12:00:00+00:00"}
+        sync.activity_apply_json(activity)
+        athlete.refresh_from_db()
+        assert athlete.data_version == 1
+
+    @patch("strava.services.sync.gear_ensure", return_value=None)
+    @patch("strava.management.commands.import_strava.StravaApi")
+    def test_import_bumps_version_and_warms_the_dashboard(self, mock_api_cls, mock_gear, athlete,
+                                                          django_assert_max_num_queries):
+        activity = {"id": 100, "name": "Morning Run", "gear_id": None, "sport_type": "Run",
+                    "distance": 5000, "start_date": "2025-06-15T07:30:00+00:00"}
+        mock_api_cls.return_value.get_athlete.return_value = {"id": 42}
+        mock_api_cls.return_value.get_activities.return_value = [activity]
+        mock_api_cls.return_value.get_activity.return_value = activity
+
+        call_command("import_strava")
+
+        athlete.refresh_from_db()
+        assert athlete.data_version == 1
+        with django_assert_max_num_queries(2):
+            assert context(DashboardView)["stat"]["activities"] == 1
+
+
+def get(view_cls, headers=None, htmx=False, **kwargs):
+    """GET through the view, rendering an empty page (no templates in the test settings)."""
+    request = RequestFactory().get("/", headers=headers or {})
+    request.htmx = htmx
+    with patch.object(view_cls, "get_context_data", return_value={}), \
+            patch.object(view_cls, "render_to_response", side_effect=lambda context: HttpResponse("page")):
+        return view_cls.as_view()(request, **kwargs)
+
+
+class TestConditionalGet:
+    def test_matching_etag_is_not_modified(self, athlete):
+        sync.data_changed(athlete.pk)
+        first = get(DashboardView)
+        assert first.status_code == 200
+        assert first["Cache-Control"] == "private, no-cache"
+        assert "HX-Request" in first["Vary"]
+        again = get(DashboardView, {"If-None-Match": first["ETag"]})
+        assert again.status_code == 304
+        assert again["ETag"] == first["ETag"]
+        assert get(DashboardView, {"If-Modified-Since": first["Last-Modified"]}).status_code == 304
+
+    def test_write_changes_the_etag(self, athlete):
+        etag = get(DashboardView)["ETag"]
+        sync.data_changed(athlete.pk)
+        assert get(DashboardView, {"If-None-Match": etag}).status_code == 200
+
+    def test_nav_athletes_change_the_etag(self, athlete):
+        etag = get(DashboardView)["ETag"]
+        other = Athlete.objects.create(id=7, firstname="Grace", json={})
+        assert get(DashboardView, {"If-None-Match": etag}).status_code == 200
+        etag = get(DashboardView)["ETag"]
+        Athlete.objects.filter(pk=other.pk).update(firstname="Ada")
+        assert get(DashboardView, {"If-None-Match": etag}).status_code == 200
+
+    def test_partial_and_full_page_differ(self, athlete):
+        assert get(DashboardView)["ETag"] != get(DashboardView, htmx=True)["ETag"]
+        assert get(DashboardView)["ETag"] != get(CompareView)["ETag"]
+
+    def test_no_athlete_is_unconditional(self, db):
+        response = get(DashboardView)
+        assert response.status_code == 200 and not response.has_header("ETag")
+
+    def test_activity_card_follows_its_owner(self, athlete, make_activity):
+        make_activity(1)
+        etag = get(ActivityCardView, pk=1)["ETag"]
+        assert get(ActivityCardView, {"If-None-Match": etag}, pk=1).status_code == 304
+        sync.data_changed(athlete.pk)
+        assert get(ActivityCardView, {"If-None-Match": etag}, pk=1).status_code == 200
@@ -7,7 +7,8 @@ from django.core.management import call_command
 from django.core.management.base import CommandError
 
 from strava.management.commands.import_strava import Command
-from strava.models import Activity, Athlete
+from strava.models import Activity, ActivityStream, Athlete, Gear, TrainingDay
+from strava.services import bases, fitness
 
 
 ATHLETE_JSON = {
@@ -64,10 +65,13 @@ class TestImportStrava:
         # The command fetches the detailed activity per summary id.
         details = {100: ACTIVITY_JSON_1, 200: ACTIVITY_JSON_2}
         mock_api_cls.return_value.get_activity.side_effect = lambda activity_id: details[activity_id]
+        mock_api_cls.return_value.get_activity_streams.return_value = {"time": [0, 1]}
 
         call_command("import_strava")
 
         assert Activity.objects.count() == 2
+        # New activities come with their streams.
+        assert [s.points for s in ActivityStream.objects.order_by("pk")] == [2, 2]
         a1 = Activity.objects.get(id=100)
         assert a1.name == "Morning Run"
         assert a1.sport_type == "Run"
@@ -150,6 +154,112 @@ class TestImportStrava:
         assert Activity.objects.get(id=100).name == "Renamed Run"
 
 
+    @patch("strava.services.sync.gear_ensure", return_value=None)
+    @patch("strava.management.commands.import_strava.StravaApi")
+    def test_first_import_refreshes_the_indexes_once(self, mock_api_cls, mock_gear):
+        _connect_athlete()
+        # Newest first, as Strava lists a history without ``after``.
+        history = [{**ACTIVITY_JSON_1, "id": 100 + day, "moving_time": 3600, "start_latlng": [48.72, 21.26],
+                    "start_date": f"2024-06-{day:02}T07:30:00+00:00"} for day in range(20, 0, -1)]
+        mock_api_cls.return_value.get_athlete.return_value = ATHLETE_JSON
+        mock_api_cls.return_value.get_activities.return_value = history
+        mock_api_cls.return_value.get_activity.side_effect = lambda activity_id: history[120 - activity_id]
+        mock_api_cls.return_value.get_activity_streams.return_value = {}
+
+        with patch("strava.services.fitness._recompute", wraps=fitness._recompute) as recompute, \
+                patch("strava.services.bases.refresh", wraps=bases.refresh) as refresh:
+            call_command("import_strava")
+
+        recompute.assert_called_once()
+        refresh.assert_called_once()
+        assert TrainingDay.objects.count() == 20
+        assert Activity.objects.filter(home_distance__lt=0.001).count() == 20
+
+    @patch("strava.management.commands.import_strava.StravaApi")
+    def test_gear_stats_follow_a_gear_change(self, mock_api_cls):
+        athlete = _connect_athlete()
+        Gear.objects.create(id="g1", brand_name="Nike", model_name="A", description="", json={})
+        Gear.objects.create(id="g2", brand_name="Nike", model_name="B", description="", json={})
+        Activity.objects.create(
+            id=100, name="Morning Run", start_date=datetime(2024, 6, 15, 7, 30, tzinfo=timezone.utc),
+            sport_type="Run", distance=5000, gear_id="g1", json=ACTIVITY_JSON_1, athlete=athlete,
+        )
+        Gear.objects.all().refresh_stats()
+
+        # The re-imported activity moved from g1 to g2: the mileage moves with it.
+        moved = {**ACTIVITY_JSON_1, "gear_id": "g2"}
+        mock_api_cls.return_value.get_athlete.return_value = ATHLETE_JSON
+        mock_api_cls.return_value.get_activities.return_value = [moved]
+        mock_api_cls.return_value.get_activity.side_effect = lambda activity_id: moved
+
+        call_command("import_strava")
+
+        assert Gear.objects.get(pk="g1").public_distance == 0
+        assert Gear.objects.get(pk="g2").public_distance == 5000
+        assert Gear.objects.get(pk="g2").public_activity_count == 1
+
+
+@pytest.mark.django_db
+class TestRebuildGearStats:
+    def _stale_gear(self):
+        gear = Gear.objects.create(id="g1", brand_name="Nike", model_name="A", description="", json={})
+        Activity.objects.create(
+            id=100, name="Run", start_date=datetime(2024, 6, 15, tzinfo=timezone.utc),
+            sport_type="Run", distance=5000, gear=gear, json={},
+        )
+        return gear
+
+    def test_check_fails_on_stale_stats(self):
+        self._stale_gear()
+        with pytest.raises(CommandError):
+            call_command("rebuild_gear_stats", "--check")
+        # --check only reports; nothing is written.
+        assert Gear.objects.get(pk="g1").public_distance == 0
+
+    def test_rebuild_fixes_stale_stats(self):
+        self._stale_gear()
+        call_command("rebuild_gear_stats")
+        assert Gear.objects.get(pk="g1").public_distance == 5000
+        call_command("rebuild_gear_stats", "--check")  # now clean: no error
+
+
+@pytest.mark.django_db
+class TestSimplifyRoutes:
+    def test_fills_in_missing_routes(self):
+        athlete = Athlete.objects.create(id=42, json={})
+        Activity.objects.create(
+            id=100, name="Run", start_date=datetime(2024, 6, 15, tzinfo=timezone.utc), sport_type="Run",
+            distance=5000, polyline="_p~iF~ps|U_ulLnnqC", athlete=athlete, json={},
+        )
+        # As left by the migration: the route without its simplified copies.
+        Activity.objects.update(polyline_low="", polyline_medium="", polyline_thumb="")
+
+        call_command("simplify_routes")
+
+        activity = Activity.objects.get(pk=100)
+        assert activity.polyline_low == activity.polyline_thumb == "_p~iF~ps|U_ulLnnqC"
+        athlete.refresh_from_db()
+        assert athlete.data_version == 1
+
+
+@pytest.mark.django_db
+class TestGeocodeActivities:
+    def test_fills_in_missing_places(self):
+        athlete = Athlete.objects.create(id=42, json={})
+        Activity.objects.create(
+            id=100, name="Run", start_date=datetime(2024, 6, 15, tzinfo=timezone.utc), sport_type="Run",
+            distance=5000, start_lat=48.72, start_lng=21.26, athlete=athlete, json={},
+        )
+        # As left by the migration: the start without its country and region.
+        Activity.objects.update(country="", region="")
+
+        call_command("geocode_activities")
+
+        assert Activity.objects.values_list("country", "region").get(pk=100) == ("SK", "Kosicky")
+        athlete.refresh_from_db()
+        assert athlete.data_version == 1
+
+
 @pytest.mark.django_db
 class TestImportFromFile:
     @patch("strava.services.sync.gear_ensure", return_value=None)
@@ -166,3 +276,66 @@ class TestImportFromFile:
         with patch("strava.management.commands.import_strava.os.path.exists", return_value=False):
             Command().import_activities_from_file()
         assert Activity.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestRebuildExplorerTiles:
+    def test_rebuilds_the_index(self):
+        athlete = Athlete.objects.create(id=42, json={})
+        Activity.objects.create(
+            id=100, name="Run", start_date=datetime(2024, 6, 15, tzinfo=timezone.utc), sport_type="Run",
+            distance=5000, polyline="_p~iF~ps|U_ulLnnqC", athlete=athlete, json={},
+        )
+
+        call_command("rebuild_explorer_tiles")
+
+        assert athlete.explorer_tiles.exists()
+        assert set(athlete.explorer_tiles.values_list("activity_id", flat=True)) == {100}
+        athlete.refresh_from_db()
+        assert athlete.data_version == 1
+
+
+@pytest.mark.django_db
+class TestRebuildRoutes:
+    def test_groups_the_activities(self):
+        athlete = Athlete.objects.create(id=42, json={})
+        for pk in (100, 101):
+            Activity.objects.create(
+                id=pk, name="Run", start_date=datetime(2024, 6, pk - 85, tzinfo=timezone.utc), sport_type="Run",
+                distance=5000, polyline="_p~iF~ps|U_ulLnnqC", athlete=athlete, json={},
+            )
+
+        call_command("rebuild_routes")
+
+        assert athlete.routes.count() == 1
+        assert set(Activity.objects.values_list("route", flat=True)) == {athlete.routes.get().pk}
+        athlete.refresh_from_db()
+        assert athlete.data_version == 1
+
+
+@pytest.mark.django_db
+class TestRebuildBases:
+    def test_stores_home_and_distances(self):
+        athlete = Athlete.objects.create(id=42, json={})
+        for pk, lat in ((100, 48.72), (101, 48.72), (102, 48.21)):
+            Activity.objects.create(
+                id=pk, name="Run", start_date=datetime(2024, 6, pk - 85, tzinfo=timezone.utc), sport_type="Run",
+                distance=5000, start_lat=lat, start_lng=21.26, athlete=athlete, json={},
+            )
+
+        call_command("rebuild_bases", athlete=42)
+
+        athlete.refresh_from_db()
+        assert athlete.home_lat == pytest.approx(48.72) and athlete.data_version == 1
+        assert Activity.objects.get(pk=102).home_distance == pytest.approx(56.7, abs=0.1)
+
+
+@pytest.mark.django_db
+class TestBenchDashboard:
+    def test_runs_over_synthetic_rows(self, capsys):
+        call_command("bench_dashboard", count=50, repeat=1)
+        out = capsys.readouterr().out
+        assert out.startswith("50 activities") and "single pass" in out
+        # Each accumulator's share of the single pass, beside its own pass.
+        stats = next(line for line in out.splitlines() if line.startswith("stats")).split()
+        assert len(stats) == 3 and float(stats[2]) >= 0
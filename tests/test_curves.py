@@ -0,0 +1,160 @@
+"""Mean-maximal curves (services.curves): the computation, the envelopes and the view."""
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.management import call_command
+
+from strava.consts import CURVE_DURATIONS
+from strava.models import Activity, ActivityCurve, ActivityStream, CurveEnvelope
+from strava.services import curves, sync
+
+ALL_TIME = CurveEnvelope.ALL_TIME
+
+
+def at(duration, curve):
+    return curve[CURVE_DURATIONS.index(duration)]
+
+
+class TestMeanMaximal:
+    def test_steady_power(self):
+        curve = curves.mean_maximal(list(range(600)), [200] * 600)
+        assert at(5, curve) == pytest.approx(200)
+        assert at(600, curve) == pytest.approx(200)
+        assert at(1200, curve) is None
+
+    def test_best_window(self):
+        watts = [200] * 300 + [400] * 30 + [200] * 300
+        curve = curves.mean_maximal(list(range(len(watts))), watts)
+        assert at(30, curve) == pytest.approx(400)
+        assert at(60, curve) == pytest.approx(300)
+
+    def test_a_pause_counts_as_zero(self):
+        time = list(range(100)) + list(range(1000, 1100))
+        curve = curves.mean_maximal(time, [300] * 200)
+        assert at(60, curve) == pytest.approx(300)
+        # 600 s can't avoid the pause: at most 110 s of it held power.
+        assert at(600, curve) < 60
+
+    def test_pace_from_distance(self):
+        # Sampled every 2 s at 3 m/s, with a 1 km surge at 5 m/s.
+        time, distance, covered = [], [], 0.0
+        for t in range(0, 3000, 2):
+            time.append(t)
+            distance.append(covered)
+            covered += 10 if 1000 <= t < 1400 else 6
+        curve = curves.mean_maximal(time, distance, cumulative=True)
+        assert at(300, curve) == pytest.approx(5)
+        assert at(1200, curve) == pytest.approx((400 * 5 + 800 * 3) / 1200)
+
+    def test_without_numpy(self):
+        time = [0, 1, 2, 5, 6, 30, 31, 32] + list(range(40, 400, 3))
+        watts = [(t * 37) % 500 for t in time]
+        distance = [t * 3.1 + (t % 7) for t in time]
+        fast = curves.mean_maximal(time, watts), curves.mean_maximal(time, distance, cumulative=True)
+        with patch("strava.services.curves.np", None):
+            plain = curves.mean_maximal(time, watts), curves.mean_maximal(time, distance, cumulative=True)
+        for a, b in zip(fast, plain):
+            assert [x is None for x in a] == [x is None for x in b]
+            assert [x for x in a if x is not None] == pytest.approx([x for x in b if x is not None])
+
+    def test_nothing_to_compute(self):
+        assert curves.mean_maximal([0], [100]) is None
+        assert curves.mean_maximal(list(range(60)), [0] * 60) is None
+        assert curves.mean_maximal(list(range(60)), None) is None
+
+
+LAST_YEAR = datetime(2024, 6, 1, 7, tzinfo=timezone.utc)
+
+
+def ride(activity, watts, seconds=1200):
+    """Store ``activity``'s streams as fetched: steady ``watts`` at 8 m/s."""
+    api = MagicMock()
+    api.get_activity_streams.return_value = {
+        "time": list(range(seconds)), "distance": [8.0 * t for t in range(seconds)], "watts": [watts] * seconds,
+    }
+    return sync.activity_fetch_streams(activity, api=api)
+
+
+def envelope(athlete, kind, season):
+    row = CurveEnvelope.objects.filter(athlete=athlete, kind=kind, season=season).first()
+    return row and (at(60, row.values), at(60, row.activities))
+
+
+class TestEnvelopes:
+    def test_fetching_streams_stores_the_curves(self, make_activity):
+        ride(make_activity(1, sport_type="Ride"), 250)
+        curve = ActivityCurve.objects.get(activity_id=1)
+        assert at(60, curve.power) == 250 and at(60, curve.pace) == 8
+        assert at(3600, curve.power) is None
+
+    def test_merged_per_season_and_all_time(self, athlete, make_activity):
+        ride(make_activity(1, sport_type="Ride", start_date=LAST_YEAR), 300)
+        ride(make_activity(2, sport_type="Ride"), 250)
+        ride(make_activity(3, sport_type="Ride", is_private=True), 400)
+        assert envelope(athlete, "power", 2024) == (300, 1)
+        assert envelope(athlete, "power", 2025) == (250, 2)
+        assert envelope(athlete, "power", ALL_TIME) == (300, 1)
+        # Rides feed the power envelopes only.
+        assert envelope(athlete, "pace", ALL_TIME) is None
+
+    def test_an_edit_recomputes_the_envelopes_it_held(self, athlete, make_activity):
+        ride(make_activity(1, sport_type="Ride", start_date=LAST_YEAR), 300)
+        ride(make_activity(2, sport_type="Ride"), 250)
+        edited = Activity.objects.get(pk=1)
+        edited.is_private = True
+        edited.save()
+        curves.record(edited)
+        assert envelope(athlete, "power", ALL_TIME) == (250, 2)
+        assert envelope(athlete, "power", 2024) is None
+
+    def test_a_run_moves_to_the_pace_envelopes(self, athlete, make_activity):
+        activity = make_activity(1, sport_type="Ride")
+        ride(activity, 300)
+        activity.sport_type = "Run"
+        activity.save()
+        curves.record(activity)
+        assert envelope(athlete, "power", ALL_TIME) is None
+        assert envelope(athlete, "pace", ALL_TIME) == (8, 1)
+
+    def test_forget(self, athlete, make_activity):
+        ride(make_activity(1, sport_type="Ride"), 300)
+        ride(make_activity(2, sport_type="Ride"), 250)
+        deleted = Activity.objects.filter(pk=1)
+        curves.forget(deleted)
+        deleted.delete()
+        assert envelope(athlete, "power", 2025) == (250, 2)
+
+    def test_rebuild_command(self, athlete, make_activity):
+        ride(make_activity(1, sport_type="Ride", start_date=LAST_YEAR), 300)
+        ride(make_activity(2, sport_type="Ride"), 250)
+        ActivityCurve.objects.all().delete()
+        CurveEnvelope.objects.all().delete()
+        call_command("rebuild_curves", stdout=MagicMock())
+        assert ActivityCurve.objects.count() == 2
+        assert sorted(CurveEnvelope.objects.values_list("season", flat=True)) == [ALL_TIME, 2024, 2025]
+        assert envelope(athlete, "power", ALL_TIME) == (300, 1)
+
+
+class TestCurveView:
+    def test_season_over_all_time(self, athlete, make_activity):
+        ride(make_activity(1, sport_type="Ride", start_date=LAST_YEAR), 300)
+        ride(make_activity(2, sport_type="Ride"), 250)
+        [power] = curves.curve_view(athlete, "2025")
+        assert power["kind"] == "power" and power["points"] and power["all_points"]
+        assert [(row["duration"], row["value"], row["id"]) for row in power["rows"]] == [
+            ("5s", "250", 2), ("1m", "250", 2), ("5m", "250", 2), ("20m", "250", 2), ("1h", "—", None)]
+
+    def test_all_time_and_pace(self, athlete, make_activity):
+        activity = make_activity(1, sport_type="Run")
+        ride(activity, 300)
+        [pace] = curves.curve_view(athlete, "all")
+        assert pace["all_points"] == ""
+        # 8 m/s is 2:05 per km.
+        assert (pace["rows"][1]["value"], pace["rows"][1]["unit"]) == ("2:05", "/km")
+
+    def test_reads_no_streams(self, athlete, make_activity):
+        ride(make_activity(1, sport_type="Ride"), 300)
+        with patch.object(ActivityStream, "series", side_effect=AssertionError("streams read")):
+            assert curves.curve_view(athlete, "all")
+        assert curves.curve_view(None, "all") == []
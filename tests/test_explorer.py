@@ -0,0 +1,143 @@
+"""The explorer-tile index (services.explorer) and its map overlay endpoint."""
+import json
+from datetime import datetime
+
+import pytest
+from django.test import RequestFactory
+
+from strava import helpers
+from strava.models import Activity, ExplorerTile
+from strava.services import explorer
+from strava.views import MapExplorerView
+
+# Two routes around Košice: the second crosses the first's tiles and carries on east.
+WEST = helpers.encode_polyline([(48.72, 21.20), (48.72, 21.26)])
+EAST = helpers.encode_polyline([(48.72, 21.22), (48.72, 21.32)])
+
+
+def tiles_of(polyline):
+    return explorer.route_tiles(polyline)
+
+
+class TestGeometry:
+    def test_route_tiles_fill_the_gaps_between_points(self):
+        # ~0.022° of longitude per zoom-14 tile: the 0.06° segment crosses 3–4 tiles in
+        # one row, though it has only two points.
+        tiles = tiles_of(WEST)
+        assert len({y for _x, y in tiles}) == 1
+        xs = sorted(x for x, _y in tiles)
+        assert xs == list(range(xs[0], xs[0] + len(xs))) and len(xs) >= 3
+
+    def test_diagonal_routes_stay_connected(self):
+        tiles = tiles_of(helpers.encode_polyline([(48.70, 21.20), (48.74, 21.26)]))
+        for x, y in tiles:
+            assert len(tiles) == 1 or any(
+                neighbour in tiles for neighbour in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)))
+
+    def test_recording_gaps_are_not_filled(self):
+        tiles = tiles_of(helpers.encode_polyline([(48.72, 21.2), (48.72, 22.2)]))
+        assert len(tiles) == 2
+
+    def test_max_square(self):
+        block = {(x, y) for x in range(3) for y in range(3)}
+        assert explorer.max_square(block | {(5, 5), (3, 0)}) == (0, 0, 3)
+        assert explorer.max_square({(4, 7)}) == (4, 7, 1)
+        assert explorer.max_square(set()) is None
+
+    def test_max_cluster(self):
+        block = {(x, y) for x in range(4) for y in range(4)}
+        far = {(x, y) for x in range(10, 13) for y in range(10, 13)}
+        assert explorer.max_cluster(block | far) == {(1, 1), (1, 2), (2, 1), (2, 2)}
+        assert explorer.max_cluster({(0, 0), (1, 0)}) == set()
+
+
+@pytest.fixture
+def make_route(make_activity):
+    """A run along ``polyline``, recorded in the tile index."""
+    def make(id, polyline, **fields):
+        activity = make_activity(id, polyline=polyline, **fields)
+        explorer.record(activity)
+        return activity
+    return make
+
+
+def index(athlete):
+    return dict(((x, y), pk) for x, y, pk in athlete.explorer_tiles.values_list("x", "y", "activity_id"))
+
+
+class TestIndex:
+    def test_first_visits(self, athlete, make_route):
+        make_route(1, WEST, day=1)
+        make_route(2, EAST, day=2)
+        tiles = index(athlete)
+        assert set(tiles) == tiles_of(WEST) | tiles_of(EAST)
+        assert {tile for tile, pk in tiles.items() if pk == 1} == tiles_of(WEST)
+
+    def test_an_earlier_activity_takes_over(self, athlete, make_route):
+        make_route(2, EAST, day=2)
+        make_route(1, WEST, day=1)
+        assert {tile for tile, pk in index(athlete).items() if pk == 1} == tiles_of(WEST)
+
+    def test_matches_a_rebuild(self, athlete, make_route):
+        make_route(2, EAST, day=2)
+        make_route(1, WEST, day=1)
+        make_route(3, EAST, day=3)
+        incremental = index(athlete)
+        explorer.rebuild(athlete)
+        assert index(athlete) == incremental
+
+    def test_deleted_activity_hands_its_tiles_on(self, athlete, make_route):
+        make_route(1, WEST, day=1)
+        make_route(2, EAST, day=2)
+        deleted = Activity.objects.filter(pk=1)
+        explorer.forget(deleted)
+        deleted.delete()
+        assert set(index(athlete)) == tiles_of(EAST)
+        assert set(index(athlete).values()) == {2}
+
+    def test_private_or_rerouted_activity_drops_its_tiles(self, athlete, make_route):
+        activity = make_route(1, WEST, day=1)
+        make_route(2, EAST, day=2)
+        activity.is_private = True
+        activity.save()
+        explorer.record(activity)
+        assert set(index(athlete).values()) == {2}
+
+        activity.is_private = False
+        activity.polyline = helpers.encode_polyline([(48.72, 21.30), (48.72, 21.32)])
+        activity.save()
+        explorer.record(activity)
+        assert set(index(athlete)) == tiles_of(EAST)
+        assert {tile for tile, pk in index(athlete).items() if pk == 1} == tiles_of(activity.polyline)
+
+    def test_private_activity_is_not_indexed(self, make_route):
+        make_route(1, WEST, day=1, is_private=True)
+        assert not ExplorerTile.objects.exists()
+
+
+class TestOverlay:
+    def get(self, **params):
+        request = RequestFactory().get("/", params)
+        return json.loads(MapExplorerView.as_view()(request).content)
+
+    def test_tiles_in_view_with_the_square(self, make_route):
+        make_route(1, WEST, day=1)
+        payload = self.get(bbox="21.19,48.7,21.27,48.74")
+        assert set(zip(payload["x"], payload["y"])) == tiles_of(WEST)
+        assert payload["cluster"] == [0] * len(payload["x"])
+        assert payload["square"][2] == 1
+
+        assert self.get(bbox="16.3,48.1,16.5,48.3")["x"] == []
+
+    def test_revalidates_by_etag(self, make_route):
+        make_route(1, WEST, day=1)
+        response = MapExplorerView.as_view()(RequestFactory().get("/"))
+        etag = response.headers["ETag"]
+        again = MapExplorerView.as_view()(RequestFactory().get("/", HTTP_IF_NONE_MATCH=etag))
+        assert again.status_code == 304
+
+    def test_summary(self, athlete, make_route):
+        make_route(1, WEST, day=1)
+        summary = explorer.summary(athlete, datetime(2025, 12, 31).date())
+        assert summary["tiles"] == summary["this_year"] == len(tiles_of(WEST))
+        assert explorer.summary(athlete, datetime(2026, 1, 1).date())["this_year"] == 0
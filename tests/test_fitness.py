@@ -0,0 +1,154 @@
+"""Training load (services.fitness): activity loads, the stored daily series and its view."""
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from strava.models import Activity, Athlete, TrainingDay
+from strava.services import fitness
+
+
+class TestLoad:
+    def test_heart_rate(self):
+        # An hour at 70% of the heart-rate reserve (60–190 bpm).
+        assert fitness.load("Run", 3600, 151, None) == pytest.approx(60 * 0.7 * 0.64 * 3.8328, rel=1e-3)
+
+    def test_power_relative_to_ftp(self):
+        # An hour at FTP is 100, whatever the heart rate.
+        assert fitness.load("Ride", 3600, 151, 250, ftp=250) == pytest.approx(100)
+        assert fitness.load("Ride", 1800, None, 200, ftp=250) == pytest.approx(32)
+        # Without an FTP the heart rate counts.
+        assert fitness.load("Ride", 3600, 151, 250) == fitness.load("Ride", 3600, 151, None)
+
+    @override_settings(STRAVA_TRAINING_LOAD_POWER=False)
+    def test_power_option_off(self):
+        assert fitness.load("Ride", 3600, 151, 250, ftp=250) == fitness.load("Ride", 3600, 151, None)
+
+    def test_by_sport_without_heart_rate(self):
+        assert fitness.load("Run", 7200, None, None) == 180
+        assert fitness.load("Yoga", 3600, None, None) == 50
+        assert fitness.load("Run", None, 150, None) == 0
+
+    def test_series(self):
+        rows = fitness.series({date(2025, 1, 1): 84.0, date(2025, 1, 3): 42.0}, date(2025, 1, 1))
+        assert [row[0].day for row in rows] == [1, 2, 3]
+        day, load, ctl, atl = rows[0]
+        assert (load, ctl, atl) == (84.0, pytest.approx(2.0), pytest.approx(12.0))
+        assert rows[1][1] == 0 and rows[1][2] == pytest.approx(2.0 * 41 / 42)
+
+
+@pytest.fixture
+def make_run(make_activity):
+    """An hour's run at 150 bpm, ``day`` days into 2025."""
+    def make(id, day, moving_time=3600, **fields):
+        return make_activity(id, day=day, moving_time=moving_time, average_heartrate=150, **fields)
+    return make
+
+
+def stored(athlete):
+    return [(row.day, round(row.load, 6), round(row.fitness, 6), round(row.fatigue, 6))
+            for row in TrainingDay.objects.filter(athlete=athlete).order_by("day")]
+
+
+class TestSeries:
+    def test_rebuild_is_dense(self, athlete, make_run):
+        for id, day in enumerate((0, 3, 3, 9), start=1):
+            make_run(id, day)
+        make_run(5, 20, is_private=True)
+        assert fitness.rebuild(athlete) == 10
+        rows = stored(athlete)
+        assert rows[0][0] == date(2025, 1, 1) and rows[-1][0] == date(2025, 1, 10)
+        assert rows[3][1] == pytest.approx(2 * rows[0][1])
+        assert rows[1][1] == 0
+
+    def test_record_matches_a_rebuild(self, athlete, make_run):
+        for id, day in enumerate(range(0, 60, 2), start=1):
+            make_run(id, day)
+        fitness.rebuild(athlete)
+        # A new activity in the middle, another after the end, and one moved earlier.
+        fitness.record(make_run(100, 31, moving_time=5400))
+        fitness.record(make_run(101, 75))
+        moved = Activity.objects.get(pk=10)
+        previous = moved.start_date
+        moved.start_date -= timedelta(days=5)
+        moved.save()
+        fitness.record(moved, previous)
+        incremental = stored(athlete)
+        fitness.rebuild(athlete)
+        assert incremental == stored(athlete)
+
+    def test_a_new_latest_activity_writes_its_day_only(self, athlete, django_assert_max_num_queries, make_run):
+        for id, day in enumerate(range(0, 300), start=1):
+            make_run(id, day)
+        fitness.rebuild(athlete)
+        latest = make_run(1000, 300)
+        first_ids = set(TrainingDay.objects.filter(day__lt=date(2025, 10, 1)).values_list("pk", flat=True))
+        with django_assert_max_num_queries(6):
+            fitness.record(latest)
+        assert first_ids <= set(TrainingDay.objects.values_list("pk", flat=True))
+        assert TrainingDay.objects.count() == 301
+
+    def test_refresh_after_a_delete(self, athlete, make_run):
+        for id, day in enumerate((0, 5, 10), start=1):
+            make_run(id, day)
+        fitness.rebuild(athlete)
+        last = Activity.objects.get(pk=3)
+        last.delete()
+        fitness.refresh(athlete.pk, last.start_date)
+        assert stored(athlete)[-1][0] == date(2025, 1, 6)
+
+    def test_ten_years_rebuild_well_under_a_second(self, athlete):
+        start = datetime(2015, 1, 1, 7, tzinfo=timezone.utc)
+        Activity.objects.bulk_create([
+            Activity(id=id, name="Run", sport_type="Run", distance=10000, athlete=athlete, moving_time=3600,
+                     average_heartrate=140 + id % 20, start_date=start + timedelta(days=id * 365.25 * 10 / 4000),
+                     json={})
+            for id in range(4000)
+        ])
+        began = time.perf_counter()
+        days = fitness.rebuild(athlete)
+        assert time.perf_counter() - began < 1
+        assert days == pytest.approx(3652, abs=2)
+
+    def test_command(self, athlete, capsys, make_run):
+        make_run(1, 0)
+        call_command("rebuild_training_load", athlete=athlete.pk)
+        assert TrainingDay.objects.count() == 1
+
+
+class TestSummary:
+    def test_decays_after_the_last_day(self, athlete, make_run):
+        for id, day in enumerate(range(0, 90), start=1):
+            make_run(id, day, moving_time=5400)
+        fitness.rebuild(athlete)
+        last = TrainingDay.objects.order_by("-day").first()
+        on_the_day = fitness.summary(athlete, last.day)
+        assert on_the_day["fitness"] == round(last.fitness)
+        assert on_the_day["form"] < 0 and on_the_day["ramp"] > 0
+        rested = fitness.summary(athlete, last.day + timedelta(days=14))
+        assert rested["fitness"] < on_the_day["fitness"] and rested["form"] > 0
+        assert rested["zone"] == "fresh"
+        chart = rested["chart"]
+        assert len(chart["fitness"].split()) == 182 and chart["end"] == last.day + timedelta(days=14)
+
+    def test_long_after(self, athlete, make_run):
+        make_run(1, 0)
+        fitness.rebuild(athlete)
+        assert fitness.summary(athlete, date(2026, 1, 1))["fitness"] == 0
+
+    def test_without_a_series(self, athlete):
+        assert fitness.summary(athlete, date(2025, 1, 1)) is None
+        assert fitness.summary(None, date(2025, 1, 1)) is None
+
+
+class TestPromotedPower:
+    def test_read_json(self):
+        payload = {"name": "Ride", "gear_id": None, "sport_type": "Ride", "distance": 1,
+                   "start_date": "2025-01-01T00:00:00+00:00", "weighted_average_watts": 230}
+        assert Activity.read_json({**payload, "device_watts": True})["weighted_average_watts"] == 230
+        # Strava's estimate without a power meter isn't kept.
+        assert Activity.read_json({**payload, "device_watts": False})["weighted_average_watts"] is None
+        assert Athlete.read_json({"ftp": 260})["ftp"] == 260
+        assert Athlete.read_json({})["ftp"] is None
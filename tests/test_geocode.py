@@ -0,0 +1,86 @@
+"""Offline reverse geocoding (strava.geocode) and the country breakdown (services.places)."""
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from django.test import RequestFactory
+
+from strava import geocode
+from strava.models import Activity
+from strava.services import places
+from strava.views import ActivitiesView
+
+KOSICE = (48.7200, 21.2580)
+VIENNA = (48.2100, 16.3700)
+
+
+class TestLocate:
+    @pytest.mark.parametrize("point, country, region", [
+        (KOSICE, "SK", "Kosicky"),
+        (VIENNA, "AT", "Vienna"),
+        ((40.71, -74.00), "US", "New York"),
+        ((-33.87, 151.21), "AU", "New South Wales"),
+    ])
+    def test_country_and_region(self, point, country, region):
+        assert geocode.locate(*point) == (country, region)
+
+    def test_states_without_a_border_polygon(self):
+        # Too small for the simplified borders, which put them in France and Italy.
+        assert geocode.locate(43.738, 7.424)[0] == "MC"
+        assert geocode.locate(43.94, 12.45)[0] == "SM"
+        assert geocode.locate(44.06, 12.57)[0] == "IT"
+
+    def test_unknown(self):
+        assert geocode.locate(30.0, -40.0) == ("", "")  # mid-Atlantic
+        assert geocode.locate(None, None) == ("", "")
+
+    def test_inland_cells_settle(self):
+        index = geocode.places()
+        assert index.country(*KOSICE) == "SK"
+        lat, lng = 48.75, 19.25  # a cell no border crosses
+        assert (geocode._cell(lat), geocode._cell(lng)) not in index.crossed
+        assert index.country(lat, lng) == "SK"
+        assert index._settled[geocode._cell(lat), geocode._cell(lng)] == "SK"
+
+    def test_country_name(self):
+        assert geocode.country_name("SK") == "Slovakia"
+        assert geocode.country_name("??") == "??"
+
+
+class TestCountries:
+    def test_derived_on_save(self, make_activity):
+        activity = make_activity(1, start=KOSICE)
+        assert (activity.country, activity.region) == ("SK", "Kosicky")
+        activity.start_lat, activity.start_lng = VIENNA
+        activity.save(update_fields=["start_lat", "start_lng"])
+        assert Activity.objects.values_list("country", "region").get(pk=1) == ("AT", "Vienna")
+
+    def test_partial_save_without_the_start_skips_geocoding(self, make_activity):
+        activity = make_activity(1, start=KOSICE)
+        activity.name = "Renamed"
+        with patch("strava.geocode.locate") as locate:
+            activity.save(update_fields=["name"])
+        locate.assert_not_called()
+
+    def test_breakdown(self, athlete, make_activity):
+        make_activity(1, start=KOSICE, distance=5000, start_date=datetime(2024, 6, 1, 12, tzinfo=timezone.utc))
+        make_activity(2, start=KOSICE)
+        make_activity(3, start=VIENNA, distance=5000)
+        make_activity(4, start=(30.0, -40.0))
+
+        breakdown = places.countries(Activity.objects.for_athlete(athlete))
+        assert breakdown["total"] == 2
+        assert [(c["code"], c["name"], c["activities"], c["distance_km"]) for c in breakdown["countries"]] == [
+            ("SK", "Slovakia", 2, 15), ("AT", "Austria", 1, 5),
+        ]
+        assert breakdown["years"] == [{"year": 2025, "visited": 2, "new": 1}, {"year": 2024, "visited": 1, "new": 1}]
+
+    def test_activities_page_filters_by_country(self, make_activity):
+        make_activity(1, start=KOSICE)
+        make_activity(2, start=VIENNA)
+        view = ActivitiesView()
+        view.request = RequestFactory().get("/", {"country": "AT"})
+        view.kwargs = {}
+        assert [a.pk for a in view.get_queryset()] == [2]
+        view.object_list = view.get_queryset()
+        assert view.get_context_data()["country_list"] == [("AT", "Austria"), ("SK", "Slovakia")]
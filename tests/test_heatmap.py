@@ -0,0 +1,153 @@
+"""The route heatmap tiles (services.heatmap) and their endpoint."""
+import math
+import struct
+import zlib
+from unittest.mock import patch
+
+import pytest
+from django.http import Http404
+from django.test import RequestFactory, override_settings
+
+from strava import helpers
+from strava.models import Activity
+from strava.services import heatmap
+from strava.views import MapHeatmapView
+
+# A 10 km line east from Košice, and a route around Vienna.
+KOSICE = helpers.encode_polyline([(48.72, 21.26), (48.72, 21.40)])
+VIENNA = helpers.encode_polyline([(48.21, 16.37), (48.22, 16.40)])
+
+
+def tile_of(lat, lng, z):
+    n = 2 ** z
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return z, int((lng + 180) / 360 * n), int(y)
+
+
+def pixels(png):
+    """The RGBA rows of a tile PNG written by heatmap.encode_png."""
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    length, = struct.unpack(">I", png[33:37])
+    assert png[37:41] == b"IDAT"
+    raw = zlib.decompress(png[41:41 + length])
+    stride = heatmap.TILE_SIZE * 4 + 1
+    return [raw[row * stride + 1:(row + 1) * stride] for row in range(heatmap.TILE_SIZE)]
+
+
+class TestRaster:
+    def test_tile_bounds(self):
+        west, south, east, north = heatmap.tile_bounds(0, 0, 0)
+        assert (west, east) == (-180, 180) and south == pytest.approx(-85.0511, abs=1e-4)
+        west, south, east, north = heatmap.tile_bounds(*tile_of(48.72, 21.26, 12))
+        assert west <= 21.26 <= east and south <= 48.72 <= north
+
+    def test_each_route_counts_once_per_pixel(self):
+        z, x, y = tile_of(48.72, 21.26, 10)
+        back_and_forth = helpers.encode_polyline([(48.72, 21.26), (48.72, 21.40), (48.72, 21.26)])
+        counts = heatmap.accumulate([back_and_forth, KOSICE, VIENNA], z, x, y)
+        assert counts and set(counts.values()) == {2}
+        # ~10 km at zoom 10 (~100 m per pixel at this latitude): a line of ~100 pixels.
+        assert 95 < len(counts) < 110
+
+    def test_segments_off_the_tile_are_skipped(self):
+        z, x, y = tile_of(48.72, 21.26, 12)
+        far = [(10.0, 10.0), (10.0, 10.1)]
+        assert list(heatmap.segments(far, z, x, y)) == []
+        assert heatmap.accumulate([helpers.encode_polyline(far)], z, x, y) == {}
+
+    def test_png_colours_visited_pixels_only(self):
+        z, x, y = tile_of(48.72, 21.26, 10)
+        counts = heatmap.accumulate([KOSICE], z, x, y)
+        rows = pixels(heatmap.encode_png(counts))
+        pixel = next(iter(counts))
+        row, col = divmod(pixel, heatmap.TILE_SIZE)
+        assert rows[row][col * 4 + 3] > 0
+        assert sum(1 for r in rows for alpha in r[3::4] if alpha) == len(counts)
+
+
+@pytest.fixture(autouse=True)
+def heatmap_root(tmp_path):
+    with override_settings(STRAVA_HEATMAP_ROOT=str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture
+def make_route(make_activity):
+    """A run along ``polyline``, starting at its first point."""
+    def make(id, polyline, **fields):
+        return make_activity(id, start=helpers.decode_polyline(polyline)[0], polyline=polyline, **fields)
+    return make
+
+
+def get(z, x, y, headers=None, **params):
+    request = RequestFactory().get("/", params, headers=headers or {})
+    return MapHeatmapView.as_view()(request, z=z, x=x, y=y)
+
+
+class TestHeatmapView:
+    def test_tile_is_served_and_revalidated(self, make_route):
+        make_route(1, KOSICE)
+        tile = tile_of(48.72, 21.3, 10)
+        response = get(*tile)
+        assert response.status_code == 200 and response["Content-Type"] == "image/png"
+        assert any(any(row[3::4]) for row in pixels(response.content))
+        assert get(*tile, {"If-None-Match": response["ETag"]}).status_code == 304
+
+    def test_revalidation_draws_nothing(self, make_route):
+        make_route(1, KOSICE)
+        tile = tile_of(48.72, 21.3, 10)
+        etag = get(*tile)["ETag"]
+        with patch("strava.services.heatmap.cached_tile") as cached_tile:
+            assert get(*tile, {"If-None-Match": etag}).status_code == 304
+        cached_tile.assert_not_called()
+
+    def test_rendered_once_then_read_from_disk(self, heatmap_root, make_route):
+        make_route(1, KOSICE)
+        tile = tile_of(48.72, 21.3, 10)
+        first = get(*tile).content
+        with patch("strava.services.heatmap.render") as render:
+            assert get(*tile).content == first
+        render.assert_not_called()
+        assert len(list(heatmap_root.rglob("*.png"))) == 1
+
+    def test_only_tiles_a_write_touches_change(self, heatmap_root, make_route):
+        make_route(1, KOSICE)
+        kosice, vienna = tile_of(48.72, 21.3, 10), tile_of(48.21, 16.38, 10)
+        etags = {tile: get(*tile)["ETag"] for tile in (kosice, vienna)}
+
+        make_route(2, VIENNA)
+        assert get(*kosice)["ETag"] == etags[kosice]
+        assert get(*vienna)["ETag"] != etags[vienna]
+        # The Vienna tile's earlier rendering was replaced, not kept beside the new one.
+        assert len(list(heatmap_root.rglob("*.png"))) == 2
+
+        Activity.objects.filter(pk=1).update(is_private=True)
+        assert get(*kosice)["ETag"] != etags[kosice]
+
+    def test_a_route_edited_in_place_changes_the_etag(self, make_route):
+        activity = make_route(1, KOSICE)
+        tile = tile_of(48.72, 21.3, 10)
+        etag = get(*tile)["ETag"]
+        # Same length and box, another route.
+        activity.polyline = helpers.encode_polyline([(48.72, 21.40), (48.72, 21.26)])
+        assert len(activity.polyline) == len(KOSICE)
+        activity.save()
+        assert get(*tile)["ETag"] != etag
+
+    def test_only_the_unfiltered_layer_is_stored(self, heatmap_root, make_route):
+        make_route(1, KOSICE)
+        assert get(*tile_of(48.72, 21.3, 10), q="activity").status_code == 200
+        assert get(*tile_of(48.72, 21.3, 16)).status_code == 200
+        # No route crosses it: the shared blank tile.
+        assert get(*tile_of(48.21, 16.38, 10)).content == heatmap.BLANK
+        assert not list(heatmap_root.rglob("*.png"))
+
+    def test_filtered_tiles(self, make_route):
+        make_route(1, KOSICE, sport_type="Ride")
+        tile = tile_of(48.72, 21.3, 10)
+        assert any(any(row[3::4]) for row in pixels(get(*tile, sport="group-ride").content))
+        assert not any(any(row[3::4]) for row in pixels(get(*tile, sport="group-run").content))
+
+    def test_out_of_range_tile(self, athlete):
+        with pytest.raises(Http404):
+            get(2, 4, 0)
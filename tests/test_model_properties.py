@@ -213,11 +213,15 @@ class TestGear:
         return Gear.objects.create(**defaults)
 
     def _activity(self, id, gear, distance=5000, start_date=None):
-        return Activity.objects.create(
+        activity = Activity.objects.create(
             id=id, name=f"A{id}",
             start_date=start_date or datetime(2025, 6, 15, tzinfo=timezone.utc),
             sport_type="Run", distance=distance, gear=gear, json={},
         )
+        # Gear statistics are denormalised; refresh them as the ingest paths do.
+        sync.gear_refresh_stats(gear.pk)
+        gear.refresh_from_db()
+        return activity
 
     def test_distance_sums_activities(self):
         g = self._gear()
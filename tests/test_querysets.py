@@ -1,15 +1,16 @@
 """Tests for ActivityQuerySet / GearQuerySet filter and sort helpers.
 
-The PostgreSQL-only methods (``search`` — uses ``unaccent``; ``gear_unsynced`` /
-``summary_only`` / ``detailed`` — use ``jsonb_extract_path_text``) can't run on
-the SQLite test backend and are exercised against the real database in the
-consuming project instead. Everything here is portable ORM.
+The PostgreSQL-only method ``gear_unsynced`` (uses ``jsonb_extract_path_text``) can't
+run on the SQLite test backend and is exercised against the real database in the
+consuming project instead. ``search`` runs here against the SQLite FTS5 index.
 """
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
+from unittest.mock import patch
 
 import pytest
 
 from strava.models import Activity, Gear
+from strava.pagination import decode_cursor, encode_cursor, paginate
 
 
 def make(id, sport_type="Run", distance=5000, moving_time=1800,
@@ -196,6 +197,58 @@ class TestActivitySortedBy:
         assert set(ids(Activity.objects.sorted_by("bogus"))) == {1, 2}
 
 
+@pytest.mark.django_db
+class TestSearch:
+    def _named(self, id, name, sport_type="Run"):
+        a = make(id, sport_type)
+        a.name = name
+        a.save()
+        return a
+
+    def test_accent_and_case_folded(self):
+        self._named(1, "Ranný beh v Košiciach")
+        self._named(2, "Evening ride", "Ride")
+        assert ids(Activity.objects.search("KOSICE")) == []
+        assert ids(Activity.objects.search("kosic")) == [1]
+        assert ids(Activity.objects.search("Košic")) == [1]
+
+    def test_tokens_are_anded_across_name_and_sport(self):
+        self._named(1, "Lunch loop", "TrailRun")
+        self._named(2, "Lunch loop", "Ride")
+        assert ids(Activity.objects.search("loop trail")) == [1]
+        assert set(ids(Activity.objects.search("lunch"))) == {1, 2}
+
+    def test_token_never_spans_name_and_sport(self):
+        # "loopride" only exists by gluing the name to the sport type.
+        self._named(1, "Lunch loop", "Ride")
+        assert ids(Activity.objects.search("loopride")) == []
+
+    def test_short_token_falls_back_to_column(self):
+        self._named(1, "5k tempo")
+        self._named(2, "Long run")
+        assert ids(Activity.objects.search("5k")) == [1]
+
+    def test_index_follows_renames_and_deletes(self):
+        a = self._named(1, "Morning run")
+        a.name = "Sunrise tempo"
+        a.save(update_fields=["name"])
+        assert ids(Activity.objects.search("morning")) == []
+        assert ids(Activity.objects.search("sunrise")) == [1]
+        a.delete()
+        assert ids(Activity.objects.search("sunrise")) == []
+
+    def test_blank_query_is_noop(self):
+        make(1)
+        assert ids(Activity.objects.search("")) == [1]
+        assert ids(Activity.objects.search(None)) == [1]
+
+    def test_gear_search(self):
+        Gear.objects.create(id="g1", brand_name="Brütting", model_name="Trail", description="", json={})
+        Gear.objects.create(id="g2", brand_name="Nike", model_name="Pegasus", description="", json={})
+        assert [g.id for g in Gear.objects.search("brutt trail")] == ["g1"]
+        assert [g.id for g in Gear.objects.search("PEG")] == ["g2"]
+
+
 @pytest.mark.django_db
 class TestGearQuerySet:
     def _gear(self, id, gear_type, brand="Brand"):
@@ -227,3 +280,184 @@ class TestGearQuerySet:
                             model_name="M", description="", json={})
         # primary gear (g2) sorts first despite the later brand name.
         assert [g.id for g in Gear.objects.sorted_by("nope")] == ["g2", "g1"]
+
+    def test_refresh_stats_aggregates_public_and_total(self):
+        self._gear("g1", "shoe")
+        self._gear("g2", "shoe")
+        make(1, distance=5000, gear_id="g1", start_date=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        make(2, distance=3000, gear_id="g1", start_date=datetime(2025, 1, 1, tzinfo=timezone.utc))
+        make(3, distance=9000, gear_id="g1", is_private=True,
+             start_date=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        Gear.objects.all().refresh_stats()
+
+        g1, g2 = Gear.objects.get(pk="g1"), Gear.objects.get(pk="g2")
+        assert (g1.public_distance, g1.total_distance) == (8000, 17000)
+        assert (g1.public_activity_count, g1.total_activity_count) == (2, 3)
+        # First/last used ignore the private activity, like the public gear page.
+        assert g1.first_used == datetime(2024, 1, 1, tzinfo=timezone.utc)
+        assert g1.last_used == datetime(2025, 1, 1, tzinfo=timezone.utc)
+        assert (g2.public_distance, g2.total_activity_count, g2.last_used) == (0, 0, None)
+
+    def test_stale_stats_reports_then_clears(self):
+        self._gear("g1", "shoe")
+        make(1, distance=5000, gear_id="g1")
+        stale = Gear.objects.stale_stats()
+        assert [gear.pk for gear, _diff in stale] == ["g1"]
+        assert stale[0][1]["public_distance"] == (0, 5000)
+
+        Gear.objects.all().refresh_stats()
+        assert Gear.objects.stale_stats() == []
+
+    def test_by_age_and_sort_read_stored_stats(self):
+        self._gear("g1", "shoe")
+        self._gear("g2", "shoe")
+        make(1, distance=5000, gear_id="g1", start_date=datetime(2001, 1, 1, tzinfo=timezone.utc))
+        make(2, distance=1000, gear_id="g2", start_date=datetime.now(timezone.utc))
+        Gear.objects.all().refresh_stats()
+        assert [g.id for g in Gear.objects.sorted_by("distance", "desc")] == ["g1", "g2"]
+        assert {g.id for g in Gear.objects.by_age("old")} == {"g1"}
+        assert {g.id for g in Gear.objects.used()} == {"g1", "g2"}
+
+
+@pytest.mark.django_db
+class TestOnThisDay:
+    def at(self, id, year, month, day, hour=12):
+        return make(id, start_date=datetime(year, month, day, hour, tzinfo=timezone.utc))
+
+    def test_month_day_derived_on_save(self):
+        activity = self.at(1, 2024, 6, 15)
+        assert activity.month_day == 615
+        # 03:00 UTC on Jul 1 is still Jun 30 in the test timezone (America/Chicago).
+        activity.start_date = datetime(2024, 7, 1, 3, tzinfo=timezone.utc)
+        activity.save(update_fields=["start_date"])
+        activity.refresh_from_db()
+        assert activity.month_day == 630
+
+    def test_past_years_newest_first(self):
+        self.at(1, 2020, 6, 15)
+        self.at(2, 2023, 6, 15)
+        self.at(3, 2023, 6, 16)
+        self.at(4, 2025, 6, 15)  # today: not a past year
+        assert ids(Activity.objects.on_this_day(date(2025, 6, 15))) == [2, 1]
+
+    def test_leap_day_on_feb_28(self):
+        self.at(1, 2024, 2, 29)
+        self.at(2, 2023, 2, 28)
+        assert ids(Activity.objects.on_this_day(date(2025, 2, 28))) == [1, 2]
+        assert ids(Activity.objects.on_this_day(date(2028, 2, 28))) == [2]
+
+    def test_uses_the_index(self):
+        plan = Activity.objects.filter(athlete_id=1).on_this_day(date(2025, 6, 15)).explain()
+        assert "strava_activity_month_day" in plan
+
+
+@pytest.mark.django_db
+class TestMapGrid:
+    def _place(self, id, lat, lng, polyline=""):
+        activity = make(id)
+        activity.start_lat, activity.start_lng, activity.polyline = lat, lng, polyline
+        activity.save(update_fields=["start_lat", "start_lng", "polyline"])
+        return activity
+
+    def test_box_and_cell_derived_on_save(self):
+        activity = self._place(1, 38.0, -121.0, "_p~iF~ps|U_ulLnnqC")
+        activity.refresh_from_db()
+        assert (activity.min_lat, activity.min_lng, activity.max_lat, activity.max_lng) == (38.0, -121.0, 40.7, -120.2)
+        assert activity.grid_cell is not None
+        assert make(2).grid_cell is None
+
+    def test_simplified_routes_derived_on_save(self):
+        activity = self._place(1, 38.5, -120.2, "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        activity.refresh_from_db()
+        assert activity.polyline_low == activity.polyline_medium == activity.polyline
+        assert activity.polyline_thumb == activity.polyline
+        assert make(2).polyline_thumb == ""
+
+    def test_partial_save_without_the_route_skips_simplifying(self):
+        activity = self._place(1, 38.5, -120.2, "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        activity.json = {"id": 1}
+        with patch("strava.helpers.simplified_routes") as simplify:
+            activity.save(update_fields=["json"])
+        simplify.assert_not_called()
+
+    def test_in_bbox_matches_routes_crossing_the_view(self):
+        self._place(1, 48.72, 21.26)
+        # Starts west of the view but its route runs into it.
+        self._place(2, 48.0, 15.0, "__~cH_upzA_ry@_~cH")
+        self._place(3, 48.21, 16.37)
+        view = (16.0, 47.5, 22.9, 49.7)
+        assert set(ids(Activity.objects.in_bbox(*view))) == {1, 2, 3}
+        assert set(ids(Activity.objects.in_bbox(20, 48, 22, 49))) == {1}
+        # A zoomed-out view wider than the world doesn't filter on longitude.
+        assert set(ids(Activity.objects.in_bbox(-400, 48.5, 400, 49))) == {1}
+
+    def test_grid_clusters(self):
+        self._place(1, 48.720, 21.260)
+        self._place(2, 48.722, 21.262)
+        self._place(3, 48.21, 16.37)
+        make(4)  # no GPS
+        fine = Activity.objects.grid_clusters(12)
+        assert [c["count"] for c in fine] == [2, 1]
+        assert fine[0]["lat"] == pytest.approx(48.721)
+        assert (fine[0]["south"], fine[0]["north"]) == (48.720, 48.722)
+        assert [c["count"] for c in Activity.objects.grid_clusters(3)] == [3]
+
+
+@pytest.mark.django_db
+class TestKeysetPagination:
+    def _seed(self):
+        # Ties (equal distance/kudos, one shared start date) and nulls (calories, time)
+        # so every page boundary has to rely on the tie-breakers.
+        rows = [
+            (1, 5000, 1800, 300, 2, datetime(2025, 1, 1, tzinfo=timezone.utc)),
+            (2, 5000, 1700, None, 2, datetime(2025, 1, 2, tzinfo=timezone.utc)),
+            (3, 8000, None, 500, 0, datetime(2025, 1, 2, tzinfo=timezone.utc)),
+            (4, 3000, 1200, None, 5, datetime(2025, 1, 4, tzinfo=timezone.utc)),
+            (5, 0, 600, 300, 2, datetime(2025, 1, 5, tzinfo=timezone.utc)),
+            (6, 8000, 2400, 200, 0, datetime(2025, 1, 6, tzinfo=timezone.utc)),
+            (7, 4000, 1200, 300, 1, datetime(2025, 1, 7, tzinfo=timezone.utc)),
+        ]
+        for id, distance, moving_time, calories, kudos, start_date in rows:
+            a = make(id, distance=distance, moving_time=moving_time, calories=calories,
+                     start_date=start_date)
+            a.kudos_count = kudos
+            a.save()
+
+    @pytest.mark.parametrize("key", ["date", "dist", "time", "elev", "cal", "pace", "kudos", "name"])
+    @pytest.mark.parametrize("direction", ["asc", "desc"])
+    def test_pages_concatenate_to_the_full_order(self, key, direction):
+        self._seed()
+        qs = Activity.objects.sorted_by(key, direction)
+        seen, cursor = [], None
+        for _ in range(10):
+            page = paginate(qs, key, direction, cursor, 2)
+            seen += [a.id for a in page.items]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert seen == ids(qs)
+        assert len(seen) == 7
+
+    def test_malformed_cursor_reads_as_first_page(self):
+        self._seed()
+        qs = Activity.objects.sorted_by("date", "desc")
+        page = paginate(qs, "date", "desc", "not-a-cursor!", 3)
+        assert [a.id for a in page.items] == [7, 6, 5]
+
+    @pytest.mark.parametrize("key, values", [
+        ("date", ["2024-13-45T00:00:00+00:00", 1]),  # well-formed, but no such date
+        ("date", ["2025-01-02T00:00:00", 1]),  # naive
+        ("date", [20250102, 1]),
+        ("date", ["2025-01-02T00:00:00+00:00", "1"]),
+        ("date", ["2025-01-02T00:00:00+00:00", True]),
+        ("dist", [{"a": 1}, "2025-01-02T00:00:00+00:00", 1]),
+        ("dist", [[5000], "2025-01-02T00:00:00+00:00", 1]),
+        ("dist", [5000, "2025-01-02T00:00:00+00:00", 1.5]),
+    ])
+    def test_ill_typed_cursor_reads_as_first_page(self, key, values):
+        assert decode_cursor(encode_cursor(values), key, "desc") is None
+
+    def test_cursor_values_round_trip(self):
+        start = datetime(2025, 1, 2, 7, 30, 15, 123456, tzinfo=timezone.utc)
+        assert decode_cursor(encode_cursor([None, start, 3]), "elev", "desc") == [None, start, 3]
+        assert decode_cursor(encode_cursor(["Run", start, 3]), "name", "asc") == ["Run", start, 3]
@@ -0,0 +1,91 @@
+"""The rolling-window engine must match brute-force window sums."""
+import datetime
+import random
+from datetime import timezone as tz
+from types import SimpleNamespace
+
+import pytest
+
+from strava.services import rolling
+
+D = datetime.date
+
+
+def act(day, km=10, hours=1, elevation=0):
+    return SimpleNamespace(start_date=datetime.datetime(day.year, day.month, day.day, 12, tzinfo=tz.utc),
+                           distance=km * 1000, moving_time=hours * 3600, total_elevation_gain=elevation)
+
+
+def brute_window(daily, end, width):
+    return sum(v for d, v in daily.items() if 0 <= (end - d).days < width)
+
+
+@pytest.fixture
+def history():
+    rng = random.Random(3)
+    start = D(2000, 1, 1)
+    activities = [act(start + datetime.timedelta(days=rng.randrange(9000)), km=rng.randrange(1, 40))
+                  for _ in range(600)]
+    daily = {}
+    for a in activities:
+        day = a.start_date.date()
+        daily[day] = daily.get(day, 0.0) + a.distance / 1000
+    return activities, daily
+
+
+class TestDailySeries:
+    def test_trailing_and_total_match_brute_force(self, history):
+        activities, daily = history
+        series = rolling.daily_series(activities)
+        assert series.days == sorted(daily)
+        for width in (1, 7, 28, 365):
+            expected = [brute_window(daily, d, width) for d in series.days]
+            assert series.trailing("distance", width) == pytest.approx(expected)
+        for on in (D(2000, 1, 1), D(2010, 5, 17), D(2030, 1, 1)):
+            assert series.total("distance", 28, on) == pytest.approx(brute_window(daily, on, 28))
+
+    def test_peak_matches_brute_force(self, history):
+        activities, daily = history
+        series = rolling.daily_series(activities)
+        for width in (7, 28, 365):
+            best = max(brute_window(daily, d + datetime.timedelta(days=width - 1), width) for d in daily)
+            total, first, last = series.peak("distance", width)
+            assert total == pytest.approx(best)
+            assert (last - first).days == width - 1
+            assert brute_window(daily, last, width) == pytest.approx(best)
+
+    def test_peak_tie_keeps_earliest_block(self):
+        series = rolling.daily_series([act(D(2025, 1, 1)), act(D(2025, 3, 1))])
+        assert series.peak("distance", 7) == (10.0, D(2025, 1, 1), D(2025, 1, 7))
+
+    def test_empty(self):
+        series = rolling.daily_series([])
+        assert series.peak("distance", 7) is None
+        assert series.total("hours", 7, D(2025, 1, 1)) == 0
+        assert series.acwr("hours", D(2025, 1, 1)) is None
+
+    def test_acwr(self):
+        # Steady 1h/day for four weeks is a ratio of 1; doubling the last week lifts it.
+        today = D(2025, 6, 28)
+        steady = [act(today - datetime.timedelta(days=n)) for n in range(28)]
+        assert rolling.daily_series(steady).acwr("hours", today) == pytest.approx(1.0)
+        ramp = steady + [act(today - datetime.timedelta(days=n)) for n in range(7)]
+        assert rolling.daily_series(ramp).acwr("hours", today) == pytest.approx(14 / 8.75)
+
+
+def test_training_load():
+    today = D(2025, 6, 28)
+    activities = [act(today, km=20, hours=2, elevation=300), act(D(2025, 6, 10), km=5),
+                  act(D(2024, 1, 1), km=100)]
+    load = rolling.training_load(activities, today)
+    assert load["windows"] == [
+        {"days": 7, "distance": 20, "hours": 2.0, "elevation": 300},
+        {"days": 28, "distance": 25, "hours": 3.0, "elevation": 300},
+        {"days": 365, "distance": 25, "hours": 3.0, "elevation": 300},
+    ]
+    assert load["peaks"][0] == {"days": 7, "distance": 100, "start": D(2024, 1, 1), "end": D(2024, 1, 7)}
+    assert load["acwr"] == {"ratio": 2.67, "zone": "high"}
+    assert rolling.training_load([], today) == {
+        "windows": [{"days": w, "distance": 0, "hours": 0, "elevation": 0} for w in (7, 28, 365)],
+        "peaks": [], "acwr": None,
+    }
@@ -0,0 +1,103 @@
+"""Repeat-route matching (services.routes): fingerprints, LSH buckets and route stats."""
+import math
+import random
+from datetime import datetime
+
+import pytest
+
+from strava import helpers
+from strava.models import Activity, Route
+from strava.services import routes
+
+
+def loop(lat, lng, radius_km=1.5, jitter=0.0, seed=0):
+    """An encoded ~``2π·radius`` km loop around (lat, lng), its points moved by up to
+    ``jitter`` degrees (GPS noise)."""
+    rng = random.Random(seed)
+    points = []
+    for i in range(61):
+        angle = 2 * math.pi * i / 60
+        points.append((lat + radius_km / 111 * math.sin(angle) + rng.uniform(-jitter, jitter),
+                       lng + radius_km / 74 * math.cos(angle) + rng.uniform(-jitter, jitter)))
+    return helpers.encode_polyline(points)
+
+
+PARK = (48.72, 21.26)
+LAKE = (48.75, 21.35)
+
+
+class TestFingerprint:
+    def test_noisy_repeats_agree_and_other_routes_do_not(self):
+        first = routes.signature(loop(*PARK, seed=1, jitter=1e-4))
+        again = routes.signature(loop(*PARK, seed=2, jitter=1e-4))
+        other = routes.signature(loop(*LAKE))
+        assert routes.similarity(first, again) >= 0.7
+        assert routes.similarity(first, other) < 0.1
+        assert set(routes.buckets(first)) & set(routes.buckets(again))
+
+    def test_empty_route(self):
+        assert routes.signature("") is None
+
+
+@pytest.fixture
+def make_route(make_activity):
+    """A 9.4 km run along ``polyline``, recorded in the route index."""
+    def make(id, polyline, distance=9400, moving_time=3000, **fields):
+        activity = make_activity(id, polyline=polyline, distance=distance, moving_time=moving_time, **fields)
+        routes.record(activity)
+        return activity
+    return make
+
+
+def route_of(pk):
+    return Activity.objects.get(pk=pk).route_id
+
+
+class TestMatching:
+    def test_repeats_share_a_route(self, make_route):
+        make_route(1, loop(*PARK, seed=1, jitter=1e-4))
+        make_route(2, loop(*PARK, seed=2, jitter=1e-4), day=2)
+        make_route(3, loop(*LAKE), day=3)
+        assert route_of(1) == route_of(2) != route_of(3)
+        assert Route.objects.get(pk=route_of(1)).name == "Activity 1"
+
+    def test_other_sport_or_distance_is_another_route(self, make_route):
+        make_route(1, loop(*PARK))
+        make_route(2, loop(*PARK), sport_type="Ride", day=2)
+        make_route(3, loop(*PARK), distance=20000, day=3)
+        assert len({route_of(1), route_of(2), route_of(3)}) == 3
+
+    def test_private_activity_has_no_route(self, make_route):
+        make_route(1, loop(*PARK), is_private=True)
+        assert route_of(1) is None and not Route.objects.exists()
+
+    def test_rerouted_activity_leaves_no_empty_route(self, make_route):
+        make_route(1, loop(*PARK))
+        activity = make_route(2, loop(*LAKE), day=2)
+        activity.polyline = loop(*PARK, seed=3, jitter=1e-4)
+        activity.save()
+        routes.record(activity)
+        assert route_of(2) == route_of(1)
+        assert Route.objects.count() == 1
+
+    def test_rebuild_regroups_the_history(self, athlete, make_route):
+        for day in range(3):
+            make_route(day + 1, loop(*PARK, seed=day, jitter=1e-4), day=day)
+        make_route(9, loop(*LAKE), day=5)
+        assert routes.rebuild(athlete) == 2
+        assert route_of(1) == route_of(2) == route_of(3) != route_of(9)
+
+
+class TestRepeatRoutes:
+    def test_attempts_best_and_trend(self, make_route):
+        times = [3000, 3100, 2950, 2900, 2800]
+        for day, time in enumerate(times):
+            make_route(day + 1, loop(*PARK, seed=day, jitter=1e-4), day=day, moving_time=time)
+        make_route(9, loop(*LAKE), day=9)
+
+        top, = routes.repeat_routes(Activity.objects.public())
+        assert top["attempts"] == 5
+        assert top["best"]["time"] == "46:40" and top["best"]["id"] == 5
+        # The latest two (2900, 2800) against the two before (3100, 2950): 175 s faster.
+        assert top["trend"] == -175 and top["trend_display"] == "−2:55"
+        assert top["last"] == datetime(2025, 1, 5).date()
@@ -0,0 +1,99 @@
+"""Activity streams: the compact binary codec (strava.streams), their storage and fetch."""
+import json
+import math
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.management import call_command
+from stravalib import exc
+
+from strava import streams
+from strava.models import Activity, ActivityStream, Athlete
+from strava.services import sync
+
+POINTS = 3600
+# An hour's run: a point a second, drifting north-east, rolling terrain.
+STREAMS = {
+    "time": list(range(POINTS)),
+    "latlng": [[round(48.72 + i * 2e-5, 6), round(21.26 + i * 3e-5, 6)] for i in range(POINTS)],
+    "distance": [round(i * 2.8, 1) for i in range(POINTS)],
+    "altitude": [round(200 + 15 * math.sin(i / 300), 1) for i in range(POINTS)],
+    "heartrate": [140 + round(8 * math.sin(i / 60)) for i in range(POINTS)],
+    "velocity_smooth": [round(2.8 + 0.2 * math.sin(i / 40), 3) for i in range(POINTS)],
+    "cadence": [86 + i % 3 for i in range(POINTS)],
+}
+
+
+def flat(series):
+    """A decoded (or JSON) stream as one flat list of numbers, latlng rows unrolled."""
+    return [number for value in series for number in (value if hasattr(value, "__len__") else [value])]
+
+
+class TestCodec:
+    @pytest.mark.parametrize("kind", list(STREAMS))
+    def test_round_trip(self, kind):
+        decoded = streams.decode(kind, streams.encode(kind, STREAMS[kind]))
+        assert len(decoded) == POINTS
+        assert flat(decoded) == pytest.approx(flat(STREAMS[kind]), abs=1e-5)
+
+    @pytest.mark.parametrize("kind", ["latlng", "altitude", "velocity_smooth"])
+    def test_without_numpy(self, kind):
+        data = streams.encode(kind, STREAMS[kind])
+        with patch("strava.streams.np", None):
+            plain = streams.decode(kind, data)
+        assert isinstance(plain, list)
+        assert flat(plain) == pytest.approx(flat(streams.decode(kind, data)))
+
+    def test_float_series_are_views(self):
+        pytest.importorskip("numpy")
+        series = streams.decode("velocity_smooth", streams.encode("velocity_smooth", STREAMS["velocity_smooth"]))
+        assert series.dtype.name == "float32" and not series.flags.owndata
+
+    def test_a_fraction_of_the_json(self):
+        stored = sum(len(streams.encode(kind, values)) for kind, values in STREAMS.items())
+        assert stored < len(json.dumps(STREAMS)) / 5
+
+
+@pytest.fixture
+def activity(db):
+    athlete = Athlete.objects.create(id=42, access_token="tok", refresh_token="ref", json={})
+    return Activity.objects.create(
+        id=1, name="Run", sport_type="Run", distance=10000, athlete=athlete,
+        start_date=datetime(2025, 6, 1, 7, tzinfo=timezone.utc), json={},
+    )
+
+
+class TestStorage:
+    def test_store_and_read(self, activity):
+        ActivityStream.store(activity, {**STREAMS, "temp": [20] * POINTS})
+        stream = ActivityStream.objects.get(activity=activity)
+        assert stream.points == POINTS
+        assert stream.kinds == ["time", "latlng", "distance", "altitude", "heartrate", "velocity_smooth", "cadence"]
+        assert stream.series("watts") is None
+        assert list(stream.series("heartrate")[:3]) == STREAMS["heartrate"][:3]
+
+    def test_fetch_replaces_and_tolerates_missing_streams(self, activity):
+        api = MagicMock()
+        api.get_activity_streams.return_value = {"time": [0, 1, 2]}
+        assert sync.activity_fetch_streams(activity, api=api).kinds == ["time"]
+        api.get_activity_streams.side_effect = exc.ObjectNotFound("manual activity")
+        assert sync.activity_fetch_streams(activity, api=api).points == 0
+        assert ActivityStream.objects.count() == 1
+
+
+@pytest.mark.django_db
+class TestFetchStreams:
+    @patch("strava.management.commands.fetch_streams.StravaApi")
+    def test_fetches_missing_streams_up_to_the_limit(self, api_cls, activity):
+        for pk in (2, 3):
+            Activity.objects.create(id=pk, name="Run", sport_type="Run", distance=5000, athlete=activity.athlete,
+                                    start_date=datetime(2025, 6, pk, 7, tzinfo=timezone.utc), json={})
+        ActivityStream.store(Activity.objects.get(pk=3), {"time": [0]})
+        api_cls.return_value.get_activity_streams.return_value = {"time": [0, 1]}
+
+        call_command("fetch_streams", limit=1)
+        # Newest first, skipping the stored one.
+        assert set(ActivityStream.objects.values_list("activity", flat=True)) == {2, 3}
+        call_command("fetch_streams")
+        assert ActivityStream.objects.count() == 3
@@ -1,20 +1,27 @@
 """Context-data tests for the list/detail/compare views.
 
 These drive ``get_context_data`` directly (the test settings define no TEMPLATES,
-so nothing is rendered) and avoid the ``q=`` search param, which needs the
-PostgreSQL ``unaccent`` extension not available on SQLite.
+so nothing is rendered).
 """
 import datetime
+import json
+import random
 from datetime import timezone as tz
 
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
 import pytest
 from django.http import Http404
 from django.test import RequestFactory
 
+from strava import helpers
 from strava.models import Activity, Gear
+from strava.services import compare, rolling, sync
+from strava.sports import PACE_SPORT_TYPES, sport_matches
 from strava.views import (
     ActivitiesView, ActivityCardView, CompareView, DashboardView,
-    GalleryView, GearView,
+    GalleryView, GearView, MapMarkersView, MapRoutesView,
 )
 
 
@@ -27,7 +34,7 @@ def make_activity(id, sport_type="Run", distance=10000, moving_time=3000,
                   photo_url="", name=None, calories=0, pr_count=0,
                   achievement_count=0, start_lat=None, start_lng=None,
                   is_private=False):
-    return Activity.objects.create(
+    activity = Activity.objects.create(
         id=id,
         name=name or f"Activity {id}",
         start_date=start_date or dt(2025, 6, 15),
@@ -46,6 +53,61 @@ def make_activity(id, sport_type="Run", distance=10000, moving_time=3000,
         is_private=is_private,
         json={"id": id},
     )
+    # Keep the gear's denormalised statistics current, as the ingest paths do.
+    sync.gear_refresh_stats(activity.gear_id)
+    return activity
+
+
+def in_memory_matrix(activities, home, today):
+    """The compare matrix of a list of activities, one season at a time in Python: the
+    reference ``compare.queryset_matrix`` must reproduce."""
+    by_year = {}
+    for a in activities:
+        by_year.setdefault(helpers.local_date(a).year, []).append(a)
+    if not by_year:
+        return {"years": [], "rows": [], "aoty_rows": []}
+    years = list(range(min(by_year), max(by_year) + 1))
+
+    def paceable(a):
+        return (a.sport_type in PACE_SPORT_TYPES and a.moving_time and a.distance
+                and a.moving_time / (a.distance / 1000) >= compare.MIN_PLAUSIBLE_PACE_SEC)
+
+    def avg_pace(acts):
+        paced = [a for a in acts if paceable(a)]
+        km = sum(a.distance for a in paced) / 1000
+        return sum(a.moving_time for a in paced) / km if km else None
+
+    fns = {
+        "Distance": lambda acts: round(sum(a.distance for a in acts) / 1000),
+        "Elevation gain": lambda acts: round(sum(a.total_elevation_gain or 0 for a in acts)),
+        "Moving time": lambda acts: int(round(sum(a.moving_time or 0 for a in acts) / 3600)),
+        "Activities": len,
+        "Active days": lambda acts: len({helpers.local_date(a) for a in acts}),
+        "Average pace": avg_pace,
+        "Biggest week": lambda acts: round(rolling.daily_series(acts).peak("distance", 7)[0]) or None,
+        "Kudos received": lambda acts: sum(a.kudos_count for a in acts),
+        "PRs set": lambda acts: sum(a.pr_count for a in acts),
+        "Achievements": lambda acts: sum(a.achievement_count for a in acts),
+    }
+    values = {name: [fn(by_year[y]) if y in by_year else None for y in years] for name, fn in fns.items()}
+
+    # (eligible, key, best) per effort row; ties go to the newest (the rows come newest first).
+    rankings = {
+        "trophy": (lambda a: True, lambda a: a.calories or 0, max),
+        "longest": (lambda a: True, lambda a: a.distance, max),
+        "climb": (lambda a: a.total_elevation_gain, lambda a: a.total_elevation_gain, max),
+        "bolt": (paceable, compare.pace_of, min),
+    }
+    if home:
+        rankings["pin"] = (lambda a: a.start_lat is not None and a.start_lng is not None,
+                           lambda a: helpers.home_distances([a], home)[0], max)
+    picks = {}
+    for icon, (eligible, key, best) in rankings.items():
+        picks[icon] = []
+        for y in years:
+            acts = [a for a in by_year.get(y, []) if eligible(a)]
+            picks[icon].append(best(acts, key=key) if acts else None)
+    return compare.matrix(years, values, picks, home, today)
 
 
 def make_gear(id, gear_type="shoe", brand="Nike", primary=False):
@@ -136,6 +198,20 @@ class TestActivitiesView:
         ctx = list_context(ActivitiesView, dist_min="10", dist_max="30")
         assert [a.id for a in ctx["activities"]] == [2]
 
+    def test_first_page_then_cursor_page(self):
+        for i in range(1, 6):
+            make_activity(i, start_date=dt(2025, 6, i))
+        with patch("strava.views.ACTIVITIES_PAGE_SIZE", 3):
+            ctx = list_context(ActivitiesView)
+            assert [a.id for a in ctx["activities"]] == [5, 4, 3]
+            # The summary still covers the whole filtered list, not just the page.
+            assert ctx["summary"]["count"] == 5
+            cursor = parse_qs(urlparse(ctx["next_url"]).query)["cursor"][0]
+
+            ctx = list_context(ActivitiesView, cursor=cursor)
+            assert [a.id for a in ctx["activities"]] == [2, 1]
+            assert ctx["next_url"] == ""
+
     def test_distance_ceiling_is_per_sport(self):
         make_activity(1, "Run", distance=42195)
         make_activity(2, "Swim", distance=3000)
@@ -204,7 +280,7 @@ class TestGearView:
         make_activity(1, "Run", distance=100000, gear=shoe)                    # 100 km public
         make_activity(2, "Run", distance=600000, gear=shoe, is_private=True)   # private, ignored
         g = {x.id: x for x in list_context(GearView)["gear_list"]}["s1"]
-        assert g.activity_count == 1
+        assert g.public_activity_count == 1
         assert g.distance_km == 100
 
 
@@ -238,6 +314,21 @@ class TestGalleryView:
         ctx = list_context(GalleryView, sort="kudos")
         assert [a.id for a in ctx["photos"]] == [2, 1]
 
+    def test_search_filter(self):
+        make_activity(1, photo_url="http://x/1.jpg", name="Tatranská magistrála")
+        make_activity(2, photo_url="http://x/2.jpg", name="City loop")
+        ctx = list_context(GalleryView, q="tatranska")
+        assert [a.id for a in ctx["photos"]] == [1]
+
+    def test_count_covers_all_pages(self):
+        for i in range(1, 4):
+            make_activity(i, photo_url=f"http://x/{i}.jpg", start_date=dt(2025, 6, i))
+        with patch("strava.views.GALLERY_PAGE_SIZE", 2):
+            ctx = list_context(GalleryView, sort="oldest")
+        assert [a.id for a in ctx["photos"]] == [1, 2]
+        assert ctx["count"] == 3
+        assert "cursor=" in ctx["next_url"]
+
     def test_year_filter(self):
         make_activity(1, photo_url="http://x/1.jpg", start_date=dt(2025, 6, 1))
         make_activity(2, photo_url="http://x/2.jpg", start_date=dt(2024, 6, 1))
@@ -337,6 +428,35 @@ class TestCompareView:
         assert prs_row["cells"][1]["delta"]["text"] == "—"
 
 
+    @pytest.mark.parametrize("sport", ["all", "group-run", "group-ride", "Swim"])
+    def test_queryset_matrix_matches_in_memory(self, sport, django_assert_max_num_queries):
+        # The database aggregates must reproduce the in-memory matrix, whatever the
+        # mix of sports, seasons and missing values.
+        rng = random.Random(11)
+        for pk in range(1, 121):
+            located = rng.random() < 0.8
+            make_activity(
+                pk, rng.choice(["Run", "TrailRun", "Walk", "Ride", "Swim"]),
+                distance=round(rng.uniform(500, 60000), 1) if rng.random() < 0.95 else 0,
+                moving_time=rng.randrange(200, 15000) if rng.random() < 0.95 else None,
+                elevation=round(rng.uniform(1, 900), 1) if rng.random() < 0.9 else None,
+                start_date=dt(2022, 1, 1, rng.randrange(24)) + datetime.timedelta(days=rng.randrange(1200)),
+                kudos=rng.randrange(9), calories=rng.randrange(1500), pr_count=rng.randrange(3),
+                achievement_count=rng.randrange(4),
+                start_lat=round(48.7 + rng.uniform(-0.02, 0.02) * rng.choice([1, 40]), 5) if located else None,
+                start_lng=round(21.2 + rng.uniform(-0.02, 0.02), 5) if located else None,
+            )
+        public = Activity.objects.public()
+        home = helpers.home_location(public.rows())
+        assert public.home_location() == pytest.approx(home)
+        today = datetime.date(2025, 6, 20)
+        expected = in_memory_matrix(
+            [a for a in public.rows() if sport_matches(sport, a.sport_type)], home, today)
+        with django_assert_max_num_queries(8):
+            actual = compare.queryset_matrix(public.for_sport_selection(sport), home, today)
+        assert actual == expected
+
+
 # --------------------------------------------------------------------------- #
 # ActivityCardView
 # --------------------------------------------------------------------------- #
@@ -369,6 +489,100 @@ class TestActivityCardView:
             view.get_object()
 
 
+# --------------------------------------------------------------------------- #
+# Map markers / routes endpoints
+# --------------------------------------------------------------------------- #
+@pytest.mark.django_db
+class TestMapData:
+    def _get(self, view_cls, **params):
+        response = view_cls.as_view()(RequestFactory().get("/", params))
+        assert response.status_code == 200
+        return json.loads(response.content)
+
+    def _spread(self):
+        # Three runs around Košice, one ride in Vienna.
+        make_activity(1, start_date=dt(2024, 5, 1), start_lat=48.720, start_lng=21.260)
+        make_activity(2, start_date=dt(2025, 5, 2), start_lat=48.722, start_lng=21.262)
+        make_activity(3, start_date=dt(2025, 5, 3), start_lat=48.724, start_lng=21.264, name="Hill reps")
+        make_activity(4, "Ride", start_date=dt(2025, 5, 4), start_lat=48.21, start_lng=16.37)
+
+    def test_markers_are_columnar_and_dictionary_encoded(self):
+        shoe = make_gear("g1")
+        make_activity(1, start_date=dt(2024, 5, 1), start_lat=48.123456, start_lng=21.5, gear=shoe)
+        make_activity(2, "Ride", distance=42000, start_date=dt(2025, 6, 1), start_lat=48.2, start_lng=21.6)
+        make_activity(3, start_date=dt(2025, 6, 2), start_lat=48.3, start_lng=21.7, gear=shoe, name="Tempo")
+        make_activity(4, start_date=dt(2025, 6, 3))  # no GPS: no marker
+        make_activity(5, start_date=dt(2025, 6, 4), start_lat=1, start_lng=1, is_private=True)
+
+        payload = self._get(MapMarkersView)
+        assert payload["id"] == [3, 2, 1]
+        assert payload["lat"] == [48.3, 48.2, 48.12346]
+        assert payload["sports"] == [["Run", "run"], ["Ride", "ride"]]
+        assert payload["sport"] == [0, 1, 0]
+        assert payload["gear_list"] == [["g1", str(shoe)]]
+        assert payload["gear"] == [0, -1, 0]
+        assert payload["distance"] == [10.0, 42.0, 10.0]
+        assert payload["year"] == [2025, 2025, 2024]
+        assert payload["name"] == ["Tempo", "Activity 2", "Activity 1"]
+
+    def _route(self, pk, polyline):
+        activity = Activity.objects.get(pk=pk)
+        activity.polyline = polyline
+        activity.save(update_fields=["polyline"])
+
+    def test_routes_only_for_markers_with_a_polyline(self):
+        make_activity(1, start_lat=48.1, start_lng=21.5)
+        make_activity(2, start_date=dt(2025, 6, 16), start_lat=48.2, start_lng=21.6)
+        self._route(2, "_p~iF~ps|U")
+        assert self._get(MapRoutesView) == {"id": [2], "polyline": ["_p~iF~ps|U"], "max_zoom": 11}
+
+    def test_routes_resolution_follows_the_zoom(self):
+        make_activity(1, start_lat=48.7, start_lng=21.2)
+        # A straight kilometre east with a 20 m wiggle every 100 m.
+        wiggly = helpers.encode_polyline([(48.7 + (0.0002 if i % 2 else 0), 21.2 + i * 0.00135) for i in range(11)])
+        self._route(1, wiggly)
+        low, medium, full = (self._get(MapRoutesView, zoom=zoom) for zoom in ("8", "12.5", "16"))
+        assert len(helpers.decode_polyline(low["polyline"][0])) == 2 and low["max_zoom"] == 11
+        assert len(helpers.decode_polyline(medium["polyline"][0])) == 11 and medium["max_zoom"] == 13
+        assert full == {"id": [1], "polyline": [wiggly], "max_zoom": None}
+
+    def test_complete_payload_carries_extent_and_options(self):
+        self._spread()
+        payload = self._get(MapMarkersView)
+        assert payload["complete"] is True and len(payload["id"]) == 4
+        assert payload["bounds"] == [[48.21, 16.37], [48.724, 21.264]]
+        assert payload["years"] == [2025, 2024]
+        assert payload["gear_options"] == []
+
+    def test_viewport_and_filters_narrow_the_markers(self):
+        self._spread()
+        payload = self._get(MapMarkersView, bbox="20,48,22,49", zoom="10")
+        assert payload["id"] == [3, 2, 1] and payload["complete"] is False
+        assert "bounds" not in payload
+        assert self._get(MapMarkersView, bbox="20,48,22,49", q="hill")["id"] == [3]
+        assert self._get(MapMarkersView, sport="group-ride")["id"] == [4]
+
+    def test_clusters_past_the_limit(self):
+        self._spread()
+        with patch("strava.services.dashboard.MAP_MARKER_LIMIT", 2):
+            payload = self._get(MapMarkersView, zoom="6")
+            assert payload["complete"] is False and "id" not in payload
+            assert payload["clusters"]["count"] == [3, 1]
+            assert payload["bounds"] == [[48.21, 16.37], [48.724, 21.264]]
+            # Zoomed in on Košice: few enough in view for markers again.
+            assert self._get(MapMarkersView, bbox="21.261,48.5,21.5,49", zoom="14")["id"] == [3, 2]
+
+    def test_routes_in_view(self):
+        self._spread()
+        self._route(1, "_p~iF~ps|U")
+        self._route(4, "_p~iF~ps|U")
+        assert self._get(MapRoutesView, bbox="20,48,22,49")["id"] == [1]
+
+    def test_dashboard_no_longer_embeds_markers(self):
+        make_activity(1, start_lat=48.1, start_lng=21.5)
+        assert "map_markers" not in template_context(DashboardView)
+
+
 # --------------------------------------------------------------------------- #
 # htmx template selection — each view returns an hx/ fragment for htmx requests
 # and the full page otherwise.
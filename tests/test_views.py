@@ -96,6 +96,64 @@ class TestHomeLocation:
         assert lat == pytest.approx(48.72, abs=0.01)
 
 
+class TestMapGeometry:
+    def test_decode_polyline(self):
+        # Google's reference example.
+        assert helpers.decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@") == [
+            (38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        assert helpers.decode_polyline("") == []
+
+    def test_route_bounds_include_the_start(self):
+        assert helpers.route_bounds("_p~iF~ps|U_ulLnnqC", 38.0, -121.0) == (38.0, -121.0, 40.7, -120.2)
+        assert helpers.route_bounds("", 48.7, 21.2) == (48.7, 21.2, 48.7, 21.2)
+        assert helpers.route_bounds("", None, None) is None
+
+    def test_grid_cell_prefixes_are_coarser_cells(self):
+        near, far = helpers.grid_cell(48.7201, 21.2601), helpers.grid_cell(48.21, 16.37)
+        assert helpers.grid_cell(-90, -180) == 0
+        assert helpers.grid_cell(90, 180) == 4 ** 16 - 1
+        # One level up, a cell holds four; nearby points share coarse cells only.
+        assert near >> 2 * 6 == helpers.grid_cell(48.7202, 21.2602) >> 2 * 6
+        assert near >> 2 * 10 != far >> 2 * 10
+        assert near >> 2 * 12 == far >> 2 * 12
+
+    def test_encode_polyline_round_trips(self):
+        encoded = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+        assert helpers.encode_polyline(helpers.decode_polyline(encoded)) == encoded
+        assert helpers.encode_polyline([]) == ""
+
+    def test_simplify_keeps_points_off_the_line(self):
+        line = [(48.0, 21.0), (48.00002, 21.001), (48.0, 21.002), (48.001, 21.003), (48.0, 21.004)]
+        # The 2 m bump goes, the 110 m spike stays; the ends always stay.
+        assert helpers.simplify(line, 1e-4) == [line[0], line[2], line[3], line[4]]
+        assert helpers.simplify(line, 1e-2) == [line[0], line[4]]
+        assert helpers.simplify(line[:2], 1) == line[:2]
+        # A loop back to its start keeps its far point.
+        loop = [(48.0, 21.0), (48.01, 21.0), (48.0, 21.0)]
+        assert helpers.simplify(loop, 1e-3) == loop
+
+    def test_thumbnail_tolerance_follows_the_route_extent(self):
+        # The same 20 m wiggle: noise on a 10 km route, detail on a 300 m one.
+        def wiggly(length):
+            return helpers.encode_polyline([(48.7 + (0.0002 if i % 2 else 0), 21.2 + i * length / 10)
+                                            for i in range(11)])
+        long_route, short_route = helpers.simplified_routes(wiggly(0.135)), helpers.simplified_routes(wiggly(0.004))
+        assert len(helpers.decode_polyline(long_route["polyline_thumb"])) == 2
+        assert len(helpers.decode_polyline(short_route["polyline_thumb"])) == 11
+        assert helpers.simplified_routes("") == {"polyline_low": "", "polyline_medium": "", "polyline_thumb": ""}
+
+    def test_route_resolution(self):
+        assert helpers.route_resolution(0) == ("polyline_low", 11)
+        assert helpers.route_resolution(11.5) == ("polyline_medium", 13)
+        assert helpers.route_resolution(14) == ("polyline", None)
+
+    def test_to_bbox(self):
+        assert helpers.to_bbox("16.1,47.5,22.9,49.7") == (16.1, 47.5, 22.9, 49.7)
+        assert helpers.to_bbox("1,2,3") is None
+        assert helpers.to_bbox("1,2,3,inf") is None
+        assert helpers.to_bbox(None) is None
+
+
 class TestFormatters:
     def test_fmt_pace(self):
         assert helpers.fmt_pace(330) == "5:30"
@@ -335,3 +393,202 @@ class TestRunPerformance:
         rows = self._rows(dashboard_context())
         assert rows["5 km"]["best"] == "—"
         assert rows["10 km"]["best"] == "—"
+
+
+# --------------------------------------------------------------------------- #
+# Lean rows (ActivityQuerySet.rows) vs model instances
+# --------------------------------------------------------------------------- #
+@pytest.mark.django_db
+class TestLeanRows:
+    """The services read activities by attribute only, so the lean ``ActivityRow``s the
+    dashboard and compare pages pass must give exactly what model instances give."""
+
+    def _seed(self):
+        shoe = Gear.objects.create(id="g1", brand_name="Nike", model_name="Peg",
+                                   description="", gear_type="shoe", json={})
+        bike = Gear.objects.create(id="b1", brand_name="Canyon", model_name="Endurace",
+                                   description="", gear_type="bike", json={})
+        make_activity(1, "Run", distance=42195, start_date=dt(2024, 4, 7), moving_time=14683,
+                      start_lat=48.72, start_lng=21.26, gear=shoe, best_efforts=BEST_EFFORTS,
+                      calories=2900, pr_count=2, kudos=14, photos=3)
+        make_activity(2, "Ride", distance=80000, start_date=dt(2024, 8, 3), moving_time=10800,
+                      max_speed=16.5, start_lat=48.21, start_lng=16.37, gear=bike, calories=2100)
+        make_activity(3, "Hike", distance=12000, start_date=dt(2025, 5, 1), moving_time=14400,
+                      elevation=900, start_lat=49.2, start_lng=20.1, name="Rysy")
+        make_activity(4, "Swim", distance=2000, start_date=dt(2025, 6, 2), moving_time=2400,
+                      average_heartrate=None, achievement_count=4)
+        make_activity(5, "TrailRun", distance=21000, start_date=dt(2025, 6, 3), moving_time=8000,
+                      start_lat=48.721, start_lng=21.259, gear=shoe, best_efforts=BEST_EFFORTS[:2])
+
+    def _both(self):
+        self._seed()
+        qs = Activity.objects.order_by("-start_date")
+        return list(qs.select_related("gear")), qs.rows()
+
+    def test_rows_mirror_model_attributes(self):
+        models, rows = self._both()
+        for model, row in zip(models, rows):
+            assert row.pk == model.pk
+            assert str(row.gear or "") == str(model.gear or "")
+            assert row.best_efforts == model.best_efforts
+            assert row.get_absolute_url() == model.get_absolute_url()
+            assert row.get_sport_type_display() == model.get_sport_type_display()
+            for attr in ("start_date", "distance_km", "duration", "pace", "elevation",
+                         "map_sport_type", "is_speed_sport", "has_gps"):
+                assert getattr(row, attr) == getattr(model, attr)
+
+    def test_services_agree(self):
+        from strava import services
+        today = datetime.date(2025, 6, 20)
+        models, rows = self._both()
+        home = helpers.home_location(models)
+        assert helpers.home_location(rows) == home
+
+        def run(acts):
+            dashboard, analytics = services.dashboard, services.analytics
+            filtered = dashboard.filter_activities(acts, "", "all", "g1", "all")
+            health, usage = services.gear.dashboard_sections(acts, no_filter=False)
+            return {
+                "filtered": [a.pk for a in filtered],
+                "totals": dashboard.totals(acts),
+                "aoty": dashboard.activity_of_year(acts, "2024", today).pk,
+                "records": analytics.records(acts, home),
+                "run_perf": analytics.run_performance(acts),
+                "numbers": analytics.by_the_numbers(acts),
+                "trends": analytics.trends(acts, today),
+                "calendar": analytics.activity_calendar(acts, today),
+                "markers": analytics.map_data(acts)[0],
+                "gear": ([(g.pk, g.activity_count, g.distance_km) for g in health], usage),
+            }
+
+        assert run(rows) == run(models)
+
+
+# --------------------------------------------------------------------------- #
+# Single-pass dashboard pipeline
+# --------------------------------------------------------------------------- #
+def separate_passes(all_activities, q, sport, gear_id, year, dist_min, dist_max, today):
+    """The dashboard sections computed one function (one pass) at a time, as the view
+    used to — the reference ``dashboard.sections`` must reproduce."""
+    from strava.services import analytics, dashboard, gear, rolling
+    activities = dashboard.filter_activities(all_activities, q, sport, gear_id, year, dist_min, dist_max)
+    season = dashboard.filter_activities(all_activities, "", "all", "all", year)
+    no_filter = not q and sport == "all" and gear_id == "all" and year == "all"
+    context = {
+        "stat": dashboard.totals(activities),
+        "latest_activity": activities[0] if activities else None,
+        "latest_activities": activities[:4],
+        "map_hidden_count": sum(1 for a in activities if not helpers.has_gps(a)),
+        "aoty": dashboard.activity_of_year(activities, year, today),
+        "records": analytics.records(season, helpers.home_location(all_activities)),
+        "run_perf": analytics.run_performance(season),
+        "trends": analytics.trends(activities, today),
+        "calendar": analytics.activity_calendar(activities, today),
+        "training_load": rolling.training_load(activities, today),
+    }
+    context["gear_health"], context["gear_usage"] = gear.dashboard_sections(activities, no_filter)
+    context["fun_stats"], context["summary"] = analytics.by_the_numbers(activities)
+    return context
+
+
+@pytest.mark.django_db
+class TestDashboardSections:
+    def _seed(self):
+        shoe = Gear.objects.create(id="g1", brand_name="Nike", model_name="Peg",
+                                   description="", json={})
+        make_activity(1, "Run", distance=10000, start_date=dt(2025, 6, 15), name="Morning Run",
+                      start_lat=48.72, start_lng=21.26, gear=shoe, best_efforts=BEST_EFFORTS, calories=700)
+        make_activity(2, "Ride", distance=40000, start_date=dt(2025, 7, 1), name="Evening Ride",
+                      start_lat=48.21, start_lng=16.37, max_speed=15.0, calories=900)
+        make_activity(3, "Run", distance=8000, start_date=dt(2024, 5, 1), name="Trail Loop",
+                      start_lat=48.721, start_lng=21.259, gear=shoe)
+        make_activity(4, "Swim", distance=1500, start_date=dt(2024, 5, 2), moving_time=1800)
+        make_activity(5, "Hike", distance=15000, start_date=dt(2025, 6, 14), moving_time=18000,
+                      elevation=1200, start_lat=49.1, start_lng=20.0, calories=900)
+
+    @pytest.mark.parametrize("params", [
+        ("", "all", "all", "all", None, None),
+        ("run", "all", "all", "all", None, None),
+        ("", "group-run", "g1", "2025", None, None),
+        ("", "all", "all", "2024", "1", "9"),
+        ("nothing", "all", "all", "all", None, None),
+    ])
+    def test_one_pass_matches_separate_passes(self, params):
+        from strava.services import dashboard
+        self._seed()
+        rows = Activity.objects.order_by("-start_date").rows()
+        today = datetime.date(2025, 7, 10)
+        expected = separate_passes(rows, *params, today)
+        actual = dashboard.sections(rows, *params, today)
+        for context in (expected, actual):
+            context["gear_health"] = [(g.pk, g.activity_count, g.distance_km) for g in context["gear_health"]]
+        assert actual == expected
+
+    @pytest.mark.parametrize("params", [
+        ("", "all", "all", "all", None, None),
+        ("run", "all", "all", "all", None, None),
+        ("", "group-run", "g1", "2025", None, None),
+        ("", "all", "all", "2024", "1", "9"),
+        ("nothing", "all", "all", "all", None, None),
+        # Matches the map sport type ("trail", "ride", "other") or the folded name, but
+        # not the sport_type itself ("gravel"), exactly as in memory.
+        ("trail", "all", "all", "all", None, None),
+        ("other", "all", "all", "all", None, None),
+        ("gravel", "all", "all", "all", None, None),
+        ("ÉVENING ride", "all", "all", "all", None, None),
+        ("", "all", "all", "02025", None, None),
+        ("", "all", "all", "abc", None, None),
+    ])
+    def test_database_filtering_matches_in_memory(self, params):
+        from strava.services import dashboard
+        self._seed()
+        make_activity(6, "Yoga", distance=0, start_date=dt(2025, 6, 16), name="Stretch")
+        make_activity(7, "GravelRide", distance=60000, start_date=dt(2025, 6, 17), name="Dirt")
+        rows = Activity.objects.order_by("-start_date").rows()
+        today = datetime.date(2025, 7, 10)
+        expected = dashboard.sections(rows, *params, today)
+        actual = dashboard.filtered_sections(Activity.objects.public(), *params, today)
+        for context in (expected, actual):
+            context["gear_health"] = [(g.pk, g.activity_count, g.distance_km) for g in context["gear_health"]]
+            context["latest_activities"] = [a.pk for a in context["latest_activities"]]
+            for key in ("latest_activity", "aoty"):
+                context[key] = context[key] and context[key].pk
+        assert actual == expected
+
+    def test_requested_sections_only(self, django_assert_num_queries):
+        from strava.services import dashboard
+        self._seed()
+        today = datetime.date(2025, 7, 10)
+        params = ("", "group-run", "all", "2025", None, None)
+        full = dashboard.filtered_sections(Activity.objects.public(), *params, today)
+        # The year-only sections need just the season rows and the home location.
+        with django_assert_num_queries(2):
+            season = dashboard.filtered_sections(Activity.objects.public(), *params, today,
+                                                 frozenset({"records", "run_perf"}))
+        assert season == {"records": full["records"], "run_perf": full["run_perf"]}
+        with django_assert_num_queries(1):
+            stats = dashboard.filtered_sections(Activity.objects.public(), *params, today,
+                                                frozenset({"stats", "trends"}))
+        assert stats == {"stat": full["stat"], "trends": full["trends"]}
+
+    def test_parse_sections(self):
+        from strava.services import dashboard
+        assert dashboard.parse_sections("stats,records,bogus") == {"stats", "records"}
+        assert dashboard.parse_sections("") == dashboard.parse_sections("bogus") == dashboard.SECTIONS
+
+    def test_htmx_request_renders_its_sections(self):
+        from strava.services import dashboard
+        self._seed()
+        # The full page renders everything and carries the section map for the JS.
+        full = dashboard_context(sections="stats")
+        assert "records" in full and full["sections"] == dashboard.SECTIONS
+        assert full["section_filters"]["records"] == ["year"]
+
+        view = DashboardView()
+        view.request = RequestFactory().get("/", {"sections": "stats,latest"})
+        view.request.htmx = True
+        view.kwargs = {}
+        context = view.get_context_data()
+        assert context["sections"] == {"stats", "latest"}
+        assert context["stat"] == full["stat"]
+        assert "records" not in context and "trends" not in context